@@ -1,16 +1,14 @@
 import os
 import secrets
-import sqlite3
 
 import click
 from flask import Flask
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import event
-from sqlalchemy.engine import Engine
 
 from app.security import generate_csrf_token
+from app.services.sqlite_profile import install_sqlite_profile
 
 db = SQLAlchemy()
 migrate = Migrate()
@@ -20,43 +18,116 @@ login_manager.login_message = "Veuillez vous connecter pour continuer."
 login_manager.login_message_category = "warning"
 
 
-@event.listens_for(Engine, "connect")
-def _set_sqlite_pragmas(dbapi_connection, _connection_record):
-    # Reduce SQLite lock errors on heavy imports:
-    # - WAL allows concurrent readers during writes
-    # - busy_timeout waits before raising "database is locked"
-    if isinstance(dbapi_connection, sqlite3.Connection):
-        cursor = dbapi_connection.cursor()
-        cursor.execute("PRAGMA journal_mode=WAL;")
-        cursor.execute("PRAGMA synchronous=NORMAL;")
-        cursor.execute("PRAGMA busy_timeout=60000;")
-        cursor.close()
+def _postgres_engine_options(config):
+    connect_args = {"application_name": "ransites"}
+    if config["DB_STATEMENT_TIMEOUT_MS"] > 0:
+        connect_args["options"] = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"
+    return {
+        "pool_size": config["DB_POOL_SIZE"],
+        "max_overflow": config["DB_MAX_OVERFLOW"],
+        "pool_timeout": config["DB_POOL_TIMEOUT"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+        # Drop connections the server closed (restart, idle timeout) instead of failing a request.
+        "pool_pre_ping": True,
+        # executemany() UPDATE/DELETE (sync jobs, road upserts) in batched pages instead of row by row.
+        "executemany_mode": "values_plus_batch",
+        "connect_args": connect_args,
+    }
 
 
 def create_app():
     app = Flask(__name__)
 
-    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///radio.db")
+    database_url = os.getenv("DATABASE_URL", "sqlite:///radio.db")
+    if database_url.startswith("postgres://"):
+        # Hosting providers still hand out the scheme SQLAlchemy dropped in 1.4.
+        database_url = "postgresql://" + database_url[len("postgres://"):]
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY") or secrets.token_hex(32)
     app.config["ROADS_GEOJSON_URL"] = os.getenv("ROADS_GEOJSON_URL", "").strip()
     app.config["ROAD_IMPORT_HTTP_TIMEOUT"] = int(os.getenv("ROAD_IMPORT_HTTP_TIMEOUT", "45"))
+    # Douglas-Peucker tolerance applied to imported roads (0 disables simplification).
+    app.config["ROAD_SIMPLIFY_TOLERANCE_M"] = float(os.getenv("ROAD_SIMPLIFY_TOLERANCE_M", "0"))
+    # 0 = one worker per CPU for multi-road batch analysis.
+    app.config["ROAD_BATCH_MAX_WORKERS"] = int(os.getenv("ROAD_BATCH_MAX_WORKERS", "0"))
+    # KML/KMZ artifact cache under instance/kml_exports: size quota (MB) and time-to-live (hours).
+    app.config["KML_CACHE_MAX_MB"] = int(os.getenv("KML_CACHE_MAX_MB", "1024"))
+    app.config["KML_CACHE_TTL_HOURS"] = float(os.getenv("KML_CACHE_TTL_HOURS", "24"))
+    # In-memory budget (MB of text) for rendered per-site/per-sector placemark fragments.
+    app.config["KML_FRAGMENT_CACHE_MB"] = int(os.getenv("KML_FRAGMENT_CACHE_MB", "256"))
+    # Threads rendering per-wilaya/per-commune sub-documents of regionated KMZ exports.
+    app.config["KML_REGION_WORKERS"] = int(os.getenv("KML_REGION_WORKERS", "4"))
+    # Worker processes filling D4b workbooks for batch exports (1 renders in the job thread).
+    app.config["D4B_BATCH_WORKERS"] = int(os.getenv("D4B_BATCH_WORKERS", "4"))
+    # Full rebuild of the dashboard counters (inventory_stat) every N minutes; 0 disables the thread.
+    app.config["INVENTORY_STATS_RECONCILE_MINUTES"] = float(os.getenv("INVENTORY_STATS_RECONCILE_MINUTES", "60"))
+    # Dashboard snapshot lifetime per scope; older snapshots are served while refreshed in the background.
+    app.config["DASHBOARD_CACHE_TTL_SECONDS"] = float(os.getenv("DASHBOARD_CACHE_TTL_SECONDS", "60"))
+    # Disk cache of map tiles: size cap (MB) and how long superseded data versions stay readable (s).
+    app.config["MAP_TILES_CACHE_MAX_MB"] = int(os.getenv("MAP_TILES_CACHE_MAX_MB", "512"))
+    app.config["MAP_TILES_GRACE_SECONDS"] = float(os.getenv("MAP_TILES_GRACE_SECONDS", "600"))
+    # PostgreSQL pool: persistent connections per process, burst connections, wait (s) for a free one, recycle age (s).
+    app.config["DB_POOL_SIZE"] = int(os.getenv("DB_POOL_SIZE", "10"))
+    app.config["DB_MAX_OVERFLOW"] = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    app.config["DB_POOL_TIMEOUT"] = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    app.config["DB_POOL_RECYCLE"] = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # PostgreSQL statement_timeout (ms) for every connection; 0 leaves the server setting.
+    app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+    # SQLite profile. WAL lets readers run during writes; busy_timeout waits before "database is locked".
+    app.config["SQLITE_JOURNAL_MODE"] = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    app.config["SQLITE_SYNCHRONOUS"] = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    app.config["SQLITE_BUSY_TIMEOUT_MS"] = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "60000"))
+    # Page cache per connection (KiB) and memory-mapped I/O window (MB, 0 disables).
+    app.config["SQLITE_CACHE_SIZE_KB"] = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+    app.config["SQLITE_MMAP_SIZE_MB"] = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+    # Sorts, temp indexes and staging tables kept in RAM (MEMORY) or on disk (FILE/DEFAULT).
+    app.config["SQLITE_TEMP_STORE"] = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+    # Enforce FOREIGN KEY constraints in SQLite (off by default, as before; the ORM handles cascades).
+    app.config["SQLITE_FOREIGN_KEYS"] = os.getenv("SQLITE_FOREIGN_KEYS", "0").lower() in ("1", "true", "yes", "on")
+    # Connections of the query_only pool serving list/export/dashboard reads on file databases.
+    app.config["SQLITE_READ_POOL_SIZE"] = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+    # Separate database for reporting reads (e.g. a PostgreSQL replica); defaults to the primary file for SQLite.
+    app.config["READ_DATABASE_URL"] = os.getenv("READ_DATABASE_URL", "").strip()
+    # Single in-process write slot ("auto" = SQLite only): interactive writes jump ahead of bulk-job batches.
+    app.config["WRITE_COORDINATOR"] = os.getenv("WRITE_COORDINATOR", "auto").strip().lower()
+    # Target duration of one bulk-job commit batch, and how long a writer waits for the slot before going without it.
+    app.config["WRITE_SLICE_MS"] = int(os.getenv("WRITE_SLICE_MS", "250"))
+    app.config["WRITE_SLOT_TIMEOUT_SECONDS"] = float(os.getenv("WRITE_SLOT_TIMEOUT_SECONDS", "60"))
     if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
         app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
             "connect_args": {
                 "timeout": 60
             }
         }
+    elif app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _postgres_engine_options(app.config)
 
     app.jinja_env.add_extension("jinja2.ext.do")
     app.jinja_env.globals["csrf_token"] = generate_csrf_token
 
     db.init_app(app)
     migrate.init_app(app, db)
+    from app.services.read_session import build_read_engine
+    from app.services.write_coordinator import WriteCoordinator  # also registers the write-slot session listeners
+
+    with app.app_context():
+        if db.engine.dialect.name == "sqlite":
+            install_sqlite_profile(db.engine, app.config)
+    app.extensions["read_engine"] = build_read_engine(app, app.config.get("SQLALCHEMY_ENGINE_OPTIONS"))
+    coordinate_writes = app.config["WRITE_COORDINATOR"]
+    if coordinate_writes == "auto":
+        coordinate_writes = app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite")
+    else:
+        coordinate_writes = coordinate_writes in ("1", "true", "yes", "on")
+    if coordinate_writes:
+        app.extensions["write_coordinator"] = WriteCoordinator(app.config["WRITE_SLOT_TIMEOUT_SECONDS"])
     login_manager.init_app(app)
 
     from app import models  # noqa: F401
     from app.models import User
+    from app.services import data_version  # noqa: F401  (registers version-bump session listeners)
+    from app.services import inventory_stats  # noqa: F401  (registers dashboard counter listeners)
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -79,6 +150,46 @@ def create_app():
         role = "admin" if admin else "engineer"
         click.echo(f"Utilisateur '{username}' cree ({role}).")
 
+    @app.cli.command("export-columnar")
+    @click.option("--out", "out_dir", required=True, type=click.Path(file_okay=False), help="Dossier de sortie.")
+    @click.option("--format", "export_format", type=click.Choice(["parquet", "feather"]), default="parquet", show_default=True)
+    def export_columnar(out_dir, export_format):
+        """Exporte l'inventaire complet (sites, secteurs, cellules, antennes, mapping) en Parquet/Arrow."""
+        from app.services.columnar_export import write_columnar_inventory
+
+        try:
+            counts = write_columnar_inventory(out_dir, export_format)
+        except RuntimeError as exc:
+            raise click.ClickException(str(exc))
+        for name, count in counts.items():
+            click.echo(f"{name}: {count} lignes")
+
+    @app.cli.command("import-roads")
+    @click.argument("source")
+    @click.option("--simplify-tolerance-m", type=float, default=None, help="Tolerance Douglas-Peucker (m); defaut ROAD_SIMPLIFY_TOLERANCE_M.")
+    def import_roads(source, simplify_tolerance_m):
+        """Importe/met a jour les routes depuis un fichier ou une URL GeoJSON (FeatureCollection)."""
+        from app.routes.road_analysis import _import_summary, import_roads_from_source
+
+        if simplify_tolerance_m is None:
+            simplify_tolerance_m = float(app.config.get("ROAD_SIMPLIFY_TOLERANCE_M", 0.0) or 0.0)
+        try:
+            added, updated, vertex_stats = import_roads_from_source(
+                source,
+                simplify_tolerance_m=simplify_tolerance_m,
+                progress_cb=lambda done, total, message: click.echo(message),
+            )
+        except (OSError, ValueError) as exc:
+            raise click.ClickException(str(exc))
+        click.echo(_import_summary("Road import", added, updated, vertex_stats))
+
+    @app.cli.command("reconcile-stats")
+    def reconcile_stats():
+        """Recalcule les compteurs du tableau de bord (inventory_stat) depuis les tables sources."""
+        with db.engine.begin() as connection:
+            fixed = inventory_stats.reconcile_inventory_stats(connection)
+        click.echo(f"{fixed} compteurs corriges.")
+
     from app.routes.list_data import list_bp
     app.register_blueprint(list_bp, url_prefix="/")
 
@@ -109,4 +220,7 @@ def create_app():
     from app.routes.road_analysis import road_bp
     app.register_blueprint(road_bp)
 
+    from app.routes.map_data import map_bp
+    app.register_blueprint(map_bp)
+
     return app
@@ -2,6 +2,7 @@
 from datetime import datetime
 
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from . import db
@@ -86,14 +87,14 @@ class Wilaya(db.Model):
     __tablename__ = 'wilaya'
     id = db.Column(db.Integer, primary_key=True, autoincrement=False)
     name = db.Column(db.String(100), unique=True, nullable=False)
-    region_id = db.Column(db.Integer, db.ForeignKey('region.id', ondelete='CASCADE'), nullable=False)
+    region_id = db.Column(db.Integer, db.ForeignKey('region.id', ondelete='CASCADE'), nullable=False, index=True)
     communes = db.relationship('Commune', backref='wilaya', cascade="all, delete-orphan", lazy=True)
 
 class Commune(db.Model):
     __tablename__ = 'commune'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    wilaya_id = db.Column(db.Integer, db.ForeignKey('wilaya.id', ondelete='CASCADE'), nullable=False)
+    wilaya_id = db.Column(db.Integer, db.ForeignKey('wilaya.id', ondelete='CASCADE'), nullable=False, index=True)
     sites = db.relationship('Site', backref='commune', cascade="all, delete-orphan", lazy='dynamic')
 
 
@@ -119,7 +120,7 @@ class Antenna(db.Model):
     __tablename__ = 'antenna'
     id = db.Column(db.Integer, primary_key=True)
     supplier = db.Column(db.String(100), nullable=False)
-    model = db.Column(db.String(100), nullable=False)
+    model = db.Column(db.String(100), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=True)
     port = db.Column(db.Integer, nullable=True)
     frequency = db.Column(db.Float, nullable=False)
@@ -145,8 +146,8 @@ class Site(db.Model):
     status = db.Column(db.String(20), nullable=False, default="On air", server_default="On air")
     comments = db.Column(db.Text, nullable=True)
     
-    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=True)
-    commune_id = db.Column(db.Integer, db.ForeignKey('commune.id', ondelete='CASCADE'), nullable=False)
+    supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'), nullable=True, index=True)
+    commune_id = db.Column(db.Integer, db.ForeignKey('commune.id', ondelete='CASCADE'), nullable=False, index=True)
     
     sectors = db.relationship('Sector', backref='site', cascade="all, delete-orphan", lazy='dynamic')
 
@@ -159,9 +160,27 @@ class Sector(db.Model):
     hba = db.Column(db.Integer, nullable=False)
     coverage_goal = db.Column(db.String(50), nullable=True)
     
-    site_id = db.Column(db.Integer, db.ForeignKey('site.id', ondelete='CASCADE'), nullable=False)
+    site_id = db.Column(db.Integer, db.ForeignKey('site.id', ondelete='CASCADE'), nullable=False, index=True)
     cells = db.relationship('Cell', backref='sector', cascade="all, delete-orphan", lazy='dynamic')
 
+def derive_cell_codes(cellname):
+    """(site_code_hint, cell_code) parsed from a "<prefix><site code>_<cell code>" cell name.
+
+    The site part starts at the first 'C', 'A' or 'O' (technology prefixes such
+    as "4" in "4C28SU217_1" are dropped); either value is None when missing.
+    """
+    parts = str(cellname or "").rsplit("_", 1)
+    if len(parts) != 2:
+        return None, None
+    raw_site_part = parts[0].strip()
+    site_code = raw_site_part
+    for i, char in enumerate(raw_site_part):
+        if char.upper() in ("C", "A", "O"):
+            site_code = raw_site_part[i:]
+            break
+    return site_code or None, parts[1].strip() or None
+
+
 # --- Cell ---
 class Cell(db.Model):
     __tablename__ = 'cell'
@@ -172,14 +191,22 @@ class Cell(db.Model):
     antenna_tech = db.Column(db.String(50), nullable=True)
     tilt_mechanical = db.Column(db.Float, nullable=True)
     tilt_electrical = db.Column(db.Float, nullable=True)
+    # Derived from cellname (see derive_cell_codes) so mapping and sector lookups can use an index.
+    cell_code = db.Column(db.String(50), nullable=True, index=True)
+    site_code_hint = db.Column(db.String(80), nullable=True, index=True)
     
-    antenna_id = db.Column(db.Integer, db.ForeignKey('antenna.id'), nullable=True)
-    sector_id = db.Column(db.Integer, db.ForeignKey('sector.id', ondelete='CASCADE'), nullable=True)
+    antenna_id = db.Column(db.Integer, db.ForeignKey('antenna.id'), nullable=True, index=True)
+    sector_id = db.Column(db.Integer, db.ForeignKey('sector.id', ondelete='CASCADE'), nullable=True, index=True)
     profile_2g = db.relationship('Cell2G', back_populates='cell', uselist=False, cascade='all, delete-orphan')
     profile_3g = db.relationship('Cell3G', back_populates='cell', uselist=False, cascade='all, delete-orphan')
     profile_4g = db.relationship('Cell4G', back_populates='cell', uselist=False, cascade='all, delete-orphan')
     profile_5g = db.relationship('Cell5G', back_populates='cell', uselist=False, cascade='all, delete-orphan')
 
+    @validates('cellname')
+    def _derive_codes(self, _key, cellname):
+        self.site_code_hint, self.cell_code = derive_cell_codes(cellname)
+        return cellname
+
 
 class Cell2G(db.Model):
     __tablename__ = 'cell_2g'
@@ -239,6 +266,8 @@ class Cell5G(db.Model):
 # --- Mapping ---
 class Mapping(db.Model):
     __tablename__ = 'mapping'
+    # (cell_code, technology) serves sector resolution; its cell_code prefix serves the semi-joins.
+    __table_args__ = (db.Index('ix_mapping_cell_code_technology', 'cell_code', 'technology'),)
     id = db.Column(db.Integer, primary_key=True)
     map_id = db.Column(db.String(100), unique=True, nullable=False)
     cell_code = db.Column(db.String(50), nullable=False)
@@ -246,3 +275,22 @@ class Mapping(db.Model):
     band = db.Column(db.String(50), nullable=False)
     sector_code = db.Column(db.String(50), nullable=False)
     technology = db.Column(db.String(20), nullable=False)
+
+
+# --- Data versions ---
+class DataVersion(db.Model):
+    """Monotonic change counter per data scope ("inventory", "roads"), bumped in the writing transaction."""
+    __tablename__ = 'data_version'
+    scope = db.Column(db.String(40), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# --- Dashboard statistics ---
+class InventoryStat(db.Model):
+    """Pre-aggregated dashboard counter: (commune, metric, key) -> value; commune 0 holds network-wide rows."""
+    __tablename__ = 'inventory_stat'
+    commune_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    metric = db.Column(db.String(40), primary_key=True, index=True)
+    key = db.Column(db.String(120), primary_key=True, default='')
+    value = db.Column(db.Integer, nullable=False, default=0)
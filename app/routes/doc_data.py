@@ -1,26 +1,55 @@
+import hashlib
 import io
+import json
 import logging
+import math
+import multiprocessing
 import os
+import tempfile
 import threading
+import time
 import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
-from math import asin, atan2, cos, radians, sin, degrees
 from pathlib import Path
 from xml.sax.saxutils import escape
 
-from flask import Blueprint, abort, current_app, jsonify, request, send_file, url_for
+from flask import Blueprint, Response, abort, current_app, jsonify, request, send_file, stream_with_context, url_for
 from flask_login import current_user
-from openpyxl import load_workbook
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 
-from app.models import Cell, Commune, Sector, Site, Wilaya
-from app.security import csrf_protect, get_accessible_site_ids, is_admin_user, login_required
+from app import db
+from app.models import Antenna, Cell, Commune, Sector, Site, Wilaya
+from app.security import csrf_protect, get_accessible_site_ids, is_admin_user, login_required, site_scope_fingerprint
+from app.services.beam_geometry import format_kml_coordinates, geodesic_beam_vertices
+from app.services.d4b import D4B_TEMPLATE_PATH, d4b_cell_values, render_d4b, render_d4b_entry
+from app.services.data_version import INVENTORY_SCOPE, get_data_version
+from app.services.excel_export import prune_old_exports
+from app.services.fragment_cache import FragmentCache
 
 doc_bp = Blueprint('doc_bp', __name__)
 logger = logging.getLogger(__name__)
 _kml_jobs = {}
 _kml_jobs_lock = threading.Lock()
+_d4b_jobs = {}
+_d4b_jobs_lock = threading.Lock()
+_kml_cache_lock = threading.Lock()
+_placemark_cache = FragmentCache()
 ADMIN_FULL_SCOPE = "__ADMIN_FULL_SCOPE__"
+KML_MIMETYPE = "application/vnd.google-earth.kml+xml"
+KMZ_MIMETYPE = "application/vnd.google-earth.kmz"
+KML_STREAM_CHUNK_CHARS = 64 * 1024
+# "kmz_wilaya"/"kmz_commune" are regionated KMZ packages (one NetworkLink per partition).
+KML_EXPORT_FORMATS = ("kml", "kmz", "kmz_wilaya", "kmz_commune")
+KML_REGION_MIN_LOD_PIXELS = 128
+# Bumped whenever the generated KML changes for the same data, so stale cached artifacts are not served.
+KML_LAYOUT_VERSION = 2
+# Sites handed to each D4b worker process per round trip.
+D4B_BATCH_CHUNK = 8
+# Finished batch archives are kept this long for download, then pruned by the next batch.
+D4B_EXPORT_RETENTION_HOURS = 24
 
 
 def _site_allowed(site):
@@ -49,17 +78,374 @@ def _kml_exports_dir():
     return out_dir
 
 
-def _kml_document(placemarks):
+_KML_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+    '  <Document>\n'
+)
+_KML_FOOTER = (
+    '  </Document>\n'
+    '</kml>\n'
+)
+
+
+def _iter_kml_document(placemarks):
+    """Yield the KML document as text chunks of roughly KML_STREAM_CHUNK_CHARS."""
+    buffer = [_KML_HEADER]
+    size = len(_KML_HEADER)
+    for placemark in placemarks:
+        if not placemark:
+            continue
+        buffer.append(placemark)
+        size += len(placemark)
+        if size >= KML_STREAM_CHUNK_CHARS:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(_KML_FOOTER)
+    yield ''.join(buffer)
+
+
+class _ZipStreamSink(io.RawIOBase):
+    """Unseekable write target for zipfile; compressed bytes are drained as they arrive."""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _iter_kmz_bytes(chunks):
+    sink = _ZipStreamSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open("doc.kml", "w") as entry:
+            for chunk in chunks:
+                entry.write(chunk.encode("utf-8"))
+                data = sink.drain()
+                if data:
+                    yield data
+    yield sink.drain()
+
+
+def _write_kml_file(chunks, out_path, kmz=False):
+    if kmz:
+        with zipfile.ZipFile(out_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open("doc.kml", "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk.encode("utf-8"))
+        return
+    with open(out_path, "w", encoding="utf-8", newline="\n") as handle:
+        for chunk in chunks:
+            handle.write(chunk)
+
+
+def _kml_export_format(value):
+    value = str(value or "").strip().lower()
+    return value if value in KML_EXPORT_FORMATS else "kml"
+
+
+def _kml_file_extension(export_format):
+    return "kml" if export_format == "kml" else "kmz"
+
+
+def _kml_network_link(name, href, bounds):
+    north, south, east, west = bounds
     return (
-        '<?xml version="1.0" encoding="UTF-8"?>\n'
-        '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
-        '  <Document>\n'
-        f"{placemarks}"
-        '  </Document>\n'
-        '</kml>\n'
+        '    <NetworkLink>\n'
+        f'      <name>{escape(name)}</name>\n'
+        '      <Region>\n'
+        f'        <LatLonAltBox><north>{north:.6f}</north><south>{south:.6f}</south><east>{east:.6f}</east><west>{west:.6f}</west></LatLonAltBox>\n'
+        f'        <Lod><minLodPixels>{KML_REGION_MIN_LOD_PIXELS}</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod>\n'
+        '      </Region>\n'
+        f'      <Link><href>{escape(href)}</href><viewRefreshMode>onRegion</viewRefreshMode></Link>\n'
+        '    </NetworkLink>\n'
     )
 
 
+def _kml_partitions(options, accessible_site_ids, pad_deg):
+    """Wilaya partitions (with their communes) and the padded bounding box of their located sites."""
+    query = _iter_accessible_sites(
+        region_id=options.get("region_id"),
+        wilaya_id=options.get("wilaya_id"),
+        commune_id=options.get("commune_id"),
+        site_id=options.get("site_id"),
+        accessible_site_ids=accessible_site_ids,
+    )
+    if isinstance(query, list):
+        abort(403, description='Aucun site autorise pour cet utilisateur.')
+    rows = (
+        query.order_by(None)
+        .join(Commune, Site.commune_id == Commune.id)
+        .filter(Site.latitude.isnot(None), Site.longitude.isnot(None))
+        .with_entities(
+            Commune.wilaya_id,
+            Commune.id,
+            Commune.name,
+            func.max(Site.latitude),
+            func.min(Site.latitude),
+            func.max(Site.longitude),
+            func.min(Site.longitude),
+        )
+        .group_by(Commune.wilaya_id, Commune.id, Commune.name)
+        .all()
+    )
+    wilaya_names = {w.id: w.name for w in Wilaya.query.filter(Wilaya.id.in_({row[0] for row in rows})).all()} if rows else {}
+
+    def padded(north, south, east, west):
+        # A degree of longitude shrinks with cos(latitude): widen the east/west pad at the pole-ward edge.
+        lon_pad = pad_deg / max(math.cos(math.radians(max(abs(north), abs(south)))), 0.01)
+        return (min(north + pad_deg, 90.0), max(south - pad_deg, -90.0), min(east + lon_pad, 180.0), max(west - lon_pad, -180.0))
+
+    partitions = {}
+    for wilaya_id, commune_id, commune_name, north, south, east, west in rows:
+        partition = partitions.setdefault(wilaya_id, {
+            "id": wilaya_id,
+            "name": wilaya_names.get(wilaya_id, ""),
+            "bounds": (north, south, east, west),
+            "communes": [],
+        })
+        n, s_, e, w = partition["bounds"]
+        partition["bounds"] = (max(n, north), min(s_, south), max(e, east), min(w, west))
+        partition["communes"].append({"id": commune_id, "name": commune_name, "bounds": padded(north, south, east, west)})
+    for partition in partitions.values():
+        partition["bounds"] = padded(*partition["bounds"])
+        partition["communes"].sort(key=lambda commune: commune["id"])
+    return [partitions[key] for key in sorted(partitions)]
+
+
+def _render_kml_partition(app_obj, kind, options, accessible_site_ids, out_path):
+    with app_obj.app_context():
+        _write_kml_file(_iter_kml_export_chunks(kind, options, accessible_site_ids), out_path)
+
+
+def _write_regionated_kmz(app_obj, kind, options, accessible_site_ids, out_path, split_communes=False, progress_cb=None):
+    """Package a root doc.kml of per-wilaya NetworkLinks (optionally per commune) with the
+    sub-documents, which are rendered concurrently, one per partition."""
+    # Beams reach beyond their site, so sector partitions are padded by the beam length.
+    pad_deg = (options.get("beam_length_km", 0.0) / 111.0) + 0.01
+    partitions = _kml_partitions(options, accessible_site_ids, pad_deg)
+    with tempfile.TemporaryDirectory(dir=out_path.parent) as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        root_links = []
+        tasks = []
+        for wilaya in partitions:
+            wilaya_file = f"wilaya_{wilaya['id']}.kml"
+            root_links.append(_kml_network_link(f"{wilaya['id']:02d} - {wilaya['name']}", wilaya_file, wilaya["bounds"]))
+            if not split_communes:
+                tasks.append((wilaya_file, dict(options, wilaya_id=wilaya["id"])))
+                continue
+            commune_links = []
+            for commune in wilaya["communes"]:
+                commune_file = f"commune_{commune['id']}.kml"
+                commune_links.append(_kml_network_link(commune["name"], commune_file, commune["bounds"]))
+                tasks.append((commune_file, dict(options, commune_id=commune["id"])))
+            _write_kml_file(_iter_kml_document(commune_links), tmp_dir / wilaya_file)
+        _write_kml_file(_iter_kml_document(root_links), tmp_dir / "doc.kml")
+
+        max_workers = max(1, int(current_app.config.get("KML_REGION_WORKERS", 4)))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(_render_kml_partition, app_obj, kind, partition_options, accessible_site_ids, tmp_dir / file_name)
+                for file_name, partition_options in tasks
+            ]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                if progress_cb:
+                    progress_cb(done, len(tasks), f"Building regions {done}/{len(tasks)}")
+
+        with zipfile.ZipFile(out_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            # Google Earth opens the first .kml entry, so the root document goes first.
+            archive.write(tmp_dir / "doc.kml", "doc.kml")
+            for path in sorted(tmp_dir.glob("*.kml")):
+                if path.name != "doc.kml":
+                    archive.write(path, path.name)
+
+
+def _build_kml_artifact(app_obj, kind, options, accessible_site_ids, export_format, out_path, progress_cb=None):
+    # Write beside the final name and publish atomically so readers never see a partial artifact.
+    part_path = out_path.with_name(f"{out_path.name}.{uuid.uuid4().hex}.part")
+    try:
+        if export_format in ("kmz_wilaya", "kmz_commune"):
+            _write_regionated_kmz(
+                app_obj, kind, options, accessible_site_ids, part_path,
+                split_communes=export_format == "kmz_commune",
+                progress_cb=progress_cb,
+            )
+        else:
+            chunks = _iter_kml_export_chunks(kind, options, accessible_site_ids=accessible_site_ids, progress_cb=progress_cb)
+            _write_kml_file(chunks, part_path, kmz=export_format == "kmz")
+        os.replace(part_path, out_path)
+    finally:
+        part_path.unlink(missing_ok=True)
+    _evict_kml_cache(keep=out_path)
+    return out_path
+
+
+def _iter_teed_to_artifact(body, out_path):
+    """Pass ``body`` through while writing it to ``out_path``; a disconnect leaves no artifact."""
+    part_path = out_path.with_name(f"{out_path.name}.{uuid.uuid4().hex}.part")
+    try:
+        with open(part_path, "wb") as handle:
+            for data in body:
+                handle.write(data)
+                yield data
+        os.replace(part_path, out_path)
+    finally:
+        part_path.unlink(missing_ok=True)
+    _evict_kml_cache(keep=out_path)
+
+
+def _kml_stream_response(chunks, base_name, export_format, cache_path=None):
+    if export_format == "kmz":
+        body = _iter_kmz_bytes(chunks)
+        download_name = f"{base_name}.kmz"
+        mimetype = KMZ_MIMETYPE
+    else:
+        body = (chunk.encode("utf-8") for chunk in chunks)
+        download_name = f"{base_name}.kml"
+        mimetype = KML_MIMETYPE
+    if cache_path is not None:
+        body = _iter_teed_to_artifact(body, cache_path)
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{download_name}"'},
+    )
+
+
+def _kml_scope_fingerprint(accessible_site_ids):
+    return site_scope_fingerprint(None if accessible_site_ids == ADMIN_FULL_SCOPE else accessible_site_ids)
+
+
+def _kml_cache_key(kind, export_format, options, accessible_site_ids):
+    payload = {
+        "kind": kind,
+        "format": export_format,
+        "options": options,
+        "scope": _kml_scope_fingerprint(accessible_site_ids),
+        "data_version": get_data_version(INVENTORY_SCOPE),
+        "layout": KML_LAYOUT_VERSION,
+    }
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _kml_cache_path(cache_key, export_format):
+    return _kml_exports_dir() / f"kml_{cache_key}.{_kml_file_extension(export_format)}"
+
+
+def _cached_kml_artifact(cache_key, export_format):
+    path = _kml_cache_path(cache_key, export_format)
+    try:
+        # mtime doubles as the LRU clock.
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def _open_kml_artifact(path):
+    """Open a cached artifact for sending; an open handle survives a concurrent eviction."""
+    if path is None:
+        return None
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+
+def _evict_kml_cache(keep=None):
+    """Drop artifacts older than the TTL, then least recently used ones until the quota holds."""
+    max_bytes = int(current_app.config.get("KML_CACHE_MAX_MB", 1024)) * 1024 * 1024
+    ttl_seconds = float(current_app.config.get("KML_CACHE_TTL_HOURS", 24)) * 3600
+    out_dir = _kml_exports_dir()
+    now = time.time()
+    with _kml_cache_lock:
+        entries = []
+        for path in out_dir.glob("kml_*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path == keep:
+                continue
+            if now - stat.st_mtime > ttl_seconds:
+                path.unlink(missing_ok=True)
+                continue
+            if path.suffix != ".part":
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and keep.exists():
+            total += keep.stat().st_size
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def _kml_export_options(kind, values):
+    """Normalized filters and styling for a KML export, from request args/form or job params."""
+    options = {
+        "region_id": _safe_int(values.get("region_id")),
+        "wilaya_id": _safe_int(values.get("wilaya_id")),
+        "commune_id": _safe_int(values.get("commune_id")),
+        "site_id": _safe_int(values.get("site_id")),
+    }
+    if kind == "sites":
+        options["icon_href"] = _site_icon_href(values.get("site_icon"))
+        options["icon_scale"] = _clamp(_safe_float(values.get("site_icon_scale")) or 1.2, 0.8, 1.8)
+    else:
+        beam_rgb = _parse_hex_color(values.get("beam_color") or "#0055ff")
+        options["beam_length_km"] = _clamp(_safe_float(values.get("beam_length_km")) or 0.8, 0.1, 10.0)
+        options["beam_width_deg"] = _clamp(_safe_float(values.get("beam_width_deg")) or 40.0, 5.0, 180.0)
+        options["line_color"] = _kml_color_from_rgb(beam_rgb, "ff")
+        options["poly_color"] = _kml_color_from_rgb(beam_rgb, "66")
+    return options
+
+
+def _iter_kml_export_chunks(kind, options, accessible_site_ids=None, progress_cb=None):
+    builder = _iter_sites_kml_chunks if kind == "sites" else _iter_sectors_kml_chunks
+    return builder(progress_cb=progress_cb, accessible_site_ids=accessible_site_ids, **options)
+
+
+def _kml_sync_export(kind):
+    export_format = _kml_export_format(request.args.get("format"))
+    options = _kml_export_options(kind, request.args)
+    accessible_sites = get_accessible_site_ids()
+    scope = ADMIN_FULL_SCOPE if accessible_sites is None else accessible_sites
+    cache_key = _kml_cache_key(kind, export_format, options, scope)
+    cache_path = _kml_cache_path(cache_key, export_format)
+    handle = _open_kml_artifact(_cached_kml_artifact(cache_key, export_format))
+    if handle is None and export_format in ("kmz_wilaya", "kmz_commune"):
+        # Regionated packages need every partition on disk before zipping, so they cannot be streamed.
+        handle = _open_kml_artifact(
+            _build_kml_artifact(current_app._get_current_object(), kind, options, scope, export_format, cache_path)
+        )
+        if handle is None:
+            abort(503, description="Export evicted from the cache before it could be sent; please retry.")
+    if handle is not None:
+        return send_file(
+            handle,
+            as_attachment=True,
+            download_name=f"{kind}_export.{_kml_file_extension(export_format)}",
+            mimetype=KML_MIMETYPE if export_format == "kml" else KMZ_MIMETYPE,
+        )
+    # Stream to the client and keep a copy, so the same export is served from the cache next time.
+    chunks = _iter_kml_export_chunks(kind, options, accessible_site_ids=scope)
+    return _kml_stream_response(chunks, f"{kind}_export", export_format, cache_path=cache_path)
+
+
 def _site_icon_href(icon_key):
     key = (icon_key or "tower").strip().lower()
     icon_map = {
@@ -181,37 +567,38 @@ def _sector_beamwidth(sector, cells):
     return 40.0
 
 
-def _destination(lat, lon, bearing_deg, distance_km):
-    r = 6371.0
-    brng = radians(bearing_deg)
-    lat1 = radians(lat)
-    lon1 = radians(lon)
-    d = distance_km / r
-
-    lat2 = asin(sin(lat1) * cos(d) + cos(lat1) * sin(d) * cos(brng))
-    lon2 = lon1 + atan2(
-        sin(brng) * sin(d) * cos(lat1),
-        cos(d) - sin(lat1) * sin(lat2),
-    )
-    return degrees(lat2), degrees(lon2)
-
-
-def _sector_beam_polygon(sector, site, beamwidth=40.0, radius_km=0.8, points=20):
+def _sector_azimuth(sector):
     try:
-        azimuth = float(getattr(sector, "azimuth", 0.0) or 0.0)
+        return float(getattr(sector, "azimuth", 0.0) or 0.0)
     except (TypeError, ValueError, AttributeError):
-        azimuth = 0.0
+        return 0.0
 
-    half = beamwidth / 2.0
-    coords = [(site.longitude, site.latitude, 0)]
 
-    for i in range(points + 1):
-        angle = azimuth - half + (beamwidth * i / points)
-        lat2, lon2 = _destination(site.latitude, site.longitude, angle, radius_km)
-        coords.append((lon2, lat2, 0))
-
-    coords.append((site.longitude, site.latitude, 0))
-    return " ".join(f"{lon},{lat},{alt}" for lon, lat, alt in coords)
+def _sector_beam_polygon(sector, site, beamwidth=40.0, radius_km=0.8, points=20):
+    lons, lats = geodesic_beam_vertices(
+        [site.latitude], [site.longitude], [_sector_azimuth(sector)], [beamwidth], [radius_km], points=points
+    )
+    return format_kml_coordinates(lons, lats)[0]
+
+
+def _sector_beam_polygons(sectors, beamwidths, radius_km=0.8, points=20):
+    """Beam coordinate strings for a whole batch of sectors in one vectorized pass, keyed by sector id."""
+    located = [
+        (sector, beamwidth)
+        for sector, beamwidth in zip(sectors, beamwidths)
+        if sector.site and sector.site.latitude is not None and sector.site.longitude is not None
+    ]
+    if not located:
+        return {}
+    lons, lats = geodesic_beam_vertices(
+        [sector.site.latitude for sector, _ in located],
+        [sector.site.longitude for sector, _ in located],
+        [_sector_azimuth(sector) for sector, _ in located],
+        [beamwidth for _, beamwidth in located],
+        radius_km,
+        points=points,
+    )
+    return {sector.id: text for (sector, _), text in zip(located, format_kml_coordinates(lons, lats))}
 
 
 def _clamp(value, lo, hi):
@@ -238,6 +625,28 @@ def _kml_color_from_rgb(hex_rgb, alpha_hex):
     return f"{alpha_hex}{bb}{gg}{rr}"
 
 
+def _d4b_values_by_site(site_ids):
+    """D4b cell values for ``site_ids`` from three bulk queries (sites, sectors, antenna models)."""
+    sites = Site.query.filter(Site.id.in_(list(site_ids))).order_by(Site.code_site).all()
+    sectors_by_site = {}
+    for sector in Sector.query.filter(Sector.site_id.in_(list(site_ids))).order_by(Sector.code_sector):
+        sectors_by_site.setdefault(sector.site_id, []).append(sector)
+    models_by_sector = {}
+    model_rows = (
+        db.session.query(Cell.sector_id, Antenna.model)
+        .join(Antenna, Cell.antenna_id == Antenna.id)
+        .join(Sector, Cell.sector_id == Sector.id)
+        .filter(Sector.site_id.in_(list(site_ids)), Antenna.model.isnot(None), Antenna.model != '')
+        .distinct()
+    )
+    for sector_id, model in model_rows:
+        models_by_sector.setdefault(sector_id, []).append(model)
+    return [
+        (site, d4b_cell_values(site, sectors_by_site.get(site.id, []), models_by_sector))
+        for site in sites
+    ]
+
+
 @doc_bp.route('/generate_d4b/<int:site_id>')
 @login_required
 def generate_d4b(site_id):
@@ -245,77 +654,11 @@ def generate_d4b(site_id):
     if not _site_allowed(site):
         abort(403, description='Acces refuse a ce site.')
 
-    sectors = (
-        Sector.query.filter_by(site_id=site_id)
-        .order_by(Sector.code_sector)
-        .all()
-    )
-
-    template_path = os.path.join('app', 'static', 'template_D4b.xlsx')
-
-    if not os.path.exists(template_path):
+    if not D4B_TEMPLATE_PATH.exists():
         abort(404, description='Template D4b introuvable dans app/static/')
 
-    wb = load_workbook(template_path)
-    ws = wb.active
-
-    def get_sector_value(index, attr):
-        if len(sectors) > index:
-            val = getattr(sectors[index], attr)
-            return val if val is not None else ''
-        return ''
-
-    def get_sector_antennas(index):
-        if len(sectors) <= index:
-            return ''
-        sector = sectors[index]
-        cells = Cell.query.filter_by(sector_id=sector.id).all()
-        models = sorted({c.antenna.model for c in cells if c.antenna and c.antenna.model})
-        return ' / '.join(models)
-
-    try:
-        ws['J5'] = site.code_site or ''
-        ws['C5'] = site.name or ''
-        ws['J9'] = f"{site.code_site} C1" if site.code_site else 'C1'
-
-        ws['E11'].value = site.address or ''
-        ws['H18'].value = site.longitude or ''
-        ws['J18'].value = site.latitude or ''
-
-        support_parts = [
-            str(site.support_nature or ''),
-            str(site.support_type or ''),
-            f"{site.support_height} m" if site.support_height else '',
-        ]
-        ws['H23'].value = ' '.join(filter(None, support_parts))
-
-        ws['E31'] = get_sector_value(0, 'azimuth')
-        ws['G31'] = get_sector_value(1, 'azimuth')
-        ws['I31'] = get_sector_value(2, 'azimuth')
-        ws['K31'] = get_sector_value(3, 'azimuth')
-
-        ws['E32'] = get_sector_value(0, 'hba')
-        ws['G32'] = get_sector_value(1, 'hba')
-        ws['I32'] = get_sector_value(2, 'hba')
-        ws['K32'] = get_sector_value(3, 'hba')
-
-        # Antenna values extracted from cells (a sector can host multiple antennas)
-        ws['E33'] = get_sector_antennas(0)
-        ws['G33'] = get_sector_antennas(1)
-        ws['I33'] = get_sector_antennas(2)
-        ws['K33'] = get_sector_antennas(3)
-
-        ws['C42'] = get_sector_value(0, 'coverage_goal')
-        ws['C43'] = get_sector_value(1, 'coverage_goal')
-        ws['C44'] = get_sector_value(2, 'coverage_goal')
-        ws['C45'] = get_sector_value(3, 'coverage_goal')
-
-    except Exception:
-        logger.exception('Erreur lors du remplissage du D4b')
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    _, values = _d4b_values_by_site([site.id])[0]
+    output = io.BytesIO(render_d4b(values))
 
     return send_file(
         output,
@@ -325,54 +668,169 @@ def generate_d4b(site_id):
     )
 
 
+def _set_d4b_job(job_id, **fields):
+    with _d4b_jobs_lock:
+        job = _d4b_jobs.get(job_id, {})
+        job.update(fields)
+        _d4b_jobs[job_id] = job
+        return dict(job)
+
+
+def _get_d4b_job(job_id):
+    with _d4b_jobs_lock:
+        return dict(_d4b_jobs.get(job_id, {}))
+
+
+def _d4b_exports_dir(app_obj):
+    out_dir = Path(app_obj.instance_path) / "d4b_exports"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return out_dir
+
+
+def _iter_rendered_d4b(entries, workers):
+    if workers <= 1 or len(entries) <= 1:
+        for entry in entries:
+            yield render_d4b_entry(entry)
+        return
+    # Spawned workers only import openpyxl and the D4b module; each parses the template once.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(entries)), mp_context=context) as pool:
+        yield from pool.map(render_d4b_entry, entries, chunksize=D4B_BATCH_CHUNK)
+
+
+def _run_d4b_batch_job(app_obj, job_id, site_ids):
+    started_at = datetime.utcnow()
+    _set_d4b_job(job_id, status="processing", progress=2, message="Loading sites, sectors and antennas...", started_at=started_at.isoformat())
+    part_path = None
+    try:
+        with app_obj.app_context():
+            entries = [
+                (f"D4b_{site.code_site}.xlsx", values, str(D4B_TEMPLATE_PATH))
+                for site, values in _d4b_values_by_site(site_ids)
+            ]
+            if not entries:
+                raise ValueError("No accessible site selected.")
+            total = len(entries)
+            workers = int(app_obj.config.get("D4B_BATCH_WORKERS") or 1)
+            out_dir = _d4b_exports_dir(app_obj)
+            prune_old_exports(out_dir, "d4b_*.zip*", D4B_EXPORT_RETENTION_HOURS)
+            out_path = out_dir / f"d4b_{job_id}.zip"
+            part_path = out_dir / f"d4b_{job_id}.zip.part"
+            # .xlsx members are already deflated; storing them keeps the ZIP step I/O bound.
+            with zipfile.ZipFile(part_path, "w", compression=zipfile.ZIP_STORED) as zf:
+                for processed, (file_name, data) in enumerate(_iter_rendered_d4b(entries, workers), start=1):
+                    zf.writestr(file_name, data)
+                    if processed == 1 or processed % 25 == 0 or processed == total:
+                        _set_d4b_job(
+                            job_id,
+                            progress=5 + int(processed * 93 / total),
+                            processed=processed,
+                            total=total,
+                            message=f"Generated D4b {processed}/{total}",
+                        )
+            os.replace(part_path, out_path)
+            _set_d4b_job(
+                job_id,
+                status="completed",
+                progress=100,
+                message=f"{total} D4b sheets generated.",
+                file_path=str(out_path),
+                download_name=f"D4b_batch_{started_at.strftime('%Y%m%d_%H%M%S')}.zip",
+                finished_at=datetime.utcnow().isoformat(),
+            )
+    except Exception as exc:
+        logger.exception("D4b batch generation failed")
+        if part_path is not None:
+            try:
+                part_path.unlink()
+            except OSError:
+                pass
+        _set_d4b_job(
+            job_id,
+            status="failed",
+            progress=100,
+            message=f"D4b batch failed: {exc}",
+            finished_at=datetime.utcnow().isoformat(),
+        )
+
+
+@doc_bp.route('/generate_d4b/batch/start', methods=['POST'])
+@login_required
+@csrf_protect
+def start_d4b_batch():
+    site_ids = set()
+    for raw in request.form.getlist("site_ids"):
+        for part in raw.split(","):
+            try:
+                site_ids.add(int(part.strip()))
+            except ValueError:
+                continue
+    codes = [code.strip() for code in (request.form.get("site_codes") or "").replace(",", "\n").splitlines() if code.strip()]
+    if codes:
+        site_ids.update(row[0] for row in db.session.query(Site.id).filter(Site.code_site.in_(codes)))
+
+    accessible_sites = get_accessible_site_ids()
+    if accessible_sites is not None:
+        site_ids &= set(accessible_sites)
+    if not site_ids:
+        return jsonify({"success": False, "message": "Select at least one accessible site."}), 400
+    if not D4B_TEMPLATE_PATH.exists():
+        return jsonify({"success": False, "message": "Template D4b introuvable dans app/static/"}), 404
+
+    job_id = uuid.uuid4().hex
+    _set_d4b_job(job_id, status="queued", progress=0, message=f"D4b batch queued ({len(site_ids)} sites)...", total=len(site_ids))
+    app_obj = current_app._get_current_object()
+    threading.Thread(target=_run_d4b_batch_job, args=(app_obj, job_id, sorted(site_ids)), daemon=True).start()
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": url_for("doc_bp.d4b_job_status", job_id=job_id),
+        "download_url": url_for("doc_bp.d4b_job_download", job_id=job_id),
+    }), 202
+
+
+@doc_bp.route('/generate_d4b/batch/status/<job_id>', methods=['GET'])
+@login_required
+def d4b_job_status(job_id):
+    job = _get_d4b_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "D4b job not found."}), 404
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": job.get("status", "unknown"),
+        "progress": int(job.get("progress", 0)),
+        "message": job.get("message", ""),
+        "processed": int(job.get("processed", 0)),
+        "total": int(job.get("total", 0)),
+        "download_ready": bool(job.get("file_path")),
+        "download_url": url_for("doc_bp.d4b_job_download", job_id=job_id),
+    }), 200
+
+
+@doc_bp.route('/generate_d4b/batch/download/<job_id>', methods=['GET'])
+@login_required
+def d4b_job_download(job_id):
+    job = _get_d4b_job(job_id)
+    file_path = job.get("file_path") if job else None
+    if not file_path:
+        return jsonify({"success": False, "message": "D4b archive not ready."}), 404
+    p = Path(file_path)
+    if not p.exists():
+        return jsonify({"success": False, "message": "D4b archive missing."}), 404
+    return send_file(str(p), as_attachment=True, download_name=job.get("download_name", p.name), mimetype="application/zip")
+
+
 @doc_bp.route('/export_kml/sites')
 @login_required
 def export_kml_sites():
-    icon_href = _site_icon_href(request.args.get('site_icon', default='tower', type=str))
-    icon_scale = _clamp(request.args.get('site_icon_scale', default=1.2, type=float) or 1.2, 0.8, 1.8)
-    content = _build_sites_kml_content(
-        icon_href=icon_href,
-        icon_scale=icon_scale,
-        region_id=_safe_int(request.args.get("region_id")),
-        wilaya_id=_safe_int(request.args.get("wilaya_id")),
-        commune_id=_safe_int(request.args.get("commune_id")),
-        site_id=_safe_int(request.args.get("site_id")),
-    )
-
-    return send_file(
-        io.BytesIO(content.encode('utf-8')),
-        as_attachment=True,
-        download_name='sites_export.kml',
-        mimetype='application/vnd.google-earth.kml+xml',
-    )
+    return _kml_sync_export("sites")
 
 
 @doc_bp.route('/export_kml/sectors')
 @login_required
 def export_kml_sectors():
-    beam_length_km = _clamp(request.args.get('beam_length_km', default=0.8, type=float) or 0.8, 0.1, 10.0)
-    beam_width_deg = _clamp(request.args.get('beam_width_deg', default=40.0, type=float) or 40.0, 5.0, 180.0)
-    beam_rgb = _parse_hex_color(request.args.get('beam_color', default='#0055ff', type=str))
-    line_color = _kml_color_from_rgb(beam_rgb, "ff")
-    poly_color = _kml_color_from_rgb(beam_rgb, "66")
-
-    content = _build_sectors_kml_content(
-        beam_length_km=beam_length_km,
-        beam_width_deg=beam_width_deg,
-        line_color=line_color,
-        poly_color=poly_color,
-        region_id=_safe_int(request.args.get("region_id")),
-        wilaya_id=_safe_int(request.args.get("wilaya_id")),
-        commune_id=_safe_int(request.args.get("commune_id")),
-        site_id=_safe_int(request.args.get("site_id")),
-    )
-
-    return send_file(
-        io.BytesIO(content.encode('utf-8')),
-        as_attachment=True,
-        download_name='sectors_export.kml',
-        mimetype='application/vnd.google-earth.kml+xml',
-    )
+    return _kml_sync_export("sectors")
 
 
 def _safe_int(value):
@@ -384,6 +842,15 @@ def _safe_int(value):
         return None
 
 
+def _safe_float(value):
+    try:
+        if value is None or str(value).strip() == "":
+            return None
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
 def _iter_accessible_sites(region_id=None, wilaya_id=None, commune_id=None, site_id=None, accessible_site_ids=None):
     query = Site.query.order_by(Site.code_site.asc())
     if accessible_site_ids == ADMIN_FULL_SCOPE:
@@ -431,7 +898,41 @@ def _iter_accessible_sectors(region_id=None, wilaya_id=None, commune_id=None, si
     return query
 
 
-def _build_sites_kml_content(icon_href, icon_scale, progress_cb=None, region_id=None, wilaya_id=None, commune_id=None, site_id=None, accessible_site_ids=None):
+def _placemark_fragments():
+    _placemark_cache.max_chars = int(current_app.config.get("KML_FRAGMENT_CACHE_MB", 256)) * 1024 * 1024
+    return _placemark_cache
+
+
+def _site_placemark_signature(site):
+    return (
+        site.code_site, site.name, site.longitude, site.latitude, site.altitude,
+        site.supplier.name if site.supplier else None,
+        site.support_nature, site.support_type, site.support_height,
+    )
+
+
+def _sector_placemark_signature(sector, cells):
+    site = sector.site
+    cell_rows = sorted(
+        (
+            str(cell.technology or ""),
+            str(cell.frequency or ""),
+            str(cell.antenna.model or "") if getattr(cell, "antenna", None) else "",
+            cell.antenna.hbeamwidth if getattr(cell, "antenna", None) else None,
+        )
+        for cell in cells
+    )
+    return (
+        sector.code_sector, sector.azimuth, sector.hba,
+        site.code_site if site else None, site.name if site else None,
+        site.longitude if site else None, site.latitude if site else None, site.altitude if site else None,
+        site.commune.name if site and site.commune else None,
+        tuple(cell_rows),
+    )
+
+
+def _iter_sites_kml_chunks(icon_href, icon_scale, progress_cb=None, region_id=None, wilaya_id=None, commune_id=None, site_id=None, accessible_site_ids=None):
+    # Scope is resolved eagerly so a 403 is raised before any bytes are streamed.
     query = _iter_accessible_sites(
         region_id=region_id,
         wilaya_id=wilaya_id,
@@ -441,16 +942,26 @@ def _build_sites_kml_content(icon_href, icon_scale, progress_cb=None, region_id=
     )
     if isinstance(query, list):
         abort(403, description='Aucun site autorise pour cet utilisateur.')
-
-    total = query.count()
-    placemarks = []
-    processed = 0
-    for site in query.yield_per(1000):
-        placemarks.append(_build_site_placemark(site, icon_href=icon_href, icon_scale=icon_scale))
-        processed += 1
-        if progress_cb and (processed == 1 or processed % 300 == 0 or processed == total):
-            progress_cb(processed, total, f"Building sites KML {processed}/{total}")
-    return _kml_document(''.join(placemarks))
+    query = query.options(joinedload(Site.supplier))
+    fragments = _placemark_fragments()
+
+    def placemarks():
+        total = query.count()
+        processed = 0
+        for site in query.yield_per(1000):
+            # Unchanged sites reuse the fragment rendered by an earlier export with the same styling.
+            key = ("site", site.id, icon_href, icon_scale)
+            signature = _site_placemark_signature(site)
+            placemark = fragments.get(key, signature)
+            if placemark is None:
+                placemark = _build_site_placemark(site, icon_href=icon_href, icon_scale=icon_scale)
+                fragments.put(key, signature, placemark)
+            yield placemark
+            processed += 1
+            if progress_cb and (processed == 1 or processed % 300 == 0 or processed == total):
+                progress_cb(processed, total, f"Building sites KML {processed}/{total}")
+
+    return _iter_kml_document(placemarks())
 
 
 def _prefetch_cells_by_sector(sector_ids, progress_cb=None):
@@ -473,7 +984,18 @@ def _prefetch_cells_by_sector(sector_ids, progress_cb=None):
     return cells_by_sector
 
 
-def _build_sectors_kml_content(beam_length_km, beam_width_deg, line_color, poly_color, progress_cb=None, region_id=None, wilaya_id=None, commune_id=None, site_id=None, accessible_site_ids=None):
+def _iter_sector_batches(query, batch_size=1000):
+    batch = []
+    for sector in query.yield_per(batch_size):
+        batch.append(sector)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _iter_sectors_kml_chunks(beam_length_km, beam_width_deg, line_color, poly_color, progress_cb=None, region_id=None, wilaya_id=None, commune_id=None, site_id=None, accessible_site_ids=None):
     query = _iter_accessible_sectors(
         region_id=region_id,
         wilaya_id=wilaya_id,
@@ -483,34 +1005,57 @@ def _build_sectors_kml_content(beam_length_km, beam_width_deg, line_color, poly_
     )
     if isinstance(query, list):
         abort(403, description='Aucun secteur autorise pour cet utilisateur.')
+    fragments = _placemark_fragments()
+
+    def placemarks():
+        total = query.count()
+        processed = 0
+        # Cells are prefetched one sector batch at a time so memory stays bounded by the batch.
+        for batch in _iter_sector_batches(query):
+            cells_by_sector = _prefetch_cells_by_sector([sector.id for sector in batch])
+            placemarks_by_id = {}
+            stale = []
+            for sector in batch:
+                key = ("sector", sector.id, beam_length_km, beam_width_deg, line_color, poly_color)
+                signature = _sector_placemark_signature(sector, cells_by_sector.get(sector.id, []))
+                placemarks_by_id[sector.id] = fragments.get(key, signature)
+                if placemarks_by_id[sector.id] is None:
+                    stale.append((sector, key, signature))
+
+            # Only new or edited sectors pay for beam geometry and balloon rendering.
+            stale_sectors = [sector for sector, _, _ in stale]
+            beam_polygons = _sector_beam_polygons(
+                stale_sectors,
+                [beam_width_deg or _sector_beamwidth(sector, cells_by_sector.get(sector.id, [])) for sector in stale_sectors],
+                radius_km=beam_length_km,
+            )
+            for sector, key, signature in stale:
+                placemark = _build_sector_placemark_with_options(
+                    sector,
+                    beam_length_km=beam_length_km,
+                    beam_width_deg=beam_width_deg,
+                    line_color=line_color,
+                    poly_color=poly_color,
+                    preloaded_cells=cells_by_sector.get(sector.id, []),
+                    beam_polygon=beam_polygons.get(sector.id),
+                )
+                fragments.put(key, signature, placemark)
+                placemarks_by_id[sector.id] = placemark
 
-    sectors = query.all()
-    if not sectors:
-        return _kml_document("")
+            for sector in batch:
+                yield placemarks_by_id[sector.id]
+                processed += 1
+                if progress_cb and (processed == 1 or processed % 300 == 0 or processed == total):
+                    progress_cb(processed, total, f"Building sectors KML {processed}/{total}")
 
-    sector_ids = [s.id for s in sectors]
-    cells_by_sector = _prefetch_cells_by_sector(
-        sector_ids,
-        progress_cb=(lambda done, total, msg: progress_cb(done, total * 2, msg) if progress_cb else None),
-    )
+    return _iter_kml_document(placemarks())
 
-    total = len(sectors)
-    placemarks = []
-    for idx, sector in enumerate(sectors, start=1):
-        placemarks.append(
-            _build_sector_placemark_with_options(
-                sector,
-                beam_length_km=beam_length_km,
-                beam_width_deg=beam_width_deg,
-                line_color=line_color,
-                poly_color=poly_color,
-                preloaded_cells=cells_by_sector.get(sector.id, []),
-            )
-        )
-        if progress_cb and (idx == 1 or idx % 300 == 0 or idx == total):
-            progress_cb(total + idx, total * 2, f"Building sectors KML {idx}/{total}")
 
-    return _kml_document(''.join(placemarks))
+def _kml_job_scope(params):
+    if params.get("admin_scope"):
+        return ADMIN_FULL_SCOPE
+    raw_scope = params.get("accessible_site_ids")
+    return None if raw_scope is None else set(raw_scope)
 
 
 def _run_kml_job(app_obj, job_id, kind, params):
@@ -518,73 +1063,29 @@ def _run_kml_job(app_obj, job_id, kind, params):
     _set_kml_job(job_id, status="processing", progress=2, message="Starting KML export...", started_at=started_at.isoformat())
     try:
         with app_obj.app_context():
-            region_id = _safe_int(params.get("region_id"))
-            wilaya_id = _safe_int(params.get("wilaya_id"))
-            commune_id = _safe_int(params.get("commune_id"))
-            site_id = _safe_int(params.get("site_id"))
-            raw_scope = params.get("accessible_site_ids")
-            force_admin_scope = bool(params.get("admin_scope", False))
-            if force_admin_scope:
-                accessible_site_ids = ADMIN_FULL_SCOPE
-            elif raw_scope is None:
-                accessible_site_ids = None
-            else:
-                accessible_site_ids = set(raw_scope)
-            if kind == "sites":
-                icon_href = _site_icon_href(params.get("site_icon"))
-                icon_scale = _clamp(float(params.get("site_icon_scale", 1.2)), 0.8, 1.8)
-                content = _build_sites_kml_content(
-                    icon_href=icon_href,
-                    icon_scale=icon_scale,
-                    region_id=region_id,
-                    wilaya_id=wilaya_id,
-                    commune_id=commune_id,
-                    site_id=site_id,
-                    accessible_site_ids=accessible_site_ids,
-                    progress_cb=lambda done, total, msg: _set_kml_job(
-                        job_id,
-                        progress=int((done * 100 / max(total, 1))),
-                        processed=int(done),
-                        total=int(total),
-                        message=msg,
-                    ),
-                )
-                download_name = "sites_export.kml"
-            else:
-                beam_length_km = _clamp(float(params.get("beam_length_km", 0.8)), 0.1, 10.0)
-                beam_width_deg = _clamp(float(params.get("beam_width_deg", 40.0)), 5.0, 180.0)
-                beam_rgb = _parse_hex_color(params.get("beam_color", "#0055ff"))
-                line_color = _kml_color_from_rgb(beam_rgb, "ff")
-                poly_color = _kml_color_from_rgb(beam_rgb, "66")
-                content = _build_sectors_kml_content(
-                    beam_length_km=beam_length_km,
-                    beam_width_deg=beam_width_deg,
-                    line_color=line_color,
-                    poly_color=poly_color,
-                    region_id=region_id,
-                    wilaya_id=wilaya_id,
-                    commune_id=commune_id,
-                    site_id=site_id,
-                    accessible_site_ids=accessible_site_ids,
-                    progress_cb=lambda done, total, msg: _set_kml_job(
-                        job_id,
-                        progress=int((done * 100 / max(total, 1))),
-                        processed=int(done),
-                        total=int(total),
-                        message=msg,
-                    ),
-                )
-                download_name = "sectors_export.kml"
-
-            out_path = _kml_exports_dir() / f"kml_{job_id}.kml"
-            out_path.write_text(content, encoding="utf-8")
+            export_format = _kml_export_format(params.get("format"))
+            out_path = _build_kml_artifact(
+                app_obj,
+                kind,
+                _kml_export_options(kind, params),
+                _kml_job_scope(params),
+                export_format,
+                _kml_cache_path(params.get("cache_key") or job_id, export_format),
+                progress_cb=lambda done, total, msg: _set_kml_job(
+                    job_id,
+                    progress=int((done * 100 / max(total, 1))),
+                    processed=int(done),
+                    total=int(total),
+                    message=msg,
+                ),
+            )
             _set_kml_job(
                 job_id,
                 status="completed",
                 progress=100,
-                message="KML export completed.",
+                message=f"{_kml_file_extension(export_format).upper()} export completed.",
                 file_path=str(out_path),
-                download_name=download_name,
+                download_name=f"{kind}_export.{_kml_file_extension(export_format)}",
                 finished_at=datetime.utcnow().isoformat(),
             )
     except Exception as exc:
@@ -598,61 +1099,65 @@ def _run_kml_job(app_obj, job_id, kind, params):
         )
 
 
-@doc_bp.route('/export_kml/sites/start', methods=['POST'])
-@login_required
-@csrf_protect
-def start_kml_sites_export():
+def _start_kml_export(kind, params):
     admin_scope = bool(is_admin_user() or getattr(current_user, "is_admin_user", False) or getattr(current_user, "is_admin", False))
     accessible_sites = None if admin_scope else get_accessible_site_ids()
-    job_id = uuid.uuid4().hex
-    params = {
-        "site_icon": request.form.get("site_icon", "tower"),
-        "site_icon_scale": request.form.get("site_icon_scale", "1.2"),
+    params.update({
         "region_id": request.form.get("region_id", ""),
         "wilaya_id": request.form.get("wilaya_id", ""),
         "commune_id": request.form.get("commune_id", ""),
         "site_id": request.form.get("site_id", ""),
+        "format": _kml_export_format(request.form.get("format")),
         "admin_scope": admin_scope,
         "accessible_site_ids": None if accessible_sites is None else list(accessible_sites),
-    }
-    _set_kml_job(job_id, status="queued", progress=0, message="Sites KML queued...")
-    app_obj = current_app._get_current_object()
-    threading.Thread(target=_run_kml_job, args=(app_obj, job_id, "sites", params), daemon=True).start()
+    })
+    job_id = uuid.uuid4().hex
+    export_format = params["format"]
+    params["cache_key"] = _kml_cache_key(kind, export_format, _kml_export_options(kind, params), _kml_job_scope(params))
+    cached = _cached_kml_artifact(params["cache_key"], export_format)
+    if cached is not None:
+        _set_kml_job(
+            job_id,
+            status="completed",
+            progress=100,
+            message=f"{_kml_file_extension(export_format).upper()} served from export cache.",
+            file_path=str(cached),
+            download_name=f"{kind}_export.{_kml_file_extension(export_format)}",
+            finished_at=datetime.utcnow().isoformat(),
+        )
+    else:
+        label = "Sites" if kind == "sites" else "Sectors"
+        _set_kml_job(job_id, status="queued", progress=0, message=f"{label} KML queued...")
+        app_obj = current_app._get_current_object()
+        threading.Thread(target=_run_kml_job, args=(app_obj, job_id, kind, params), daemon=True).start()
     return jsonify({
         "success": True,
         "job_id": job_id,
+        "cached": cached is not None,
         "status_url": url_for("doc_bp.kml_job_status", job_id=job_id),
         "download_url": url_for("doc_bp.kml_job_download", job_id=job_id),
     }), 202
 
 
+@doc_bp.route('/export_kml/sites/start', methods=['POST'])
+@login_required
+@csrf_protect
+def start_kml_sites_export():
+    return _start_kml_export("sites", {
+        "site_icon": request.form.get("site_icon", "tower"),
+        "site_icon_scale": request.form.get("site_icon_scale", "1.2"),
+    })
+
+
 @doc_bp.route('/export_kml/sectors/start', methods=['POST'])
 @login_required
 @csrf_protect
 def start_kml_sectors_export():
-    admin_scope = bool(is_admin_user() or getattr(current_user, "is_admin_user", False) or getattr(current_user, "is_admin", False))
-    accessible_sites = None if admin_scope else get_accessible_site_ids()
-    job_id = uuid.uuid4().hex
-    params = {
+    return _start_kml_export("sectors", {
         "beam_length_km": request.form.get("beam_length_km", "0.8"),
         "beam_width_deg": request.form.get("beam_width_deg", "40"),
         "beam_color": request.form.get("beam_color", "#0055ff"),
-        "region_id": request.form.get("region_id", ""),
-        "wilaya_id": request.form.get("wilaya_id", ""),
-        "commune_id": request.form.get("commune_id", ""),
-        "site_id": request.form.get("site_id", ""),
-        "admin_scope": admin_scope,
-        "accessible_site_ids": None if accessible_sites is None else list(accessible_sites),
-    }
-    _set_kml_job(job_id, status="queued", progress=0, message="Sectors KML queued...")
-    app_obj = current_app._get_current_object()
-    threading.Thread(target=_run_kml_job, args=(app_obj, job_id, "sectors", params), daemon=True).start()
-    return jsonify({
-        "success": True,
-        "job_id": job_id,
-        "status_url": url_for("doc_bp.kml_job_status", job_id=job_id),
-        "download_url": url_for("doc_bp.kml_job_download", job_id=job_id),
-    }), 202
+    })
 
 
 @doc_bp.route('/export_kml/status/<job_id>', methods=['GET'])
@@ -682,17 +1187,18 @@ def kml_job_download(job_id):
     if not file_path:
         return jsonify({"success": False, "message": "KML file not ready."}), 404
     p = Path(file_path)
-    if not p.exists():
+    handle = _open_kml_artifact(p)
+    if handle is None:
         return jsonify({"success": False, "message": "KML file missing."}), 404
     return send_file(
-        str(p),
+        handle,
         as_attachment=True,
         download_name=job.get("download_name", p.name),
-        mimetype='application/vnd.google-earth.kml+xml',
+        mimetype=KMZ_MIMETYPE if p.suffix == ".kmz" else KML_MIMETYPE,
     )
 
 
-def _build_sector_placemark_with_options(sector, beam_length_km, beam_width_deg, line_color, poly_color, preloaded_cells=None):
+def _build_sector_placemark_with_options(sector, beam_length_km, beam_width_deg, line_color, poly_color, preloaded_cells=None, beam_polygon=None):
     site = sector.site
     if not site or site.longitude is None or site.latitude is None:
         return ''
@@ -708,15 +1214,15 @@ def _build_sector_placemark_with_options(sector, beam_length_km, beam_width_deg,
     frequencies_text = " / ".join(frequencies) if frequencies else "N/A"
     commune_name = site.commune.name if site.commune else ""
 
-    computed_beamwidth = _sector_beamwidth(sector, cells)
-    effective_beamwidth = beam_width_deg if beam_width_deg else computed_beamwidth
-    beam_polygon = _sector_beam_polygon(
-        sector,
-        site,
-        beamwidth=effective_beamwidth,
-        radius_km=beam_length_km,
-        points=20,
-    )
+    if beam_polygon is None:
+        effective_beamwidth = beam_width_deg if beam_width_deg else _sector_beamwidth(sector, cells)
+        beam_polygon = _sector_beam_polygon(
+            sector,
+            site,
+            beamwidth=effective_beamwidth,
+            radius_km=beam_length_km,
+            points=20,
+        )
 
     description_html = (
         "<![CDATA["
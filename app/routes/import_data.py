@@ -1,7 +1,7 @@
 from flask import Blueprint, request, redirect, url_for, flash, jsonify, current_app, send_file
 import pandas as pd 
 import io 
-from sqlalchemy import select 
+from sqlalchemy import and_, func, select 
 from datetime import datetime
 import numpy as np 
 import logging
@@ -16,11 +16,15 @@ import time
 from urllib.parse import urlencode, urlparse
 from urllib.request import urlopen
 from app.security import append_audit_event, login_required, csrf_protect, admin_required
+from app.services.bulk_load import copy_rows, model_row
+from app.services.data_version import flag_bulk_write
+from app.services.inventory_stats import flag_copied_rows
+from app.services.write_coordinator import bulk_writer, claim_write_slot, commit_slice
 # --- IMPORTS CRITIQUES : Ajustez si nécessaire ---
 try:
     from app import db 
     # Ajout du modèle Cell
-    from app.models import Region, Wilaya, Commune, Site, Antenna, Supplier, Sector, Mapping, Cell, Cell2G, Cell3G, Cell4G, Cell5G
+    from app.models import Region, Wilaya, Commune, Site, Antenna, Supplier, Sector, Mapping, Cell, Cell2G, Cell3G, Cell4G, Cell5G, derive_cell_codes
 except ImportError:
     # Définir des classes factices si l'environnement Flask/SQLAlchemy n'est pas complet
     class DummyDB:
@@ -256,12 +260,16 @@ def _run_fpall_job(app, job_id, temp_file_path, original_filename):
             _set_fpall_job(job_id, **kwargs)
 
         with app.app_context():
-            _set_fpall_job(job_id, progress=45, message="Normalizing sheets and validating columns...")
-            success, message, details = process_file_data(
-                _MemoryUpload(original_filename, content),
-                "cells",
-                progress_cb=_progress_update,
-            )
+            def _queued(ahead):
+                _set_fpall_job(job_id, message=f"Waiting for {ahead} write job(s) to finish...")
+
+            with bulk_writer("fpall", on_queued=_queued):
+                _set_fpall_job(job_id, progress=45, message="Normalizing sheets and validating columns...")
+                success, message, details = process_file_data(
+                    _MemoryUpload(original_filename, content),
+                    "cells",
+                    progress_cb=_progress_update,
+                )
             _set_fpall_job(job_id, progress=96, message="Finalizing import report...", eta_seconds=None)
 
             finished_at = datetime.utcnow()
@@ -440,18 +448,10 @@ def resolve_sector_id_for_cell(cellname, technology, frequency, return_reason=Fa
         if not cellname:
             return _ret(None, None, "CELLNAME_OR_SITE_MISSING")
 
-        parts = str(cellname).rsplit('_', 1)
-        if len(parts) != 2:
+        if len(str(cellname).rsplit('_', 1)) != 2:
             return _ret(None, None, "CELLNAME_FORMAT_INVALID")
 
-        raw_site_part = parts[0].strip()
-        cell_code_suffix = parts[1].strip()
-
-        code_site = raw_site_part
-        for i, char in enumerate(raw_site_part):
-            if char.upper() in ['C', 'A', 'O']:
-                code_site = raw_site_part[i:]
-                break
+        code_site, cell_code_suffix = derive_cell_codes(cellname)
     except Exception:
         return _ret(None, None, "CELLNAME_PARSE_ERROR")
 
@@ -489,6 +489,44 @@ def resolve_sector_id_for_cell(cellname, technology, frequency, return_reason=Fa
         logger.debug("Sector resolution exception for cell '%s': %s", cellname, e)
         return _ret(None, None, f"RESOLUTION_EXCEPTION:{type(e).__name__}")
 
+def resolved_sector_statement():
+    """SELECT (cell_id, sector_id) for every cell whose mapping points to an existing sector.
+
+    Set-based twin of resolve_sector_id_for_cell: the latest mapping row per
+    (cell_code, technology) is joined on the indexed Cell.cell_code, then the
+    sector on its unique code "<site_code_hint>_<mapping sector_code>".
+    """
+    latest_mapping = (
+        select(func.max(Mapping.id).label("id"))
+        .group_by(Mapping.cell_code, Mapping.technology)
+        .subquery()
+    )
+    return (
+        select(Cell.id.label("cell_id"), Sector.id.label("sector_id"))
+        .join(Mapping, and_(
+            Mapping.cell_code == Cell.cell_code,
+            Mapping.technology == func.upper(func.trim(Cell.technology)),
+        ))
+        .join(latest_mapping, latest_mapping.c.id == Mapping.id)
+        .join(Sector, Sector.code_sector == Cell.site_code_hint + "_" + Mapping.sector_code)
+    )
+
+def _copy_new_rows(model, objects):
+    """Insert the new transient ``objects`` of an import with COPY (PostgreSQL) or executemany().
+
+    The rows bypass the unit of work, so the write slot, data version and
+    dashboard counters are told about them here.
+    """
+    rows = [model_row(obj) for obj in objects]
+    if not rows:
+        return 0
+    table = model.__table__
+    claim_write_slot(db.session)
+    copy_rows(db.session.connection(), table, rows)
+    flag_bulk_write(db.session, {table.name})
+    flag_copied_rows(db.session, table.name, rows)
+    return len(rows)
+
 # ====================================================================
 # FONCTIONS D'IMPORTATION 
 # ====================================================================
@@ -770,6 +808,8 @@ def import_sites(df):
     altitude_auto_filled = 0
     altitude_lookup_failed = 0
     altitude_cache = {}
+    # New sites are bulk-loaded after the loop (see _copy_new_rows).
+    new_sites = []
     
     required_cols = [SITE_CODE_COL, SITE_NAME_COL, COMMUNE_ID_COL, SUPPLIER_NAME_COL, LATITUDE_COL, LONGITUDE_COL]
     FLOAT_COLS = [LATITUDE_COL, LONGITUDE_COL, ALTITUDE_COL, SUPPORT_HEIGHT_COL]
@@ -886,7 +926,7 @@ def import_sites(df):
                     latitude=float(latitude_value),
                     longitude=float(longitude_value)
                 ) 
-                db.session.add(site_to_save)
+                new_sites.append(site_to_save)
                 added += 1
             
             # 4. Affectation des attributs
@@ -918,6 +958,7 @@ def import_sites(df):
             site_to_save.comments = comments_value
             site_to_save.supplier_id = supplier_id_value
                 
+        _copy_new_rows(Site, new_sites)
         db.session.commit()
         
         # --- CRÉATION DU MESSAGE DE SUCCÈS ---
@@ -950,6 +991,8 @@ def import_sectors(df):
     failed_dependencies = 0 
     row_errors = 0 
     failed_rows = []
+    # New sectors are bulk-loaded after the loop (see _copy_new_rows).
+    new_sectors = []
     
     # Colonnes requises (non nulles dans le modèle ou pour les dépendances)
     required_cols = [SECTOR_CODE_COL, SITE_CODE_COL, AZIMUTH_COL, HBA_COL]
@@ -1075,7 +1118,7 @@ def import_sectors(df):
                     hba=hba_value,
                     site_id=site_id
                 ) 
-                db.session.add(sector_to_save)
+                new_sectors.append(sector_to_save)
                 added += 1
             
             # 3. Affectation des attributs
@@ -1089,6 +1132,7 @@ def import_sectors(df):
             if hasattr(sector_to_save, 'comments'):
                 sector_to_save.comments = comments_value
                 
+        _copy_new_rows(Sector, new_sectors)
         db.session.commit()
         
         # --- CRÉATION DU MESSAGE DE SUCCÈS ---
@@ -1254,7 +1298,30 @@ def import_cells(df, progress_cb=None):
     failed_sector_resolutions = 0
     failed_rows = []
     batch_size = 1000
-    pending_in_batch = 0
+    # Commit every batch_size rows or WRITE_SLICE_MS, whichever comes first, so edits are not held up.
+    pending_slice = commit_slice(max_rows=batch_size)
+    # New cells of the current slice, bulk-loaded with their profile rows at commit time.
+    new_cells = []
+
+    def commit_slice_rows():
+        _copy_new_rows(Cell, new_cells)
+        if new_cells:
+            ids = {}
+            names = [cell.cellname for cell in new_cells]
+            for start in range(0, len(names), 500):
+                ids.update(db.session.execute(
+                    select(Cell.cellname, Cell.id).where(Cell.cellname.in_(names[start:start + 500]))
+                ).all())
+            for profile_model, attr in ((Cell2G, "profile_2g"), (Cell3G, "profile_3g"), (Cell4G, "profile_4g"), (Cell5G, "profile_5g")):
+                profiles = []
+                for cell in new_cells:
+                    profile = getattr(cell, attr)
+                    if profile is not None:
+                        profile.cell_id = ids[cell.cellname]
+                        profiles.append(profile)
+                _copy_new_rows(profile_model, profiles)
+            new_cells.clear()
+        db.session.commit()
 
     def to_int_or_none(value):
         if pd.isna(value) or value is None:
@@ -1380,8 +1447,8 @@ def import_cells(df, progress_cb=None):
                     if existing_cell:
                         cell = existing_cell
                     else:
+                        # Kept out of the session; inserted in bulk by commit_slice_rows().
                         cell = Cell(cellname=cellname)
-                        db.session.add(cell)
 
                     incoming_tech = get_text(row_data, TECHNOLOGY_COL)
                     tech_norm = (incoming_tech or cell.technology or "").strip().upper()
@@ -1493,13 +1560,15 @@ def import_cells(df, progress_cb=None):
                 if row_is_existing:
                     updated += 1
                 else:
+                    new_cells.append(cell)
                     added += 1
-                pending_in_batch += 1
-                if pending_in_batch >= batch_size:
-                    db.session.commit()
-                    pending_in_batch = 0
+                if pending_slice.add():
+                    commit_slice_rows()
+                    pending_slice.reset()
             except Exception as row_exc:
                 db.session.rollback()
+                new_cells.clear()
+                pending_slice.reset()
                 failed_rows.append({
                     "row_number": row_number,
                     "source_sheet": source_sheet,
@@ -1509,7 +1578,7 @@ def import_cells(df, progress_cb=None):
                 })
             emit_progress(processed_rows)
 
-        db.session.commit()
+        commit_slice_rows()
         emit_progress(total_rows, force=True, message="Rows processed. Finalizing import...")
 
         if failed_rows:
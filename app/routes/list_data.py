@@ -2,15 +2,15 @@
 
 from flask import Blueprint, render_template, request, jsonify
 from sqlalchemy import select, or_, asc, desc, cast, String
-from sqlalchemy.orm import joinedload
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import contains_eager, joinedload
 import logging
 from app.security import admin_required, get_accessible_commune_ids, get_accessible_site_ids, login_required
+from app.services.read_session import read_session
 
 # --- IMPORTS CRITIQUES : Ajustez si nécessaire ---
 try:
     from app import db 
-    from app.models import Region, Wilaya, Commune, Site, Antenna, Supplier, Sector, Mapping, Cell
+    from app.models import Region, Wilaya, Commune, Site, Antenna, Supplier, Sector, Mapping, Cell, Cell2G, Cell3G, Cell4G, Cell5G
 except ImportError:
     # Définir des classes factices si l'environnement Flask/SQLAlchemy n'est pas complet
     class DummyDB:
@@ -28,6 +28,10 @@ except ImportError:
     class Sector: pass
     class Mapping: pass
     class Cell: pass
+    class Cell2G: pass
+    class Cell3G: pass
+    class Cell4G: pass
+    class Cell5G: pass
 # --- FIN DES IMPORTS ---
 
 list_bp = Blueprint('list_bp', __name__)
@@ -37,193 +41,218 @@ logger = logging.getLogger(__name__)
 # FONCTIONS D'AFFICHAGE (LISTING)
 # ====================================================================
 
+# Rows per fetch when exports walk a listing through a server-side cursor.
+EXPORT_FETCH_BATCH = 2000
+
+
+def _search_clause(search, columns):
+    """OR of case-insensitive substring matches of ``search`` over ``columns`` (as text), or None."""
+    needle = (search or '').strip()
+    if not needle:
+        return None
+    escaped = needle.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    like = f"%{escaped}%"
+    return or_(*[cast(column, String).ilike(like, escape='\\') for column in columns])
+
+
+def _sites_statement(dq_filter='', search='', accessible_sites=None):
+    statement = select(
+        Site,
+        Commune.name.label('commune_name'),
+        Wilaya.name.label('wilaya_name'),
+        Region.name.label('region_name'),
+        Supplier.name.label('supplier_name')
+    ) \
+    .join(Commune, Site.commune_id == Commune.id) \
+    .join(Wilaya, Commune.wilaya_id == Wilaya.id) \
+    .join(Region, Wilaya.region_id == Region.id) \
+    .outerjoin(Supplier, Site.supplier_id == Supplier.id) \
+    .order_by(Site.code_site)
+
+    if dq_filter == 'without_sectors':
+        # Keep only correction scope: sites that still have no sector linked.
+        statement = (
+            statement
+            .outerjoin(Sector, Sector.site_id == Site.id)
+            .filter(Sector.id.is_(None))
+        )
+    elif dq_filter == 'without_vendor':
+        statement = statement.filter(Site.supplier_id.is_(None))
+
+    if accessible_sites is not None:
+        statement = statement.filter(Site.id.in_(list(accessible_sites)))
+
+    clause = _search_clause(search, [
+        Site.id, Site.code_site, Site.name, Site.latitude, Site.longitude, Site.altitude,
+        Site.support_nature, Site.support_type, Site.support_height, Site.status,
+        Supplier.name, Commune.name, Wilaya.name, Region.name, Site.address, Site.comments,
+    ])
+    if clause is not None:
+        statement = statement.filter(clause)
+    return statement
+
+
+def _site_row(site, commune_name, wilaya_name, region_name, supplier_name):
+    return {
+        'id': site.id,
+        'code_site': site.code_site,
+        'name': site.name,
+        'latitude': site.latitude,
+        'longitude': site.longitude,
+        'altitude': site.altitude,
+        'support_nature': site.support_nature,
+        'support_type': site.support_type,
+        'support_height': site.support_height,
+        'status': site.status,
+        'supplier_name': supplier_name,
+        'commune_name': commune_name,
+        'wilaya_name': wilaya_name,
+        'region_name': region_name,
+        'address': site.address,
+        'comments': site.comments,
+    }
+
+
+def iter_sites(dq_filter='', search=''):
+    """Site rows filtered and searched in SQL, fetched in batches through a streaming cursor."""
+    accessible_sites = get_accessible_site_ids()
+    if accessible_sites is not None and not accessible_sites:
+        return
+    statement = _sites_statement(dq_filter, search, accessible_sites)
+    with read_session() as session:
+        for row in session.execute(statement.execution_options(yield_per=EXPORT_FETCH_BATCH, stream_results=True)):
+            yield _site_row(*row)
+
+
 def list_sites(dq_filter=''):
     """
     Liste tous les sites avec les informations associées (Commune, Wilaya, Region, Supplier).
     """
     try:
-        # Construction de la requête avec les jointures nécessaires (Commune, Wilaya, Region, Supplier)
-        statement = select(
-            Site,
-            Commune.name.label('commune_name'),
-            Wilaya.name.label('wilaya_name'),
-            Region.name.label('region_name'),
-            Supplier.name.label('supplier_name')
-        ) \
-        .join(Commune, Site.commune_id == Commune.id) \
-        .join(Wilaya, Commune.wilaya_id == Wilaya.id) \
-        .join(Region, Wilaya.region_id == Region.id) \
-        .outerjoin(Supplier, Site.supplier_id == Supplier.id) \
-        .order_by(Site.code_site)
-
-        if dq_filter == 'without_sectors':
-            # Keep only correction scope: sites that still have no sector linked.
-            statement = (
-                statement
-                .outerjoin(Sector, Sector.site_id == Site.id)
-                .filter(Sector.id.is_(None))
-            )
-        elif dq_filter == 'without_vendor':
-            statement = statement.filter(Site.supplier_id.is_(None))
-        
-        accessible_sites = get_accessible_site_ids()
-        if accessible_sites is not None:
-            if not accessible_sites:
-                return []
-            statement = statement.filter(Site.id.in_(list(accessible_sites)))
-
-        sites_data = db.session.execute(statement).all()
-        
-        sites = []
-        for site, commune_name, wilaya_name, region_name, supplier_name in sites_data:
-            sites.append({
-                'id': site.id,
-                'code_site': site.code_site,
-                'name': site.name,
-                'latitude': site.latitude,
-                'longitude': site.longitude,
-                'altitude': site.altitude,
-                'support_nature': site.support_nature,
-                'support_type': site.support_type,
-                'support_height': site.support_height,
-                'status': site.status,
-                'supplier_name': supplier_name,
-                'commune_name': commune_name,
-                'wilaya_name': wilaya_name,
-                'region_name': region_name,
-                'address': site.address,
-                'comments': site.comments,
-            })
-        return sites
+        return list(iter_sites(dq_filter=dq_filter))
     except Exception:
         logger.exception("Erreur lors de la récupération des sites")
         return []
 
-def list_sectors(without_cells=False):
-    """
-    Liste tous les secteurs avec le Code Site associé.
-    """
-    try:
-        statement = select(
-            Sector,
-            Site.code_site.label('site_code')
-        ).join(Site, Sector.site_id == Site.id).order_by(Sector.code_sector)
-        if without_cells:
-            statement = (
-                statement
-                .outerjoin(Cell, Cell.sector_id == Sector.id)
-                .filter(Cell.id.is_(None))
-            )
 
-        accessible_sites = get_accessible_site_ids()
-        if accessible_sites is not None:
-            if not accessible_sites:
-                return []
-            statement = statement.filter(Site.id.in_(list(accessible_sites)))
-        
-        sectors_data = db.session.execute(statement).all()
-        
-        sectors = []
-        for sector, site_code in sectors_data:
-            sectors.append({
+def _sectors_statement(without_cells=False, search='', accessible_sites=None):
+    statement = select(
+        Sector,
+        Site.code_site.label('site_code')
+    ).join(Site, Sector.site_id == Site.id).order_by(Sector.code_sector)
+    if without_cells:
+        statement = (
+            statement
+            .outerjoin(Cell, Cell.sector_id == Sector.id)
+            .filter(Cell.id.is_(None))
+        )
+    if accessible_sites is not None:
+        statement = statement.filter(Site.id.in_(list(accessible_sites)))
+
+    clause = _search_clause(search, [
+        Sector.id, Sector.code_sector, Sector.azimuth, Sector.hba, Sector.coverage_goal, Site.code_site,
+    ])
+    if clause is not None:
+        statement = statement.filter(clause)
+    return statement
+
+
+def iter_sectors(without_cells=False, search=''):
+    accessible_sites = get_accessible_site_ids()
+    if accessible_sites is not None and not accessible_sites:
+        return
+    statement = _sectors_statement(without_cells, search, accessible_sites)
+    with read_session() as session:
+        for sector, site_code in session.execute(statement.execution_options(yield_per=EXPORT_FETCH_BATCH, stream_results=True)):
+            yield {
                 'id': sector.id,
                 'code_sector': sector.code_sector,
                 'azimuth': sector.azimuth,
                 'hba': sector.hba,
                 'coverage_goal': sector.coverage_goal,
                 'site_code': site_code
-            })
-        return sectors
-    except Exception:
-        logger.exception("Erreur secteurs")
-        return []
+            }
 
-def list_cells():
+
+def list_sectors(without_cells=False):
     """
-    Liste toutes les cellules avec les infos Antenna et Sector.
+    Liste tous les secteurs avec le Code Site associé.
     """
     try:
-        # Eager-load related objects to avoid N+1 queries on tech profiles.
-        query = (
-            db.session.query(Cell)
-            .options(
-                joinedload(Cell.antenna),
-                joinedload(Cell.sector),
-                joinedload(Cell.profile_2g),
-                joinedload(Cell.profile_3g),
-                joinedload(Cell.profile_4g),
-                joinedload(Cell.profile_5g),
-            )
-        )
+        return list(iter_sectors(without_cells=without_cells))
+    except Exception:
+        logger.exception("Erreur secteurs")
+        return []
 
-        accessible_sites = get_accessible_site_ids()
-        if accessible_sites is not None:
-            if not accessible_sites:
-                return []
-            query = (
-                query
-                .outerjoin(Sector, Cell.sector_id == Sector.id)
-                .outerjoin(Site, Sector.site_id == Site.id)
-                .filter(Site.id.in_(list(accessible_sites)))
-            )
-
-        results = query.order_by(Cell.cellname.asc()).all()
-
-        data = []
-        for cell in results:
-            ant_model = cell.antenna.model if cell.antenna else None
-            sec_name = cell.sector.code_sector if cell.sector else None
-            tech = (cell.technology or "").strip().upper()
-            tech_settings = "N/A"
-            if tech == "2G" and cell.profile_2g:
-                tech_settings = (
-                    f"BSC={cell.profile_2g.bsc or '-'} / "
-                    f"LAC={cell.profile_2g.lac or '-'} / "
-                    f"RAC={cell.profile_2g.rac or '-'} / "
-                    f"BSIC={cell.profile_2g.bsic or '-'} / "
-                    f"BCCH={cell.profile_2g.bcch or '-'} / "
-                    f"CI={cell.profile_2g.ci or '-'}"
-                )
-            elif tech == "3G" and cell.profile_3g:
-                tech_settings = (
-                    f"RNC={cell.profile_3g.rnc or '-'} / "
-                    f"LAC={cell.profile_3g.lac or '-'} / "
-                    f"RAC={cell.profile_3g.rac or '-'} / "
-                    f"PSC={cell.profile_3g.psc or '-'} / "
-                    f"DLARFCN={cell.profile_3g.dlarfcn or '-'} / "
-                    f"CI={cell.profile_3g.ci or '-'}"
-                )
-            elif tech == "4G" and cell.profile_4g:
-                tech_settings = (
-                    f"eNodeB={cell.profile_4g.enodeb or '-'} / "
-                    f"TAC={cell.profile_4g.tac or '-'} / "
-                    f"RSI={cell.profile_4g.rsi or '-'} / "
-                    f"PCI={cell.profile_4g.pci or '-'} / "
-                    f"EARFCN={cell.profile_4g.earfcn or '-'} / "
-                    f"CI={cell.profile_4g.ci or '-'}"
-                )
-            elif tech == "5G" and cell.profile_5g:
-                tech_settings = (
-                    f"GNODEB={cell.profile_5g.gnodeb or '-'} / "
-                    f"LAC={cell.profile_5g.lac or '-'} / "
-                    f"RSI={cell.profile_5g.rsi or '-'} / "
-                    f"PCI={cell.profile_5g.pci or '-'} / "
-                    f"ARFCN={cell.profile_5g.arfcn or '-'} / "
-                    f"CI={cell.profile_5g.ci or '-'}"
-                )
 
-            data.append({
+def _cells_statement(dq_filter='', search='', accessible_sites=None):
+    # Explicit outer joins (loaded through contains_eager) so search and scope can filter on
+    # antenna, sector and profile columns in the same statement.
+    statement = (
+        select(Cell)
+        .outerjoin(Antenna, Cell.antenna_id == Antenna.id)
+        .outerjoin(Sector, Cell.sector_id == Sector.id)
+        .outerjoin(Site, Sector.site_id == Site.id)
+        .outerjoin(Cell2G, Cell2G.cell_id == Cell.id)
+        .outerjoin(Cell3G, Cell3G.cell_id == Cell.id)
+        .outerjoin(Cell4G, Cell4G.cell_id == Cell.id)
+        .outerjoin(Cell5G, Cell5G.cell_id == Cell.id)
+        .options(
+            contains_eager(Cell.antenna),
+            contains_eager(Cell.sector),
+            contains_eager(Cell.profile_2g),
+            contains_eager(Cell.profile_3g),
+            contains_eager(Cell.profile_4g),
+            contains_eager(Cell.profile_5g),
+        )
+        .order_by(Cell.cellname.asc())
+    )
+    if accessible_sites is not None:
+        statement = statement.filter(Site.id.in_(list(accessible_sites)))
+    if dq_filter == 'without_sector':
+        statement = statement.filter(Cell.sector_id.is_(None))
+    elif dq_filter == 'without_antenna':
+        statement = statement.filter(Cell.antenna_id.is_(None))
+
+    clause = _search_clause(search, [
+        Cell.id, Cell.cellname, Cell.technology, Cell.frequency, Antenna.model, Sector.code_sector,
+        Cell.tilt_mechanical, Cell.tilt_electrical,
+        Cell2G.bsc, Cell2G.lac, Cell2G.rac, Cell2G.bsic, Cell2G.bcch, Cell2G.ci,
+        Cell3G.rnc, Cell3G.lac, Cell3G.rac, Cell3G.psc, Cell3G.dlarfcn, Cell3G.ci,
+        Cell4G.enodeb, Cell4G.tac, Cell4G.rsi, Cell4G.pci, Cell4G.earfcn, Cell4G.ci,
+        Cell5G.gnodeb, Cell5G.lac, Cell5G.rsi, Cell5G.pci, Cell5G.arfcn, Cell5G.ci,
+    ])
+    if clause is not None:
+        statement = statement.filter(clause)
+    return statement
+
+
+def iter_cells(dq_filter='', search=''):
+    accessible_sites = get_accessible_site_ids()
+    if accessible_sites is not None and not accessible_sites:
+        return
+    statement = _cells_statement(dq_filter, search, accessible_sites)
+    with read_session() as session:
+        for cell in session.scalars(statement.execution_options(yield_per=EXPORT_FETCH_BATCH, stream_results=True)):
+            yield {
                 'id': cell.id,
                 'cellname': cell.cellname,
                 'technology': cell.technology,
                 'frequency': cell.frequency,
-                'antenna': ant_model or 'N/A',
-                'sector': sec_name or 'N/A',
+                'antenna': (cell.antenna.model if cell.antenna else None) or 'N/A',
+                'sector': (cell.sector.code_sector if cell.sector else None) or 'N/A',
                 'tilt_mech': cell.tilt_mechanical,
                 'tilt_elec': cell.tilt_electrical,
-                'tech_settings': tech_settings,
-            })
-        return data
+                'tech_settings': _build_cell_tech_settings(cell),
+            }
+
+
+def list_cells():
+    """
+    Liste toutes les cellules avec les infos Antenna et Sector.
+    """
+    try:
+        return list(iter_cells())
     except Exception:
         logger.exception("Erreur list_cells")
         return []
@@ -417,6 +446,36 @@ def _build_cell_tech_settings(cell):
     return 'N/A'
 
 
+def cells_query(accessible_sites=None, dq_filter='', session=None):
+    """Cells listing query (before search and paging) for a site scope (None = all) and DQ filter."""
+    query = (
+        (session or db.session).query(Cell)
+        .options(
+            joinedload(Cell.antenna),
+            joinedload(Cell.sector),
+            joinedload(Cell.profile_2g),
+            joinedload(Cell.profile_3g),
+            joinedload(Cell.profile_4g),
+            joinedload(Cell.profile_5g),
+        )
+        .outerjoin(Antenna, Cell.antenna_id == Antenna.id)
+    )
+    if accessible_sites is not None:
+        # Inner joins (the scope filter drops sectorless cells anyway) let the plan start from the sites.
+        query = (
+            query.join(Sector, Cell.sector_id == Sector.id)
+            .join(Site, Sector.site_id == Site.id)
+            .filter(Site.id.in_(list(accessible_sites)))
+        )
+    else:
+        query = query.outerjoin(Sector, Cell.sector_id == Sector.id).outerjoin(Site, Sector.site_id == Site.id)
+    if dq_filter == 'without_sector':
+        query = query.filter(Cell.sector_id.is_(None))
+    elif dq_filter == 'without_antenna':
+        query = query.filter(Cell.antenna_id.is_(None))
+    return query
+
+
 @list_bp.route('/cells/data', methods=['GET'])
 @login_required
 def cells_data():
@@ -430,78 +489,58 @@ def cells_data():
         order_col = int(request.args.get('order[0][column]', 2))
         order_dir = (request.args.get('order[0][dir]', 'asc') or 'asc').lower()
 
-        query = (
-            db.session.query(Cell)
-            .options(
-                joinedload(Cell.antenna),
-                joinedload(Cell.sector),
-                joinedload(Cell.profile_2g),
-                joinedload(Cell.profile_3g),
-                joinedload(Cell.profile_4g),
-                joinedload(Cell.profile_5g),
-            )
-            .outerjoin(Antenna, Cell.antenna_id == Antenna.id)
-            .outerjoin(Sector, Cell.sector_id == Sector.id)
-            .outerjoin(Site, Sector.site_id == Site.id)
-        )
-
         accessible_sites = get_accessible_site_ids()
-        if accessible_sites is not None:
-            if not accessible_sites:
-                return jsonify({'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': []})
-            query = query.filter(Site.id.in_(list(accessible_sites)))
-
-        if dq_filter == 'without_sector':
-            query = query.filter(Cell.sector_id.is_(None))
-        elif dq_filter == 'without_antenna':
-            query = query.filter(Cell.antenna_id.is_(None))
-
-        records_total = query.count()
-
-        if search_value:
-            like = f"%{search_value}%"
-            query = query.filter(
-                or_(
-                    cast(Cell.id, String).ilike(like),
-                    Cell.cellname.ilike(like),
-                    Cell.technology.ilike(like),
-                    Cell.frequency.ilike(like),
-                    Antenna.model.ilike(like),
-                    Sector.code_sector.ilike(like),
+        if accessible_sites is not None and not accessible_sites:
+            return jsonify({'draw': draw, 'recordsTotal': 0, 'recordsFiltered': 0, 'data': []})
+        with read_session() as session:
+            query = cells_query(accessible_sites, dq_filter, session=session)
+
+            records_total = query.count()
+
+            if search_value:
+                like = f"%{search_value}%"
+                query = query.filter(
+                    or_(
+                        cast(Cell.id, String).ilike(like),
+                        Cell.cellname.ilike(like),
+                        Cell.technology.ilike(like),
+                        Cell.frequency.ilike(like),
+                        Antenna.model.ilike(like),
+                        Sector.code_sector.ilike(like),
+                    )
                 )
-            )
-
-        records_filtered = query.count()
-
-        order_map = {
-            1: Cell.id,
-            2: Cell.cellname,
-            3: Cell.technology,
-            4: Cell.frequency,
-            5: Antenna.model,
-            6: Sector.code_sector,
-            7: Cell.tilt_mechanical,
-            8: Cell.tilt_electrical,
-        }
-        order_expr = order_map.get(order_col, Cell.cellname)
-        query = query.order_by(desc(order_expr) if order_dir == 'desc' else asc(order_expr))
-
-        rows = query.offset(start).limit(length).all()
-
-        data = []
-        for cell in rows:
-            data.append([
-                '',  # Placeholder for checkbox column (DataTables col 0)
-                str(cell.id),
-                cell.cellname or '',
-                cell.technology or '',
-                cell.frequency or '',
-                (cell.antenna.model if cell.antenna else 'N/A'),
-                (cell.sector.code_sector if cell.sector else 'N/A'),
-                '' if cell.tilt_mechanical is None else str(cell.tilt_mechanical),
-                '' if cell.tilt_electrical is None else str(cell.tilt_electrical),
-                _build_cell_tech_settings(cell),
-            ])
+
+            records_filtered = query.count()
+
+            order_map = {
+                1: Cell.id,
+                2: Cell.cellname,
+                3: Cell.technology,
+                4: Cell.frequency,
+                5: Antenna.model,
+                6: Sector.code_sector,
+                7: Cell.tilt_mechanical,
+                8: Cell.tilt_electrical,
+            }
+            order_expr = order_map.get(order_col, Cell.cellname)
+            query = query.order_by(desc(order_expr) if order_dir == 'desc' else asc(order_expr))
+
+            rows = query.offset(start).limit(length).all()
+
+            data = []
+            for cell in rows:
+                data.append([
+                    '',  # Placeholder for checkbox column (DataTables col 0)
+                    str(cell.id),
+                    cell.cellname or '',
+                    cell.technology or '',
+                    cell.frequency or '',
+                    (cell.antenna.model if cell.antenna else 'N/A'),
+                    (cell.sector.code_sector if cell.sector else 'N/A'),
+                    '' if cell.tilt_mechanical is None else str(cell.tilt_mechanical),
+                    '' if cell.tilt_electrical is None else str(cell.tilt_electrical),
+                    _build_cell_tech_settings(cell),
+                ])
 
         return jsonify({'draw': draw, 'recordsTotal': records_total, 'recordsFiltered': records_filtered, 'data': data})
     except Exception:
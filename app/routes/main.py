@@ -1,31 +1,60 @@
 ﻿import io
+import os
 import re
 import csv
 import math
 import json
+import logging
+import tempfile
 import threading
 import uuid
 from datetime import datetime
+from pathlib import Path
 from urllib.parse import urlencode
 from urllib.request import urlopen
 
 from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, send_file, jsonify
 from flask_login import current_user
 from openpyxl import Workbook, load_workbook
-from sqlalchemy import func, or_
+from sqlalchemy import case, func, or_, select, update
 from sqlalchemy.orm import joinedload
 
 from app import db
 from app.models import Region, Wilaya, Commune, Site, Antenna, Supplier, Sector, Mapping, Cell, Cell2G, Cell3G, Cell4G
-from app.security import admin_required, append_audit_event, login_required, csrf_protect, get_accessible_site_ids, is_admin_user
+from app.security import admin_required, append_audit_event, login_required, csrf_protect, get_accessible_site_ids, is_admin_user, site_scope_fingerprint
 from app.ran_reference import build_ran_reference_map
+from app.services.columnar_export import COLUMNAR_ADMIN_ONLY, COLUMNAR_ENTITIES, COLUMNAR_FORMATS, write_columnar_inventory, write_columnar_zip
+from app.services.dashboard_cache import get_dashboard_cache
+from app.services.data_version import INVENTORY_SCOPE, STATS_SCOPE, get_data_versions
+from app.services.excel_export import (
+    StreamingXlsxWriter,
+    prune_old_exports,
+    send_streaming_workbook,
+    send_temporary_file,
+    send_xlsx_file,
+)
+from app.services.inventory_stats import (
+    CUBE_DQ_FLAGS,
+    CUBE_TECHS,
+    DQ_FLAG_SEPARATOR,
+    ensure_inventory_stats,
+    load_inventory_stats,
+    split_cube_key,
+    start_stats_reconciler,
+)
+from app.services.name_staging import staged_names
+from app.services.read_session import read_session
+from app.services.write_coordinator import bulk_writer, commit_slice
 
 main_bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
 _cell_sector_sync_jobs = {}
 _cell_sector_sync_lock = threading.Lock()
 _site_altitude_sync_jobs = {}
 _site_altitude_sync_lock = threading.Lock()
+_cell_export_jobs = {}
+_cell_export_jobs_lock = threading.Lock()
 
 
 def _haversine_km(lat1, lon1, lat2, lon2):
@@ -247,6 +276,11 @@ ALLPLAN_HEADERS = {
     ],
 }
 
+# Rows fetched per round trip when walking a staged cell list.
+EXPORT_FETCH_BATCH = 1000
+
+EXPORT_NOT_FOUND_HEADERS = ["CELLNAME", "TECHNOLOGY", "ISSUE", "DETAIL"]
+
 LBS_HEADERS = {
     "2G": [
         "CID", "Site Name", "CellName", "Longitude", "Latitude", "AntennaType", "MaxCellRadius",
@@ -269,22 +303,26 @@ LBS_HEADERS = {
 }
 
 def get_stats():
-    return {
-        'total_regions': Region.query.count(),
-        'total_wilayas': Wilaya.query.count(),
-        'total_communes': Commune.query.count(),
-        'total_suppliers': Supplier.query.count(),
-        'total_antennas': Antenna.query.count(),
-        'total_cell_id_mapping': Mapping.query.count(),
-        'total_cells': Cell.query.count(),
-        'total_sectors': Sector.query.count(),
-        'total_sites': Site.query.count(),
-    }
+    rows, global_rows = load_inventory_stats()
+    return _global_table_stats(rows, global_rows)
 
 
-def _normalize_tech_for_dashboard(value):
-    tech = _normalize_tech(value)
-    return tech if tech else "Other"
+def _global_table_stats(rows, global_rows):
+    totals = {"sites": 0, "cube_sectors": 0, "cube_cells": 0}
+    for (_commune, metric, key), value in rows.items():
+        if metric == "sites" or metric == "cube_cells" or (metric == "cube_sectors" and split_cube_key(key)[2] == ""):
+            totals[metric] += value
+    return {
+        'total_regions': global_rows.get(("table_rows", "region"), 0),
+        'total_wilayas': global_rows.get(("table_rows", "wilaya"), 0),
+        'total_communes': global_rows.get(("table_rows", "commune"), 0),
+        'total_suppliers': global_rows.get(("table_rows", "supplier"), 0),
+        'total_antennas': global_rows.get(("table_rows", "antenna"), 0),
+        'total_cell_id_mapping': global_rows.get(("table_rows", "mapping"), 0),
+        'total_cells': totals["cube_cells"] + global_rows.get(("cells_without_sector", ""), 0),
+        'total_sectors': totals["cube_sectors"],
+        'total_sites': totals["sites"],
+    }
 
 
 def _dashboard_scope_badge():
@@ -308,75 +346,157 @@ def _dashboard_scope_badge():
     return f"Scoped to: Regions {region_count} | Wilayas {wilaya_count} | Sites {site_count}"
 
 
-def get_dashboard_data():
-    global_stats = get_stats()
-
-    accessible_sites = get_accessible_site_ids()
-
-    site_base_query = Site.query
-    if accessible_sites is not None:
-        if not accessible_sites:
-            site_base_query = site_base_query.filter(False)
-        else:
-            site_base_query = site_base_query.filter(Site.id.in_(list(accessible_sites)))
+def _top_counts(counts, limit=8):
+    top = sorted(((name, count) for name, count in counts.items() if count), key=lambda item: (-item[1], item[0]))[:limit]
+    max_count = max((count for _, count in top), default=1)
+    return [
+        {"name": name, "count": count, "pct": round((count * 100.0 / max_count), 1) if max_count else 0}
+        for name, count in top
+    ]
 
-    scoped_site_ids_subq = site_base_query.with_entities(Site.id).subquery()
 
-    total_sites = site_base_query.count()
+DASHBOARD_DQ_LABELS = {
+    "no_sectors": "Sites without sectors",
+    "no_cells": "Sectors without cells",
+    "no_antenna": "Cells without antenna",
+    "unmapped": "Unmapped cells",
+}
 
-    sector_base_query = Sector.query.filter(Sector.site_id.in_(db.session.query(scoped_site_ids_subq.c.id)))
-    total_sectors = sector_base_query.count()
 
-    cell_base_query = (
-        Cell.query
-        .outerjoin(Sector, Cell.sector_id == Sector.id)
-        .outerjoin(Site, Sector.site_id == Site.id)
-        .filter(Site.id.in_(db.session.query(scoped_site_ids_subq.c.id)))
+def _dashboard_filters(args):
+    """Slice filters from the query string; unknown or malformed values are dropped."""
+    filters = {}
+    for name in ("region", "wilaya"):
+        value = (args.get(name) or "").strip()
+        if value.isdigit():
+            filters[name] = int(value)
+    tech = (args.get("tech") or "").strip()
+    if tech in CUBE_TECHS:
+        filters["tech"] = tech
+    supplier = (args.get("supplier") or "").strip()
+    if supplier == "none" or supplier.isdigit():
+        filters["supplier"] = supplier
+    status = (args.get("status") or "").strip()
+    if status:
+        filters["status"] = status[:20]
+    dq = (args.get("dq") or "").strip()
+    if dq in CUBE_DQ_FLAGS:
+        filters["dq"] = dq
+    return filters
+
+
+def get_dashboard_data(filters=None):
+    filters = filters or {}
+    app_obj = current_app._get_current_object()
+    start_stats_reconciler(app_obj)
+    # A first build bumps the stats version: do it before the version is read for the cache key.
+    ensure_inventory_stats()
+    accessible_sites = get_accessible_site_ids()
+    # Users with the same resolved scope share one cached snapshot per slice; "generated_at" is its build time.
+    cache_key = site_scope_fingerprint(accessible_sites) + "".join(f"|{name}={filters[name]}" for name in sorted(filters))
+    # The inventory version changes at commit, the stats version once the counters have caught up with it.
+    payload = get_dashboard_cache(app_obj).get(
+        cache_key,
+        get_data_versions(INVENTORY_SCOPE, STATS_SCOPE),
+        lambda: _build_dashboard_data(accessible_sites, filters),
+        app_obj,
     )
-    total_cells = cell_base_query.count()
+    return dict(payload, scope_badge=_dashboard_scope_badge())
+
+
+def _build_dashboard_data(accessible_sites, filters):
+    # Every figure is a sum of pre-aggregated cube rows (see app/services/inventory_stats.py).
+    with read_session() as session:
+        rows, global_rows = load_inventory_stats(accessible_sites, session=session)
+        scope_communes = {commune_id for commune_id, _metric, _key in rows}
+        geo = {
+            commune_id: (wilaya_id, wilaya_name, region_id)
+            for commune_id, wilaya_id, wilaya_name, region_id in (
+                session.query(Commune.id, Wilaya.id, Wilaya.name, Wilaya.region_id)
+                .join(Wilaya, Commune.wilaya_id == Wilaya.id)
+                .filter(Commune.id.in_(list(scope_communes)))
+                .all()
+                if scope_communes else []
+            )
+        }
+        supplier_names = dict(session.query(Supplier.id, Supplier.name).all())
+        region_names = dict(session.query(Region.id, Region.name).all())
+
+    supplier_filter = filters.get("supplier")
+    supplier_filter = "" if supplier_filter == "none" else supplier_filter
+    tech_filter = filters.get("tech", "")
+    slice_communes = {
+        commune_id for commune_id, (wilaya_id, _name, region_id) in geo.items()
+        if filters.get("region") in (None, region_id) and filters.get("wilaya") in (None, wilaya_id)
+    }
 
-    if accessible_sites is None:
+    total_sites = total_sectors = total_cells = 0
+    tech_counts = {label: 0 for label in CUBE_TECHS}
+    wilaya_site_counts = {}
+    supplier_site_counts = {}
+    communes_with_sites = set()
+    supplier_keys = set()
+    dq_counts = {"no_sectors": 0, "no_cells": 0, "no_antenna": 0, "no_supplier": 0, "mapped": 0}
+    status_options = set()
+    supplier_options = set()
+    for (commune_id, metric, key), value in rows.items():
+        if not metric.startswith("cube_"):
+            continue
+        supplier_key, status, tech, dq = split_cube_key(key)
+        if metric == "cube_sites" and not tech:
+            status_options.add(status)
+            supplier_options.add(supplier_key)
+        if commune_id not in slice_communes:
+            continue
+        if supplier_filter is not None and supplier_key != supplier_filter:
+            continue
+        if filters.get("status") not in (None, status):
+            continue
+        flags = dq.split(DQ_FLAG_SEPARATOR)
+        if filters.get("dq") and filters["dq"] not in flags:
+            continue
+        if metric == "cube_cells":
+            if tech_filter and tech != tech_filter:
+                continue
+            total_cells += value
+            tech_counts[tech] = tech_counts.get(tech, 0) + value
+            dq_counts["no_antenna"] += value if "no_antenna" in flags else 0
+            dq_counts["mapped"] += 0 if "unmapped" in flags else value
+            continue
+        # Site and sector rows are split per carried technology; tech "" is the all-technology row.
+        if tech != tech_filter:
+            continue
+        if metric == "cube_sectors":
+            total_sectors += value
+            dq_counts["no_cells"] += value if "no_cells" in flags else 0
+            continue
+        total_sites += value
+        communes_with_sites.add(commune_id)
+        wilaya_name = geo[commune_id][1]
+        wilaya_site_counts[wilaya_name] = wilaya_site_counts.get(wilaya_name, 0) + value
+        supplier_name = supplier_names.get(int(supplier_key), "Unassigned") if supplier_key else "Unassigned"
+        supplier_site_counts[supplier_name] = supplier_site_counts.get(supplier_name, 0) + value
+        if supplier_key:
+            supplier_keys.add(supplier_key)
+        dq_counts["no_sectors"] += value if "no_sectors" in flags else 0
+        dq_counts["no_supplier"] += 0 if supplier_key else value
+
+    if accessible_sites is None and not filters:
+        global_stats = _global_table_stats(rows, global_rows)
         scoped_regions = global_stats["total_regions"]
         scoped_wilayas = global_stats["total_wilayas"]
         scoped_communes = global_stats["total_communes"]
         scoped_suppliers = global_stats["total_suppliers"]
         scoped_antennas = global_stats["total_antennas"]
     else:
-        scoped_regions = (
-            db.session.query(func.count(func.distinct(Wilaya.region_id)))
-            .join(Commune, Commune.wilaya_id == Wilaya.id)
-            .join(Site, Site.commune_id == Commune.id)
-            .filter(Site.id.in_(list(accessible_sites)))
-            .scalar()
-            or 0
-        )
-        scoped_wilayas = (
-            db.session.query(func.count(func.distinct(Commune.wilaya_id)))
-            .join(Site, Site.commune_id == Commune.id)
-            .filter(Site.id.in_(list(accessible_sites)))
-            .scalar()
-            or 0
-        )
-        scoped_communes = (
-            db.session.query(func.count(func.distinct(Site.commune_id)))
-            .filter(Site.id.in_(list(accessible_sites)))
-            .scalar()
-            or 0
-        )
-        scoped_suppliers = (
-            db.session.query(func.count(func.distinct(Site.supplier_id)))
-            .filter(Site.id.in_(list(accessible_sites)), Site.supplier_id.isnot(None))
-            .scalar()
-            or 0
-        )
-        scoped_antennas = (
-            db.session.query(func.count(func.distinct(Cell.antenna_id)))
-            .outerjoin(Sector, Cell.sector_id == Sector.id)
-            .outerjoin(Site, Sector.site_id == Site.id)
-            .filter(Site.id.in_(list(accessible_sites)), Cell.antenna_id.isnot(None))
-            .scalar()
-            or 0
-        )
+        scoped_regions = len({geo[commune_id][2] for commune_id in communes_with_sites})
+        scoped_wilayas = len({geo[commune_id][0] for commune_id in communes_with_sites})
+        scoped_communes = len(communes_with_sites)
+        scoped_suppliers = len(supplier_keys)
+        scoped_antennas = len({
+            key for (commune_id, metric, key), value in rows.items()
+            if metric == "cells_by_antenna" and key and value and commune_id in communes_with_sites
+        })
 
     stats = {
         "total_sites": total_sites,
@@ -387,113 +507,65 @@ def get_dashboard_data():
         "total_communes": scoped_communes,
         "total_suppliers": scoped_suppliers,
         "total_antennas": scoped_antennas,
-        "total_cell_id_mapping": global_stats["total_cell_id_mapping"],
+        "total_cell_id_mapping": global_rows.get(("table_rows", "mapping"), 0),
     }
 
     avg_sectors_per_site = round(total_sectors / total_sites, 2) if total_sites else 0
     avg_cells_per_sector = round(total_cells / total_sectors, 2) if total_sectors else 0
 
-    tech_query = cell_base_query.with_entities(Cell.technology, func.count(Cell.id)).group_by(Cell.technology)
-    tech_raw = tech_query.all()
-    tech_counts = {"2G": 0, "3G": 0, "4G": 0, "Other": 0}
-    for tech, count in tech_raw:
-        tech_counts[_normalize_tech_for_dashboard(tech)] += count
-
     tech_distribution = []
-    for label in ("2G", "3G", "4G", "Other"):
+    for label in CUBE_TECHS:
         value = tech_counts[label]
         pct = round((value * 100.0 / total_cells), 1) if total_cells else 0
         tech_distribution.append({"label": label, "value": value, "pct": pct})
 
-    top_wilayas_query = (
-        Wilaya.query.with_entities(Wilaya.name, func.count(Site.id).label("site_count"))
-        .join(Commune, Commune.wilaya_id == Wilaya.id)
-        .outerjoin(Site, Site.commune_id == Commune.id)
-        .filter(Site.id.in_(db.session.query(scoped_site_ids_subq.c.id)))
-        .group_by(Wilaya.id, Wilaya.name)
-    )
-    top_wilayas_raw = top_wilayas_query.order_by(func.count(Site.id).desc(), Wilaya.name.asc()).limit(8).all()
-    max_wilaya = max((row.site_count for row in top_wilayas_raw), default=1)
-    top_wilayas = [
-        {
-            "name": row.name,
-            "count": row.site_count,
-            "pct": round((row.site_count * 100.0 / max_wilaya), 1) if max_wilaya else 0,
-        }
-        for row in top_wilayas_raw
-    ]
+    top_wilayas = _top_counts(wilaya_site_counts)
+    top_suppliers = _top_counts(supplier_site_counts)
 
-    top_suppliers_query = (
-        site_base_query.with_entities(
-            func.coalesce(Supplier.name, "Unassigned").label("supplier"),
-            func.count(Site.id).label("site_count"),
-        )
-        .outerjoin(Supplier, Site.supplier_id == Supplier.id)
-        .group_by(func.coalesce(Supplier.name, "Unassigned"))
-    )
-    top_suppliers_raw = top_suppliers_query.order_by(func.count(Site.id).desc()).limit(8).all()
-    max_supplier = max((row.site_count for row in top_suppliers_raw), default=1)
-    top_suppliers = [
-        {
-            "name": row.supplier,
-            "count": row.site_count,
-            "pct": round((row.site_count * 100.0 / max_supplier), 1) if max_supplier else 0,
-        }
-        for row in top_suppliers_raw
-    ]
-
-    sites_without_sectors = (
-        site_base_query.outerjoin(Sector, Sector.site_id == Site.id)
-        .filter(Sector.id.is_(None))
-        .count()
-    )
-    sectors_without_cells = (
-        sector_base_query.outerjoin(Cell, Cell.sector_id == Sector.id)
-        .filter(Cell.id.is_(None))
-        .count()
-    )
-    # Cells without sector have no site binding; keep count only for global admin view.
-    if accessible_sites is None:
-        cells_without_sector = Cell.query.filter(Cell.sector_id.is_(None)).count()
-    else:
-        cells_without_sector = 0
-
-    cells_without_antenna_query = cell_base_query.filter(Cell.antenna_id.is_(None))
-    cells_without_antenna = cells_without_antenna_query.count()
-
-    sites_without_supplier = site_base_query.filter(Site.supplier_id.is_(None)).count()
-
-    mapping_codes = {
-        (code or "").strip()
-        for (code,) in Mapping.query.with_entities(Mapping.cell_code).distinct().all()
-        if (code or "").strip()
-    }
-    mapped_cells = 0
-    for (cellname,) in cell_base_query.with_entities(Cell.cellname).all():
-        code = _extract_cell_code(cellname)
-        if code and code in mapping_codes:
-            mapped_cells += 1
+    mapped_cells = dq_counts["mapped"]
     mapping_coverage = round((mapped_cells * 100.0 / total_cells), 1) if total_cells else 0
 
     data_quality = {
-        "sites_without_sectors": sites_without_sectors,
-        "sectors_without_cells": sectors_without_cells,
-        "cells_without_sector": cells_without_sector,
-        "cells_without_antenna": cells_without_antenna,
-        "sites_without_supplier": sites_without_supplier,
+        "sites_without_sectors": dq_counts["no_sectors"],
+        "sectors_without_cells": dq_counts["no_cells"],
+        # Cells without sector have no site binding; keep count only for the unsliced admin view.
+        "cells_without_sector": global_rows.get(("cells_without_sector", ""), 0) if accessible_sites is None and not filters else 0,
+        "cells_without_antenna": dq_counts["no_antenna"],
+        "sites_without_supplier": dq_counts["no_supplier"],
         "mapped_cells": mapped_cells,
         "mapping_coverage_pct": mapping_coverage,
     }
 
+    scope_wilayas = sorted({(wilaya_id, name, region_id) for wilaya_id, name, region_id in geo.values()}, key=lambda row: row[1])
+    filter_options = {
+        "selected": dict(filters),
+        "regions": sorted(
+            ({"id": region_id, "name": region_names.get(region_id, str(region_id))} for region_id in {row[2] for row in scope_wilayas}),
+            key=lambda row: row["name"],
+        ),
+        "wilayas": [
+            {"id": wilaya_id, "name": name, "region_id": region_id}
+            for wilaya_id, name, region_id in scope_wilayas
+            if filters.get("region") in (None, region_id)
+        ],
+        "techs": list(CUBE_TECHS),
+        "suppliers": sorted(
+            ({"id": key or "none", "name": supplier_names.get(int(key), key) if key else "Unassigned"} for key in supplier_options),
+            key=lambda row: row["name"],
+        ),
+        "statuses": sorted(status_options),
+        "dq_flags": [{"id": flag, "name": DASHBOARD_DQ_LABELS[flag]} for flag in CUBE_DQ_FLAGS],
+    }
+
     return {
         "stats": stats,
-        "scope_badge": _dashboard_scope_badge(),
         "avg_sectors_per_site": avg_sectors_per_site,
         "avg_cells_per_sector": avg_cells_per_sector,
         "tech_distribution": tech_distribution,
         "top_wilayas": top_wilayas,
         "top_suppliers": top_suppliers,
         "data_quality": data_quality,
+        "filters": filter_options,
         "charts": {
             "tech_labels": [row["label"] for row in tech_distribution],
             "tech_values": [row["value"] for row in tech_distribution],
@@ -530,15 +602,6 @@ def _extract_sector_id(cellname):
     return None
 
 
-def _extract_cell_code(cellname):
-    if not cellname:
-        return None
-    parts = str(cellname).rsplit("_", 1)
-    if len(parts) == 2 and parts[1]:
-        return parts[1]
-    return None
-
-
 def _gps_dot(value, decimals=6):
     # Force GPS decimal separator to dot for Excel exports.
     if value is None:
@@ -672,7 +735,7 @@ def _lbs_nominal_power_dbm(tech, band, ran_map):
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
-    return render_template('dashboard.html', dashboard=get_dashboard_data())
+    return render_template('dashboard.html', dashboard=get_dashboard_data(_dashboard_filters(request.args)))
 
 
 @main_bp.route('/import_export')
@@ -862,32 +925,30 @@ def _collect_export_dataset(entity, search="", dq_filter=""):
     }
     key = aliases.get(key, key)
 
+    # Sites, sectors and cells are the large tables: filter and search in SQL and hand the
+    # writer a generator over a streaming cursor instead of a materialized list.
     if key == "sites":
-        from app.routes.list_data import list_sites
-        rows = list_sites(dq_filter=dq_filter)
-        for row in rows:
-            row["addresses"] = row.get("address")
+        from app.routes.list_data import iter_sites
         headers = [
             "id", "code_site", "name", "latitude", "longitude", "altitude", "support_nature",
             "support_type", "support_height", "status", "supplier_name", "commune_name",
             "wilaya_name", "region_name", "addresses", "comments",
         ]
-        return key, headers, _apply_export_search(rows, search)
+        rows = ({**row, "addresses": row.get("address")} for row in iter_sites(dq_filter=dq_filter, search=search))
+        return key, headers, rows
 
     if key == "sectors":
-        from app.routes.list_data import list_sectors
-        rows = list_sectors()
+        from app.routes.list_data import iter_sectors
         headers = ["id", "code_sector", "azimuth", "hba", "coverage_goal", "site_code"]
-        return key, headers, _apply_export_search(rows, search)
+        return key, headers, iter_sectors(without_cells=(dq_filter == "without_cells"), search=search)
 
     if key == "cells":
-        from app.routes.list_data import list_cells
-        rows = list_cells()
+        from app.routes.list_data import iter_cells
         headers = [
             "id", "cellname", "technology", "frequency", "antenna", "sector",
             "tilt_mech", "tilt_elec", "tech_settings",
         ]
-        return key, headers, _apply_export_search(rows, search)
+        return key, headers, iter_cells(dq_filter=dq_filter, search=search)
 
     if key == "wilayas":
         from app.routes.list_data import list_wilayas
@@ -963,26 +1024,174 @@ def export_data(entity):
         flash("Access denied for this export.", "danger")
         return redirect(request.referrer or url_for("main.dashboard"))
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = key[:31] or "export"
-    ws.append(headers)
-
+    sheet = key[:31] or "export"
+    writer = StreamingXlsxWriter()
+    writer.add_sheet(sheet, headers)
     for row in rows or []:
-        ws.append([row.get(h) if isinstance(row, dict) else None for h in headers])
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+        writer.append_dict(sheet, row if isinstance(row, dict) else {})
     filename = f"{key}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
 
-    append_audit_event("export_data", key, "SUCCESS", f"rows={len(rows or [])}")
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    append_audit_event("export_data", key, "SUCCESS", f"rows={writer.row_counts[sheet]}")
+    return send_streaming_workbook(writer, filename)
+
+
+@main_bp.route('/export-columnar', methods=['GET'])
+@login_required
+def export_columnar():
+    export_format = (request.args.get("format") or "parquet").strip().lower()
+    if export_format not in COLUMNAR_FORMATS:
+        flash(f'Unsupported columnar format "{export_format}".', "danger")
+        return redirect(url_for("main.import_export"))
+
+    accessible_sites = get_accessible_site_ids()
+    entities = [
+        entity for entity in COLUMNAR_ENTITIES
+        if accessible_sites is None or entity not in COLUMNAR_ADMIN_ONLY
+    ]
+    fd, zip_path = tempfile.mkstemp(prefix="inventory_", suffix=".zip")
+    os.close(fd)
+    try:
+        with tempfile.TemporaryDirectory(prefix="inventory_") as work_dir:
+            counts = write_columnar_inventory(work_dir, export_format, accessible_sites, entities=entities)
+            write_columnar_zip(work_dir, zip_path)
+    except RuntimeError as exc:
+        os.remove(zip_path)
+        append_audit_event("export_columnar", export_format, "FAILED", str(exc))
+        flash(str(exc), "danger")
+        return redirect(url_for("main.import_export"))
+    except Exception:
+        os.remove(zip_path)
+        raise
+
+    append_audit_event(
+        "export_columnar", export_format, "SUCCESS",
+        ", ".join(f"{name}={count}" for name, count in counts.items()),
     )
+    filename = f"inventory_{export_format}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return send_temporary_file(zip_path, filename, "application/zip")
+
+
+def _write_allplan_workbook(cell_names, writer, progress_cb=None):
+    """Resolve ``cell_names`` and append one Allplan row per cell to the 2G/3G/4G/NOT_FOUND sheets of ``writer``."""
+    for tech in ('2G', '3G', '4G'):
+        writer.add_sheet(tech, ALLPLAN_HEADERS[tech])
+    writer.add_sheet("NOT_FOUND", EXPORT_NOT_FOUND_HEADERS)
+
+    with staged_names(db.session, cell_names) as staged:
+        # Semi-join on the indexed Cell.cell_code / Mapping.cell_code of the uploaded cells.
+        mappings = db.session.execute(
+            select(Mapping.cell_code, Mapping.technology, Mapping.sector_code)
+            .where(Mapping.cell_code.in_(
+                select(Cell.cell_code).join(staged, Cell.cellname == staged.c.name).where(Cell.cell_code.isnot(None))
+            ))
+            .order_by(Mapping.id)
+        )
+        mapping_tech = {}
+        mapping_code = {}
+        for cell_code, technology, sector_code in mappings:
+            code = (cell_code or "").strip()
+            tech_key = (technology or "").strip().upper()
+            if code and tech_key:
+                mapping_tech[(code, tech_key)] = sector_code
+            if code:
+                mapping_code[code] = sector_code
+
+        resolved = db.session.execute(
+            select(staged.c.name, Cell)
+            .select_from(staged)
+            .outerjoin(Cell, Cell.cellname == staged.c.name)
+            .options(
+                joinedload(Cell.sector).joinedload(Sector.site).joinedload(Site.commune),
+                joinedload(Cell.antenna),
+            )
+            .order_by(staged.c.pos)
+            .execution_options(yield_per=EXPORT_FETCH_BATCH)
+        )
+        total = len(cell_names)
+        for processed, (name, cell) in enumerate(resolved, start=1):
+            if progress_cb and (processed == 1 or processed % 300 == 0 or processed == total):
+                progress_cb(processed, total, f"Resolved {processed}/{total} cells, {writer.rows_written} rows written")
+            if not cell:
+                writer.append_dict("NOT_FOUND", {
+                    "CELLNAME": name,
+                    "TECHNOLOGY": None,
+                    "ISSUE": "CELL_MISSING",
+                    "DETAIL": "Cellule introuvable dans la table Cell.",
+                })
+                continue
+            tech = _normalize_tech(cell.technology)
+            if tech not in ALLPLAN_HEADERS:
+                writer.append_dict("NOT_FOUND", {
+                    "CELLNAME": cell.cellname,
+                    "TECHNOLOGY": cell.technology,
+                    "ISSUE": "TECHNOLOGY_UNSUPPORTED",
+                    "DETAIL": "Technologie non supportÃ©e pour export Allplan.",
+                })
+                continue
+
+            sector = cell.sector
+            site = sector.site if sector else None
+            antenna = cell.antenna
+            commune_name = site.commune.name if site and site.commune else None
+            site_type = site.support_type if site else None
+            cell_code = cell.cell_code
+            tech_key = (cell.technology or "").strip().upper()
+            sector_id_from_mapping = (
+                mapping_tech.get((cell_code, tech_key))
+                or mapping_code.get(cell_code)
+            )
+
+            issues = []
+            if not sector:
+                issues.append("SECTOR_MISSING")
+            if sector and not site:
+                issues.append("SITE_MISSING")
+            if not sector_id_from_mapping:
+                issues.append("MAPPING_MISSING")
+            if issues:
+                writer.append_dict("NOT_FOUND", {
+                    "CELLNAME": cell.cellname,
+                    "TECHNOLOGY": cell.technology,
+                    "ISSUE": ", ".join(issues),
+                    "DETAIL": "Verifier les relations Cell->Sector->Site et la table Mapping.",
+                })
+
+            common = {
+                'CELLNAME': cell.cellname,
+                'LONGITUDE': _gps_dot(site.longitude) if site else None,
+                'LATITUDE': _gps_dot(site.latitude) if site else None,
+                'AZIMUTH': sector.azimuth if sector else None,
+                'HEIGHT': sector.hba if sector else None,
+                'ANTENNA': antenna.model if antenna else None,
+                'ELECTRICALTILT': cell.tilt_electrical,
+                'MECHANICALTILT': cell.tilt_mechanical,
+                'HBEAMWIDTH': antenna.hbeamwidth if antenna else None,
+                'VBEAMWIDTH': antenna.vbeamwidth if antenna else None,
+                'GAIN': antenna.gain if antenna else None,
+                'ANTENNAGAIN': antenna.gain if antenna else None,
+                'SITENAME': site.code_site if site else None,
+                'SITE_TYPE': site_type,
+                'INDOORFLAG': None,
+                'SECTORID': sector_id_from_mapping,
+                'ARFCN': None,
+                'DL UARFCN': None,
+                'DL EARFCN': cell.frequency,
+                'LAC': None,
+                'CELLIDENTITY': None,
+                'BCCH': None,
+                'BSIC(octal)': None,
+                'RNCID': None,
+                'UTRANCELLIDENTITY': None,
+                'ENODEBNAME': None,
+                'ENODEBID': None,
+                'CI': None,
+                'PCI': None,
+                'Core or Buffer': 'Core',
+                'New Cell': None,
+                'COMMUNE': commune_name,
+            }
+            writer.append_dict(tech, common)
+
 
 @main_bp.route('/export-allplan', methods=['POST'])
 @login_required
@@ -1005,143 +1214,10 @@ def export_allplan():
         flash('Veuillez fournir un fichier (ou une liste texte) contenant au moins une cellule.', 'warning')
         return redirect(url_for('main.import_export'))
 
-    cells = (
-        Cell.query.options(
-            joinedload(Cell.sector).joinedload(Sector.site).joinedload(Site.commune),
-            joinedload(Cell.antenna),
-        )
-        .filter(Cell.cellname.in_(cell_names))
-        .all()
-    )
-
-    by_name = {c.cellname: c for c in cells}
-    rows = {'2G': [], '3G': [], '4G': []}
-    not_found_rows = []
-
-    cell_codes = {_extract_cell_code(name) for name in cell_names}
-    cell_codes.discard(None)
-    mappings = Mapping.query.filter(Mapping.cell_code.in_(list(cell_codes))).all() if cell_codes else []
-
-    mapping_tech = {}
-    mapping_code = {}
-    for m in mappings:
-        code = (m.cell_code or "").strip()
-        tech_key = (m.technology or "").strip().upper()
-        if code and tech_key:
-            mapping_tech[(code, tech_key)] = m.sector_code
-        if code:
-            mapping_code[code] = m.sector_code
-
-    for name in cell_names:
-        cell = by_name.get(name)
-        if not cell:
-            not_found_rows.append({
-                "CELLNAME": name,
-                "TECHNOLOGY": None,
-                "ISSUE": "CELL_MISSING",
-                "DETAIL": "Cellule introuvable dans la table Cell.",
-            })
-            continue
-        tech = _normalize_tech(cell.technology)
-        if tech not in rows:
-            not_found_rows.append({
-                "CELLNAME": cell.cellname,
-                "TECHNOLOGY": cell.technology,
-                "ISSUE": "TECHNOLOGY_UNSUPPORTED",
-                "DETAIL": "Technologie non supportÃ©e pour export Allplan.",
-            })
-            continue
-
-        sector = cell.sector
-        site = sector.site if sector else None
-        antenna = cell.antenna
-        commune_name = site.commune.name if site and site.commune else None
-        site_type = site.support_type if site else None
-        cell_code = _extract_cell_code(cell.cellname)
-        tech_key = (cell.technology or "").strip().upper()
-        sector_id_from_mapping = (
-            mapping_tech.get((cell_code, tech_key))
-            or mapping_code.get(cell_code)
-        )
-
-        issues = []
-        if not sector:
-            issues.append("SECTOR_MISSING")
-        if sector and not site:
-            issues.append("SITE_MISSING")
-        if not sector_id_from_mapping:
-            issues.append("MAPPING_MISSING")
-        if issues:
-            not_found_rows.append({
-                "CELLNAME": cell.cellname,
-                "TECHNOLOGY": cell.technology,
-                "ISSUE": ", ".join(issues),
-                "DETAIL": "Verifier les relations Cell->Sector->Site et la table Mapping.",
-            })
-
-        common = {
-            'CELLNAME': cell.cellname,
-            'LONGITUDE': _gps_dot(site.longitude) if site else None,
-            'LATITUDE': _gps_dot(site.latitude) if site else None,
-            'AZIMUTH': sector.azimuth if sector else None,
-            'HEIGHT': sector.hba if sector else None,
-            'ANTENNA': antenna.model if antenna else None,
-            'ELECTRICALTILT': cell.tilt_electrical,
-            'MECHANICALTILT': cell.tilt_mechanical,
-            'HBEAMWIDTH': antenna.hbeamwidth if antenna else None,
-            'VBEAMWIDTH': antenna.vbeamwidth if antenna else None,
-            'GAIN': antenna.gain if antenna else None,
-            'ANTENNAGAIN': antenna.gain if antenna else None,
-            'SITENAME': site.code_site if site else None,
-            'SITE_TYPE': site_type,
-            'INDOORFLAG': None,
-            'SECTORID': sector_id_from_mapping,
-            'ARFCN': None,
-            'DL UARFCN': None,
-            'DL EARFCN': cell.frequency,
-            'LAC': None,
-            'CELLIDENTITY': None,
-            'BCCH': None,
-            'BSIC(octal)': None,
-            'RNCID': None,
-            'UTRANCELLIDENTITY': None,
-            'ENODEBNAME': None,
-            'ENODEBID': None,
-            'CI': None,
-            'PCI': None,
-            'Core or Buffer': 'Core',
-            'New Cell': None,
-            'COMMUNE': commune_name,
-        }
-        rows[tech].append(common)
-
-    wb = Workbook()
-    wb.remove(wb.active)
-
-    for tech in ('2G', '3G', '4G'):
-        ws = wb.create_sheet(tech)
-        headers = ALLPLAN_HEADERS[tech]
-        ws.append(headers)
-        for row in rows[tech]:
-            ws.append([row.get(h) for h in headers])
-
-    ws_nf = wb.create_sheet("NOT_FOUND")
-    nf_headers = ["CELLNAME", "TECHNOLOGY", "ISSUE", "DETAIL"]
-    ws_nf.append(nf_headers)
-    for row in not_found_rows:
-        ws_nf.append([row.get(h) for h in nf_headers])
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
+    writer = StreamingXlsxWriter()
+    _write_allplan_workbook(cell_names, writer)
     filename = f"allplan_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-    )
+    return send_streaming_workbook(writer, filename)
 
 
 @main_bp.route('/sync-cell-sectors', methods=['POST'])
@@ -1241,9 +1317,12 @@ def _run_cell_sector_sync_job(app_obj, job_id, scope, cell_names, search, priori
         started_at=started_at.isoformat(),
     )
 
+    def _queued(ahead):
+        _set_cell_sector_sync_job(job_id, message=f"Waiting for {ahead} write job(s) to finish...")
+
     try:
-        from app.routes.import_data import resolve_sector_id_for_cell
-        with app_obj.app_context():
+        from app.routes.import_data import resolved_sector_statement
+        with app_obj.app_context(), bulk_writer("cell_sector_sync", on_queued=_queued):
             # Sync targets only cells without sector.
             query = Cell.query.filter(Cell.sector_id.is_(None))
             if scope != "all":
@@ -1274,57 +1353,46 @@ def _run_cell_sector_sync_job(app_obj, job_id, scope, cell_names, search, priori
 
             _set_cell_sector_sync_job(job_id, total=total, message=f"Syncing {total} cells...")
 
-            updated = 0
-            unchanged = 0
-            unresolved = 0
-            skipped = 0
-            processed = 0
-            pending = 0
-            batch_size = 2000
-
+            eligible = query.filter(
+                Cell.cellname.isnot(None),
+                func.trim(func.coalesce(Cell.technology, "")) != "",
+                func.trim(func.coalesce(Cell.frequency, "")) != "",
+            )
+            skipped = total - eligible.count()
+            # One join resolves every eligible cell (see resolved_sector_statement) instead of two lookups per cell.
+            resolution = resolved_sector_statement().where(Cell.id.in_(eligible.with_entities(Cell.id)))
             priority_set = set(prioritized_cells or [])
             if priority_set:
-                # Process currently visible rows first, then the rest.
-                ordered = (
-                    list(query.filter(Cell.cellname.in_(list(priority_set))).yield_per(1000))
-                    + list(query.filter(~Cell.cellname.in_(list(priority_set))).yield_per(1000))
-                )
+                # Write currently visible rows first, then the rest.
+                resolution = resolution.order_by(case((Cell.cellname.in_(list(priority_set)), 0), else_=1), Cell.id)
             else:
-                ordered = query.yield_per(1000)
+                resolution = resolution.order_by(Cell.id)
+            resolved = db.session.execute(resolution).all()
 
-            for cell in ordered:
-                tech = (cell.technology or "").strip().upper()
-                freq = (cell.frequency or "").strip()
-                if not cell.cellname or not tech or not freq:
-                    skipped += 1
-                else:
-                    sector_id, _ = resolve_sector_id_for_cell(cell.cellname, tech, freq)
-                    if sector_id is None:
-                        unresolved += 1
-                    elif cell.sector_id == int(sector_id):
-                        unchanged += 1
-                    else:
-                        cell.sector_id = int(sector_id)
-                        updated += 1
-                        pending += 1
-
-                processed += 1
-                if pending >= batch_size:
-                    db.session.commit()
-                    pending = 0
-
-                if processed == 1 or processed % 500 == 0 or processed == total:
-                    pct = int(processed * 100 / total)
-                    _set_cell_sector_sync_job(
-                        job_id,
-                        progress=pct,
-                        processed=processed,
-                        updated=updated,
-                        unchanged=unchanged,
-                        unresolved=unresolved,
-                        skipped=skipped,
-                        message=f"Sync {processed}/{total}",
-                    )
+            updated = 0
+            unchanged = 0
+            batch_size = 250
+            # Commit once the slice is due so interactive edits get the write slot in between.
+            pending_slice = commit_slice()
+            for start in range(0, len(resolved), batch_size):
+                batch = resolved[start:start + batch_size]
+                db.session.execute(update(Cell), [{"id": cell_id, "sector_id": sector_id} for cell_id, sector_id in batch])
+                updated += len(batch)
+                if not pending_slice.add(len(batch)) and updated < len(resolved):
+                    continue
+                db.session.commit()
+                pending_slice.reset()
+                _set_cell_sector_sync_job(
+                    job_id,
+                    progress=int(updated * 100 / total),
+                    processed=skipped + updated,
+                    updated=updated,
+                    unchanged=unchanged,
+                    skipped=skipped,
+                    message=f"Sync {updated}/{len(resolved)} resolved cells",
+                )
+            processed = total
+            unresolved = total - skipped - updated
 
             db.session.commit()
             finished_at = datetime.utcnow()
@@ -1440,8 +1508,12 @@ def _run_site_altitude_sync_job(app_obj, job_id, scope, search, prioritized_site
         message="Loading sites...",
         started_at=datetime.utcnow().isoformat(),
     )
+
+    def _queued(ahead):
+        _set_site_altitude_sync_job(job_id, message=f"Waiting for {ahead} write job(s) to finish...")
+
     try:
-        with app_obj.app_context():
+        with app_obj.app_context(), bulk_writer("site_altitude_sync", on_queued=_queued):
             query = Site.query
             accessible_sites = accessible_sites_snapshot
             if accessible_sites is not None:
@@ -1479,11 +1551,21 @@ def _run_site_altitude_sync_job(app_obj, job_id, scope, search, prioritized_site
             unresolved = 0
             skipped = 0
             processed = 0
-            pending = 0
             batch_size = 100
+            pending_slice = commit_slice(max_rows=batch_size)
 
-            ordered = query.yield_per(200)
-            for site in ordered:
+            # Commits below would close a server-side cursor (PostgreSQL), so walk id pages instead.
+            site_ids = [row[0] for row in query.with_entities(Site.id).order_by(Site.id)]
+
+            def ordered_sites():
+                for idx in range(0, len(site_ids), 200):
+                    # No autoflush: pending altitudes are written at commit time only, so the
+                    # write slot is never held across the elevation lookups.
+                    with db.session.no_autoflush:
+                        page = Site.query.filter(Site.id.in_(site_ids[idx:idx + 200])).order_by(Site.id).all()
+                    yield from page
+
+            for site in ordered_sites():
                 lat = site.latitude
                 lon = site.longitude
                 if lat is None or lon is None:
@@ -1495,12 +1577,12 @@ def _run_site_altitude_sync_job(app_obj, job_id, scope, search, prioritized_site
                     else:
                         site.altitude = round(float(alt), 1)
                         updated += 1
-                        pending += 1
+                        pending_slice.add()
 
                 processed += 1
-                if pending >= batch_size:
+                if pending_slice.due:
                     db.session.commit()
-                    pending = 0
+                    pending_slice.reset()
 
                 if processed == 1 or processed % 25 == 0 or processed == total:
                     pct = int(processed * 100 / total)
@@ -1562,6 +1644,173 @@ def site_altitude_sync_status(job_id):
     }), 200
 
 
+def _write_lbs_workbook(cell_names, writer, ran_map, progress_cb=None):
+    """Resolve ``cell_names`` and append one LBS row per cell to the 2G/3G/4G/NOT_FOUND sheets of ``writer``."""
+    for tech in ("2G", "3G", "4G"):
+        writer.add_sheet(tech, LBS_HEADERS[tech])
+    writer.add_sheet("NOT_FOUND", EXPORT_NOT_FOUND_HEADERS)
+
+    with staged_names(db.session, cell_names) as staged:
+        resolved = db.session.execute(
+            select(staged.c.name, Cell)
+            .select_from(staged)
+            .outerjoin(Cell, Cell.cellname == staged.c.name)
+            .options(
+                joinedload(Cell.sector).joinedload(Sector.site).joinedload(Site.commune),
+                joinedload(Cell.antenna),
+                joinedload(Cell.profile_2g),
+                joinedload(Cell.profile_3g),
+                joinedload(Cell.profile_4g),
+            )
+            .order_by(staged.c.pos)
+            .execution_options(yield_per=EXPORT_FETCH_BATCH)
+        )
+        total = len(cell_names)
+        for processed, (name, cell) in enumerate(resolved, start=1):
+            if progress_cb and (processed == 1 or processed % 300 == 0 or processed == total):
+                progress_cb(processed, total, f"Resolved {processed}/{total} cells, {writer.rows_written} rows written")
+            if not cell:
+                writer.append_dict("NOT_FOUND", {
+                    "CELLNAME": name,
+                    "TECHNOLOGY": None,
+                    "ISSUE": "CELL_MISSING",
+                    "DETAIL": "Cell not found in Cell table.",
+                })
+                continue
+
+            tech = _normalize_tech(cell.technology)
+            if tech not in LBS_HEADERS:
+                writer.append_dict("NOT_FOUND", {
+                    "CELLNAME": cell.cellname,
+                    "TECHNOLOGY": cell.technology,
+                    "ISSUE": "TECHNOLOGY_UNSUPPORTED",
+                    "DETAIL": "Supported technologies for LBS export are 2G/3G/4G.",
+                })
+                continue
+
+            sector = cell.sector
+            site = sector.site if sector else None
+            antenna = cell.antenna
+            cid = _cell_suffix_int(cell.cellname)
+            band = _freq_band_int(cell.frequency)
+            common = {
+                "site_code": site.code_site if site else None,
+                "cellname": cell.cellname,
+                "lon": _gps_dot(site.longitude) if site else None,
+                "lat": _gps_dot(site.latitude) if site else None,
+                "ant_type": _antenna_type_for_lbs(site),
+                "radius": _lbs_radius_km(tech, band, ran_map),
+                "gain": antenna.gain if antenna else None,
+                "pwr": _lbs_nominal_power_dbm(tech, band, ran_map),
+                "spec": antenna.model if antenna else None,
+                "hba": sector.hba if sector else None,
+                "down_tilt": cell.tilt_electrical,
+                "mech_tilt": cell.tilt_mechanical,
+                "elec_tilt": cell.tilt_electrical,
+                "az": sector.azimuth if sector else None,
+                "h_bw": antenna.hbeamwidth if antenna else None,
+                "band": band,
+            }
+
+            issues = []
+            if not sector:
+                issues.append("SECTOR_MISSING")
+            if sector and not site:
+                issues.append("SITE_MISSING")
+
+            if tech == "2G":
+                p2 = cell.profile_2g
+                ncc, bcc = _ncc_bcc_from_bsic(p2.bsic if p2 else None)
+                writer.append_dict("2G", {
+                    "CID": p2.ci if p2 and p2.ci is not None else cid,
+                    "Site Name": common["site_code"],
+                    "CellName": common["cellname"],
+                    "Longitude": common["lon"],
+                    "Latitude": common["lat"],
+                    "AntennaType": common["ant_type"],
+                    "MaxCellRadius": common["radius"],
+                    "AntennaGain": common["gain"],
+                    "BSNominalPower": common["pwr"],
+                    "BSPowerBCCH": 20,
+                    "TAlimit": 5,
+                    "AntennaSpec": common["spec"],
+                    "HeightAGL": common["hba"],
+                    "DownTilt": common["down_tilt"],
+                    "MechanicalTilt": common["mech_tilt"],
+                    "ElectricalTilt": common["elec_tilt"],
+                    "Azimuth": common["az"],
+                    "HorizBeamWidth": common["h_bw"],
+                    "LAC": p2.lac if p2 else None,
+                    "NCC": ncc,
+                    "BCC": bcc,
+                    "BCCH": p2.bcch if p2 else None,
+                    "MCC": 603,
+                    "MNC": 2,
+                    "FrequencyBand": common["band"],
+                    "Node Name": p2.bsc if p2 else None,
+                })
+            elif tech == "3G":
+                p3 = cell.profile_3g
+                writer.append_dict("3G", {
+                    "CID": p3.ci if p3 and p3.ci is not None else cid,
+                    "SiteName": common["site_code"],
+                    "CellName": common["cellname"],
+                    "Longitude": common["lon"],
+                    "Latitude": common["lat"],
+                    "AntennaType": common["ant_type"],
+                    "MaxCellRadius": common["radius"],
+                    "Gain": common["gain"],
+                    "BSNominalPower": common["pwr"],
+                    "AntennaSpec": common["spec"],
+                    "HeightAGL": common["hba"],
+                    "DownTilt": common["down_tilt"],
+                    "Azimuth": common["az"],
+                    "MechanicalTilt": common["mech_tilt"],
+                    "ElectricalTilt": common["elec_tilt"],
+                    "HorizBeamWidth": common["h_bw"],
+                    "LAC": p3.lac if p3 else None,
+                    "SAC": cid,
+                    "RNCid": p3.rnc if p3 else None,
+                    "PSC": p3.psc if p3 else None,
+                    "UARFCN": p3.dlarfcn if p3 else None,
+                    "FrequencyBand": common["band"],
+                    "NodeName": p3.rnc if p3 else None,
+                })
+            else:
+                p4 = cell.profile_4g
+                writer.append_dict("4G", {
+                    "Site Name": common["site_code"],
+                    "CellName": common["cellname"],
+                    "Longitude": common["lon"],
+                    "Latitude": common["lat"],
+                    "AntennaType": common["ant_type"],
+                    "MaxCellRadius": common["radius"],
+                    "AntennaGain": common["gain"],
+                    "BSNominalPower": common["pwr"],
+                    "AntennaSpec": common["spec"],
+                    "HeightAGL": common["hba"],
+                    "DownTilt": common["down_tilt"],
+                    "MechanicalTilt": common["mech_tilt"],
+                    "ElectricalTilt": common["elec_tilt"],
+                    "Azimuth": common["az"],
+                    "HorizBeamWidth": common["h_bw"],
+                    "TAC ": p4.tac if p4 else None,
+                    "E-UTRANCELLID": p4.ci if p4 and p4.ci is not None else cid,
+                    "EARFCN": p4.earfcn if p4 else None,
+                    "FrequencyBand": common["band"],
+                    "PCI": p4.pci if p4 else None,
+                    "NodeName": p4.enodeb if p4 else None,
+                })
+
+            if issues:
+                writer.append_dict("NOT_FOUND", {
+                    "CELLNAME": cell.cellname,
+                    "TECHNOLOGY": cell.technology,
+                    "ISSUE": ", ".join(issues),
+                    "DETAIL": "Missing relationship Cell->Sector->Site.",
+                })
+
+
 @main_bp.route('/export-lbs', methods=['POST'])
 @login_required
 @csrf_protect
@@ -1583,190 +1832,167 @@ def export_lbs():
         flash("Please provide a non-empty cell list (.xlsx/.csv or text).", "warning")
         return redirect(url_for("main.lbs_export_page"))
 
-    ran_map = build_ran_reference_map(current_app.instance_path)
+    writer = StreamingXlsxWriter()
+    _write_lbs_workbook(cell_names, writer, build_ran_reference_map(current_app.instance_path))
+    filename = f"lbs_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    return send_streaming_workbook(writer, filename)
 
-    cells = (
-        Cell.query.options(
-            joinedload(Cell.sector).joinedload(Sector.site).joinedload(Site.commune),
-            joinedload(Cell.antenna),
-            joinedload(Cell.profile_2g),
-            joinedload(Cell.profile_3g),
-            joinedload(Cell.profile_4g),
-        )
-        .filter(Cell.cellname.in_(cell_names))
-        .all()
-    )
 
-    by_name = {c.cellname: c for c in cells}
-    rows = {"2G": [], "3G": [], "4G": []}
-    not_found_rows = []
+CELL_EXPORT_KINDS = {"allplan": "Allplan", "lbs": "LBS"}
+# Finished Allplan/LBS workbooks are kept this long for download.
+CELL_EXPORT_RETENTION_HOURS = 24
 
-    for name in cell_names:
-        cell = by_name.get(name)
-        if not cell:
-            not_found_rows.append({
-                "CELLNAME": name,
-                "TECHNOLOGY": None,
-                "ISSUE": "CELL_MISSING",
-                "DETAIL": "Cell not found in Cell table.",
-            })
-            continue
 
-        tech = _normalize_tech(cell.technology)
-        if tech not in rows:
-            not_found_rows.append({
-                "CELLNAME": cell.cellname,
-                "TECHNOLOGY": cell.technology,
-                "ISSUE": "TECHNOLOGY_UNSUPPORTED",
-                "DETAIL": "Supported technologies for LBS export are 2G/3G/4G.",
-            })
-            continue
+def _set_cell_export_job(job_id, **fields):
+    with _cell_export_jobs_lock:
+        job = _cell_export_jobs.get(job_id, {})
+        job.update(fields)
+        _cell_export_jobs[job_id] = job
+        return dict(job)
 
-        sector = cell.sector
-        site = sector.site if sector else None
-        antenna = cell.antenna
-        cid = _cell_suffix_int(cell.cellname)
-        band = _freq_band_int(cell.frequency)
-        common = {
-            "site_code": site.code_site if site else None,
-            "cellname": cell.cellname,
-            "lon": _gps_dot(site.longitude) if site else None,
-            "lat": _gps_dot(site.latitude) if site else None,
-            "ant_type": _antenna_type_for_lbs(site),
-            "radius": _lbs_radius_km(tech, band, ran_map),
-            "gain": antenna.gain if antenna else None,
-            "pwr": _lbs_nominal_power_dbm(tech, band, ran_map),
-            "spec": antenna.model if antenna else None,
-            "hba": sector.hba if sector else None,
-            "down_tilt": cell.tilt_electrical,
-            "mech_tilt": cell.tilt_mechanical,
-            "elec_tilt": cell.tilt_electrical,
-            "az": sector.azimuth if sector else None,
-            "h_bw": antenna.hbeamwidth if antenna else None,
-            "band": band,
-        }
 
-        issues = []
-        if not sector:
-            issues.append("SECTOR_MISSING")
-        if sector and not site:
-            issues.append("SITE_MISSING")
-
-        if tech == "2G":
-            p2 = cell.profile_2g
-            ncc, bcc = _ncc_bcc_from_bsic(p2.bsic if p2 else None)
-            rows["2G"].append({
-                "CID": p2.ci if p2 and p2.ci is not None else cid,
-                "Site Name": common["site_code"],
-                "CellName": common["cellname"],
-                "Longitude": common["lon"],
-                "Latitude": common["lat"],
-                "AntennaType": common["ant_type"],
-                "MaxCellRadius": common["radius"],
-                "AntennaGain": common["gain"],
-                "BSNominalPower": common["pwr"],
-                "BSPowerBCCH": 20,
-                "TAlimit": 5,
-                "AntennaSpec": common["spec"],
-                "HeightAGL": common["hba"],
-                "DownTilt": common["down_tilt"],
-                "MechanicalTilt": common["mech_tilt"],
-                "ElectricalTilt": common["elec_tilt"],
-                "Azimuth": common["az"],
-                "HorizBeamWidth": common["h_bw"],
-                "LAC": p2.lac if p2 else None,
-                "NCC": ncc,
-                "BCC": bcc,
-                "BCCH": p2.bcch if p2 else None,
-                "MCC": 603,
-                "MNC": 2,
-                "FrequencyBand": common["band"],
-                "Node Name": p2.bsc if p2 else None,
-            })
-        elif tech == "3G":
-            p3 = cell.profile_3g
-            rows["3G"].append({
-                "CID": p3.ci if p3 and p3.ci is not None else cid,
-                "SiteName": common["site_code"],
-                "CellName": common["cellname"],
-                "Longitude": common["lon"],
-                "Latitude": common["lat"],
-                "AntennaType": common["ant_type"],
-                "MaxCellRadius": common["radius"],
-                "Gain": common["gain"],
-                "BSNominalPower": common["pwr"],
-                "AntennaSpec": common["spec"],
-                "HeightAGL": common["hba"],
-                "DownTilt": common["down_tilt"],
-                "Azimuth": common["az"],
-                "MechanicalTilt": common["mech_tilt"],
-                "ElectricalTilt": common["elec_tilt"],
-                "HorizBeamWidth": common["h_bw"],
-                "LAC": p3.lac if p3 else None,
-                "SAC": cid,
-                "RNCid": p3.rnc if p3 else None,
-                "PSC": p3.psc if p3 else None,
-                "UARFCN": p3.dlarfcn if p3 else None,
-                "FrequencyBand": common["band"],
-                "NodeName": p3.rnc if p3 else None,
-            })
-        else:
-            p4 = cell.profile_4g
-            rows["4G"].append({
-                "Site Name": common["site_code"],
-                "CellName": common["cellname"],
-                "Longitude": common["lon"],
-                "Latitude": common["lat"],
-                "AntennaType": common["ant_type"],
-                "MaxCellRadius": common["radius"],
-                "AntennaGain": common["gain"],
-                "BSNominalPower": common["pwr"],
-                "AntennaSpec": common["spec"],
-                "HeightAGL": common["hba"],
-                "DownTilt": common["down_tilt"],
-                "MechanicalTilt": common["mech_tilt"],
-                "ElectricalTilt": common["elec_tilt"],
-                "Azimuth": common["az"],
-                "HorizBeamWidth": common["h_bw"],
-                "TAC ": p4.tac if p4 else None,
-                "E-UTRANCELLID": p4.ci if p4 and p4.ci is not None else cid,
-                "EARFCN": p4.earfcn if p4 else None,
-                "FrequencyBand": common["band"],
-                "PCI": p4.pci if p4 else None,
-                "NodeName": p4.enodeb if p4 else None,
-            })
+def _get_cell_export_job(job_id):
+    with _cell_export_jobs_lock:
+        return dict(_cell_export_jobs.get(job_id, {}))
 
-        if issues:
-            not_found_rows.append({
-                "CELLNAME": cell.cellname,
-                "TECHNOLOGY": cell.technology,
-                "ISSUE": ", ".join(issues),
-                "DETAIL": "Missing relationship Cell->Sector->Site.",
-            })
 
-    wb = Workbook()
-    wb.remove(wb.active)
-    for tech in ("2G", "3G", "4G"):
-        ws = wb.create_sheet(tech)
-        headers = LBS_HEADERS[tech]
-        ws.append(headers)
-        for row in rows[tech]:
-            ws.append([row.get(h) for h in headers])
+def _cell_exports_dir(app_obj=None):
+    out_dir = Path((app_obj or current_app).instance_path) / "cell_exports"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return out_dir
 
-    ws_nf = wb.create_sheet("NOT_FOUND")
-    nf_headers = ["CELLNAME", "TECHNOLOGY", "ISSUE", "DETAIL"]
-    ws_nf.append(nf_headers)
-    for row in not_found_rows:
-        ws_nf.append([row.get(h) for h in nf_headers])
 
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    filename = f"lbs_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+def _run_cell_export_job(app_obj, job_id, kind, cell_names):
+    started_at = datetime.utcnow()
+    _set_cell_export_job(
+        job_id,
+        status="processing",
+        progress=2,
+        message=f"Starting {CELL_EXPORT_KINDS[kind]} export...",
+        started_at=started_at.isoformat(),
+    )
+    try:
+        with app_obj.app_context():
+            out_dir = _cell_exports_dir(app_obj)
+            prune_old_exports(out_dir, "*.xlsx*", CELL_EXPORT_RETENTION_HOURS)
+            writer = StreamingXlsxWriter()
+
+            def progress_cb(done, total, msg):
+                _set_cell_export_job(
+                    job_id,
+                    progress=2 + int(done * 90 / max(total, 1)),
+                    processed=int(done),
+                    total=int(total),
+                    rows_written=writer.rows_written,
+                    message=msg,
+                )
+
+            if kind == "allplan":
+                _write_allplan_workbook(cell_names, writer, progress_cb=progress_cb)
+            else:
+                _write_lbs_workbook(cell_names, writer, build_ran_reference_map(app_obj.instance_path), progress_cb=progress_cb)
+            _set_cell_export_job(job_id, progress=95, message="Saving workbook...")
+
+            out_path = out_dir / f"{kind}_{job_id}.xlsx"
+            part_path = out_dir / f"{kind}_{job_id}.xlsx.part"
+            writer.save(part_path)
+            os.replace(part_path, out_path)
+            _set_cell_export_job(
+                job_id,
+                status="completed",
+                progress=100,
+                message=f"{CELL_EXPORT_KINDS[kind]} export completed: {writer.rows_written} rows.",
+                rows_written=writer.rows_written,
+                file_path=str(out_path),
+                download_name=f"{kind}_export_{started_at.strftime('%Y%m%d_%H%M%S')}.xlsx",
+                finished_at=datetime.utcnow().isoformat(),
+            )
+    except Exception as exc:
+        logger.exception("%s async export failed", CELL_EXPORT_KINDS[kind])
+        _set_cell_export_job(
+            job_id,
+            status="failed",
+            progress=100,
+            message=f"{CELL_EXPORT_KINDS[kind]} export failed: {exc}",
+            finished_at=datetime.utcnow().isoformat(),
+        )
+
+
+def _start_cell_export(kind):
+    uploaded_file = request.files.get("cell_file")
+    try:
+        if uploaded_file and uploaded_file.filename:
+            cell_names = _parse_cell_file(uploaded_file)
+        else:
+            cell_names = _parse_cell_list(request.form.get("cell_list", ""))
+    except ValueError as exc:
+        return jsonify({"success": False, "message": str(exc)}), 400
+    if not cell_names:
+        return jsonify({"success": False, "message": "Please provide a non-empty cell list (.xlsx/.csv or text)."}), 400
+
+    job_id = uuid.uuid4().hex
+    _set_cell_export_job(
+        job_id,
+        status="queued",
+        progress=0,
+        message=f"{CELL_EXPORT_KINDS[kind]} export queued ({len(cell_names)} cells)...",
+        total=len(cell_names),
+        processed=0,
+        rows_written=0,
+        created_at=datetime.utcnow().isoformat(),
     )
+    app_obj = current_app._get_current_object()
+    threading.Thread(target=_run_cell_export_job, args=(app_obj, job_id, kind, cell_names), daemon=True).start()
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": url_for("main.cell_export_status", job_id=job_id),
+        "download_url": url_for("main.cell_export_download", job_id=job_id),
+    }), 202
+
+
+@main_bp.route('/export-allplan/start', methods=['POST'])
+@login_required
+@csrf_protect
+def start_allplan_export():
+    return _start_cell_export("allplan")
+
 
+@main_bp.route('/export-lbs/start', methods=['POST'])
+@login_required
+@csrf_protect
+def start_lbs_export():
+    return _start_cell_export("lbs")
+
+
+@main_bp.route('/export-cells/status/<job_id>', methods=['GET'])
+@login_required
+def cell_export_status(job_id):
+    job = _get_cell_export_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Export job not found."}), 404
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": job.get("status", "unknown"),
+        "progress": int(job.get("progress", 0)),
+        "message": job.get("message", ""),
+        "processed": int(job.get("processed", 0)),
+        "total": int(job.get("total", 0)),
+        "rows_written": int(job.get("rows_written", 0)),
+        "download_ready": bool(job.get("file_path")),
+        "download_url": url_for("main.cell_export_download", job_id=job_id),
+    }), 200
+
+
+@main_bp.route('/export-cells/download/<job_id>', methods=['GET'])
+@login_required
+def cell_export_download(job_id):
+    job = _get_cell_export_job(job_id)
+    file_path = job.get("file_path") if job else None
+    if not file_path:
+        return jsonify({"success": False, "message": "Export file not ready."}), 404
+    p = Path(file_path)
+    if not p.exists():
+        return jsonify({"success": False, "message": "Export file missing."}), 404
+    return send_xlsx_file(p, job.get("download_name", p.name), remove_after=False)
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from flask import Blueprint, current_app, jsonify, request, send_file
+
+from app.security import get_accessible_site_ids, login_required, site_scope_fingerprint
+from app.services.data_version import INVENTORY_SCOPE, get_data_version
+from app.services.map_tiles import TILE_LAYERS, TILE_MAX_ZOOM, build_tile, is_valid_tile
+from app.services.site_index import get_site_index
+
+map_bp = Blueprint('map_bp', __name__)
+logger = logging.getLogger(__name__)
+_tiles_lock = threading.Lock()
+_tiles_prune = {"running": False, "next_at": 0.0}
+GEOJSON_MIMETYPE = "application/geo+json"
+CREATED_MARKER = ".created"
+# How often a worker re-checks the tile cache size while serving tiles of the same version.
+TILE_PRUNE_INTERVAL_SECONDS = 300
+
+
+def _created_at(version_dir):
+    try:
+        return (version_dir / CREATED_MARKER).stat().st_mtime
+    except OSError:
+        try:
+            return version_dir.stat().st_mtime
+        except OSError:
+            return None
+
+
+def _prune_tile_cache(root, grace_seconds, max_bytes):
+    """Drop superseded data versions after the grace period, then the oldest tiles beyond max_bytes.
+
+    Other workers and in-flight requests may still read an older version, or delete the same
+    files, so every filesystem error is treated as "already gone".
+    """
+    try:
+        versions = sorted(
+            (int(path.name[1:]), path)
+            for path in root.iterdir()
+            if path.is_dir() and path.name[:1] == "v" and path.name[1:].isdigit()
+        )
+    except OSError:
+        return
+    now = time.time()
+    kept = []
+    successor_created = None
+    for _number, version_dir in reversed(versions):
+        # A version is only dropped once its successor has existed for the whole grace period.
+        if successor_created is not None and now - successor_created > grace_seconds:
+            shutil.rmtree(version_dir, ignore_errors=True)
+        else:
+            kept.append(version_dir)
+        successor_created = _created_at(version_dir) or successor_created
+
+    tiles = []
+    total = 0
+    for version_dir in kept:
+        for dirpath, _dirnames, filenames in os.walk(version_dir):
+            for filename in filenames:
+                if filename == CREATED_MARKER:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                tiles.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+    if total <= max_bytes:
+        return
+    # Evict down to 80% of the cap so the next few tiles do not trigger another walk.
+    target = max_bytes * 0.8
+    for _mtime, size, path in sorted(tiles):
+        if total <= target:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def _run_tile_prune(root, grace_seconds, max_bytes):
+    try:
+        _prune_tile_cache(root, grace_seconds, max_bytes)
+    except Exception:
+        logger.exception("Map tile cache prune failed")
+    finally:
+        with _tiles_lock:
+            _tiles_prune["running"] = False
+
+
+def _schedule_tile_prune(root, force=False):
+    now = time.monotonic()
+    with _tiles_lock:
+        if _tiles_prune["running"] or (not force and now < _tiles_prune["next_at"]):
+            return
+        _tiles_prune["running"] = True
+        _tiles_prune["next_at"] = now + TILE_PRUNE_INTERVAL_SECONDS
+    threading.Thread(
+        target=_run_tile_prune,
+        args=(
+            root,
+            float(current_app.config.get("MAP_TILES_GRACE_SECONDS", 600)),
+            int(current_app.config.get("MAP_TILES_CACHE_MAX_MB", 512)) * 1024 * 1024,
+        ),
+        daemon=True,
+    ).start()
+
+
+def _tiles_cache_dir(data_version):
+    """instance/map_tiles/v<version>; older versions and excess tiles are pruned in the background."""
+    root = Path(current_app.instance_path) / "map_tiles"
+    version_dir = root / f"v{data_version}"
+    if not version_dir.exists():
+        version_dir.mkdir(parents=True, exist_ok=True)
+        marker = version_dir / CREATED_MARKER
+        if not marker.exists():
+            marker.touch()
+        _schedule_tile_prune(root, force=True)
+    else:
+        _schedule_tile_prune(root)
+    return version_dir
+
+
+def _store_tile(tile_path, body):
+    part_path = tile_path.with_name(f"{tile_path.name}.{uuid.uuid4().hex}.part")
+    try:
+        tile_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path.write_text(body, encoding="utf-8")
+        os.replace(part_path, tile_path)
+    except OSError:
+        # The directory was pruned underneath us; the tile is still served from memory.
+        part_path.unlink(missing_ok=True)
+
+
+@map_bp.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>')
+@login_required
+def map_tile(layer, z, x, y):
+    if layer not in TILE_LAYERS or not is_valid_tile(z, x, y):
+        return jsonify({"success": False, "message": "Unknown tile."}), 404
+
+    accessible_sites = get_accessible_site_ids()
+    data_version = get_data_version(INVENTORY_SCOPE)
+    fingerprint = site_scope_fingerprint(accessible_sites)
+    tile_path = _tiles_cache_dir(data_version) / fingerprint / layer / str(z) / str(x) / f"{y}.geojson"
+    # The URL is shared by every user but the body follows their scope: browser cache only.
+    etag = f"{data_version}-{fingerprint}"
+    try:
+        response = send_file(str(tile_path), mimetype=GEOJSON_MIMETYPE, max_age=None, etag=etag)
+    except FileNotFoundError:
+        body = json.dumps(build_tile(layer, z, x, y, accessible_sites), separators=(",", ":"))
+        _store_tile(tile_path, body)
+        response = current_app.response_class(body, mimetype=GEOJSON_MIMETYPE)
+        response.set_etag(etag)
+        response.make_conditional(request)
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    response.vary.add("Cookie")
+    return response
+
+
+def _parse_bbox(raw):
+    try:
+        west, south, east, north = (float(part) for part in (raw or "").split(","))
+    except ValueError:
+        return None
+    if not (-180.0 <= west <= east <= 180.0 and -90.0 <= south <= north <= 90.0):
+        return None
+    return west, south, east, north
+
+
+@map_bp.route('/sites/viewport')
+@login_required
+def sites_viewport():
+    bbox = _parse_bbox(request.args.get("bbox"))
+    zoom = request.args.get("zoom", type=int)
+    if bbox is None or zoom is None or not 0 <= zoom <= TILE_MAX_ZOOM:
+        return jsonify({"success": False, "message": "bbox=west,south,east,north and zoom are required."}), 400
+
+    accessible_sites = get_accessible_site_ids()
+    if accessible_sites is not None and not accessible_sites:
+        return jsonify({"success": True, "zoom": zoom, "clustered": False, "truncated": False, "total": 0, "points": []})
+
+    index = get_site_index(current_app._get_current_object(), get_data_version(INVENTORY_SCOPE))
+    result = index.query(bbox, zoom, accessible_sites)
+    return jsonify({"success": True, "zoom": zoom, **result})
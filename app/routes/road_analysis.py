@@ -1,28 +1,97 @@
+import codecs
 import io
 import json
 import csv
+import logging
+import re
+import threading
+import uuid
 import xml.etree.ElementTree as ET
+import zipfile
+from dataclasses import asdict
 from datetime import datetime
+from pathlib import Path
 from urllib.error import URLError, HTTPError
 from urllib.parse import urlparse
 from urllib.request import Request, urlopen
 
-from flask import Blueprint, current_app, flash, redirect, render_template, request, send_file, url_for
-from openpyxl import Workbook
+from flask import Blueprint, current_app, flash, jsonify, redirect, render_template, request, send_file, url_for
+from sqlalchemy import update
 
 from app import db
 from app.models import Road
-from app.security import admin_required, get_accessible_site_ids, login_required
+from app.security import admin_required, csrf_protect, get_accessible_site_ids, is_admin_user, login_required
+from app.services.bulk_load import copy_rows
+from app.services.data_version import flag_bulk_write
+from app.services.excel_export import StreamingXlsxWriter, prune_old_exports, send_streaming_workbook
 from app.services.road_analysis_service import (
     DEFAULT_BEAM_LENGTH_M,
     DEFAULT_SITE_DISTANCE_M,
     DEFAULT_BEAM_WIDTH_DEG,
     DEFAULT_MAX_SITES,
+    RoadAnalysisResult,
     analyze_road_for_sites_and_sectors,
+    analyze_roads_batch,
+    build_inventory_snapshot,
+    simplify_line_coords,
 )
+from app.services.write_coordinator import claim_write_slot, commit_slice
 
 
 road_bp = Blueprint("road_bp", __name__)
+logger = logging.getLogger(__name__)
+_road_jobs = {}
+_road_jobs_lock = threading.Lock()
+ROAD_UPSERT_CHUNK_SIZE = 500
+# Road job outputs (single-road JSON results, batch workbooks/archives) are dropped after this long.
+ROAD_EXPORT_RETENTION_HOURS = 24
+
+ROAD_SITE_HEADERS = [
+    "site_code",
+    "site_name",
+    "latitude",
+    "longitude",
+    "selected_road",
+    "distance_to_road_m",
+    "distance_perpendicular_m",
+    "nearest_road_latitude",
+    "nearest_road_longitude",
+    "perpendicular_road_latitude",
+    "perpendicular_road_longitude",
+    "bearing_to_road_deg",
+    "bearing_perpendicular_deg",
+]
+ROAD_SECTOR_HEADERS = [
+    "site_code",
+    "site_name",
+    "sector_code",
+    "dlarfcn_list",
+    "azimuth_deg",
+    "distance_to_road_m",
+    "distance_perpendicular_m",
+    "distance_intersection_m",
+    "bearing_to_road_deg",
+    "bearing_perpendicular_deg",
+    "bearing_intersection_deg",
+    "intersection_road_latitude",
+    "intersection_road_longitude",
+    "intersects_road_1km_beam60",
+    "angular_difference_deg",
+    "beamwidth_deg",
+    "facing_threshold_deg",
+    "facing_road",
+]
+ROAD_BATCH_SUMMARY_HEADERS = [
+    "road_id",
+    "road_code",
+    "road_name",
+    "sheet",
+    "total_sites",
+    "total_sectors",
+    "facing_sectors",
+    "facing_ratio_pct",
+    "status",
+]
 
 
 def _safe_int(value, default):
@@ -137,42 +206,70 @@ def _parse_kml_coord_text(text):
     return coords
 
 
-def _kml_to_geometry(upload, road_name, road_code=None):
-    raw = upload.read()
-    try:
-        text = raw.decode("utf-8-sig")
-    except UnicodeDecodeError:
-        text = raw.decode("latin-1")
+def _iter_decoded_chunks(stream, encoding, chunk_size=1 << 20):
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            yield decoder.decode(b"", final=True)
+            return
+        yield decoder.decode(chunk)
 
-    try:
-        root = ET.fromstring(text)
-    except Exception as exc:
-        raise ValueError(f"Invalid KML XML: {exc}") from exc
 
+def _kml_coordinates(stream, encoding):
+    """LineString coordinate lists and ordered Point coordinates of a KML document decoded as ``encoding``."""
     lines = []
-    # Priority 1: use LineString geometries (best representation for roads).
-    for elem in root.iter():
-        if not isinstance(elem.tag, str) or not elem.tag.endswith("LineString"):
-            continue
-        for child in list(elem):
-            if isinstance(child.tag, str) and child.tag.endswith("coordinates"):
-                current = _parse_kml_coord_text(child.text)
-                if len(current) >= 2:
-                    lines.append(current)
-
-    # Priority 2: fallback to ordered Point placemarks if no LineString found.
-    if not lines:
-        coords = []
-        for elem in root.iter():
-            if not isinstance(elem.tag, str) or not elem.tag.endswith("Point"):
+    point_coords = []
+    stack = []
+    parser = ET.XMLPullParser(events=("start", "end"))
+
+    def handle_events():
+        for event, elem in parser.read_events():
+            if event == "start":
+                stack.append(elem)
                 continue
-            for child in list(elem):
-                if isinstance(child.tag, str) and child.tag.endswith("coordinates"):
-                    current = _parse_kml_coord_text(child.text)
+            stack.pop()
+            tag = elem.tag if isinstance(elem.tag, str) else ""
+            parent_tag = stack[-1].tag if stack and isinstance(stack[-1].tag, str) else ""
+            if tag.endswith("coordinates"):
+                # Priority 1: LineString geometries (best representation for roads).
+                if parent_tag.endswith("LineString"):
+                    current = _parse_kml_coord_text(elem.text)
+                    if len(current) >= 2:
+                        lines.append(current)
+                # Priority 2: ordered Point placemarks, used only if no LineString is found.
+                elif parent_tag.endswith("Point") and not lines:
+                    current = _parse_kml_coord_text(elem.text)
                     if current:
-                        coords.append(current[0])
-        if len(coords) >= 2:
-            lines = [coords]
+                        point_coords.append(current[0])
+            elem.clear()
+            if stack and len(stack[-1]) and stack[-1][-1] is elem:
+                del stack[-1][-1]
+
+    # Stream the document: each element is dropped once handled, so memory
+    # stays flat even for very large route files.
+    for text in _iter_decoded_chunks(stream, encoding):
+        parser.feed(text)
+        handle_events()
+    parser.close()
+    handle_events()
+    return lines, point_coords
+
+
+def _kml_to_geometry(upload, road_name, road_code=None):
+    stream = getattr(upload, "stream", upload)
+    try:
+        try:
+            lines, point_coords = _kml_coordinates(stream, "utf-8-sig")
+        except UnicodeDecodeError:
+            # Not UTF-8: read the file again as latin-1, as whole-file decoding did.
+            stream.seek(0)
+            lines, point_coords = _kml_coordinates(stream, "latin-1")
+    except ET.ParseError as exc:
+        raise ValueError(f"Invalid KML XML: {exc}") from exc
+
+    if not lines and len(point_coords) >= 2:
+        lines = [point_coords]
 
     if not lines:
         raise ValueError("KML must contain at least 2 coordinates (LineString or Point list).")
@@ -193,17 +290,105 @@ def _kml_to_geometry(upload, road_name, road_code=None):
     }
 
 
-def _extract_geojson_features(payload):
-    if not isinstance(payload, dict):
+def _iter_geojson_features(stream, chunk_size=1 << 20):
+    """Yield the features of a GeoJSON FeatureCollection read from a binary stream.
+
+    Features are decoded one at a time from a sliding text buffer, so only the
+    current feature (plus one read chunk) is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    state = {"buf": "", "pos": 0, "eof": False}
+
+    def fill(min_size):
+        buf = state["buf"][state["pos"]:]
+        while not state["eof"] and len(buf) < min_size:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                state["eof"] = True
+                buf += text_decoder.decode(b"", final=True)
+                break
+            buf += text_decoder.decode(chunk)
+        state["buf"] = buf
+        state["pos"] = 0
+
+    def peek():
+        while True:
+            buf, pos = state["buf"], state["pos"]
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            state["pos"] = pos
+            if pos < len(buf):
+                return buf[pos]
+            if state["eof"]:
+                return ""
+            fill(1)
+
+    def expect(char):
+        if peek() != char:
+            raise ValueError(f"Invalid GeoJSON file: expected '{char}' at offset {state['pos']}.")
+        state["pos"] += 1
+
+    def read_value():
+        want = chunk_size
+        while True:
+            try:
+                value, end = decoder.raw_decode(state["buf"], state["pos"])
+                # A number ending exactly at the buffer edge may be truncated.
+                if end < len(state["buf"]) or state["eof"]:
+                    state["pos"] = end
+                    return value
+            except json.JSONDecodeError as exc:
+                if state["eof"]:
+                    raise ValueError(f"Invalid GeoJSON file: {exc}") from exc
+            # Grow geometrically so a huge feature is re-scanned only a few times.
+            fill(len(state["buf"]) - state["pos"] + want)
+            want *= 2
+
+    fill(chunk_size)
+    if peek() != "{":
         raise ValueError("GeoJSON payload must be a JSON object.")
-    features = payload.get("features")
-    if not isinstance(features, list):
+    state["pos"] += 1
+    found_features = False
+    while peek() != "}":
+        if not peek():
+            raise ValueError("Invalid GeoJSON file: unexpected end of data.")
+        key = read_value()
+        expect(":")
+        if key == "features" and peek() == "[":
+            found_features = True
+            state["pos"] += 1
+            if peek() == "]":
+                state["pos"] += 1
+            else:
+                while True:
+                    peek()
+                    yield read_value()
+                    if peek() == ",":
+                        state["pos"] += 1
+                        continue
+                    expect("]")
+                    break
+        else:
+            peek()
+            read_value()
+        if peek() == ",":
+            state["pos"] += 1
+    if not found_features:
         raise ValueError("GeoJSON must contain a FeatureCollection with features.")
-    return features
 
 
-def _upsert_roads_from_features(features):
+def _upsert_roads_from_features(features, simplify_tolerance_m=0.0, progress_cb=None):
     grouped = {}
+    vertex_stats = {"before": 0, "after": 0}
+
+    def add_line(bucket, line):
+        vertex_stats["before"] += len(line)
+        if simplify_tolerance_m and simplify_tolerance_m > 0:
+            line = simplify_line_coords(line, simplify_tolerance_m)
+        vertex_stats["after"] += len(line)
+        bucket["lines"].append(line)
+
     for idx, feat in enumerate(features, start=1):
         if not isinstance(feat, dict):
             continue
@@ -234,12 +419,27 @@ def _upsert_roads_from_features(features):
         coords = geom.get("coordinates") or []
         if gtype == "LineString":
             if len(coords) >= 2:
-                bucket["lines"].append(coords)
+                add_line(bucket, coords)
         elif gtype == "MultiLineString":
             for line in coords:
                 if isinstance(line, list) and len(line) >= 2:
-                    bucket["lines"].append(line)
-
+                    add_line(bucket, line)
+
+    # Preload every road once; lookups then follow the previous query order
+    # (code first, then the lowest id with that name) without per-road queries.
+    by_code = {}
+    by_name = {}
+    current = {}
+    next_key = 1
+    for road_id, code, name in db.session.query(Road.id, Road.code, Road.name).order_by(Road.id.asc()):
+        current[road_id] = (code, name)
+        if code:
+            by_code[code] = road_id
+        by_name.setdefault(name, []).append(road_id)
+        next_key = road_id + 1
+
+    pending_inserts = {}
+    pending_updates = {}
     added = 0
     updated = 0
     for item in grouped.values():
@@ -251,51 +451,121 @@ def _upsert_roads_from_features(features):
             geom = {"type": "LineString", "coordinates": item["lines"][0]}
         else:
             geom = {"type": "MultiLineString", "coordinates": item["lines"]}
-        geom_json = json.dumps(geom, ensure_ascii=True)
-
-        existing = None
-        if road_code:
-            existing = Road.query.filter_by(code=road_code).first()
-        if not existing:
-            existing = Road.query.filter_by(name=road_name).first()
-
-        if existing:
-            existing.name = road_name
-            existing.code = road_code
-            existing.geometry_geojson = geom_json
-            existing.is_active = True
+        row = {
+            "code": road_code,
+            "name": road_name,
+            "geometry_geojson": json.dumps(geom, ensure_ascii=True),
+            "is_active": True,
+        }
+
+        target = by_code.get(road_code) if road_code else None
+        if target is None and by_name.get(road_name):
+            target = by_name[road_name][0]
+
+        if target is not None:
+            old_code, old_name = current[target]
+            if old_code and by_code.get(old_code) == target:
+                del by_code[old_code]
+            by_name[old_name].remove(target)
+            if not by_name[old_name]:
+                del by_name[old_name]
+            if target in pending_inserts:
+                pending_inserts[target].update(row)
+            else:
+                pending_updates[target] = {"id": target, **row}
             updated += 1
         else:
-            db.session.add(
-                Road(
-                    code=road_code,
-                    name=road_name,
-                    geometry_geojson=geom_json,
-                    is_active=True,
-                )
-            )
+            target = next_key
+            next_key += 1
+            pending_inserts[target] = row
             added += 1
+
+        current[target] = (road_code, road_name)
+        if road_code:
+            by_code[road_code] = target
+        names = by_name.setdefault(road_name, [])
+        names.append(target)
+        names.sort()
+
+    # Updates go first so codes released by renamed roads are free for inserts.
+    update_rows = list(pending_updates.values())
+    insert_rows = list(pending_inserts.values())
+    total = len(update_rows) + len(insert_rows)
+    done = 0
+    # Called from web requests: write through the slot without queueing behind background jobs,
+    # and commit whenever the slice is due so other writers are not held behind the whole import.
+    pending_slice = commit_slice()
+    for stmt, rows in ((update(Road), update_rows), (None, insert_rows)):
+        for idx in range(0, len(rows), ROAD_UPSERT_CHUNK_SIZE):
+            chunk = rows[idx:idx + ROAD_UPSERT_CHUNK_SIZE]
+            if stmt is None:
+                # COPY on PostgreSQL; bypasses the ORM, so the write slot and the roads version are handled by hand.
+                claim_write_slot(db.session)
+                copy_rows(db.session.connection(), Road.__table__, chunk)
+                flag_bulk_write(db.session, {Road.__tablename__})
+            else:
+                db.session.execute(stmt, chunk)
+            done += len(chunk)
+            if pending_slice.add(len(chunk)):
+                db.session.commit()
+                pending_slice.reset()
+            if progress_cb:
+                progress_cb(done, total, f"Saving roads {done}/{total}")
     db.session.commit()
-    return added, updated
+    return added, updated, vertex_stats
+
+
+def _log_road_progress(label):
+    """progress_cb for web imports: the request blocks until done, so progress goes to the server log."""
+    def report(done, total, message):
+        logger.info("%s: %s", label, message)
+    return report
+
+
+def import_roads_from_source(source, simplify_tolerance_m=0.0, progress_cb=None):
+    """Upsert roads from a GeoJSON FeatureCollection file path or http(s) URL (``flask import-roads``)."""
+    if urlparse(source).scheme in {"http", "https"}:
+        return _upsert_roads_from_features(
+            _iter_geojson_features_from_url(source), simplify_tolerance_m=simplify_tolerance_m, progress_cb=progress_cb,
+        )
+    with open(source, "rb") as stream:
+        return _upsert_roads_from_features(
+            _iter_geojson_features(stream), simplify_tolerance_m=simplify_tolerance_m, progress_cb=progress_cb,
+        )
+
+
+def _simplify_tolerance_from_request():
+    default = float(current_app.config.get("ROAD_SIMPLIFY_TOLERANCE_M", 0.0) or 0.0)
+    return max(0.0, min(1000.0, _safe_float(request.form.get("simplify_tolerance_m"), default)))
 
 
-def _load_geojson_from_url(url):
+def _import_summary(label, added, updated, vertex_stats):
+    message = f"{label} completed: {added} added, {updated} updated."
+    before = vertex_stats.get("before", 0)
+    after = vertex_stats.get("after", 0)
+    if before and after < before:
+        reduction = (before - after) * 100.0 / before
+        message += f" Simplified {before:,} -> {after:,} vertices (-{reduction:.1f}%)."
+    return message
+
+
+def _iter_geojson_features_from_url(url):
     parsed = urlparse(url)
     if parsed.scheme not in {"http", "https"}:
         raise ValueError("URL must start with http:// or https://")
     timeout = int(current_app.config.get("ROAD_IMPORT_HTTP_TIMEOUT", 45))
     req = Request(url, headers={"User-Agent": "RANSites-RoadImporter/1.0"})
     try:
-        with urlopen(req, timeout=timeout) as resp:
-            raw = resp.read()
+        resp = urlopen(req, timeout=timeout)
     except HTTPError as exc:
         raise ValueError(f"HTTP error {exc.code} while fetching roads URL.") from exc
     except URLError as exc:
         raise ValueError(f"Network error while fetching roads URL: {exc.reason}") from exc
-    try:
-        return json.loads(raw.decode("utf-8"))
-    except Exception as exc:
-        raise ValueError(f"Fetched file is not valid JSON: {exc}") from exc
+    with resp:
+        try:
+            yield from _iter_geojson_features(resp)
+        except (URLError, OSError) as exc:
+            raise ValueError(f"Network error while reading roads URL: {exc}") from exc
 
 
 @road_bp.route("/road-analysis", methods=["GET"])
@@ -311,6 +581,7 @@ def road_analysis_page():
             "site_distance_m": int(DEFAULT_SITE_DISTANCE_M),
             "beam_width_deg": int(DEFAULT_BEAM_WIDTH_DEG),
             "beam_length_m": int(DEFAULT_BEAM_LENGTH_M),
+            "simplify_tolerance_m": current_app.config.get("ROAD_SIMPLIFY_TOLERANCE_M", 0.0),
         },
     )
 
@@ -325,19 +596,16 @@ def import_roads_geojson():
         return redirect(url_for("road_bp.road_analysis_page"))
 
     try:
-        payload = json.loads(upload.read().decode("utf-8"))
-    except Exception as exc:
-        flash(f"Invalid GeoJSON file: {exc}", "danger")
-        return redirect(url_for("road_bp.road_analysis_page"))
-
-    try:
-        features = _extract_geojson_features(payload)
-        added, updated = _upsert_roads_from_features(features)
+        added, updated, vertex_stats = _upsert_roads_from_features(
+            _iter_geojson_features(upload.stream),
+            simplify_tolerance_m=_simplify_tolerance_from_request(),
+            progress_cb=_log_road_progress("Road import"),
+        )
     except ValueError as exc:
         flash(str(exc), "danger")
         return redirect(url_for("road_bp.road_analysis_page"))
 
-    flash(f"Road import completed: {added} added, {updated} updated.", "success")
+    flash(_import_summary("Road import", added, updated, vertex_stats), "success")
     return redirect(url_for("road_bp.road_analysis_page"))
 
 
@@ -353,14 +621,16 @@ def import_roads_from_url():
         return redirect(url_for("road_bp.road_analysis_page"))
 
     try:
-        payload = _load_geojson_from_url(roads_url)
-        features = _extract_geojson_features(payload)
-        added, updated = _upsert_roads_from_features(features)
+        added, updated, vertex_stats = _upsert_roads_from_features(
+            _iter_geojson_features_from_url(roads_url),
+            simplify_tolerance_m=_simplify_tolerance_from_request(),
+            progress_cb=_log_road_progress("Road URL import"),
+        )
     except ValueError as exc:
         flash(str(exc), "danger")
         return redirect(url_for("road_bp.road_analysis_page"))
 
-    flash(f"Road URL import completed: {added} added, {updated} updated.", "success")
+    flash(_import_summary("Road URL import", added, updated, vertex_stats), "success")
     return redirect(url_for("road_bp.road_analysis_page"))
 
 
@@ -384,12 +654,15 @@ def import_road_from_csv_points():
             Road.query.delete()
             db.session.commit()
         feature = _csv_points_to_geometry(upload, road_name=road_name, road_code=road_code)
-        added, updated = _upsert_roads_from_features([feature])
+        added, updated, vertex_stats = _upsert_roads_from_features(
+            [feature],
+            simplify_tolerance_m=_simplify_tolerance_from_request(),
+        )
     except ValueError as exc:
         flash(f"CSV import failed: {exc}", "danger")
         return redirect(url_for("road_bp.road_analysis_page"))
 
-    flash(f"CSV points import completed: {added} added, {updated} updated.", "success")
+    flash(_import_summary("CSV points import", added, updated, vertex_stats), "success")
     return redirect(url_for("road_bp.road_analysis_page"))
 
 
@@ -422,12 +695,15 @@ def import_road_from_file():
         else:
             raise ValueError("Unsupported format. Please upload .csv or .kml")
 
-        added, updated = _upsert_roads_from_features([feature])
+        added, updated, vertex_stats = _upsert_roads_from_features(
+            [feature],
+            simplify_tolerance_m=_simplify_tolerance_from_request(),
+        )
     except ValueError as exc:
         flash(f"Route import failed: {exc}", "danger")
         return redirect(url_for("road_bp.road_analysis_page"))
 
-    flash(f"Route import completed: {added} added, {updated} updated.", "success")
+    flash(_import_summary("Route import", added, updated, vertex_stats), "success")
     return redirect(url_for("road_bp.road_analysis_page"))
 
 
@@ -452,15 +728,28 @@ def import_road_from_kml():
             Road.query.delete()
             db.session.commit()
         feature = _kml_to_geometry(upload, road_name=road_name, road_code=road_code)
-        added, updated = _upsert_roads_from_features([feature])
+        added, updated, vertex_stats = _upsert_roads_from_features(
+            [feature],
+            simplify_tolerance_m=_simplify_tolerance_from_request(),
+        )
     except ValueError as exc:
         flash(f"KML import failed: {exc}", "danger")
         return redirect(url_for("road_bp.road_analysis_page"))
 
-    flash(f"KML import completed: {added} added, {updated} updated.", "success")
+    flash(_import_summary("KML import", added, updated, vertex_stats), "success")
     return redirect(url_for("road_bp.road_analysis_page"))
 
 
+def _road_result_workbook_response(result, road_id):
+    writer = StreamingXlsxWriter()
+    writer.add_sheet("Sites", ROAD_SITE_HEADERS)
+    writer.add_sheet("Sectors", ROAD_SECTOR_HEADERS)
+    writer.append_rows("Sites", result.site_rows)
+    writer.append_rows("Sectors", result.sector_rows)
+    filename = f"road_analysis_{road_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    return send_streaming_workbook(writer, filename)
+
+
 @road_bp.route("/road-analysis/results", methods=["POST"])
 @login_required
 def road_analysis_results():
@@ -489,6 +778,7 @@ def road_analysis_results():
         result=result,
         params=params,
         road_geometry_geojson=road.geometry_geojson,
+        export_url=url_for("road_bp.road_analysis_export", road_id=road.id, **params),
     )
 
 
@@ -513,61 +803,382 @@ def road_analysis_export(road_id):
     except RuntimeError as exc:
         flash(str(exc), "danger")
         return redirect(url_for("road_bp.road_analysis_page"))
+    return _road_result_workbook_response(result, road.id)
+
+
+def _set_road_job(job_id, **fields):
+    with _road_jobs_lock:
+        job = _road_jobs.get(job_id, {})
+        job.update(fields)
+        _road_jobs[job_id] = job
+        return dict(job)
+
+
+def _get_road_job(job_id):
+    with _road_jobs_lock:
+        return dict(_road_jobs.get(job_id, {}))
+
+
+def _road_exports_dir():
+    out_dir = Path(current_app.instance_path) / "road_analysis_exports"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return out_dir
+
+
+def _unique_sheet_title(text, used):
+    # Excel sheet names: max 31 chars, no []:*?/\ and case-insensitive unique.
+    base = re.sub(r"[\[\]:*?/\\]", "_", str(text or "Road")).strip() or "Road"
+    base = base[:31]
+    title = base
+    counter = 2
+    while title.lower() in used:
+        suffix = f"~{counter}"
+        title = f"{base[:31 - len(suffix)]}{suffix}"
+        counter += 1
+    used.add(title.lower())
+    return title
+
+
+def _road_batch_summary_rows(roads, results):
+    used_titles = {"network summary", "all sites"}
+    rows = []
+    for road in roads:
+        result, error = results.get(road["id"], (None, "Not analyzed"))
+        facing = sum(1 for r in result.sector_rows if r.get("facing_road")) if result else 0
+        total_sectors = result.total_sectors if result else 0
+        rows.append({
+            "road_id": road["id"],
+            "road_code": road.get("code"),
+            "road_name": road["name"],
+            "sheet": _unique_sheet_title(road.get("code") or road["name"], used_titles) if result else None,
+            "total_sites": result.total_sites if result else 0,
+            "total_sectors": total_sectors,
+            "facing_sectors": facing,
+            "facing_ratio_pct": round(facing * 100.0 / total_sectors, 1) if total_sectors else 0.0,
+            "status": "OK" if result else f"FAILED: {error}",
+            "_result": result,
+        })
+    return rows
+
+
+def _write_road_batch_workbook(summary_rows, out_path):
+    writer = StreamingXlsxWriter()
+    writer.add_sheet("Network Summary", ROAD_BATCH_SUMMARY_HEADERS)
+    writer.append_rows("Network Summary", summary_rows)
+
+    writer.add_sheet("All Sites", ["road_id", "road_code"] + ROAD_SITE_HEADERS)
+    for row in summary_rows:
+        result = row["_result"]
+        if not result:
+            continue
+        for site_row in result.site_rows:
+            writer.append("All Sites", [row["road_id"], row["road_code"]] + [site_row.get(h) for h in ROAD_SITE_HEADERS])
+
+    for row in summary_rows:
+        result = row["_result"]
+        if not result:
+            continue
+        writer.add_sheet(row["sheet"], ROAD_SECTOR_HEADERS)
+        writer.append_rows(row["sheet"], result.sector_rows)
+    writer.save(out_path)
+
+
+def _write_road_batch_parquet(summary_rows, out_path):
+    import pandas as pd
+
+    site_records = []
+    sector_records = []
+    for row in summary_rows:
+        result = row["_result"]
+        if not result:
+            continue
+        for site_row in result.site_rows:
+            site_records.append({"road_id": row["road_id"], "road_code": row["road_code"], **site_row})
+        for sector_row in result.sector_rows:
+            sector_records.append({"road_id": row["road_id"], "road_code": row["road_code"], **sector_row})
+    frames = {
+        "network_summary.parquet": pd.DataFrame(
+            [{h: row.get(h) for h in ROAD_BATCH_SUMMARY_HEADERS} for row in summary_rows],
+            columns=ROAD_BATCH_SUMMARY_HEADERS,
+        ),
+        "sites.parquet": pd.DataFrame(site_records),
+        "sectors.parquet": pd.DataFrame(sector_records),
+    }
+    with zipfile.ZipFile(str(out_path), "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, frame in frames.items():
+            buffer = io.BytesIO()
+            try:
+                frame.to_parquet(buffer, index=False)
+            except ImportError as exc:
+                raise RuntimeError("Parquet output requires 'pyarrow'. Install it with: pip install pyarrow") from exc
+            zf.writestr(name, buffer.getvalue())
+
 
-    wb = Workbook()
-    ws_sites = wb.active
-    ws_sites.title = "Sites"
-    site_headers = [
-        "site_code",
-        "site_name",
-        "latitude",
-        "longitude",
-        "selected_road",
-        "distance_to_road_m",
-        "distance_perpendicular_m",
-        "nearest_road_latitude",
-        "nearest_road_longitude",
-        "perpendicular_road_latitude",
-        "perpendicular_road_longitude",
-        "bearing_to_road_deg",
-        "bearing_perpendicular_deg",
-    ]
-    ws_sites.append(site_headers)
-    for row in result.site_rows:
-        ws_sites.append([row.get(h) for h in site_headers])
-
-    ws_sectors = wb.create_sheet("Sectors")
-    sector_headers = [
-        "site_code",
-        "site_name",
-        "sector_code",
-        "dlarfcn_list",
-        "azimuth_deg",
-        "distance_to_road_m",
-        "distance_perpendicular_m",
-        "distance_intersection_m",
-        "bearing_to_road_deg",
-        "bearing_perpendicular_deg",
-        "bearing_intersection_deg",
-        "intersection_road_latitude",
-        "intersection_road_longitude",
-        "intersects_road_1km_beam60",
-        "angular_difference_deg",
-        "beamwidth_deg",
-        "facing_threshold_deg",
-        "facing_road",
-    ]
-    ws_sectors.append(sector_headers)
-    for row in result.sector_rows:
-        ws_sectors.append([row.get(h) for h in sector_headers])
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    filename = f"road_analysis_{road.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=filename,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+def _run_road_batch_job(app_obj, job_id, road_ids, accessible_site_ids, params, output_format):
+    started_at = datetime.utcnow()
+    _set_road_job(job_id, status="processing", progress=2, message="Starting batch road analysis...", started_at=started_at.isoformat())
+    try:
+        with app_obj.app_context():
+            prune_old_exports(_road_exports_dir(), "road_*", ROAD_EXPORT_RETENTION_HOURS)
+            query = Road.query.filter_by(is_active=True).order_by(Road.name.asc())
+            if road_ids:
+                query = query.filter(Road.id.in_(road_ids))
+            roads = [
+                {"id": r.id, "code": r.code, "name": r.name, "geometry_geojson": r.geometry_geojson}
+                for r in query.all()
+            ]
+            if not roads:
+                raise ValueError("No active roads selected.")
+
+            _set_road_job(job_id, progress=4, message="Loading inventory snapshot...", total=len(roads))
+            inventory = build_inventory_snapshot(None if accessible_site_ids is None else set(accessible_site_ids))
+            results = analyze_roads_batch(
+                roads,
+                inventory,
+                max_sites=params["max_sites"],
+                beam_width_deg=params["beam_width_deg"],
+                beam_length_m=params["beam_length_m"],
+                site_distance_m=params["site_distance_m"],
+                max_workers=current_app.config.get("ROAD_BATCH_MAX_WORKERS") or None,
+                progress_cb=lambda done, total, msg: _set_road_job(
+                    job_id,
+                    progress=5 + int(done * 90 / max(total, 1)),
+                    processed=int(done),
+                    total=int(total),
+                    message=msg,
+                ),
+            )
+
+            _set_road_job(job_id, progress=96, message="Writing batch output...")
+            summary_rows = _road_batch_summary_rows(roads, results)
+            stamp = started_at.strftime("%Y%m%d_%H%M%S")
+            if output_format == "parquet":
+                out_path = _road_exports_dir() / f"road_batch_{job_id}.zip"
+                _write_road_batch_parquet(summary_rows, out_path)
+                download_name = f"road_analysis_batch_{stamp}_parquet.zip"
+            else:
+                out_path = _road_exports_dir() / f"road_batch_{job_id}.xlsx"
+                _write_road_batch_workbook(summary_rows, out_path)
+                download_name = f"road_analysis_batch_{stamp}.xlsx"
+
+            failed = sum(1 for row in summary_rows if not row["_result"])
+            _set_road_job(
+                job_id,
+                status="completed",
+                progress=100,
+                message=f"Batch road analysis completed: {len(roads) - failed} roads analyzed, {failed} failed.",
+                file_path=str(out_path),
+                download_name=download_name,
+                finished_at=datetime.utcnow().isoformat(),
+            )
+    except Exception as exc:
+        logger.exception("Batch road analysis failed")
+        _set_road_job(
+            job_id,
+            status="failed",
+            progress=100,
+            message=f"Batch road analysis failed: {exc}",
+            finished_at=datetime.utcnow().isoformat(),
+        )
+
+
+@road_bp.route("/road-analysis/batch/start", methods=["POST"])
+@login_required
+@csrf_protect
+def start_road_batch_analysis():
+    road_ids = [rid for rid in (_safe_int(v, 0) for v in request.form.getlist("road_ids")) if rid > 0]
+    output_format = "parquet" if (request.form.get("output_format") or "").strip().lower() == "parquet" else "xlsx"
+    accessible_sites = None if is_admin_user() else get_accessible_site_ids()
+    params = _analysis_params_from_request()
+    job_id = uuid.uuid4().hex
+    _set_road_job(job_id, status="queued", progress=0, message="Batch road analysis queued...")
+    app_obj = current_app._get_current_object()
+    threading.Thread(
+        target=_run_road_batch_job,
+        args=(
+            app_obj,
+            job_id,
+            road_ids,
+            None if accessible_sites is None else list(accessible_sites),
+            params,
+            output_format,
+        ),
+        daemon=True,
+    ).start()
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": url_for("road_bp.road_batch_job_status", job_id=job_id),
+        "download_url": url_for("road_bp.road_batch_job_download", job_id=job_id),
+    }), 202
+
+
+@road_bp.route("/road-analysis/batch/status/<job_id>", methods=["GET"])
+@login_required
+def road_batch_job_status(job_id):
+    job = _get_road_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Batch job not found."}), 404
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": job.get("status", "unknown"),
+        "progress": int(job.get("progress", 0)),
+        "message": job.get("message", ""),
+        "processed": int(job.get("processed", 0)),
+        "total": int(job.get("total", 0)),
+        "download_ready": bool(job.get("file_path")),
+        "download_url": url_for("road_bp.road_batch_job_download", job_id=job_id),
+    }), 200
+
+
+@road_bp.route("/road-analysis/batch/download/<job_id>", methods=["GET"])
+@login_required
+def road_batch_job_download(job_id):
+    job = _get_road_job(job_id)
+    file_path = job.get("file_path") if job else None
+    if not file_path:
+        return jsonify({"success": False, "message": "Batch output not ready."}), 404
+    p = Path(file_path)
+    if not p.exists():
+        return jsonify({"success": False, "message": "Batch output missing."}), 404
+    return send_file(str(p), as_attachment=True, download_name=job.get("download_name", p.name))
+
+
+def _run_road_analysis_job(app_obj, job_id, road_id, accessible_site_ids, params):
+    started_at = datetime.utcnow()
+    _set_road_job(job_id, status="processing", progress=2, message="Starting road analysis...", started_at=started_at.isoformat())
+    try:
+        with app_obj.app_context():
+            prune_old_exports(_road_exports_dir(), "road_*", ROAD_EXPORT_RETENTION_HOURS)
+            road = db.session.get(Road, road_id)
+            if not road or not road.is_active:
+                raise ValueError("Selected road not found.")
+            result = analyze_road_for_sites_and_sectors(
+                road_obj=road,
+                accessible_site_ids=None if accessible_site_ids is None else set(accessible_site_ids),
+                max_sites=params["max_sites"],
+                beam_width_deg=params["beam_width_deg"],
+                beam_length_m=params["beam_length_m"],
+                site_distance_m=params["site_distance_m"],
+                progress_cb=lambda done, total, msg: _set_road_job(
+                    job_id,
+                    progress=5 + int(done * 90 / max(total, 1)),
+                    processed=int(done),
+                    total=int(total),
+                    message=msg,
+                ),
+            )
+            out_path = _road_exports_dir() / f"road_result_{job_id}.json"
+            out_path.write_text(
+                json.dumps({
+                    "params": params,
+                    "road_geometry_geojson": road.geometry_geojson,
+                    "result": asdict(result),
+                }),
+                encoding="utf-8",
+            )
+            _set_road_job(
+                job_id,
+                status="completed",
+                progress=100,
+                message=f"Road analysis completed: {result.total_sites} sites, {result.total_sectors} sectors.",
+                result_path=str(out_path),
+                road_id=road.id,
+                finished_at=datetime.utcnow().isoformat(),
+            )
+    except Exception as exc:
+        logger.exception("Road analysis job failed")
+        _set_road_job(
+            job_id,
+            status="failed",
+            progress=100,
+            message=f"Road analysis failed: {exc}",
+            finished_at=datetime.utcnow().isoformat(),
+        )
+
+
+def _load_road_job_result(job_id):
+    job = _get_road_job(job_id)
+    result_path = job.get("result_path") if job else None
+    if not result_path or not Path(result_path).exists():
+        return None
+    payload = json.loads(Path(result_path).read_text(encoding="utf-8"))
+    payload["result"] = RoadAnalysisResult(**payload["result"])
+    return payload
+
+
+@road_bp.route("/road-analysis/start", methods=["POST"])
+@login_required
+@csrf_protect
+def start_road_analysis():
+    road_id = _safe_int(request.form.get("road_id"), 0)
+    road = Road.query.get(road_id)
+    if not road or not road.is_active:
+        return jsonify({"success": False, "message": "Selected road not found."}), 404
+
+    accessible_sites = None if is_admin_user() else get_accessible_site_ids()
+    params = _analysis_params_from_request()
+    job_id = uuid.uuid4().hex
+    _set_road_job(job_id, status="queued", progress=0, message="Road analysis queued...")
+    app_obj = current_app._get_current_object()
+    threading.Thread(
+        target=_run_road_analysis_job,
+        args=(app_obj, job_id, road.id, None if accessible_sites is None else list(accessible_sites), params),
+        daemon=True,
+    ).start()
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": url_for("road_bp.road_analysis_job_status", job_id=job_id),
+        "results_url": url_for("road_bp.road_analysis_job_results", job_id=job_id),
+        "export_url": url_for("road_bp.road_analysis_job_export", job_id=job_id),
+    }), 202
+
+
+@road_bp.route("/road-analysis/jobs/<job_id>/status", methods=["GET"])
+@login_required
+def road_analysis_job_status(job_id):
+    job = _get_road_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Road analysis job not found."}), 404
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": job.get("status", "unknown"),
+        "progress": int(job.get("progress", 0)),
+        "message": job.get("message", ""),
+        "processed": int(job.get("processed", 0)),
+        "total": int(job.get("total", 0)),
+        "results_ready": bool(job.get("result_path")),
+        "results_url": url_for("road_bp.road_analysis_job_results", job_id=job_id),
+        "export_url": url_for("road_bp.road_analysis_job_export", job_id=job_id),
+    }), 200
+
+
+@road_bp.route("/road-analysis/jobs/<job_id>", methods=["GET"])
+@login_required
+def road_analysis_job_results(job_id):
+    payload = _load_road_job_result(job_id)
+    if not payload:
+        flash("Road analysis results not found or not ready.", "warning")
+        return redirect(url_for("road_bp.road_analysis_page"))
+    return render_template(
+        "road_analysis/results.html",
+        title="Road Analysis Results",
+        result=payload["result"],
+        params=payload["params"],
+        road_geometry_geojson=payload["road_geometry_geojson"],
+        export_url=url_for("road_bp.road_analysis_job_export", job_id=job_id),
     )
+
+
+@road_bp.route("/road-analysis/jobs/<job_id>/export", methods=["GET"])
+@login_required
+def road_analysis_job_export(job_id):
+    payload = _load_road_job_result(job_id)
+    if not payload:
+        flash("Road analysis results not found or not ready.", "warning")
+        return redirect(url_for("road_bp.road_analysis_page"))
+    result = payload["result"]
+    return _road_result_workbook_response(result, result.road_id)
@@ -1,3 +1,4 @@
+import hashlib
 import hmac
 import secrets
 import json
@@ -167,14 +168,19 @@ def get_accessible_site_ids():
     if is_admin_user():
         return None
 
+    return resolve_scope_site_ids(
+        region_ids=_safe_relation_ids(current_user, "assigned_regions"),
+        wilaya_ids=_safe_relation_ids(current_user, "assigned_wilayas"),
+        commune_ids=_safe_relation_ids(current_user, "assigned_communes"),
+        site_ids=_safe_relation_ids(current_user, "assigned_sites"),
+    )
+
+
+def resolve_scope_site_ids(region_ids=(), wilaya_ids=(), commune_ids=(), site_ids=()):
+    # Site ids covered by explicit scope assignments; an empty set means no access.
     from app import db
     from app.models import Commune, Site, Wilaya
 
-    region_ids = _safe_relation_ids(current_user, "assigned_regions")
-    wilaya_ids = _safe_relation_ids(current_user, "assigned_wilayas")
-    commune_ids = _safe_relation_ids(current_user, "assigned_communes")
-    site_ids = _safe_relation_ids(current_user, "assigned_sites")
-
     # If explicit scopes exist, do NOT expand by region.
     resolved = set(site_ids) if site_ids else set()
 
@@ -207,6 +213,16 @@ def get_accessible_site_ids():
     return set()
 
 
+def site_scope_fingerprint(accessible_site_ids):
+    # Stable short key for a resolved site scope (None = full access), used by caches shared across users.
+    if accessible_site_ids is None:
+        return "all"
+    digest = hashlib.blake2b(digest_size=16)
+    for site_id in sorted(int(value) for value in accessible_site_ids):
+        digest.update(f"{site_id},".encode("ascii"))
+    return digest.hexdigest()
+
+
 def admin_required(view):
     @wraps(view)
     def wrapped(*args, **kwargs):
@@ -0,0 +1,86 @@
+from typing import Tuple
+
+import numpy as np
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _as_column(values, size: int) -> np.ndarray:
+    arr = np.asarray(values, dtype=np.float64).reshape(-1)
+    if arr.size == 1 and size != 1:
+        arr = np.full(size, arr[0])
+    return arr[:, None]
+
+
+def geodesic_beam_vertices(lats, lons, azimuths, beamwidths, radii_km, points: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+    """Build closed sector beams on the sphere for many sites at once.
+
+    Returns ``(lon, lat)`` arrays shaped ``(n, points + 3)``: the site apex,
+    ``points + 1`` arc vertices from ``azimuth - width/2`` clockwise to
+    ``azimuth + width/2``, then the apex again. Scalar beamwidths/radii are
+    broadcast to every site.
+    """
+    lats = np.asarray(lats, dtype=np.float64).reshape(-1)
+    lons = np.asarray(lons, dtype=np.float64).reshape(-1)
+    n = lats.size
+    azimuth = _as_column(azimuths, n)
+    width = _as_column(beamwidths, n)
+    dist = _as_column(radii_km, n) / EARTH_RADIUS_KM
+
+    steps = np.arange(points + 1, dtype=np.float64) / float(points)
+    bearing = np.radians(azimuth - (width / 2.0) + (width * steps[None, :]))
+    lat1 = np.radians(lats)[:, None]
+    lon1 = np.radians(lons)[:, None]
+
+    sin_lat1 = np.sin(lat1)
+    cos_lat1 = np.cos(lat1)
+    sin_d = np.sin(dist)
+    cos_d = np.cos(dist)
+    sin_lat2 = np.clip(sin_lat1 * cos_d + cos_lat1 * sin_d * np.cos(bearing), -1.0, 1.0)
+    lat2 = np.arcsin(sin_lat2)
+    lon2 = lon1 + np.arctan2(np.sin(bearing) * sin_d * cos_lat1, cos_d - sin_lat1 * sin_lat2)
+
+    out_lon = np.empty((n, points + 3), dtype=np.float64)
+    out_lat = np.empty((n, points + 3), dtype=np.float64)
+    out_lon[:, 0] = out_lon[:, -1] = lons
+    out_lat[:, 0] = out_lat[:, -1] = lats
+    out_lon[:, 1:-1] = np.degrees(lon2)
+    out_lat[:, 1:-1] = np.degrees(lat2)
+    return out_lon, out_lat
+
+
+def metric_beam_vertices(xs, ys, azimuths, beamwidths, radii_m, steps: int = 24) -> Tuple[np.ndarray, np.ndarray]:
+    """Planar variant of :func:`geodesic_beam_vertices` for projected metres (bearing clockwise from North)."""
+    xs = np.asarray(xs, dtype=np.float64).reshape(-1)
+    ys = np.asarray(ys, dtype=np.float64).reshape(-1)
+    n = xs.size
+    azimuth = _as_column(azimuths, n)
+    width = _as_column(beamwidths, n)
+    radius = _as_column(radii_m, n)
+
+    fractions = np.arange(steps + 1, dtype=np.float64) / float(steps)
+    bearing = np.radians(azimuth - (width / 2.0) + (width * fractions[None, :]))
+
+    out_x = np.empty((n, steps + 3), dtype=np.float64)
+    out_y = np.empty((n, steps + 3), dtype=np.float64)
+    out_x[:, 0] = out_x[:, -1] = xs
+    out_y[:, 0] = out_y[:, -1] = ys
+    out_x[:, 1:-1] = xs[:, None] + radius * np.sin(bearing)
+    out_y[:, 1:-1] = ys[:, None] + radius * np.cos(bearing)
+    return out_x, out_y
+
+
+def format_kml_coordinates(lons, lats, precision: int = 6):
+    """Format vertex rows as KML ``lon,lat,0`` strings, one string per row.
+
+    Each row is exactly ``" ".join("%.6f,%.6f,0" % (lon, lat) ...)``; the
+    numbers are formatted for all rows at once with ``np.char.mod``.
+    """
+    lons = np.atleast_2d(np.asarray(lons, dtype=np.float64))
+    lats = np.atleast_2d(np.asarray(lats, dtype=np.float64))
+    if lons.size == 0:
+        return [""] * lons.shape[0]
+    number = f"%.{precision}f"
+    pairs = np.char.add(np.char.add(np.char.mod(number, lons), ","), np.char.mod(number + ",0", lats))
+    return [" ".join(row) for row in pairs.tolist()]
@@ -0,0 +1,96 @@
+import io
+from datetime import date, datetime
+
+from sqlalchemy import insert, inspect
+
+
+# Rows per COPY round trip (PostgreSQL) or executemany() call (other databases).
+BULK_LOAD_CHUNK = 10000
+
+
+def copy_rows(connection, table, rows, chunk_size=BULK_LOAD_CHUNK):
+    """Insert ``rows`` (dicts keyed by column name) into ``table``; returns the number of rows.
+
+    On PostgreSQL the rows are streamed with ``COPY ... FROM STDIN``, which skips
+    per-statement parsing and planning; elsewhere they go through executemany().
+    COPY ignores SQLAlchemy defaults, so Python-side column defaults are filled
+    in here; columns absent from every row keep their server default.
+    """
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            count += _load_chunk(connection, table, batch)
+            batch = []
+    if batch:
+        count += _load_chunk(connection, table, batch)
+    return count
+
+
+def model_row(obj):
+    """``copy_rows`` dict of the column attributes set on a transient ORM object (unset ones are left out)."""
+    state = inspect(obj)
+    return {
+        attr.columns[0].name: state.dict[attr.key]
+        for attr in state.mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+
+def _load_chunk(connection, table, rows):
+    defaults = {
+        column.name: column.default.arg
+        for column in table.columns
+        if column.default is not None and (column.default.is_scalar or column.default.is_callable)
+    }
+    names = set(defaults)
+    for row in rows:
+        names.update(row)
+    columns = [column.name for column in table.columns if column.name in names]
+
+    def value(row, name):
+        if name in row:
+            return row[name]
+        default = defaults.get(name)
+        return default(None) if callable(default) else default
+
+    if connection.dialect.name != "postgresql":
+        # executemany() needs the same keys in every row.
+        connection.execute(insert(table), [{name: value(row, name) for name in columns} for row in rows])
+        return len(rows)
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(value(row, name)) for name in columns))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    preparer = connection.dialect.identifier_preparer
+    sql = "COPY {} ({}) FROM STDIN".format(
+        preparer.format_table(table),
+        ", ".join(preparer.quote(name) for name in columns),
+    )
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+def _copy_text(value):
+    # COPY text format: \N is NULL; backslash, tab and line breaks are escaped.
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
@@ -0,0 +1,239 @@
+import os
+import zipfile
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+    _PYARROW_AVAILABLE = True
+except ModuleNotFoundError:
+    pa = pa_ipc = pq = None
+    _PYARROW_AVAILABLE = False
+
+from sqlalchemy import select
+
+from app.models import Antenna, Cell, Cell2G, Cell3G, Cell4G, Cell5G, Commune, Mapping, Region, Sector, Site, Supplier, Wilaya
+from app.services.read_session import read_session
+
+
+COLUMNAR_FORMATS = {"parquet": ".parquet", "feather": ".arrow"}
+# Rows per SQL fetch and per Parquet row group / Arrow record batch.
+COLUMNAR_CHUNK_ROWS = 50000
+# Entities restricted to admins, mirroring /export-data.
+COLUMNAR_ADMIN_ONLY = ("antennas", "mapping")
+
+
+def _columns(*specs):
+    return [{"name": name, "expr": expr, "type": dtype} for name, expr, dtype in specs]
+
+
+def _sites_spec():
+    return _columns(
+        ("id", Site.id, "int64"),
+        ("code_site", Site.code_site, "string"),
+        ("name", Site.name, "string"),
+        ("latitude", Site.latitude, "float64"),
+        ("longitude", Site.longitude, "float64"),
+        ("altitude", Site.altitude, "float64"),
+        ("support_nature", Site.support_nature, "string"),
+        ("support_type", Site.support_type, "string"),
+        ("support_height", Site.support_height, "float64"),
+        ("status", Site.status, "string"),
+        ("supplier_name", Supplier.name, "string"),
+        ("commune_id", Commune.id, "int64"),
+        ("commune_name", Commune.name, "string"),
+        ("wilaya_id", Wilaya.id, "int64"),
+        ("wilaya_name", Wilaya.name, "string"),
+        ("region_name", Region.name, "string"),
+        ("address", Site.address, "string"),
+        ("comments", Site.comments, "string"),
+    )
+
+
+def _sectors_spec():
+    return _columns(
+        ("id", Sector.id, "int64"),
+        ("code_sector", Sector.code_sector, "string"),
+        ("azimuth", Sector.azimuth, "int64"),
+        ("hba", Sector.hba, "int64"),
+        ("coverage_goal", Sector.coverage_goal, "string"),
+        ("site_id", Site.id, "int64"),
+        ("site_code", Site.code_site, "string"),
+    )
+
+
+def _cells_spec():
+    return _columns(
+        ("id", Cell.id, "int64"),
+        ("cellname", Cell.cellname, "string"),
+        ("technology", Cell.technology, "string"),
+        ("frequency", Cell.frequency, "string"),
+        ("antenna_tech", Cell.antenna_tech, "string"),
+        ("tilt_mechanical", Cell.tilt_mechanical, "float64"),
+        ("tilt_electrical", Cell.tilt_electrical, "float64"),
+        ("antenna_id", Cell.antenna_id, "int64"),
+        ("antenna_model", Antenna.model, "string"),
+        ("sector_id", Sector.id, "int64"),
+        ("sector_code", Sector.code_sector, "string"),
+        ("site_id", Site.id, "int64"),
+        ("site_code", Site.code_site, "string"),
+        ("bsc_2g", Cell2G.bsc, "string"),
+        ("lac_2g", Cell2G.lac, "string"),
+        ("rac_2g", Cell2G.rac, "string"),
+        ("bcch_2g", Cell2G.bcch, "int64"),
+        ("bsic_2g", Cell2G.bsic, "string"),
+        ("ci_2g", Cell2G.ci, "int64"),
+        ("rnc_3g", Cell3G.rnc, "string"),
+        ("lac_3g", Cell3G.lac, "string"),
+        ("rac_3g", Cell3G.rac, "string"),
+        ("psc_3g", Cell3G.psc, "int64"),
+        ("dlarfcn_3g", Cell3G.dlarfcn, "string"),
+        ("ci_3g", Cell3G.ci, "int64"),
+        ("enodeb_4g", Cell4G.enodeb, "string"),
+        ("tac_4g", Cell4G.tac, "string"),
+        ("rsi_4g", Cell4G.rsi, "string"),
+        ("pci_4g", Cell4G.pci, "int64"),
+        ("earfcn_4g", Cell4G.earfcn, "string"),
+        ("ci_4g", Cell4G.ci, "int64"),
+        ("gnodeb_5g", Cell5G.gnodeb, "string"),
+        ("lac_5g", Cell5G.lac, "string"),
+        ("rsi_5g", Cell5G.rsi, "string"),
+        ("pci_5g", Cell5G.pci, "int64"),
+        ("arfcn_5g", Cell5G.arfcn, "string"),
+        ("ci_5g", Cell5G.ci, "int64"),
+    )
+
+
+def _antennas_spec():
+    return _columns(
+        ("id", Antenna.id, "int64"),
+        ("supplier", Antenna.supplier, "string"),
+        ("model", Antenna.model, "string"),
+        ("name", Antenna.name, "string"),
+        ("port", Antenna.port, "int64"),
+        ("frequency", Antenna.frequency, "float64"),
+        ("type", Antenna.type, "string"),
+        ("hbeamwidth", Antenna.hbeamwidth, "float64"),
+        ("vbeamwidth", Antenna.vbeamwidth, "float64"),
+        ("gain", Antenna.gain, "float64"),
+    )
+
+
+def _mapping_spec():
+    return _columns(
+        ("id", Mapping.id, "int64"),
+        ("map_id", Mapping.map_id, "string"),
+        ("cell_code", Mapping.cell_code, "string"),
+        ("antenna_tech", Mapping.antenna_tech, "string"),
+        ("band", Mapping.band, "string"),
+        ("sector_code", Mapping.sector_code, "string"),
+        ("technology", Mapping.technology, "string"),
+    )
+
+
+def _entity_statement(entity, spec, accessible_site_ids):
+    statement = select(*[column["expr"] for column in spec])
+    if entity == "sites":
+        statement = (
+            statement
+            .join(Commune, Site.commune_id == Commune.id)
+            .join(Wilaya, Commune.wilaya_id == Wilaya.id)
+            .join(Region, Wilaya.region_id == Region.id)
+            .outerjoin(Supplier, Site.supplier_id == Supplier.id)
+            .order_by(Site.id)
+        )
+    elif entity == "sectors":
+        statement = statement.join(Site, Sector.site_id == Site.id).order_by(Sector.id)
+    elif entity == "cells":
+        statement = (
+            statement.select_from(Cell)
+            .outerjoin(Antenna, Cell.antenna_id == Antenna.id)
+            .outerjoin(Sector, Cell.sector_id == Sector.id)
+            .outerjoin(Site, Sector.site_id == Site.id)
+            .outerjoin(Cell2G, Cell2G.cell_id == Cell.id)
+            .outerjoin(Cell3G, Cell3G.cell_id == Cell.id)
+            .outerjoin(Cell4G, Cell4G.cell_id == Cell.id)
+            .outerjoin(Cell5G, Cell5G.cell_id == Cell.id)
+            .order_by(Cell.id)
+        )
+    elif entity == "antennas":
+        statement = statement.order_by(Antenna.id)
+    else:
+        statement = statement.order_by(Mapping.id)
+    if accessible_site_ids is not None and entity in ("sites", "sectors", "cells"):
+        statement = statement.where(Site.id.in_(list(accessible_site_ids)))
+    return statement
+
+
+COLUMNAR_ENTITIES = {
+    "sites": _sites_spec,
+    "sectors": _sectors_spec,
+    "cells": _cells_spec,
+    "antennas": _antennas_spec,
+    "mapping": _mapping_spec,
+}
+
+
+def _require_pyarrow():
+    if not _PYARROW_AVAILABLE:
+        raise RuntimeError("Columnar export requires 'pyarrow'. Install it with: pip install pyarrow")
+
+
+def _arrow_schema(spec):
+    types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string()}
+    return pa.schema([pa.field(column["name"], types[column["type"]]) for column in spec])
+
+
+def _iter_record_batches(entity, spec, schema, accessible_site_ids):
+    statement = _entity_statement(entity, spec, accessible_site_ids)
+    with read_session() as session:
+        result = session.execute(statement.execution_options(yield_per=COLUMNAR_CHUNK_ROWS, stream_results=True))
+        for rows in result.partitions():
+            columns = list(zip(*rows))
+            yield pa.RecordBatch.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            )
+
+
+def write_columnar_entity(entity, out_path, export_format="parquet", accessible_site_ids=None):
+    """Write one entity to ``out_path`` as Parquet or Arrow IPC; returns the row count."""
+    _require_pyarrow()
+    spec = COLUMNAR_ENTITIES[entity]()
+    schema = _arrow_schema(spec)
+    total = 0
+    if export_format == "parquet":
+        with pq.ParquetWriter(str(out_path), schema, compression="zstd") as writer:
+            for batch in _iter_record_batches(entity, spec, schema, accessible_site_ids):
+                writer.write_batch(batch)
+                total += batch.num_rows
+            if total == 0:
+                writer.write_table(schema.empty_table())
+    else:
+        with pa.OSFile(str(out_path), "wb") as sink, pa_ipc.new_file(sink, schema) as writer:
+            for batch in _iter_record_batches(entity, spec, schema, accessible_site_ids):
+                writer.write_batch(batch)
+                total += batch.num_rows
+    return total
+
+
+def write_columnar_inventory(out_dir, export_format="parquet", accessible_site_ids=None, entities=None):
+    """Write every entity as ``<entity><ext>`` under ``out_dir``; returns {file name: row count}."""
+    _require_pyarrow()
+    if export_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported columnar format: {export_format}")
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    counts = {}
+    for entity in entities or COLUMNAR_ENTITIES:
+        file_name = f"{entity}{COLUMNAR_FORMATS[export_format]}"
+        counts[file_name] = write_columnar_entity(entity, out_dir / file_name, export_format, accessible_site_ids)
+    return counts
+
+
+def write_columnar_zip(out_dir, zip_path):
+    # Parquet/Arrow files are already compressed; store them as-is.
+    with zipfile.ZipFile(str(zip_path), "w", compression=zipfile.ZIP_STORED) as zf:
+        for name in sorted(os.listdir(out_dir)):
+            zf.write(os.path.join(out_dir, name), arcname=name)
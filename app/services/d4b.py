@@ -0,0 +1,77 @@
+import io
+import os
+import threading
+from pathlib import Path
+
+from openpyxl import load_workbook
+
+
+D4B_TEMPLATE_PATH = Path(__file__).resolve().parents[1] / "static" / "template_D4b.xlsx"
+# Sector columns of the D4b sheet (first four sectors, ordered by code).
+D4B_SECTOR_COLUMNS = ("E", "G", "I", "K")
+D4B_COVERAGE_CELLS = ("C42", "C43", "C44", "C45")
+
+# One parsed template per thread: a batch job and concurrent single-site downloads each
+# fill their own copy without waiting on each other. Filling rewrites the full D4B cell
+# set below, so nothing from the previous site can leak into the next workbook.
+_template_cache = threading.local()
+
+
+def d4b_cell_values(site, sectors, antenna_models_by_sector):
+    """Every cell of the D4b layout mapped to its value for ``site`` (plain data, picklable)."""
+    support_parts = [
+        str(site.support_nature or ''),
+        str(site.support_type or ''),
+        f"{site.support_height} m" if site.support_height else '',
+    ]
+    values = {
+        'J5': site.code_site or '',
+        'C5': site.name or '',
+        'J9': f"{site.code_site} C1" if site.code_site else 'C1',
+        'E11': site.address or '',
+        'H18': site.longitude or '',
+        'J18': site.latitude or '',
+        'H23': ' '.join(filter(None, support_parts)),
+    }
+    for index, column in enumerate(D4B_SECTOR_COLUMNS):
+        sector = sectors[index] if index < len(sectors) else None
+        values[f'{column}31'] = _value_or_blank(sector, 'azimuth')
+        values[f'{column}32'] = _value_or_blank(sector, 'hba')
+        # A sector can host several antennas: list their distinct models.
+        models = antenna_models_by_sector.get(sector.id, ()) if sector is not None else ()
+        values[f'{column}33'] = ' / '.join(sorted(set(models)))
+        values[D4B_COVERAGE_CELLS[index]] = _value_or_blank(sector, 'coverage_goal')
+    return values
+
+
+def _value_or_blank(obj, attr):
+    if obj is None:
+        return ''
+    value = getattr(obj, attr)
+    return value if value is not None else ''
+
+
+def _template_workbook(template_path):
+    stat = os.stat(template_path)
+    key = (str(template_path), stat.st_mtime_ns, stat.st_size)
+    if getattr(_template_cache, "key", None) != key:
+        _template_cache.workbook = load_workbook(template_path)
+        _template_cache.key = key
+    return _template_cache.workbook
+
+
+def render_d4b(values, template_path=D4B_TEMPLATE_PATH):
+    """Fill this thread's cached template with ``values`` and return the .xlsx bytes."""
+    wb = _template_workbook(template_path)
+    ws = wb.active
+    for ref, value in values.items():
+        ws[ref] = value
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def render_d4b_entry(entry):
+    """Process-pool entry point: (file name, cell values) -> (file name, .xlsx bytes)."""
+    file_name, values, template_path = entry
+    return file_name, render_d4b(values, template_path)
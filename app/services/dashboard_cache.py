@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class DashboardCache:
+    """Per-scope dashboard payloads with a TTL and stale-while-revalidate.
+
+    Entries are keyed by site-scope fingerprint, so users sharing a scope share
+    one payload, and tagged with the data version they were built from (any
+    ordered value, e.g. an (inventory, stats) version pair the caller reads in
+    one query). Within the TTL a hit is a dict lookup. Past the TTL the stale
+    payload is served at once while one background thread rebuilds it. A newer
+    data version invalidates the entry: one request rebuilds it while
+    concurrent requests for the same scope keep getting the previous snapshot.
+    """
+
+    def __init__(self, ttl_seconds=60, max_entries=256):
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._building = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, data_version, compute, app_obj=None):
+        """Payload for ``key``; ``compute()`` builds it (in a thread with ``app_obj``'s context when refreshing)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            if entry is not None and entry["version"] == data_version:
+                self.hits += 1
+                if now - entry["built_at"] >= self.ttl_seconds and key not in self._building and app_obj is not None:
+                    self._building.add(key)
+                    threading.Thread(
+                        target=self._refresh_in_background,
+                        args=(app_obj, key, data_version, compute),
+                        daemon=True,
+                    ).start()
+                return entry["payload"]
+            if entry is not None and key in self._building:
+                # Another request is already rebuilding this scope: serve its previous snapshot.
+                self.hits += 1
+                return entry["payload"]
+            self.misses += 1
+            self._building.add(key)
+        try:
+            payload = compute()
+            self._store(key, data_version, payload)
+            return payload
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def _refresh_in_background(self, app_obj, key, data_version, compute):
+        try:
+            with app_obj.app_context():
+                self._store(key, data_version, compute())
+        except Exception:
+            logger.exception("Dashboard cache refresh failed for scope %s", key)
+        finally:
+            with self._lock:
+                self._building.discard(key)
+
+    def _store(self, key, data_version, payload):
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current["version"] > data_version:
+                return
+            self._entries[key] = {"version": data_version, "built_at": time.monotonic(), "payload": payload}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def get_dashboard_cache(app_obj):
+    cache = app_obj.extensions.get("dashboard_cache")
+    if cache is None:
+        cache = app_obj.extensions.setdefault(
+            "dashboard_cache",
+            DashboardCache(ttl_seconds=app_obj.config.get("DASHBOARD_CACHE_TTL_SECONDS", 60)),
+        )
+    return cache
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import DataVersion
+
+
+INVENTORY_SCOPE = "inventory"
+ROADS_SCOPE = "roads"
+# Bumped by the dashboard counter refresh itself, after the inventory write it follows has committed.
+STATS_SCOPE = "inventory_stats"
+
+# Tables whose writes invalidate derived artifacts (exports, tiles, dashboards).
+_SCOPE_BY_TABLE = {
+    "region": INVENTORY_SCOPE,
+    "wilaya": INVENTORY_SCOPE,
+    "commune": INVENTORY_SCOPE,
+    "supplier": INVENTORY_SCOPE,
+    "antenna": INVENTORY_SCOPE,
+    "site": INVENTORY_SCOPE,
+    "sector": INVENTORY_SCOPE,
+    "cell": INVENTORY_SCOPE,
+    "cell_2g": INVENTORY_SCOPE,
+    "cell_3g": INVENTORY_SCOPE,
+    "cell_4g": INVENTORY_SCOPE,
+    "cell_5g": INVENTORY_SCOPE,
+    "mapping": INVENTORY_SCOPE,
+    "road": ROADS_SCOPE,
+}
+_PENDING_KEY = "data_version_scopes"
+
+
+def get_data_version(scope=INVENTORY_SCOPE):
+    version = db.session.execute(select(DataVersion.version).where(DataVersion.scope == scope)).scalar()
+    return int(version or 0)
+
+
+def get_data_versions(*scopes):
+    """Versions of several scopes read in one query, in the order given."""
+    rows = db.session.execute(
+        select(DataVersion.scope, DataVersion.version).where(DataVersion.scope.in_(scopes))
+    ).all()
+    versions = {scope: version for scope, version in rows}
+    return tuple(int(versions.get(scope) or 0) for scope in scopes)
+
+
+def _flag_scopes(session, table_names):
+    scopes = {_SCOPE_BY_TABLE[name] for name in table_names if name in _SCOPE_BY_TABLE}
+    if scopes:
+        session.info.setdefault(_PENDING_KEY, set()).update(scopes)
+
+
+def flag_bulk_write(session, table_names):
+    """Flag tables written with SQL the ORM does not see (e.g. COPY) so their scopes are bumped on commit."""
+    _flag_scopes(session, table_names)
+
+
+def bump_data_version(connection, scope):
+    """Increment ``scope``'s version in the transaction of ``connection``."""
+    table = DataVersion.__table__
+    now = datetime.utcnow()
+    result = connection.execute(
+        table.update()
+        .where(table.c.scope == scope)
+        .values(version=table.c.version + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(scope=scope, version=1, updated_at=now))
+
+
+def _bump_pending_versions(session):
+    scopes = session.info.pop(_PENDING_KEY, None)
+    if not scopes:
+        return
+    connection = session.connection()
+    for scope in sorted(scopes):
+        bump_data_version(connection, scope)
+
+
+@event.listens_for(Session, "before_flush")
+def _flag_flushed_changes(session, _flush_context, _instances):
+    objects = list(session.new) + list(session.dirty) + list(session.deleted)
+    _flag_scopes(session, {getattr(obj, "__tablename__", None) for obj in objects})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_bulk_statements(orm_execute_state):
+    # insert()/update()/delete() executed through the session bypass the flush.
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None:
+        _flag_scopes(orm_execute_state.session, {mapper.local_table.name})
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_after_flush(session, _flush_context):
+    _bump_pending_versions(session)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_before_commit(session):
+    _bump_pending_versions(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_versions(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from flask import send_file
+from openpyxl import Workbook
+
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class StreamingXlsxWriter:
+    """Append-only .xlsx writer built on openpyxl's write_only mode.
+
+    Every sheet spools its rows to its own temporary file as they are appended,
+    so sheets can be fed in any interleaving and memory does not grow with the
+    number of rows. ``save`` zips the spooled sheets into the final workbook.
+    """
+
+    def __init__(self):
+        self._workbook = Workbook(write_only=True)
+        self._sheets = {}
+        self._headers = {}
+        self.row_counts = {}
+
+    def add_sheet(self, title, headers=None):
+        ws = self._workbook.create_sheet(title[:31] or "Sheet1")
+        self._sheets[title] = ws
+        self._headers[title] = list(headers or [])
+        self.row_counts[title] = 0
+        if headers:
+            ws.append(list(headers))
+        return ws
+
+    def append(self, title, values):
+        self._sheets[title].append(list(values))
+        self.row_counts[title] += 1
+
+    def append_dict(self, title, row):
+        self.append(title, [row.get(h) for h in self._headers[title]])
+
+    @property
+    def rows_written(self):
+        return sum(self.row_counts.values())
+
+    def append_rows(self, title, rows):
+        for row in rows:
+            if isinstance(row, dict):
+                self.append_dict(title, row)
+            else:
+                self.append(title, row)
+
+    def save(self, path=None):
+        """Write the workbook to ``path`` (a fresh temporary file when omitted) and return the path."""
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="export_", suffix=".xlsx")
+            os.close(fd)
+        try:
+            self._workbook.save(str(path))
+        except Exception:
+            _remove_quietly(path)
+            raise
+        return str(path)
+
+
+def prune_old_exports(out_dir, pattern, retention_hours):
+    """Delete the files of ``out_dir`` matching ``pattern`` last modified more than ``retention_hours`` ago."""
+    cutoff = time.time() - retention_hours * 3600
+    for path in Path(out_dir).glob(pattern):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            continue
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def send_temporary_file(path, download_name, mimetype):
+    """Stream a file from disk as an attachment and remove it once the response is closed."""
+    response = send_file(str(path), as_attachment=True, download_name=download_name, mimetype=mimetype)
+    # Passthrough responses hand the file wrapper straight to the server and skip close callbacks.
+    response.direct_passthrough = False
+    response.call_on_close(lambda: _remove_quietly(path))
+    return response
+
+
+def send_xlsx_file(path, download_name, remove_after=True):
+    if remove_after:
+        return send_temporary_file(path, download_name, XLSX_MIMETYPE)
+    return send_file(str(path), as_attachment=True, download_name=download_name, mimetype=XLSX_MIMETYPE)
+
+
+def send_streaming_workbook(writer, download_name):
+    return send_xlsx_file(writer.save(), download_name)
@@ -0,0 +1,60 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered text fragments, bounded by total size in characters.
+
+    Each entry is stored under a caller key (entity + styling) together with a
+    digest of the row signature it was rendered from; a lookup only hits when
+    the current signature digest matches, so edited rows re-render on their own.
+    """
+
+    def __init__(self, max_chars=256 * 1024 * 1024):
+        self.max_chars = int(max_chars)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(signature):
+        return hashlib.blake2b(repr(signature).encode("utf-8"), digest_size=16).digest()
+
+    def get(self, key, signature):
+        digest = self._digest(signature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != digest:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, signature, fragment):
+        digest = self._digest(signature)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            if len(fragment) > self.max_chars:
+                return
+            self._entries[key] = (digest, fragment)
+            self._size += len(fragment)
+            while self._size > self.max_chars:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
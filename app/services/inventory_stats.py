@@ -0,0 +1,530 @@
+import logging
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+from flask import after_this_request, current_app, g, has_app_context, has_request_context
+from sqlalchemy import delete, event, exists, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Antenna, Cell, Commune, InventoryStat, Mapping, Region, Sector, Site, Supplier, Wilaya
+from app.services.bulk_load import copy_rows
+from app.services.data_version import STATS_SCOPE, bump_data_version
+from app.services.write_coordinator import INTERACTIVE, get_write_coordinator, write_priority
+
+
+logger = logging.getLogger(__name__)
+
+# commune_id of network-wide counters (table sizes, cells without sector, build marker).
+GLOBAL_COMMUNE = 0
+# Tables whose plain row count is shown on the admin dashboard.
+GLOBAL_COUNT_MODELS = {
+    "region": Region,
+    "wilaya": Wilaya,
+    "commune": Commune,
+    "supplier": Supplier,
+    "antenna": Antenna,
+    "mapping": Mapping,
+}
+# Cube row keys: "<supplier id>|<site status>|<tech bucket>|<dq flags>", flags joined by "+".
+CUBE_KEY_SEPARATOR = "|"
+DQ_FLAG_SEPARATOR = "+"
+CUBE_DQ_FLAGS = ("no_sectors", "no_cells", "no_antenna", "unmapped")
+CUBE_TECHS = ("2G", "3G", "4G", "Other")
+# Above this many dirty communes one pass over the whole network is cheaper than an IN list.
+FULL_REFRESH_COMMUNES = 500
+# Stored in the "built" row; a different value makes the next read rebuild every counter.
+STATS_LAYOUT_VERSION = 2
+# Bulk statements whose rows cannot be resolved are reconciled in the background after this delay.
+DEFERRED_RECONCILE_DELAY_SECONDS = 2.0
+_PENDING_KEY = "inventory_stats_pending"
+# flask.g key collecting the communes committed during a request (refreshed after the response).
+_REQUEST_REFRESH_KEY = "inventory_stats_refresh"
+_reconciler_lock = threading.Lock()
+_deferred_lock = threading.Lock()
+_deferred_engines = set()
+# Engines whose counters have been seen built (see ensure_inventory_stats).
+_built_engines = weakref.WeakSet()
+
+
+def _scoped(statement, commune_ids, site_ids):
+    if commune_ids is not None:
+        statement = statement.where(Site.commune_id.in_(list(commune_ids)))
+    if site_ids is not None:
+        statement = statement.where(Site.id.in_(list(site_ids)))
+    return statement
+
+
+def tech_label(technology):
+    """Dashboard technology bucket of a raw Cell.technology value: 2G, 3G, 4G or Other."""
+    tech = (technology or "").strip().upper()
+    if tech.startswith("2") or tech == "GSM":
+        return "2G"
+    if tech.startswith("3") or tech in ("UMTS", "WCDMA"):
+        return "3G"
+    if tech.startswith("4") or tech == "LTE":
+        return "4G"
+    return "Other"
+
+
+def cube_key(supplier_id, status, tech, dq):
+    return CUBE_KEY_SEPARATOR.join([
+        "" if supplier_id is None else str(supplier_id),
+        (status or "").replace(CUBE_KEY_SEPARATOR, " "),
+        tech,
+        dq,
+    ])
+
+
+def split_cube_key(key):
+    """(supplier key, status, tech, dq) of a cube row key; supplier key is "" when unassigned."""
+    return tuple(key.split(CUBE_KEY_SEPARATOR))
+
+
+def compute_commune_stats(connection, commune_ids=None, site_ids=None):
+    """Per-commune counters for the sites matching the filters, as {(commune_id, metric, key): value}.
+
+    ``cube_sites``, ``cube_sectors`` and ``cube_cells`` count entities by the
+    cube key "supplier|status|tech|dq" (see cube_key): supplier and status come
+    from the site, dq lists the entity's own data-quality flags ("ok" when
+    clean). Cells carry their technology bucket; sites and sectors get one row
+    with tech "" plus one row per technology they carry, so summing a single
+    tech value counts the distinct sites/sectors having it. ``sites`` is the
+    plain site count and ``cells_by_antenna`` (key: antenna id, "" when missing)
+    serves the distinct-antenna count. Zero counters are not returned.
+    """
+    stats = defaultdict(int)
+    site_dims = {}
+    for site_id, commune_id, supplier_id, status, has_sectors in connection.execute(_scoped(
+        select(Site.id, Site.commune_id, Site.supplier_id, Site.status, exists().where(Sector.site_id == Site.id)),
+        commune_ids, site_ids,
+    )):
+        site_dims[site_id] = (commune_id, supplier_id, status)
+        stats[(commune_id, "sites", "")] += 1
+        dq = "ok" if has_sectors else "no_sectors"
+        stats[(commune_id, "cube_sites", cube_key(supplier_id, status, "", dq))] += 1
+    if not site_dims:
+        return {}
+
+    site_techs = defaultdict(set)
+    sector_techs = defaultdict(set)
+    for site_id, sector_id, technology in connection.execute(_scoped(
+        select(Sector.site_id, Sector.id, Cell.technology).distinct()
+        .join(Sector, Cell.sector_id == Sector.id)
+        .join(Site, Sector.site_id == Site.id),
+        commune_ids, site_ids,
+    )):
+        site_techs[site_id].add(tech_label(technology))
+        sector_techs[sector_id].add(tech_label(technology))
+    for site_id, techs in site_techs.items():
+        commune_id, supplier_id, status = site_dims[site_id]
+        for tech in techs:
+            stats[(commune_id, "cube_sites", cube_key(supplier_id, status, tech, "ok"))] += 1
+
+    for sector_id, site_id in connection.execute(_scoped(
+        select(Sector.id, Sector.site_id).join(Site, Sector.site_id == Site.id),
+        commune_ids, site_ids,
+    )):
+        commune_id, supplier_id, status = site_dims[site_id]
+        techs = sector_techs.get(sector_id)
+        stats[(commune_id, "cube_sectors", cube_key(supplier_id, status, "", "ok" if techs else "no_cells"))] += 1
+        for tech in techs or ():
+            stats[(commune_id, "cube_sectors", cube_key(supplier_id, status, tech, "ok"))] += 1
+
+    # Indexed semi-join on the persisted Cell.cell_code, grouped from a derived table.
+    cells = _scoped(
+        select(
+            Sector.site_id.label("site_id"),
+            Cell.technology.label("technology"),
+            Cell.antenna_id.label("antenna_id"),
+            exists().where(Mapping.cell_code == Cell.cell_code).label("is_mapped"),
+        )
+        .join(Sector, Cell.sector_id == Sector.id)
+        .join(Site, Sector.site_id == Site.id),
+        commune_ids, site_ids,
+    ).subquery()
+    for site_id, technology, antenna_id, is_mapped, count in connection.execute(
+        select(cells.c.site_id, cells.c.technology, cells.c.antenna_id, cells.c.is_mapped, func.count())
+        .group_by(cells.c.site_id, cells.c.technology, cells.c.antenna_id, cells.c.is_mapped)
+    ):
+        commune_id, supplier_id, status = site_dims[site_id]
+        flags = [flag for flag, raised in (("no_antenna", antenna_id is None), ("unmapped", not is_mapped)) if raised]
+        dq = DQ_FLAG_SEPARATOR.join(flags) or "ok"
+        stats[(commune_id, "cube_cells", cube_key(supplier_id, status, tech_label(technology), dq))] += count
+        stats[(commune_id, "cells_by_antenna", "" if antenna_id is None else str(antenna_id))] += count
+    return {key: value for key, value in stats.items() if value}
+
+
+def compute_global_stats(connection, tables=None):
+    """Network-wide counters: row counts of reference tables and cells without a sector."""
+    stats = {}
+    for table_name, model in GLOBAL_COUNT_MODELS.items():
+        if tables is None or table_name in tables:
+            count = connection.execute(select(func.count()).select_from(model)).scalar() or 0
+            stats[(GLOBAL_COMMUNE, "table_rows", table_name)] = count
+    if tables is None or "cell" in tables:
+        count = connection.execute(select(func.count(Cell.id)).where(Cell.sector_id.is_(None))).scalar() or 0
+        stats[(GLOBAL_COMMUNE, "cells_without_sector", "")] = count
+    return stats
+
+
+def _stored_stats(connection, statement):
+    table = InventoryStat.__table__
+    return {
+        (row.commune_id, row.metric, row.key): row.value
+        for row in connection.execute(statement.with_only_columns(table.c.commune_id, table.c.metric, table.c.key, table.c.value))
+    }
+
+
+def _apply(connection, stored, computed):
+    """Write the difference between ``stored`` and ``computed``; returns the number of rows changed."""
+    table = InventoryStat.__table__
+    stale = [key for key, value in stored.items() if computed.get(key) != value]
+    fresh = [
+        {"commune_id": key[0], "metric": key[1], "key": key[2], "value": value}
+        for key, value in computed.items()
+        if value and stored.get(key) != value
+    ]
+    for commune_id, metric, key in stale:
+        connection.execute(delete(table).where(table.c.commune_id == commune_id, table.c.metric == metric, table.c.key == key))
+    if fresh:
+        copy_rows(connection, table, fresh)
+    changed = len(set(stale) | {(row["commune_id"], row["metric"], row["key"]) for row in fresh})
+    if changed:
+        # Dashboard snapshots are keyed on this version, so none is cached from pre-refresh counters.
+        bump_data_version(connection, STATS_SCOPE)
+    return changed
+
+
+def reconcile_inventory_stats(connection):
+    """Recompute every counter from the source tables and repair drifted rows; returns the number fixed."""
+    table = InventoryStat.__table__
+    computed = compute_commune_stats(connection)
+    computed.update(compute_global_stats(connection))
+    computed[(GLOBAL_COMMUNE, "built", "")] = STATS_LAYOUT_VERSION
+    return _apply(connection, _stored_stats(connection, select(table)), computed)
+
+
+def refresh_inventory_stats(connection, commune_ids=(), tables=()):
+    """Recompute the counters of ``commune_ids`` and the global rows of ``tables`` in place."""
+    table = InventoryStat.__table__
+    commune_ids = {cid for cid in commune_ids if cid is not None}
+    if len(commune_ids) > FULL_REFRESH_COMMUNES:
+        reconcile_inventory_stats(connection)
+        return
+    if commune_ids:
+        stored = _stored_stats(connection, select(table).where(table.c.commune_id.in_(list(commune_ids))))
+        _apply(connection, stored, compute_commune_stats(connection, commune_ids=commune_ids))
+    if tables:
+        keys = compute_global_stats(connection, tables)
+        stored = {key: value for key, value in _stored_stats(
+            connection, select(table).where(table.c.commune_id == GLOBAL_COMMUNE)
+        ).items() if key in keys}
+        _apply(connection, stored, keys)
+
+
+# --- Incremental maintenance -------------------------------------------------
+
+def _pending(session):
+    return session.info.setdefault(_PENDING_KEY, {"communes": set(), "tables": set(), "all": False})
+
+
+def _history_values(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    values = set(history.added or ()) | set(history.deleted or ()) | set(history.unchanged or ())
+    return {value for value in values if value is not None}
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_touched_communes(session, _flush_context):
+    objects = list(session.new) + list(session.dirty) + list(session.deleted)
+    if not objects:
+        return
+    pending = None
+    site_ids, sector_ids, mapping_codes = set(), set(), set()
+    site_communes, sector_sites = {}, {}
+    for obj in objects:
+        table_name = getattr(obj, "__tablename__", None)
+        if table_name not in GLOBAL_COUNT_MODELS and table_name not in ("site", "sector", "cell"):
+            continue
+        pending = pending or _pending(session)
+        pending["tables"].add(table_name)
+        if table_name == "mapping":
+            mapping_codes.update(_history_values(obj, "cell_code"))
+        elif table_name == "site":
+            pending["communes"].update(_history_values(obj, "commune_id"))
+            site_communes[obj.id] = obj.commune_id
+        elif table_name == "sector":
+            site_ids.update(_history_values(obj, "site_id"))
+            sector_sites[obj.id] = obj.site_id
+        elif table_name == "cell":
+            sector_ids.update(_history_values(obj, "sector_id"))
+    if pending is None:
+        return
+
+    if mapping_codes:
+        # Only communes holding cells with a (re)mapped code change their mapped/unmapped split.
+        pending["communes"].update(session.connection().execute(
+            select(Site.commune_id).distinct()
+            .join(Sector, Sector.site_id == Site.id)
+            .join(Cell, Cell.sector_id == Sector.id)
+            .where(Cell.cell_code.in_(list(mapping_codes)))
+        ).scalars())
+    # Rows deleted by this flush are gone from the tables: resolve them from the flushed objects first.
+    for sector_id in list(sector_ids):
+        if sector_id in sector_sites:
+            sector_ids.discard(sector_id)
+            site_ids.add(sector_sites[sector_id])
+    if sector_ids:
+        site_ids.update(session.connection().execute(
+            select(Sector.site_id).where(Sector.id.in_(list(sector_ids)))
+        ).scalars())
+    for site_id in list(site_ids):
+        if site_id in site_communes:
+            site_ids.discard(site_id)
+            pending["communes"].add(site_communes[site_id])
+    if site_ids:
+        pending["communes"].update(session.connection().execute(
+            select(Site.commune_id).where(Site.id.in_(list(site_ids)))
+        ).scalars())
+
+
+def _bulk_rows(orm_execute_state):
+    """Parameter rows of a bulk INSERT / UPDATE-by-primary-key, or None when the touched rows are unknown."""
+    statement = orm_execute_state.statement
+    rows = orm_execute_state.parameters
+    if isinstance(rows, dict):
+        rows = [rows]
+    if not rows or orm_execute_state.is_delete:
+        return None
+    if getattr(statement, "whereclause", None) is not None or getattr(statement, "_post_values_clause", None) is not None:
+        return None
+    return rows
+
+
+def _bulk_statement_communes(connection, table_name, rows):
+    """Communes touched by bulk ``rows`` on ``table_name``, from their old and new keys (read before the write)."""
+    def column(model, name, ids):
+        ids = [value for value in ids if value is not None]
+        if not ids:
+            return set()
+        return set(connection.execute(select(getattr(model, name)).where(model.id.in_(ids))).scalars())
+
+    def given(name):
+        return {row[name] for row in rows if row.get(name) is not None}
+
+    ids = [row["id"] for row in rows if row.get("id") is not None]
+    communes, site_ids, sector_ids = set(), set(), set()
+    if table_name == "mapping":
+        codes = given("cell_code") | column(Mapping, "cell_code", ids)
+        if codes:
+            communes.update(connection.execute(
+                select(Site.commune_id).distinct()
+                .join(Sector, Sector.site_id == Site.id)
+                .join(Cell, Cell.sector_id == Sector.id)
+                .where(Cell.cell_code.in_(list(codes)))
+            ).scalars())
+    elif table_name == "cell":
+        sector_ids = given("sector_id") | column(Cell, "sector_id", ids)
+    elif table_name == "sector":
+        site_ids = given("site_id") | column(Sector, "site_id", ids)
+    elif table_name == "site":
+        communes = given("commune_id") | column(Site, "commune_id", ids)
+    site_ids |= column(Sector, "site_id", sector_ids)
+    communes |= column(Site, "commune_id", site_ids)
+    return {commune_id for commune_id in communes if commune_id is not None}
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_bulk_statements(orm_execute_state):
+    # insert()/update()/delete() through the session bypass the flush: resolve the touched
+    # communes from the statement parameters, or leave the rows to a deferred reconciliation.
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    table_name = mapper.local_table.name if mapper is not None else None
+    if table_name in ("site", "sector", "cell", "mapping"):
+        pending = _pending(orm_execute_state.session)
+        rows = _bulk_rows(orm_execute_state)
+        if rows is None:
+            pending["all"] = True
+            return
+        pending["communes"].update(_bulk_statement_communes(orm_execute_state.session.connection(), table_name, rows))
+        pending["tables"].add(table_name)
+    elif table_name in GLOBAL_COUNT_MODELS:
+        _pending(orm_execute_state.session)["tables"].add(table_name)
+
+
+def flag_copied_rows(session, table_name, rows):
+    """Queue the counter refresh for rows inserted outside the ORM (e.g. COPY) into ``table_name``."""
+    pending = _pending(session)
+    pending["tables"].add(table_name)
+    if table_name in ("site", "sector", "cell", "mapping"):
+        pending["communes"].update(_bulk_statement_communes(session.connection(), table_name, rows))
+
+
+@event.listens_for(Session, "after_commit")
+def _refresh_after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    engine = session.get_bind()
+    if pending["all"]:
+        # A full pass costs seconds on a large network: never run it inside the committing
+        # request or job (which may still hold the write slot).
+        request_deferred_reconcile(engine)
+        return
+    app_obj = current_app._get_current_object() if has_app_context() else None
+    if not has_request_context():
+        # Jobs and scripts refresh in line, at their own write priority.
+        _run_refresh(engine, app_obj, pending["communes"], pending["tables"], write_priority(session))
+        return
+    # In a request, every commit's communes are merged and refreshed once the response has
+    # been sent, so the user does not wait for it.
+    queued = g.get(_REQUEST_REFRESH_KEY)
+    if queued is None:
+        queued = {"communes": set(), "tables": set()}
+        setattr(g, _REQUEST_REFRESH_KEY, queued)
+
+        @after_this_request
+        def _refresh_when_sent(response):
+            response.call_on_close(
+                lambda: _run_refresh(engine, app_obj, queued["communes"], queued["tables"], INTERACTIVE)
+            )
+            return response
+
+    queued["communes"].update(pending["communes"])
+    queued["tables"].update(pending["tables"])
+
+
+def _run_refresh(engine, app_obj, commune_ids, tables, priority):
+    # Runs in its own transaction so a failed refresh never undoes the user's write, and
+    # through the write slot so it does not contend with a bulk job on SQLite; the
+    # periodic reconciliation repairs whatever is missed here.
+    coordinator = get_write_coordinator(app_obj) if app_obj is not None else None
+    held = coordinator is not None and coordinator.acquire(priority)
+    try:
+        with engine.begin() as connection:
+            refresh_inventory_stats(connection, commune_ids, tables)
+    except Exception:
+        logger.exception("Inventory statistics refresh failed; waiting for reconciliation")
+    finally:
+        if held:
+            coordinator.release()
+
+
+def request_deferred_reconcile(engine):
+    """Queue one background full reconciliation of ``engine``'s counters; bursts of requests share a run."""
+    with _deferred_lock:
+        if engine in _deferred_engines:
+            return
+        _deferred_engines.add(engine)
+    threading.Thread(target=_run_deferred_reconcile, args=(engine,), daemon=True).start()
+
+
+def _run_deferred_reconcile(engine):
+    time.sleep(DEFERRED_RECONCILE_DELAY_SECONDS)
+    with _deferred_lock:
+        # Writes committed from here on queue another run.
+        _deferred_engines.discard(engine)
+    try:
+        with engine.begin() as connection:
+            reconcile_inventory_stats(connection)
+    except Exception:
+        logger.exception("Deferred inventory statistics reconciliation failed")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_stats(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# --- Reading -----------------------------------------------------------------
+
+def ensure_inventory_stats():
+    """Build the counters once (fresh database, table just migrated or counter layout changed).
+
+    Once an engine's counters are known to be built the check is skipped, so
+    dashboard cache hits do not pay a query for it.
+    """
+    engine = db.engine
+    if engine in _built_engines:
+        return
+    table = InventoryStat.__table__
+    built = db.session.execute(
+        select(table.c.value).where(table.c.commune_id == GLOBAL_COMMUNE, table.c.metric == "built")
+    ).scalar()
+    if built != STATS_LAYOUT_VERSION:
+        with engine.begin() as connection:
+            reconcile_inventory_stats(connection)
+    _built_engines.add(engine)
+
+
+def load_inventory_stats(accessible_site_ids=None, session=None):
+    """Counter rows visible to a scope: ({(commune_id, metric, key): value}, {(metric, key): global value}).
+
+    Admins read the stored rows as-is. For scoped users, communes whose sites are
+    all accessible are read from the stored rows too; communes only partially in
+    scope are counted live for the accessible sites only. Rows are read through
+    ``session`` (default ``db.session``).
+    """
+    ensure_inventory_stats()
+    table = InventoryStat.__table__
+    connection = (session or db.session).connection()
+    rows = {}
+    if accessible_site_ids is None:
+        rows = _stored_stats(connection, select(table).where(table.c.commune_id != GLOBAL_COMMUNE))
+    elif accessible_site_ids:
+        sites_by_commune = defaultdict(list)
+        for site_id, commune_id in connection.execute(
+            select(Site.id, Site.commune_id).where(Site.id.in_(list(accessible_site_ids)))
+        ):
+            sites_by_commune[commune_id].append(site_id)
+        stored_site_counts = dict(connection.execute(
+            select(table.c.commune_id, table.c.value)
+            .where(table.c.metric == "sites", table.c.commune_id.in_(list(sites_by_commune)))
+        ).all())
+        full = [cid for cid, ids in sites_by_commune.items() if stored_site_counts.get(cid) == len(ids)]
+        partial_sites = [sid for cid, ids in sites_by_commune.items() if stored_site_counts.get(cid) != len(ids) for sid in ids]
+        if full:
+            rows.update(_stored_stats(connection, select(table).where(table.c.commune_id.in_(full))))
+        if partial_sites:
+            rows.update(compute_commune_stats(connection, site_ids=partial_sites))
+
+    global_rows = {
+        (metric, key): value
+        for (_commune, metric, key), value in _stored_stats(
+            connection, select(table).where(table.c.commune_id == GLOBAL_COMMUNE)
+        ).items()
+    }
+    return rows, global_rows
+
+
+def start_stats_reconciler(app_obj):
+    """Start (once per app) the daemon thread re-running the full reconciliation every interval."""
+    minutes = float(app_obj.config.get("INVENTORY_STATS_RECONCILE_MINUTES") or 0)
+    if minutes <= 0:
+        return None
+    with _reconciler_lock:
+        thread = app_obj.extensions.get("inventory_stats_reconciler")
+        if thread is not None and thread.is_alive():
+            return thread
+        thread = threading.Thread(target=_reconcile_forever, args=(app_obj, minutes * 60), daemon=True)
+        app_obj.extensions["inventory_stats_reconciler"] = thread
+        thread.start()
+        return thread
+
+
+def _reconcile_forever(app_obj, interval_seconds):
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            with app_obj.app_context():
+                with db.engine.begin() as connection:
+                    fixed = reconcile_inventory_stats(connection)
+                if fixed:
+                    logger.warning("Inventory statistics reconciliation repaired %s rows", fixed)
+        except Exception:
+            logger.exception("Inventory statistics reconciliation failed")
@@ -0,0 +1,185 @@
+import math
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    import shapely
+    from shapely.geometry import mapping
+    _SHAPELY_AVAILABLE = True
+except ModuleNotFoundError:
+    shapely = mapping = None
+    _SHAPELY_AVAILABLE = False
+
+from sqlalchemy import and_, func
+
+from app import db
+from app.models import Antenna, Cell, Sector, Site
+from app.services.beam_geometry import geodesic_beam_vertices
+
+
+TILE_LAYERS = ("sites", "sectors")
+TILE_MAX_ZOOM = 22
+# Below these zooms a layer is too dense to be useful as raw features.
+TILE_MIN_ZOOM = {"sites": 5, "sectors": 11}
+TILE_BEAM_LENGTH_KM = 0.8
+TILE_DEFAULT_BEAM_WIDTH_DEG = 40.0
+TILE_GRID_PX = 256
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """(west, south, east, north) in degrees of a Web Mercator (slippy map) tile."""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def is_valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= TILE_MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def coordinate_precision(z: int) -> int:
+    # Enough decimals to resolve one pixel at this zoom; more only inflates the payload.
+    deg_per_px = 360.0 / (TILE_GRID_PX * (2 ** z))
+    return max(3, min(7, int(math.ceil(-math.log10(deg_per_px)))))
+
+
+def beam_vertex_count(z: int) -> int:
+    if z >= 15:
+        return 20
+    if z >= 13:
+        return 10
+    return 5
+
+
+def _empty_collection():
+    return {"type": "FeatureCollection", "features": []}
+
+
+def _sites_in_tile_query(bounds, accessible_site_ids):
+    west, south, east, north = bounds
+    query = (
+        db.session.query(Site.id, Site.code_site, Site.name, Site.latitude, Site.longitude)
+        .filter(
+            Site.latitude.isnot(None),
+            Site.longitude.isnot(None),
+            Site.longitude >= west,
+            Site.longitude < east,
+            Site.latitude > south,
+            Site.latitude <= north,
+        )
+        .order_by(Site.id)
+    )
+    if accessible_site_ids is not None:
+        query = query.filter(Site.id.in_(list(accessible_site_ids)))
+    return query
+
+
+def _build_sites_tile(z, bounds, accessible_site_ids):
+    west, south, east, north = bounds
+    precision = coordinate_precision(z)
+    merge = z < 12
+    cells = {}
+    features = []
+    for site_id, code_site, name, lat, lon in _sites_in_tile_query(bounds, accessible_site_ids):
+        if merge:
+            # Sites sharing a pixel at this zoom collapse into one point carrying a count.
+            px = (int((lon - west) / (east - west) * TILE_GRID_PX), int((north - lat) / (north - south) * TILE_GRID_PX))
+            if px in cells:
+                cells[px]["properties"]["count"] += 1
+                continue
+        feature = {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lon, precision), round(lat, precision)]},
+            "properties": {"id": site_id, "code": code_site, "name": name or "", "count": 1},
+        }
+        if merge:
+            cells[px] = feature
+        features.append(feature)
+    return {"type": "FeatureCollection", "features": features}
+
+
+def _build_sectors_tile(z, bounds, accessible_site_ids):
+    west, south, east, north = bounds
+    site_ids = _sites_in_tile_query(bounds, accessible_site_ids).with_entities(Site.id).order_by(None)
+    rows = (
+        db.session.query(Sector.id, Sector.code_sector, Sector.azimuth, Site.code_site, Site.latitude, Site.longitude)
+        .join(Site, Sector.site_id == Site.id)
+        .filter(Sector.site_id.in_(site_ids))
+        .order_by(Sector.id)
+        .all()
+    )
+    if not rows:
+        return _empty_collection()
+
+    # Same rule as the KML export: mean antenna horizontal beamwidth, 40 deg when unknown.
+    beamwidth_by_sector = dict(
+        db.session.query(Cell.sector_id, func.avg(Antenna.hbeamwidth))
+        .join(Antenna, Cell.antenna_id == Antenna.id)
+        .filter(Cell.sector_id.in_([row.id for row in rows]), and_(Antenna.hbeamwidth >= 2, Antenna.hbeamwidth <= 180))
+        .group_by(Cell.sector_id)
+        .all()
+    )
+
+    azimuths = []
+    for row in rows:
+        try:
+            azimuths.append(float(row.azimuth or 0.0))
+        except (TypeError, ValueError):
+            azimuths.append(0.0)
+    widths = [
+        round(float(beamwidth_by_sector[row.id]), 1) if beamwidth_by_sector.get(row.id) else TILE_DEFAULT_BEAM_WIDTH_DEG
+        for row in rows
+    ]
+    lons, lats = geodesic_beam_vertices(
+        [row.latitude for row in rows],
+        [row.longitude for row in rows],
+        azimuths,
+        widths,
+        TILE_BEAM_LENGTH_KM,
+        points=beam_vertex_count(z),
+    )
+    precision = coordinate_precision(z)
+    rings = np.round(np.stack((lons, lats), axis=-1), precision)
+
+    if _SHAPELY_AVAILABLE:
+        # Each sector belongs to the tile holding its site; clip to that tile plus half a tile of margin
+        # so long beams at high zoom do not drag whole polygons into every payload.
+        margin_x = (east - west) / 2.0
+        margin_y = (north - south) / 2.0
+        clipped = shapely.clip_by_rect(
+            shapely.polygons(rings), west - margin_x, south - margin_y, east + margin_x, north + margin_y
+        )
+        geometries = [mapping(geom) if not geom.is_empty else None for geom in clipped]
+    else:
+        geometries = [{"type": "Polygon", "coordinates": [ring.tolist()]} for ring in rings]
+
+    features = []
+    for row, width, geometry in zip(rows, widths, geometries):
+        if geometry is None:
+            continue
+        features.append({
+            "type": "Feature",
+            "geometry": geometry,
+            "properties": {
+                "id": row.id,
+                "code": row.code_sector,
+                "site": row.code_site,
+                "azimuth": row.azimuth,
+                "beamwidth": width,
+            },
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def build_tile(layer: str, z: int, x: int, y: int, accessible_site_ids: Optional[set]) -> Dict[str, Any]:
+    """GeoJSON FeatureCollection for one tile of ``layer``, restricted to the accessible sites."""
+    if z < TILE_MIN_ZOOM[layer] or (accessible_site_ids is not None and not accessible_site_ids):
+        return _empty_collection()
+    bounds = tile_bounds(z, x, y)
+    if layer == "sites":
+        return _build_sites_tile(z, bounds, accessible_site_ids)
+    return _build_sectors_tile(z, bounds, accessible_site_ids)
@@ -0,0 +1,35 @@
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+from app.services.bulk_load import copy_rows
+
+
+# Rows per COPY / executemany() round trip when loading the staging table.
+STAGING_INSERT_CHUNK = 5000
+
+
+@contextmanager
+def staged_names(session, names):
+    """Load ``names`` into a connection-local TEMPORARY table and yield it for joins.
+
+    Each row keeps its input position (``pos``) so a join ordered by ``pos``
+    walks the upload in its original order, duplicates and misses included.
+    The statement size no longer depends on how many names were uploaded,
+    unlike a bound ``IN (...)`` list. The table is dropped again on exit.
+    """
+    table = Table(
+        f"tmp_names_{uuid.uuid4().hex[:12]}",
+        MetaData(),
+        Column("pos", Integer, primary_key=True),
+        Column("name", String(150), nullable=False),
+        prefixes=["TEMPORARY"],
+    )
+    connection = session.connection()
+    table.create(connection)
+    try:
+        copy_rows(connection, table, ({"pos": pos, "name": name} for pos, name in enumerate(names)), STAGING_INSERT_CHUNK)
+        yield table
+    finally:
+        table.drop(connection, checkfirst=True)
@@ -0,0 +1,125 @@
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+# "SCAN cell", "SCAN cell USING INDEX ...", "SEARCH sector AS sector_1 USING INTEGER PRIMARY KEY (rowid=?)".
+_PLAN_STEP = re.compile(r"^(SCAN|SEARCH) (\S+)(?: AS (\S+))?")
+
+# name -> (run, tables the path may legitimately read in full)
+HOT_QUERIES = {}
+
+# Representative parameters: plans depend on the statement shape, not on the values.
+SAMPLE_SITE_IDS = (1, 2, 3)
+SAMPLE_COMMUNE_IDS = (1601,)
+
+
+def register_hot_query(name, allowed_scans=()):
+    """Register ``run()`` (called inside an app context) as a hot read path whose plans are checked."""
+    def decorator(run):
+        HOT_QUERIES[name] = (run, frozenset(allowed_scans))
+        return run
+    return decorator
+
+
+@contextmanager
+def capture_statements(engine):
+    """Collect the (SQL, parameters) of every single-row SELECT executed on ``engine`` inside the block."""
+    statements = []
+
+    def record(_conn, _cursor, statement, parameters, _context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def explain_query_plan(connection, statement, parameters=()):
+    """SQLite ``EXPLAIN QUERY PLAN`` detail lines for a compiled statement."""
+    result = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+    return [row[-1] for row in result]
+
+
+def full_table_scans(plan, table_names):
+    """Tables of ``table_names`` read in full (with or without an index walk) by ``plan``."""
+    scanned = set()
+    for detail in plan:
+        match = _PLAN_STEP.match(detail.strip())
+        if match and match.group(1) == "SCAN" and match.group(2) in table_names:
+            scanned.add(match.group(2))
+    return scanned
+
+
+def hot_query_scans(name, engine, table_names):
+    """Run hot path ``name`` and return [(SQL, plan, unexpected scans)] for its offending statements."""
+    run, allowed_scans = HOT_QUERIES[name]
+    with capture_statements(engine) as statements:
+        run()
+    offending = []
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = explain_query_plan(connection, statement, parameters)
+            scans = full_table_scans(plan, table_names) - allowed_scans
+            if scans:
+                offending.append((statement, plan, scans))
+    return offending
+
+
+@register_hot_query("cells_data.scoped_page")
+def _cells_scoped_page():
+    from app.models import Cell
+    from app.routes.list_data import cells_query
+
+    query = cells_query(SAMPLE_SITE_IDS)
+    query.count()
+    query.order_by(Cell.cellname).limit(50).all()
+
+
+@register_hot_query("cells_data.data_quality_pages")
+def _cells_data_quality_pages():
+    from app.models import Cell
+    from app.routes.list_data import cells_query
+
+    for dq_filter in ("without_sector", "without_antenna"):
+        query = cells_query(None, dq_filter)
+        query.count()
+        query.order_by(Cell.id).limit(50).all()
+
+
+@register_hot_query("import.resolve_sector_id_for_cell")
+def _resolve_sector_id_for_cell():
+    from app.routes.import_data import resolve_sector_id_for_cell
+
+    resolve_sector_id_for_cell("4CSITE01_L1", "4G", None)
+
+
+@register_hot_query("dashboard.commune_refresh")
+def _dashboard_commune_refresh():
+    from app import db
+    from app.services.inventory_stats import compute_commune_stats
+
+    with db.engine.connect() as connection:
+        compute_commune_stats(connection, commune_ids=SAMPLE_COMMUNE_IDS)
+
+
+@register_hot_query("dashboard.partial_scope")
+def _dashboard_partial_scope():
+    from app import db
+    from app.services.inventory_stats import compute_commune_stats
+
+    with db.engine.connect() as connection:
+        compute_commune_stats(connection, site_ids=SAMPLE_SITE_IDS)
+
+
+@register_hot_query("scope.site_ids")
+def _scope_site_ids():
+    from app.security import resolve_scope_site_ids
+
+    resolve_scope_site_ids(wilaya_ids={16})
+    resolve_scope_site_ids(region_ids={1})
+    resolve_scope_site_ids(commune_ids=set(SAMPLE_COMMUNE_IDS), site_ids=set(SAMPLE_SITE_IDS))
@@ -0,0 +1,67 @@
+from contextlib import contextmanager
+
+from flask import current_app
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app import db
+from app.services.sqlite_profile import install_sqlite_profile
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+    )
+
+
+def build_read_engine(app_obj, engine_options=None):
+    """Engine for reporting reads, or None when reads must share the primary engine.
+
+    File-based SQLite gets a second pool on the same file whose connections are
+    ``query_only``: long list/export/dashboard readers hold their own WAL
+    snapshots and never queue for the write lock behind import commits. An
+    explicit READ_DATABASE_URL (e.g. a PostgreSQL replica) is used as given.
+    In-memory SQLite cannot be shared across engines and reads stay on the
+    primary session.
+    """
+    read_url = app_obj.config.get("READ_DATABASE_URL") or ""
+    with app_obj.app_context():
+        # The primary URL as Flask-SQLAlchemy resolved it (relative SQLite paths live in instance/).
+        url = make_url(read_url) if read_url else db.engine.url
+    if _is_memory_sqlite(url) or (not read_url and url.get_backend_name() != "sqlite"):
+        return None
+
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, **(engine_options or {}))
+    engine = create_engine(
+        url,
+        connect_args={"timeout": 60, "check_same_thread": False},
+        pool_size=app_obj.config["SQLITE_READ_POOL_SIZE"],
+    )
+    install_sqlite_profile(engine, app_obj.config, query_only=True)
+    return engine
+
+
+def get_read_engine(app_obj=None):
+    app_obj = app_obj or current_app._get_current_object()
+    return app_obj.extensions.get("read_engine")
+
+
+@contextmanager
+def read_session():
+    """Session for read-only reporting queries (lists, exports, dashboard).
+
+    Bound to the read engine when one is configured and closed on exit; falls
+    back to ``db.session`` (left open) otherwise. Objects loaded here must not
+    be modified and added to ``db.session``.
+    """
+    engine = get_read_engine()
+    if engine is None:
+        yield db.session
+        return
+    session = Session(bind=engine, autoflush=False, expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        session.close()
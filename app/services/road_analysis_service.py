@@ -1,8 +1,13 @@
 import json
 import math
-from dataclasses import dataclass
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+
 try:
     from shapely.geometry import LineString, MultiLineString, Point, Polygon, shape
     from shapely.ops import nearest_points, transform
@@ -14,7 +19,9 @@ except ModuleNotFoundError:
     CRS = Transformer = None
     _GEO_LIBS_AVAILABLE = False
 
-from app.models import Sector, Site
+from app import db
+from app.models import Antenna, Cell, Cell3G, Sector, Site
+from app.services.beam_geometry import metric_beam_vertices
 
 
 DEFAULT_MAX_SITES = 200
@@ -33,6 +40,33 @@ class RoadAnalysisResult:
     total_sectors: int
 
 
+@dataclass
+class InventorySnapshot:
+    """Plain-data copy of sites and sectors used by the road analysis.
+
+    It holds no ORM objects, so one snapshot can be shared by every road of a
+    batch and pickled once per worker process.
+    """
+
+    sites: List[Dict[str, Any]]
+    _lats: Any = field(default=None, repr=False)
+    _lons: Any = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self._lats = np.array([s["latitude"] for s in self.sites], dtype=float)
+        self._lons = np.array([s["longitude"] for s in self.sites], dtype=float)
+
+    def sites_within(self, bounds):
+        if not self.sites:
+            return []
+        min_lon, min_lat, max_lon, max_lat = bounds
+        mask = (
+            (self._lons >= min_lon) & (self._lons <= max_lon)
+            & (self._lats >= min_lat) & (self._lats <= max_lat)
+        )
+        return [self.sites[int(i)] for i in np.flatnonzero(mask)]
+
+
 def ensure_geo_libs_available():
     if _GEO_LIBS_AVAILABLE:
         return
@@ -62,16 +96,23 @@ def parse_road_geometry(road_geojson: str):
         raise ValueError(f"Invalid road geometry JSON: {exc}") from exc
 
 
-def _project_to_metric(point_wgs84: Point, line_wgs84):
-    ensure_geo_libs_available()
-    # Use local Azimuthal Equidistant projection centered on the site point.
-    # This avoids fragile dynamic EPSG generation and keeps metric precision locally.
+@lru_cache(maxsize=256)
+def _local_transformers(lon: float, lat: float):
+    # Every sector of a site reuses the same projection, so cache the pair.
     src = CRS.from_epsg(4326)
     local_metric = CRS.from_proj4(
-        f"+proj=aeqd +lat_0={point_wgs84.y} +lon_0={point_wgs84.x} +datum=WGS84 +units=m +no_defs"
+        f"+proj=aeqd +lat_0={lat} +lon_0={lon} +datum=WGS84 +units=m +no_defs"
     )
     tx = Transformer.from_crs(src, local_metric, always_xy=True)
     to_wgs = Transformer.from_crs(local_metric, src, always_xy=True)
+    return tx, to_wgs
+
+
+def _project_to_metric(point_wgs84: Point, line_wgs84):
+    ensure_geo_libs_available()
+    # Use local Azimuthal Equidistant projection centered on the site point.
+    # This avoids fragile dynamic EPSG generation and keeps metric precision locally.
+    tx, to_wgs = _local_transformers(float(point_wgs84.x), float(point_wgs84.y))
     point_m = transform(tx.transform, point_wgs84)
     line_m = transform(tx.transform, line_wgs84)
     return point_m, line_m, to_wgs
@@ -101,17 +142,8 @@ def _iter_lines(road_m):
 
 
 def _beam_polygon_metric(site_m: Point, azimuth_deg: float, beam_width_deg: float = 40.0, radius_m: float = 1000.0):
-    half = float(beam_width_deg) / 2.0
-    start = float(azimuth_deg) - half
-    end = float(azimuth_deg) + half
-    steps = 24
-    pts = [(site_m.x, site_m.y)]
-    for i in range(steps + 1):
-        b = start + ((end - start) * i / steps)
-        x, y = _point_from_bearing_xy(site_m.x, site_m.y, b, float(radius_m))
-        pts.append((x, y))
-    pts.append((site_m.x, site_m.y))
-    return Polygon(pts)
+    xs, ys = metric_beam_vertices([site_m.x], [site_m.y], [azimuth_deg], [beam_width_deg], [radius_m], steps=24)
+    return Polygon(np.column_stack((xs[0], ys[0])))
 
 
 def _center_point_on_clipped_road(clipped_geom):
@@ -449,71 +481,236 @@ def is_sector_facing_road(
     return diff <= threshold, diff, threshold
 
 
-def analyze_road_for_sites_and_sectors(
-    road_obj,
-    accessible_site_ids: Optional[set],
-    max_sites: int = DEFAULT_MAX_SITES,
-    beam_width_deg: float = DEFAULT_BEAM_WIDTH_DEG,
-    beam_length_m: float = DEFAULT_BEAM_LENGTH_M,
-    site_distance_m: float = DEFAULT_SITE_DISTANCE_M,
-) -> RoadAnalysisResult:
-    ensure_geo_libs_available()
-    road_line = parse_road_geometry(road_obj.geometry_geojson)
+def simplify_line_coords(coords, tolerance_m: float):
+    """Douglas-Peucker simplification of a lon/lat line with a tolerance in metres.
+
+    Points are placed on a local sinusoidal plane centred on the line, which is
+    accurate enough for metre-level tolerances on road-sized geometries. The
+    original coordinate items (including any altitude) are returned unchanged.
+    """
+    if not tolerance_m or float(tolerance_m) <= 0 or len(coords) < 3:
+        return list(coords)
+    pts = np.asarray([(float(c[0]), float(c[1])) for c in coords], dtype=float)
+    lon0 = float(pts[:, 0].mean())
+    lat_rad = np.radians(pts[:, 1])
+    xs = (pts[:, 0] - lon0) * 111320.0 * np.cos(lat_rad)
+    ys = pts[:, 1] * 110540.0
+    tol = float(tolerance_m)
+
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        ax, ay = xs[first], ys[first]
+        vx, vy = xs[last] - ax, ys[last] - ay
+        px = xs[first + 1:last] - ax
+        py = ys[first + 1:last] - ay
+        vv = (vx * vx) + (vy * vy)
+        if vv == 0:
+            dists = np.hypot(px, py)
+        else:
+            t = np.clip(((px * vx) + (py * vy)) / vv, 0.0, 1.0)
+            dists = np.hypot(px - (t * vx), py - (t * vy))
+        idx = int(np.argmax(dists))
+        if dists[idx] > tol:
+            split = first + 1 + idx
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return [coords[int(i)] for i in np.flatnonzero(keep)]
+
+
+def _chunks(values, size=1000):
+    for idx in range(0, len(values), size):
+        yield values[idx:idx + size]
+
+
+def _expanded_bounds(bounds, distance_m: float):
+    # Conservative degree box around (min_lon, min_lat, max_lon, max_lat):
+    # 110 km per latitude degree is below the true minimum, plus a 5% margin.
+    min_lon, min_lat, max_lon, max_lat = bounds
+    dlat = (float(distance_m) / 110000.0) * 1.05
+    lat_edge = min(89.0, max(abs(min_lat - dlat), abs(max_lat + dlat)))
+    dlon = (float(distance_m) / (111320.0 * math.cos(math.radians(lat_edge)))) * 1.05
+    return (min_lon - dlon, min_lat - dlat, max_lon + dlon, max_lat + dlat)
+
+
+def _clip_road_near_site(road_line, site_lon: float, site_lat: float, radius_m: float):
+    # Only the road part around the site matters for the metrics, and projecting a
+    # few local vertices is much cheaper than projecting the whole road per site.
+    # Whole segments are kept (no new vertices), so the metrics are unchanged.
+    min_lon, min_lat, max_lon, max_lat = _expanded_bounds((site_lon, site_lat, site_lon, site_lat), radius_m)
+    pieces = []
+    for line in _iter_lines(road_line):
+        coords = np.asarray(line.coords, dtype=float)
+        if len(coords) < 2:
+            continue
+        xa, ya = coords[:-1, 0], coords[:-1, 1]
+        xb, yb = coords[1:, 0], coords[1:, 1]
+        keep = (
+            (np.minimum(xa, xb) <= max_lon) & (np.maximum(xa, xb) >= min_lon)
+            & (np.minimum(ya, yb) <= max_lat) & (np.maximum(ya, yb) >= min_lat)
+        )
+        if not keep.any():
+            continue
+        # Split kept segments into runs of consecutive segments.
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.astype(np.int8), [0]))))
+        for run_start, run_end in zip(edges[::2], edges[1::2]):
+            pieces.append(LineString(coords[run_start:run_end + 1, :2]))
+    if not pieces:
+        return None
+    if len(pieces) == 1:
+        return pieces[0]
+    return MultiLineString(pieces)
 
-    query = Site.query.order_by(Site.code_site.asc())
+
+def build_inventory_snapshot(accessible_site_ids: Optional[set], bounds=None) -> InventorySnapshot:
+    """Load sites, sectors, beamwidths and DL ARFCNs in a few bulk queries."""
+    query = db.session.query(Site.id, Site.code_site, Site.name, Site.latitude, Site.longitude).order_by(Site.code_site.asc())
     if accessible_site_ids is not None:
         if not accessible_site_ids:
-            return RoadAnalysisResult(
-                road_id=road_obj.id,
-                road_name=road_obj.name,
-                site_rows=[],
-                sector_rows=[],
-                total_sites=0,
-                total_sectors=0,
-            )
+            return InventorySnapshot(sites=[])
         query = query.filter(Site.id.in_(list(accessible_site_ids)))
+    if bounds is not None:
+        min_lon, min_lat, max_lon, max_lat = bounds
+        query = query.filter(
+            Site.longitude >= min_lon,
+            Site.longitude <= max_lon,
+            Site.latitude >= min_lat,
+            Site.latitude <= max_lat,
+        )
 
-    candidates = []
-    for site in query.all():
-        if site.latitude is None or site.longitude is None:
+    sites = []
+    sites_by_id = {}
+    for site_id, code_site, name, latitude, longitude in query.all():
+        if latitude is None or longitude is None:
             continue
         try:
-            site_lat = float(site.latitude)
-            site_lon = float(site.longitude)
+            site_lat = float(latitude)
+            site_lon = float(longitude)
         except (TypeError, ValueError):
             continue
         if not (-90.0 <= site_lat <= 90.0 and -180.0 <= site_lon <= 180.0):
             continue
-        metrics = road_distance_metrics(site_lon, site_lat, road_line)
-        dist_m = float(metrics["distance_min_m"])
-        if dist_m > float(site_distance_m):
-            continue
-        nearest_wgs = metrics["nearest_wgs"]
-        perp_wgs = metrics["perpendicular_wgs"]
-        perp_dist_m = float(metrics["distance_perpendicular_m"])
-        win_mid_wgs = metrics["window_mid_wgs"]
-        win_mid_dist_m = float(metrics["distance_window_mid_m"])
-        bearing = calculate_bearing_deg(site_lat, site_lon, nearest_wgs.y, nearest_wgs.x)
-        bearing_perp = calculate_bearing_deg(site_lat, site_lon, perp_wgs.y, perp_wgs.x)
-        bearing_win_mid = calculate_bearing_deg(site_lat, site_lon, win_mid_wgs.y, win_mid_wgs.x)
-        candidates.append((
-            site, site_lat, site_lon, nearest_wgs, dist_m, bearing, perp_wgs, perp_dist_m, bearing_perp,
-            win_mid_wgs, win_mid_dist_m, bearing_win_mid
-        ))
+        row = {
+            "id": site_id,
+            "code_site": code_site,
+            "name": name,
+            "latitude": latitude,
+            "longitude": longitude,
+            "sectors": [],
+        }
+        sites.append(row)
+        sites_by_id[site_id] = row
+
+    sectors_by_id = {}
+    for chunk in _chunks(list(sites_by_id.keys())):
+        sector_rows = (
+            db.session.query(Sector.id, Sector.code_sector, Sector.azimuth, Sector.site_id)
+            .filter(Sector.site_id.in_(chunk))
+            .order_by(Sector.code_sector.asc())
+            .all()
+        )
+        for sector_id, code_sector, azimuth, site_id in sector_rows:
+            row = {
+                "id": sector_id,
+                "code_sector": code_sector,
+                "azimuth": azimuth,
+                "widths": [],
+                "dlarfcn": set(),
+            }
+            sites_by_id[site_id]["sectors"].append(row)
+            sectors_by_id[sector_id] = row
+
+    for chunk in _chunks(list(sectors_by_id.keys())):
+        cell_rows = (
+            db.session.query(Cell.sector_id, Antenna.hbeamwidth, Cell3G.dlarfcn)
+            .outerjoin(Antenna, Cell.antenna_id == Antenna.id)
+            .outerjoin(Cell3G, Cell3G.cell_id == Cell.id)
+            .filter(Cell.sector_id.in_(chunk))
+            .all()
+        )
+        for sector_id, hbeamwidth, dlarfcn in cell_rows:
+            row = sectors_by_id[sector_id]
+            if hbeamwidth is not None:
+                try:
+                    val = float(hbeamwidth)
+                except (TypeError, ValueError):
+                    val = None
+                if val is not None and 1.0 <= val <= 180.0:
+                    row["widths"].append(val)
+            if dlarfcn is not None:
+                text = str(dlarfcn).strip()
+                if text:
+                    row["dlarfcn"].add(text)
+
+    # Same reductions as detect_sector_beamwidth / collect_sector_dlarfcn.
+    for row in sectors_by_id.values():
+        widths = row.pop("widths")
+        values = row.pop("dlarfcn")
+        row["beamwidth"] = round(sum(widths) / len(widths), 2) if widths else None
+        row["dlarfcn_list"] = ", ".join(sorted(values)) if values else "-"
+    return InventorySnapshot(sites=sites)
+
+
+def analyze_road_geometry(
+    road_id: int,
+    road_name: str,
+    road_geojson: str,
+    inventory: InventorySnapshot,
+    max_sites: int = DEFAULT_MAX_SITES,
+    beam_width_deg: float = DEFAULT_BEAM_WIDTH_DEG,
+    beam_length_m: float = DEFAULT_BEAM_LENGTH_M,
+    site_distance_m: float = DEFAULT_SITE_DISTANCE_M,
+    progress_cb=None,
+) -> RoadAnalysisResult:
+    """Run the road analysis against an inventory snapshot (no database access)."""
+    ensure_geo_libs_available()
+    road_line = parse_road_geometry(road_geojson)
+    local_radius_m = max(float(site_distance_m), float(beam_length_m)) + 250.0
+    nearby_sites = inventory.sites_within(_expanded_bounds(road_line.bounds, float(site_distance_m)))
+
+    candidates = []
+    total = len(nearby_sites)
+    for processed, site in enumerate(nearby_sites, start=1):
+        site_lat = float(site["latitude"])
+        site_lon = float(site["longitude"])
+        local_road = _clip_road_near_site(road_line, site_lon, site_lat, local_radius_m)
+        if local_road is not None:
+            metrics = road_distance_metrics(site_lon, site_lat, local_road)
+            dist_m = float(metrics["distance_min_m"])
+            if dist_m <= float(site_distance_m):
+                nearest_wgs = metrics["nearest_wgs"]
+                perp_wgs = metrics["perpendicular_wgs"]
+                perp_dist_m = float(metrics["distance_perpendicular_m"])
+                win_mid_wgs = metrics["window_mid_wgs"]
+                win_mid_dist_m = float(metrics["distance_window_mid_m"])
+                bearing = calculate_bearing_deg(site_lat, site_lon, nearest_wgs.y, nearest_wgs.x)
+                bearing_perp = calculate_bearing_deg(site_lat, site_lon, perp_wgs.y, perp_wgs.x)
+                bearing_win_mid = calculate_bearing_deg(site_lat, site_lon, win_mid_wgs.y, win_mid_wgs.x)
+                candidates.append((
+                    site, site_lat, site_lon, nearest_wgs, dist_m, bearing, perp_wgs, perp_dist_m, bearing_perp,
+                    win_mid_wgs, win_mid_dist_m, bearing_win_mid, local_road
+                ))
+        if progress_cb and (processed == 1 or processed % 50 == 0 or processed == total):
+            progress_cb(processed, total, f"Analyzing sites {processed}/{total}")
 
     candidates.sort(key=lambda x: x[2])
     candidates = candidates[: max(int(max_sites), 1)]
 
     site_rows = []
     sector_rows = []
-    for site, site_lat, site_lon, nearest_wgs, dist_m, bearing_to_road, perp_wgs, perp_dist_m, bearing_perp, win_mid_wgs, win_mid_dist_m, bearing_win_mid in candidates:
+    for site, site_lat, site_lon, nearest_wgs, dist_m, bearing_to_road, perp_wgs, perp_dist_m, bearing_perp, win_mid_wgs, win_mid_dist_m, bearing_win_mid, local_road in candidates:
         site_rows.append({
-            "site_id": site.id,
-            "site_code": site.code_site,
-            "site_name": site.name,
-            "latitude": site.latitude,
-            "longitude": site.longitude,
-            "selected_road": road_obj.name,
+            "site_id": site["id"],
+            "site_code": site["code_site"],
+            "site_name": site["name"],
+            "latitude": site["latitude"],
+            "longitude": site["longitude"],
+            "selected_road": road_name,
             "distance_to_road_m": round(dist_m, 2),  # minimum geometric distance
             "distance_perpendicular_m": round(perp_dist_m, 2),
             "nearest_road_latitude": round(float(nearest_wgs.y), 6),
@@ -528,23 +725,22 @@ def analyze_road_for_sites_and_sectors(
             "bearing_window_mid_deg": round(float(bearing_win_mid), 2),
         })
 
-        sectors = site.sectors.order_by(Sector.code_sector.asc()).all() if hasattr(site.sectors, "order_by") else list(site.sectors)
-        for sector in sectors:
+        for sector in site["sectors"]:
             try:
-                az = float(sector.azimuth)
+                az = float(sector["azimuth"])
             except (TypeError, ValueError):
                 continue
             intercept = sector_intersection_on_road(
                 site_lon=site_lon,
                 site_lat=site_lat,
-                road_line_wgs84=road_line,
+                road_line_wgs84=local_road,
                 sector_azimuth_deg=az,
                 max_distance_m=float(beam_length_m),
                 beam_width_deg=float(beam_width_deg),
             )
             is_favorable = intercept is not None
             intercept_point = intercept["point_wgs"] if intercept else None
-            beamwidth = detect_sector_beamwidth(sector)
+            beamwidth = sector["beamwidth"]
             facing, diff, threshold = is_sector_facing_road(
                 sector_azimuth=az,
                 bearing_to_road=bearing_to_road,
@@ -552,14 +748,14 @@ def analyze_road_for_sites_and_sectors(
                 beamwidth_deg=beamwidth,
             )
             sector_rows.append({
-                "site_id": site.id,
-                "site_code": site.code_site,
-                "site_name": site.name,
-                "site_latitude": site.latitude,
-                "site_longitude": site.longitude,
-                "sector_id": sector.id,
-                "sector_code": sector.code_sector,
-                "dlarfcn_list": collect_sector_dlarfcn(sector),
+                "site_id": site["id"],
+                "site_code": site["code_site"],
+                "site_name": site["name"],
+                "site_latitude": site["latitude"],
+                "site_longitude": site["longitude"],
+                "sector_id": sector["id"],
+                "sector_code": sector["code_sector"],
+                "dlarfcn_list": sector["dlarfcn_list"],
                 "azimuth_deg": round(az, 2),
                 "distance_to_road_m": round(dist_m, 2),
                 "distance_perpendicular_m": round(perp_dist_m, 2),
@@ -585,10 +781,116 @@ def analyze_road_for_sites_and_sectors(
         )
     )
     return RoadAnalysisResult(
-        road_id=road_obj.id,
-        road_name=road_obj.name,
+        road_id=road_id,
+        road_name=road_name,
         site_rows=site_rows,
         sector_rows=sector_rows,
         total_sites=len(site_rows),
         total_sectors=len(sector_rows),
     )
+
+
+def analyze_road_for_sites_and_sectors(
+    road_obj,
+    accessible_site_ids: Optional[set],
+    max_sites: int = DEFAULT_MAX_SITES,
+    beam_width_deg: float = DEFAULT_BEAM_WIDTH_DEG,
+    beam_length_m: float = DEFAULT_BEAM_LENGTH_M,
+    site_distance_m: float = DEFAULT_SITE_DISTANCE_M,
+    progress_cb=None,
+) -> RoadAnalysisResult:
+    ensure_geo_libs_available()
+    road_line = parse_road_geometry(road_obj.geometry_geojson)
+    # Only load the sites that can possibly fall within site_distance_m of the road.
+    inventory = build_inventory_snapshot(
+        accessible_site_ids,
+        bounds=_expanded_bounds(road_line.bounds, float(site_distance_m)),
+    )
+    return analyze_road_geometry(
+        road_id=road_obj.id,
+        road_name=road_obj.name,
+        road_geojson=road_obj.geometry_geojson,
+        inventory=inventory,
+        max_sites=max_sites,
+        beam_width_deg=beam_width_deg,
+        beam_length_m=beam_length_m,
+        site_distance_m=site_distance_m,
+        progress_cb=progress_cb,
+    )
+
+
+_WORKER_INVENTORY: Optional[InventorySnapshot] = None
+
+
+def _init_batch_worker(inventory: InventorySnapshot):
+    # Runs once per worker process: the snapshot is shipped once, not per road.
+    global _WORKER_INVENTORY
+    _WORKER_INVENTORY = inventory
+
+
+def _analyze_road_in_worker(road: Dict[str, Any], params: Dict[str, Any]):
+    try:
+        return road["id"], analyze_road_geometry(
+            road_id=road["id"],
+            road_name=road["name"],
+            road_geojson=road["geometry_geojson"],
+            inventory=_WORKER_INVENTORY,
+            **params,
+        ), None
+    except Exception as exc:
+        return road["id"], None, str(exc)
+
+
+def analyze_roads_batch(
+    roads: List[Dict[str, Any]],
+    inventory: InventorySnapshot,
+    max_sites: int = DEFAULT_MAX_SITES,
+    beam_width_deg: float = DEFAULT_BEAM_WIDTH_DEG,
+    beam_length_m: float = DEFAULT_BEAM_LENGTH_M,
+    site_distance_m: float = DEFAULT_SITE_DISTANCE_M,
+    max_workers: Optional[int] = None,
+    progress_cb=None,
+) -> Dict[int, Tuple[Optional[RoadAnalysisResult], Optional[str]]]:
+    """Analyze many roads against one shared snapshot.
+
+    ``roads`` are plain dicts with ``id``, ``name`` and ``geometry_geojson``.
+    Returns ``{road_id: (result, error)}``; a failing road does not stop the batch.
+    """
+    ensure_geo_libs_available()
+    params = {
+        "max_sites": max_sites,
+        "beam_width_deg": beam_width_deg,
+        "beam_length_m": beam_length_m,
+        "site_distance_m": site_distance_m,
+    }
+    total = len(roads)
+    results = {}
+    workers = max(1, min(int(max_workers or multiprocessing.cpu_count() or 1), total or 1))
+
+    if workers == 1:
+        _init_batch_worker(inventory)
+        try:
+            for done, road in enumerate(roads, start=1):
+                road_id, result, error = _analyze_road_in_worker(road, params)
+                results[road_id] = (result, error)
+                if progress_cb:
+                    progress_cb(done, total, f"Analyzed road {done}/{total}")
+        finally:
+            _init_batch_worker(None)
+        return results
+
+    # Spawned workers avoid forking a threaded web process.
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_batch_worker,
+        initargs=(inventory,),
+    ) as pool:
+        futures = [pool.submit(_analyze_road_in_worker, road, params) for road in roads]
+        for done, future in enumerate(as_completed(futures), start=1):
+            road_id, result, error = future.result()
+            results[road_id] = (result, error)
+            if progress_cb:
+                progress_cb(done, total, f"Analyzed road {done}/{total}")
+    return results
@@ -0,0 +1,138 @@
+import math
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app import db
+from app.models import Site
+from app.services.map_tiles import coordinate_precision
+
+
+# Clusters are grid cells of VIEWPORT_CELL_PX screen pixels at the requested zoom.
+VIEWPORT_CELL_PX = 64
+# From this zoom on sites are always returned one by one.
+VIEWPORT_CLUSTER_MAX_ZOOM = 15
+# Entries per answer (~80 bytes of JSON each), whatever the zoom: below this many sites
+# in view they are listed one by one, above it clusters are coarsened to fit.
+VIEWPORT_MAX_POINTS = 100
+_MERCATOR_MAX_LAT = 85.05112878
+# Finest grid level: one cell of VIEWPORT_CELL_PX at VIEWPORT_CLUSTER_MAX_ZOOM.
+_GRID_BITS = VIEWPORT_CLUSTER_MAX_ZOOM + int(math.log2(256 // VIEWPORT_CELL_PX))
+
+
+class SiteGridIndex:
+    """In-memory positions of every located site, gridded once at the finest cluster level.
+
+    Coarser zoom levels are derived by shifting the fine cell coordinates, so one
+    build serves every zoom; a viewport query is a couple of vectorised masks.
+    """
+
+    def __init__(self, ids, codes, names, lats, lons):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.codes = list(codes)
+        self.names = list(names)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        scale = float(1 << _GRID_BITS)
+        clamped = np.radians(np.clip(self.lats, -_MERCATOR_MAX_LAT, _MERCATOR_MAX_LAT))
+        merc_x = (self.lons + 180.0) / 360.0
+        merc_y = (1.0 - np.arcsinh(np.tan(clamped)) / math.pi) / 2.0
+        self.grid_x = np.clip(merc_x * scale, 0, scale - 1).astype(np.int64)
+        self.grid_y = np.clip(merc_y * scale, 0, scale - 1).astype(np.int64)
+
+    @classmethod
+    def from_database(cls):
+        rows = (
+            db.session.query(Site.id, Site.code_site, Site.name, Site.latitude, Site.longitude)
+            .filter(Site.latitude.isnot(None), Site.longitude.isnot(None))
+            .order_by(Site.id)
+            .all()
+        )
+        return cls(
+            [row.id for row in rows],
+            [row.code_site for row in rows],
+            [row.name or "" for row in rows],
+            [row.latitude for row in rows],
+            [row.longitude for row in rows],
+        )
+
+    def __len__(self):
+        return int(self.ids.size)
+
+    def query(self, bbox, zoom: int, accessible_site_ids: Optional[set] = None) -> Dict[str, Any]:
+        """Sites inside ``bbox`` (west, south, east, north), clustered per grid cell unless few or zoomed in.
+
+        Answers hold at most VIEWPORT_MAX_POINTS entries: clusters grow past VIEWPORT_CELL_PX
+        when needed, and zoomed-in answers keep the sites nearest the centre, setting ``truncated``.
+        """
+        west, south, east, north = bbox
+        mask = (self.lons >= west) & (self.lons <= east) & (self.lats >= south) & (self.lats <= north)
+        if accessible_site_ids is not None:
+            mask &= np.isin(self.ids, np.fromiter(accessible_site_ids, dtype=np.int64, count=len(accessible_site_ids)))
+        selected = np.flatnonzero(mask)
+        precision = coordinate_precision(zoom)
+        total = int(selected.size)
+
+        if zoom >= VIEWPORT_CLUSTER_MAX_ZOOM or total <= VIEWPORT_MAX_POINTS:
+            truncated = total > VIEWPORT_MAX_POINTS
+            if truncated:
+                centre_lat, centre_lon = (south + north) / 2.0, (west + east) / 2.0
+                dx = (self.lons[selected] - centre_lon) * math.cos(math.radians(centre_lat))
+                dy = self.lats[selected] - centre_lat
+                nearest = np.argpartition(dx * dx + dy * dy, VIEWPORT_MAX_POINTS - 1)[:VIEWPORT_MAX_POINTS]
+                selected = selected[np.sort(nearest)]
+            points = [
+                {
+                    "id": int(self.ids[i]),
+                    "code": self.codes[i],
+                    "name": self.names[i],
+                    "lat": round(float(self.lats[i]), precision),
+                    "lon": round(float(self.lons[i]), precision),
+                    "count": 1,
+                }
+                for i in selected
+            ]
+            return {"clustered": False, "truncated": truncated, "total": total, "points": points}
+
+        shift = _GRID_BITS - (max(zoom, 0) + int(math.log2(256 // VIEWPORT_CELL_PX)))
+        while True:
+            cell_x = self.grid_x[selected] >> shift
+            cell_y = self.grid_y[selected] >> shift
+            keys = (cell_x << 32) | cell_y
+            _, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+            # A bbox far wider than the screen yields too many cells: double the cell size until it fits.
+            if counts.size <= VIEWPORT_MAX_POINTS or shift >= _GRID_BITS:
+                break
+            shift += 1
+        lat_sum = np.bincount(inverse, weights=self.lats[selected])
+        lon_sum = np.bincount(inverse, weights=self.lons[selected])
+        points = []
+        for cell, count in enumerate(counts):
+            count = int(count)
+            point = {
+                "lat": round(float(lat_sum[cell] / count), precision),
+                "lon": round(float(lon_sum[cell] / count), precision),
+                "count": count,
+            }
+            if count == 1:
+                i = selected[first[cell]]
+                point.update({"id": int(self.ids[i]), "code": self.codes[i], "name": self.names[i]})
+            points.append(point)
+        return {"clustered": True, "truncated": False, "total": total, "points": points}
+
+
+_index_lock = threading.Lock()
+
+
+def get_site_index(app_obj, data_version: int) -> SiteGridIndex:
+    """Per-app index, rebuilt the first time it is asked for under a newer data version."""
+    cached = app_obj.extensions.get("site_grid_index")
+    if cached is not None and cached[0] == data_version:
+        return cached[1]
+    with _index_lock:
+        cached = app_obj.extensions.get("site_grid_index")
+        if cached is None or cached[0] != data_version:
+            cached = (data_version, SiteGridIndex.from_database())
+            app_obj.extensions["site_grid_index"] = cached
+    return cached[1]
@@ -0,0 +1,51 @@
+import threading
+
+from sqlalchemy import event
+
+
+def sqlite_connection_pragmas(config, query_only=False):
+    """(pragma, value) pairs applied to every new SQLite connection, from the SQLITE_* settings."""
+    pragmas = [
+        ("synchronous", config["SQLITE_SYNCHRONOUS"]),
+        ("busy_timeout", int(config["SQLITE_BUSY_TIMEOUT_MS"])),
+        # Negative cache_size is a budget in KiB rather than in pages.
+        ("cache_size", -int(config["SQLITE_CACHE_SIZE_KB"])),
+        ("mmap_size", int(config["SQLITE_MMAP_SIZE_MB"]) * 1024 * 1024),
+        ("temp_store", config["SQLITE_TEMP_STORE"]),
+        ("foreign_keys", "ON" if config["SQLITE_FOREIGN_KEYS"] else "OFF"),
+    ]
+    if query_only:
+        pragmas.append(("query_only", "ON"))
+    return pragmas
+
+
+def install_sqlite_profile(engine, config, query_only=False):
+    """Apply the SQLite performance profile to each connection ``engine`` opens.
+
+    The journal mode is stored in the database file, so it is checked (and
+    switched if needed) on the engine's first connection only. Per-connection
+    settings (cache, mmap, temp store, foreign keys, query_only) are applied to
+    every connection. ``query_only`` engines never change the journal mode.
+    """
+    pragmas = sqlite_connection_pragmas(config, query_only=query_only)
+    journal_mode = None if query_only else str(config["SQLITE_JOURNAL_MODE"]).lower()
+    journal_lock = threading.Lock()
+    journal_state = {"checked": journal_mode is None}
+
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_profile(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+            if not journal_state["checked"]:
+                with journal_lock:
+                    if not journal_state["checked"]:
+                        current = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+                        if str(current).lower() != journal_mode:
+                            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+                        journal_state["checked"] = True
+        finally:
+            cursor.close()
+
+    return _apply_sqlite_profile
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# session.info keys: the session's write priority and the coordinator whose slot it holds.
+_ROLE_KEY = "write_role"
+_HELD_KEY = "write_slot"
+
+
+class WriteCoordinator:
+    """One in-process write slot with priority for interactive writers, plus a FIFO queue of bulk jobs.
+
+    SQLite admits a single writer; without coordination every contender polls
+    on busy_timeout and an edit can wait out a whole import commit. Sessions
+    take the slot before their first write (see the listeners below) and give
+    it back when their transaction ends. A waiting interactive writer always
+    gets the slot before a batch writer does, so an edit waits at most for the
+    batch in progress; bulk jobs keep their batches short with CommitSlice.
+    Bulk jobs themselves run one at a time, in arrival order (``bulk_job``).
+    """
+
+    def __init__(self, wait_timeout=60.0):
+        self.wait_timeout = float(wait_timeout)
+        self._cond = threading.Condition()
+        self._owner = None
+        self._depth = 0
+        self._interactive_waiting = 0
+        self._jobs = deque()
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """Take the slot for the calling thread (re-entrant); False if it stayed busy for ``timeout`` seconds."""
+        me = threading.get_ident()
+        deadline = time.monotonic() + (self.wait_timeout if timeout is None else timeout)
+        interactive = priority != BATCH
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return True
+            if interactive:
+                self._interactive_waiting += 1
+            try:
+                while self._owner is not None or (not interactive and self._interactive_waiting):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._owner = me
+                self._depth = 1
+                return True
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+                    if not self._interactive_waiting:
+                        self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            if self._owner != threading.get_ident():
+                return
+            self._depth -= 1
+            if self._depth <= 0:
+                self._owner = None
+                self._depth = 0
+                self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        """Hold the slot around writes that bypass the ORM session (e.g. ``engine.begin()`` blocks)."""
+        acquired = self.acquire(priority)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release()
+
+    @contextmanager
+    def bulk_job(self, name, on_queued=None, timeout=None):
+        """Run a bulk-writer job once the jobs queued before it are done; ``on_queued(ahead)`` reports a wait.
+
+        Background jobs wait as long as needed (``timeout=None``); with a timeout,
+        TimeoutError is raised if the jobs ahead are still running after it.
+        """
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._jobs.append((ticket, name))
+            if self._jobs[0][0] is not ticket and on_queued is not None:
+                on_queued(len(self._jobs) - 1)
+            while self._jobs[0][0] is not ticket:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._jobs.remove((ticket, name))
+                    self._cond.notify_all()
+                    ahead = ", ".join(job_name for _ticket, job_name in self._jobs)
+                    raise TimeoutError(f"Write queue busy ({ahead}); {name} was not started.")
+                self._cond.wait(remaining)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._jobs.popleft()
+                self._cond.notify_all()
+
+    def queued_jobs(self):
+        with self._cond:
+            return [name for _ticket, name in self._jobs]
+
+
+class CommitSlice:
+    """Commit pacing for bulk writers: due after ``max_rows`` rows or ``max_seconds`` since the slice's first row."""
+
+    def __init__(self, max_seconds, max_rows=None):
+        self.max_seconds = float(max_seconds)
+        self.max_rows = max_rows
+        self.reset()
+
+    def reset(self):
+        self.rows = 0
+        self._started = None
+
+    def add(self, rows=1):
+        if self._started is None:
+            self._started = time.monotonic()
+        self.rows += rows
+        return self.due
+
+    @property
+    def due(self):
+        if not self.rows:
+            return False
+        if self.max_rows is not None and self.rows >= self.max_rows:
+            return True
+        return time.monotonic() - self._started >= self.max_seconds
+
+
+def get_write_coordinator(app_obj):
+    """The app's coordinator, or None when WRITE_COORDINATOR is off (the default for non-SQLite databases)."""
+    return app_obj.extensions.get("write_coordinator")
+
+
+def commit_slice(max_rows=None, app_obj=None):
+    app_obj = app_obj or current_app
+    return CommitSlice(app_obj.config.get("WRITE_SLICE_MS", 250) / 1000.0, max_rows=max_rows)
+
+
+@contextmanager
+def bulk_writer(name, on_queued=None, timeout=None):
+    """Run a background bulk-writer job through the queue; ``db.session`` writes at batch priority inside the block.
+
+    Web requests should not enter the queue: they write through the slot like
+    any interactive edit (keeping their batches short with ``commit_slice``).
+    """
+    coordinator = get_write_coordinator(current_app)
+    if coordinator is None:
+        yield
+        return
+    session = db.session()
+    with coordinator.bulk_job(name, on_queued=on_queued, timeout=timeout):
+        previous = session.info.get(_ROLE_KEY)
+        session.info[_ROLE_KEY] = BATCH
+        try:
+            yield
+        finally:
+            if previous is None:
+                session.info.pop(_ROLE_KEY, None)
+            else:
+                session.info[_ROLE_KEY] = previous
+
+
+def write_priority(session):
+    """Priority ``session`` writes at: BATCH inside ``bulk_writer``, INTERACTIVE otherwise."""
+    return session.info.get(_ROLE_KEY, INTERACTIVE)
+
+
+def claim_write_slot(session):
+    """Take the write slot for ``session``'s transaction (no-op when held, outside an app, or disabled)."""
+    if session.info.get(_HELD_KEY) is not None or not has_app_context():
+        return
+    coordinator = get_write_coordinator(current_app)
+    if coordinator is None:
+        return
+    if not coordinator.acquire(write_priority(session)):
+        # Fall back to SQLite's own busy handling rather than failing the write.
+        logger.warning("Write slot still busy after %.0fs; writing without it", coordinator.wait_timeout)
+        return
+    session.info[_HELD_KEY] = coordinator
+
+
+@event.listens_for(Session, "before_flush")
+def _claim_before_flush(session, _flush_context, _instances):
+    claim_write_slot(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _claim_before_bulk_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        claim_write_slot(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _release_after_transaction(session, transaction):
+    # Savepoints end inside the outer transaction, which still holds the database write lock.
+    if transaction.parent is not None:
+        return
+    coordinator = session.info.pop(_HELD_KEY, None)
+    if coordinator is not None:
+        coordinator.release()
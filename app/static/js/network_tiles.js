@@ -0,0 +1,172 @@
+(function() {
+    if (typeof L === 'undefined') return;
+
+    // Grid layer that only requests /tiles/<layer>/<z>/<x>/<y> for tiles in view and
+    // draws each payload as a GeoJSON group, dropped again when Leaflet unloads the tile.
+    L.GeoJSONTileLayer = L.GridLayer.extend({
+        options: {
+            layer: 'sites',
+            style: null,
+            pointToLayer: null,
+            onEachFeature: null
+        },
+
+        initialize: function(options) {
+            L.GridLayer.prototype.initialize.call(this, options);
+            this._tileGroups = {};
+            this._tileRequests = {};
+        },
+
+        createTile: function(coords, done) {
+            const tile = document.createElement('div');
+            const key = this._tileCoordsToKey(coords);
+            const controller = new AbortController();
+            this._tileRequests[key] = controller;
+
+            fetch(`/tiles/${this.options.layer}/${coords.z}/${coords.x}/${coords.y}`, {
+                credentials: 'same-origin',
+                signal: controller.signal
+            })
+                .then(r => (r.ok ? r.json() : { type: 'FeatureCollection', features: [] }))
+                .then(data => {
+                    if (!this._map || this._tileRequests[key] !== controller) return;
+                    if (!data.features || !data.features.length) return;
+                    this._tileGroups[key] = L.geoJSON(data, {
+                        style: this.options.style,
+                        pointToLayer: this.options.pointToLayer,
+                        onEachFeature: this.options.onEachFeature
+                    }).addTo(this._map);
+                })
+                .catch(() => {})
+                .finally(() => {
+                    if (this._tileRequests[key] === controller) delete this._tileRequests[key];
+                    done(null, tile);
+                });
+            return tile;
+        },
+
+        _removeTile: function(key) {
+            const request = this._tileRequests[key];
+            if (request) {
+                request.abort();
+                delete this._tileRequests[key];
+            }
+            const group = this._tileGroups[key];
+            if (group) {
+                group.remove();
+                delete this._tileGroups[key];
+            }
+            L.GridLayer.prototype._removeTile.call(this, key);
+        }
+    });
+
+    // Layer group redrawn from /sites/viewport on every pan/zoom; the server clusters,
+    // so the payload stays small whatever the zoom level.
+    L.ViewportSitesLayer = L.LayerGroup.extend({
+        onAdd: function(map) {
+            L.LayerGroup.prototype.onAdd.call(this, map);
+            map.on('moveend', this._refresh, this);
+            this._notice = L.control({ position: 'bottomleft' });
+            this._notice.onAdd = () => L.DomUtil.create('div', 'leaflet-bar bg-white px-2 py-1 small');
+            this._refresh();
+        },
+
+        onRemove: function(map) {
+            map.off('moveend', this._refresh, this);
+            if (this._request) this._request.abort();
+            this._request = null;
+            this._notice.remove();
+            L.LayerGroup.prototype.onRemove.call(this, map);
+        },
+
+        _refresh: function() {
+            if (!this._map) return;
+            if (this._request) this._request.abort();
+            const controller = new AbortController();
+            this._request = controller;
+            const b = this._map.getBounds();
+            const clamp = (v, lim) => Math.max(-lim, Math.min(lim, v));
+            const bbox = [clamp(b.getWest(), 180), clamp(b.getSouth(), 90), clamp(b.getEast(), 180), clamp(b.getNorth(), 90)]
+                .map(v => v.toFixed(5)).join(',');
+            fetch(`/sites/viewport?bbox=${bbox}&zoom=${this._map.getZoom()}`, {
+                credentials: 'same-origin',
+                signal: controller.signal
+            })
+                .then(r => (r.ok ? r.json() : { points: [] }))
+                .then(data => {
+                    if (this._request !== controller) return;
+                    this.clearLayers();
+                    (data.points || []).forEach(p => this.addLayer(this._marker(p)));
+                    this._showNotice(data);
+                })
+                .catch(() => {});
+        },
+
+        // Zoomed-in answers are capped server-side; say so rather than silently dropping sites.
+        _showNotice: function(data) {
+            if (!data.truncated) {
+                this._notice.remove();
+                return;
+            }
+            if (!this._notice._map) this._notice.addTo(this._map);
+            this._notice.getContainer().textContent =
+                `Showing the ${data.points.length} sites nearest the centre of ${data.total}; zoom in to see all.`;
+        },
+
+        _marker: function(p) {
+            if (p.count > 1) {
+                const size = Math.round(Math.min(22 + Math.log10(p.count) * 8, 46));
+                const marker = L.marker([p.lat, p.lon], {
+                    icon: L.divIcon({
+                        className: 'site-cluster',
+                        html: `<div style="width:${size}px;height:${size}px;line-height:${size}px;border-radius:50%;background:rgba(25,135,84,0.75);color:#fff;text-align:center;font-size:11px;font-weight:600;">${p.count}</div>`,
+                        iconSize: [size, size]
+                    })
+                });
+                marker.on('click', () => this._map.setView([p.lat, p.lon], Math.min(this._map.getZoom() + 2, this._map.getMaxZoom())));
+                return marker;
+            }
+            return L.circleMarker([p.lat, p.lon], {
+                radius: 5,
+                color: '#198754',
+                fillColor: '#198754',
+                fillOpacity: 0.8,
+                weight: 1
+            }).bindPopup(`<strong>${p.code || ''}</strong><br>${p.name || ''}`);
+        }
+    });
+
+    window.createNetworkTileLayers = function() {
+        const sites = new L.GeoJSONTileLayer({
+            layer: 'sites',
+            minZoom: 5,
+            pointToLayer: function(feature, latlng) {
+                const count = Number(feature.properties.count || 1);
+                return L.circleMarker(latlng, {
+                    radius: count > 1 ? Math.min(4 + Math.log2(count) * 1.5, 12) : 4,
+                    color: '#198754',
+                    fillColor: '#198754',
+                    fillOpacity: 0.8,
+                    weight: 1
+                });
+            },
+            onEachFeature: function(feature, layer) {
+                const p = feature.properties || {};
+                const extra = Number(p.count || 1) > 1 ? `<br>+${p.count - 1} nearby` : '';
+                layer.bindPopup(`<strong>${p.code || ''}</strong><br>${p.name || ''}${extra}`);
+            }
+        });
+        const sectors = new L.GeoJSONTileLayer({
+            layer: 'sectors',
+            minZoom: 11,
+            style: function() {
+                return { color: '#fd7e14', fillColor: '#fd7e14', fillOpacity: 0.12, weight: 1 };
+            },
+            onEachFeature: function(feature, layer) {
+                const p = feature.properties || {};
+                layer.bindPopup(`<strong>${p.code || ''}</strong><br>AZ: ${p.azimuth ?? '-'}<br>BW: ${p.beamwidth ?? '-'}`);
+            }
+        });
+        return { 'Network sites': sites, 'Site clusters': new L.ViewportSitesLayer(), 'Network beams': sectors };
+    };
+})();
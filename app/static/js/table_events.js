@@ -602,7 +602,13 @@ $(document).ready(function() {
                     $('#d4bBtn, #siteProfileBtn').hide();
                 }
             } else if (count > 1) {
-                $('#editBtn, #d4bBtn, #siteProfileBtn').fadeOut();
+                $('#editBtn, #siteProfileBtn').fadeOut();
+                if (entity === 'site') {
+                    // Several sites: the D4b button generates one ZIP for the selection.
+                    $('#d4bBtn').removeAttr('data-id').fadeIn();
+                } else {
+                    $('#d4bBtn').fadeOut();
+                }
                 if (entity !== 'user') {
                     $('#deleteBulkBtn').fadeIn();
                 }
@@ -728,6 +734,10 @@ $(document).ready(function() {
                 maxZoom: 19,
                 attribution: '&copy; OpenStreetMap contributors'
             }).addTo(siteProfileMap);
+            if (typeof window.createNetworkTileLayers === 'function') {
+                // Whole-network overlays, fetched tile by tile for the visible area only.
+                L.control.layers(null, window.createNetworkTileLayers(), { collapsed: true }).addTo(siteProfileMap);
+            }
         }
 
         resetSiteProfileMap();
@@ -1065,7 +1075,65 @@ $(document).ready(function() {
 
     $(document).on('click', '#d4bBtn', function() {
         const id = $(this).attr('data-id');
-        if (id) window.location.href = `/generate_d4b/${id}`;
+        if (id) {
+            window.location.href = `/generate_d4b/${id}`;
+            return;
+        }
+
+        const selectedRows = $('.dataTable').DataTable().rows({ selected: true });
+        if (selectedRows.count() === 0) return;
+        const body = new FormData();
+        selectedRows.data().each(function(rowData) {
+            body.append('site_ids', $($.parseHTML(rowData[1])).text() || rowData[1]);
+        });
+
+        const $btn = $(this);
+        const baseHtml = $btn.html();
+        const reset = function() {
+            $btn.prop('disabled', false).html(baseHtml);
+        };
+        const poll = function(statusUrl, downloadUrl) {
+            fetch(statusUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                .then(r => r.json())
+                .then(data => {
+                    if (!data || data.success === false) {
+                        throw new Error((data && data.message) || 'D4b status error');
+                    }
+                    const status = String(data.status || '').toLowerCase();
+                    if (status === 'completed') {
+                        window.location.href = (data.download_url || downloadUrl);
+                        reset();
+                        return;
+                    }
+                    if (status === 'failed') {
+                        throw new Error(data.message || 'D4b batch failed');
+                    }
+                    $btn.html(`<span class="spinner-border spinner-border-sm"></span> ${Number(data.progress || 0)}%`);
+                    setTimeout(() => poll(statusUrl, downloadUrl), 1200);
+                })
+                .catch(err => {
+                    showToast(err.message || 'D4b batch error', 'danger');
+                    reset();
+                });
+        };
+
+        $btn.prop('disabled', true).html('<span class="spinner-border spinner-border-sm"></span>');
+        fetch('/generate_d4b/batch/start', {
+            method: 'POST',
+            headers: { 'X-CSRF-Token': csrfToken, 'X-Requested-With': 'XMLHttpRequest' },
+            body
+        })
+        .then(r => r.json())
+        .then(data => {
+            if (!data || !data.success || !data.status_url) {
+                throw new Error((data && data.message) || 'Unable to start D4b batch');
+            }
+            poll(data.status_url, data.download_url || '');
+        })
+        .catch(err => {
+            showToast(err.message || 'Unable to start D4b batch', 'danger');
+            reset();
+        });
     });
 
     function pollCellSectorSyncStatus(statusUrl, $btn, baseHtml) {
@@ -1330,7 +1398,8 @@ $(document).ready(function() {
             region_id: ($('#kmlSiteRegion').val() || '').trim(),
             wilaya_id: ($('#kmlSiteWilaya').val() || '').trim(),
             commune_id: ($('#kmlSiteCommune').val() || '').trim(),
-            site_id: ($('#kmlSiteCode').val() || '').trim()
+            site_id: ($('#kmlSiteCode').val() || '').trim(),
+            format: ($('#kmlSiteFormat').val() || 'kml').trim()
         });
 
         const poll = function(statusUrl, downloadUrl) {
@@ -1421,7 +1490,8 @@ $(document).ready(function() {
             region_id: ($('#kmlSectorRegion').val() || '').trim(),
             wilaya_id: ($('#kmlSectorWilaya').val() || '').trim(),
             commune_id: ($('#kmlSectorCommune').val() || '').trim(),
-            site_id: ($('#kmlSectorSite').val() || '').trim()
+            site_id: ($('#kmlSectorSite').val() || '').trim(),
+            format: ($('#kmlSectorFormat').val() || 'kml').trim()
         });
 
         const $submit = $('#kmlSectorSubmitBtn');
@@ -1500,6 +1570,76 @@ $(document).ready(function() {
         }
     });
 
+    $(document).on('submit', '.cell-export-form', function(e) {
+        const form = this;
+        const startUrl = $(form).data('start-url');
+        if (!startUrl || typeof fetch !== 'function') return;
+        e.preventDefault();
+
+        const $submit = $(form).find('.cell-export-submit');
+        const label = $submit.data('label') || 'Export';
+        const $wrap = $(form).find('.cell-export-progress');
+        const $bar = $(form).find('.cell-export-progress-bar');
+        const $txt = $(form).find('.cell-export-progress-text');
+        const $pct = $(form).find('.cell-export-progress-pct');
+        const reset = function() {
+            $submit.prop('disabled', false).html(`<i class="bi bi-download me-1"></i> ${label}`);
+        };
+
+        $wrap.removeClass('d-none');
+        $bar.css('width', '0%');
+        $pct.text('0%');
+        $txt.text('Uploading cell list...');
+        $submit.prop('disabled', true).html('<span class="spinner-border spinner-border-sm me-1"></span>Generating...');
+
+        const poll = function(statusUrl, downloadUrl) {
+            fetch(statusUrl, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                .then(r => r.json())
+                .then(data => {
+                    if (!data || data.success === false) {
+                        throw new Error((data && data.message) || 'Export status error');
+                    }
+                    const progress = Number(data.progress || 0);
+                    $bar.css('width', `${progress}%`);
+                    $pct.text(`${progress}%`);
+                    $txt.text(data.message || 'Processing...');
+
+                    const status = String(data.status || '').toLowerCase();
+                    if (status === 'completed') {
+                        window.location.href = (data.download_url || downloadUrl);
+                        reset();
+                        return;
+                    }
+                    if (status === 'failed') {
+                        throw new Error(data.message || 'Export failed');
+                    }
+                    setTimeout(() => poll(statusUrl, downloadUrl), 1200);
+                })
+                .catch(err => {
+                    showToast(err.message || 'Export error', 'danger');
+                    reset();
+                });
+        };
+
+        fetch(startUrl, {
+            method: 'POST',
+            headers: { 'X-CSRF-Token': csrfToken, 'X-Requested-With': 'XMLHttpRequest' },
+            body: new FormData(form)
+        })
+        .then(r => r.json())
+        .then(data => {
+            if (!data || !data.success || !data.status_url) {
+                throw new Error((data && data.message) || 'Unable to start export');
+            }
+            poll(data.status_url, data.download_url || '');
+        })
+        .catch(err => {
+            showToast(err.message || 'Unable to start export', 'danger');
+            $wrap.addClass('d-none');
+            reset();
+        });
+    });
+
     $(document).on('click', '.btn-table-export', function(e) {
         const href = $(this).attr('href');
         if (!href) return;
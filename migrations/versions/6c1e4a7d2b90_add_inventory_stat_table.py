@@ -0,0 +1,36 @@
+"""add inventory stat table
+
+Revision ID: 6c1e4a7d2b90
+Revises: 5b8d2e1f9c3a
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c1e4a7d2b90'
+down_revision = '5b8d2e1f9c3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are built on the first dashboard load (or `flask reconcile-stats`).
+    op.create_table('inventory_stat',
+    sa.Column('commune_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('metric', sa.String(length=40), nullable=False),
+    sa.Column('key', sa.String(length=120), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('commune_id', 'metric', 'key')
+    )
+    with op.batch_alter_table('inventory_stat', schema=None) as batch_op:
+        batch_op.create_index('ix_inventory_stat_metric', ['metric'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('inventory_stat', schema=None) as batch_op:
+        batch_op.drop_index('ix_inventory_stat_metric')
+
+    op.drop_table('inventory_stat')
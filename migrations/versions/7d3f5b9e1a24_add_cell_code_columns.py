@@ -0,0 +1,81 @@
+"""add cell code columns
+
+Revision ID: 7d3f5b9e1a24
+Revises: 6c1e4a7d2b90
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7d3f5b9e1a24"
+down_revision = "6c1e4a7d2b90"
+branch_labels = None
+depends_on = None
+
+BACKFILL_CHUNK = 5000
+
+
+def _derive_cell_codes(cellname):
+    # Frozen copy of app.models.derive_cell_codes at the time of this revision.
+    parts = str(cellname or "").rsplit("_", 1)
+    if len(parts) != 2:
+        return None, None
+    raw_site_part = parts[0].strip()
+    site_code = raw_site_part
+    for i, char in enumerate(raw_site_part):
+        if char.upper() in ("C", "A", "O"):
+            site_code = raw_site_part[i:]
+            break
+    return site_code or None, parts[1].strip() or None
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    cell_columns = {col["name"] for col in inspector.get_columns("cell")}
+
+    if "cell_code" not in cell_columns:
+        op.add_column("cell", sa.Column("cell_code", sa.String(length=50), nullable=True))
+    if "site_code_hint" not in cell_columns:
+        op.add_column("cell", sa.Column("site_code_hint", sa.String(length=80), nullable=True))
+    op.create_index("ix_cell_cell_code", "cell", ["cell_code"], unique=False)
+    op.create_index("ix_cell_site_code_hint", "cell", ["site_code_hint"], unique=False)
+    op.create_index("ix_mapping_cell_code", "mapping", ["cell_code"], unique=False)
+
+    cell = sa.table(
+        "cell",
+        sa.column("id", sa.Integer),
+        sa.column("cellname", sa.String),
+        sa.column("cell_code", sa.String),
+        sa.column("site_code_hint", sa.String),
+    )
+    update = (
+        sa.update(cell)
+        .where(cell.c.id == sa.bindparam("cell_id"))
+        .values(cell_code=sa.bindparam("code"), site_code_hint=sa.bindparam("site_code"))
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(cell.c.id, cell.c.cellname).where(cell.c.id > last_id).order_by(cell.c.id).limit(BACKFILL_CHUNK)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for cell_id, cellname in rows:
+            site_code, code = _derive_cell_codes(cellname)
+            params.append({"cell_id": cell_id, "code": code, "site_code": site_code})
+        bind.execute(update, params)
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    op.drop_index("ix_mapping_cell_code", table_name="mapping")
+    op.drop_index("ix_cell_site_code_hint", table_name="cell")
+    op.drop_index("ix_cell_cell_code", table_name="cell")
+    with op.batch_alter_table("cell", schema=None) as batch_op:
+        batch_op.drop_column("site_code_hint")
+        batch_op.drop_column("cell_code")
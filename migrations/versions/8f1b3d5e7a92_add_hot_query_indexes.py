@@ -0,0 +1,51 @@
+"""add hot query indexes
+
+Revision ID: 8f1b3d5e7a92
+Revises: 7d3f5b9e1a24
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8f1b3d5e7a92"
+down_revision = "7d3f5b9e1a24"
+branch_labels = None
+depends_on = None
+
+# (index name, table, columns): foreign keys and lookups used by the hot queries
+# registered in app/services/query_plans.py.
+INDEXES = (
+    ("ix_wilaya_region_id", "wilaya", ["region_id"]),
+    ("ix_commune_wilaya_id", "commune", ["wilaya_id"]),
+    ("ix_site_commune_id", "site", ["commune_id"]),
+    ("ix_site_supplier_id", "site", ["supplier_id"]),
+    ("ix_sector_site_id", "sector", ["site_id"]),
+    ("ix_cell_sector_id", "cell", ["sector_id"]),
+    ("ix_cell_antenna_id", "cell", ["antenna_id"]),
+    ("ix_antenna_model", "antenna", ["model"]),
+    ("ix_mapping_cell_code_technology", "mapping", ["cell_code", "technology"]),
+)
+
+
+def _existing_indexes(inspector, table_name):
+    return {index["name"] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table_name, columns in INDEXES:
+        # Databases created with db.create_all() already carry the model indexes.
+        if name not in _existing_indexes(inspector, table_name):
+            op.create_index(name, table_name, columns, unique=False)
+    # The composite index serves cell_code lookups through its prefix.
+    if "ix_mapping_cell_code" in _existing_indexes(inspector, "mapping"):
+        op.drop_index("ix_mapping_cell_code", table_name="mapping")
+
+
+def downgrade():
+    op.create_index("ix_mapping_cell_code", "mapping", ["cell_code"], unique=False)
+    for name, table_name, _columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table_name)
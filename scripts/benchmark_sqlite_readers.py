@@ -0,0 +1,119 @@
+"""
+Measure cells-listing read latency on SQLite while a bulk writer commits batches.
+
+Each pass builds a throwaway database and runs the /cells/data query (count + first
+page) in a loop, either through the primary session or through the query_only read
+pool, while a writer thread commits 500-cell batches. SQLITE_* settings are read
+from the environment like the app does, so profiles can be compared:
+
+Usage:
+    python scripts/benchmark_sqlite_readers.py --cells 50000 --seconds 10
+    SQLITE_CACHE_SIZE_KB=2000 SQLITE_MMAP_SIZE_MB=0 SQLITE_TEMP_STORE=DEFAULT python scripts/benchmark_sqlite_readers.py
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import Cell, Commune, Region, Sector, Site, Wilaya  # noqa: E402
+from app.routes.list_data import cells_query  # noqa: E402
+from app.services.read_session import read_session  # noqa: E402
+
+WRITE_BATCH = 500
+
+
+def _seed(cell_count):
+    with db.engine.begin() as connection:
+        connection.execute(insert(Region.__table__), [{"id": 1, "name": "center"}])
+        connection.execute(insert(Wilaya.__table__), [{"id": 16, "name": "ALGER", "region_id": 1}])
+        connection.execute(insert(Commune.__table__), [{"id": 1601, "name": "ALGER CENTRE", "wilaya_id": 16}])
+        connection.execute(insert(Site.__table__), [
+            {"id": i, "code_site": f"S{i}", "name": f"Site {i}", "commune_id": 1601, "latitude": 36.7, "longitude": 3.0, "status": "On air"}
+            for i in range(1, 201)
+        ])
+        connection.execute(insert(Sector.__table__), [
+            {"id": i, "code_sector": f"S{i}_1", "azimuth": 0, "hba": 20, "site_id": i} for i in range(1, 201)
+        ])
+        connection.execute(insert(Cell.__table__), [
+            {"cellname": f"S{i % 200 + 1}_L{i}", "technology": "4G", "sector_id": i % 200 + 1} for i in range(cell_count)
+        ])
+
+
+def _writer(app, stop):
+    next_id = 0
+    with app.app_context():
+        while not stop.is_set():
+            with db.engine.begin() as connection:
+                connection.execute(insert(Cell.__table__), [
+                    {"cellname": f"W_{next_id + i}", "technology": "2G"} for i in range(WRITE_BATCH)
+                ])
+            next_id += WRITE_BATCH
+
+
+def _read_once(session):
+    query = cells_query(None, "", session=session)
+    query.count()
+    query.order_by(Cell.cellname).limit(50).all()
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+def run_pass(mode, cell_count, seconds):
+    tmp_dir = tempfile.mkdtemp(prefix="ransites_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    app = create_app()
+    try:
+        with app.app_context():
+            db.create_all()
+            _seed(cell_count)
+            stop = threading.Event()
+            writer = threading.Thread(target=_writer, args=(app, stop), daemon=True)
+            writer.start()
+            samples = []
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                if mode == "read":
+                    with read_session() as session:
+                        _read_once(session)
+                else:
+                    _read_once(db.session)
+                    db.session.remove()
+                samples.append(time.perf_counter() - started)
+            stop.set()
+            writer.join()
+            db.session.remove()
+            db.engine.dispose()
+            app.extensions["read_engine"].dispose()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(
+        f"{mode:>7}: {len(samples)} reads, p50 {_percentile(samples, 50):.1f} ms, "
+        f"p95 {_percentile(samples, 95):.1f} ms, p99 {_percentile(samples, 99):.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cells", type=int, default=20000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    for mode in ("primary", "read"):
+        run_pass(mode, args.cells, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+from flask_login import login_user
+from sqlalchemy import event, func, update
+
+from app import create_app, db
+from app.models import Antenna, Cell, Commune, InventoryStat, Mapping, Region, Sector, Site, Supplier, User, Wilaya
+from app.routes.main import get_dashboard_data
+from app.services.dashboard_cache import DashboardCache, get_dashboard_cache
+from app.services.data_version import INVENTORY_SCOPE, bump_data_version
+from app.services import inventory_stats
+from app.services.inventory_stats import reconcile_inventory_stats
+
+
+class DashboardStatsTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["INVENTORY_STATS_RECONCILE_MINUTES"] = 0
+        with self.app.app_context():
+            db.create_all()
+            self._seed_data()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+    def _seed_data(self):
+        region = Region(name="center")
+        db.session.add(region)
+        db.session.flush()
+        wilaya = Wilaya(id=16, name="ALGER", region_id=region.id)
+        db.session.add(wilaya)
+        db.session.flush()
+        supplier = Supplier(name="Nokia")
+        antenna = Antenna(supplier="ACME", model="A65", frequency=2100, hbeamwidth=65, vbeamwidth=7, gain=17)
+        db.session.add_all([
+            Commune(id=1601, name="ALGER CENTRE", wilaya_id=wilaya.id),
+            Commune(id=1602, name="BAB EL OUED", wilaya_id=wilaya.id),
+            supplier,
+            antenna,
+        ])
+        db.session.flush()
+        s1 = Site(code_site="S1", name="Site 1", commune_id=1601, latitude=36.7, longitude=3.05, supplier_id=supplier.id)
+        s2 = Site(code_site="S2", name="Site 2", commune_id=1601, latitude=36.8, longitude=3.06)
+        s3 = Site(code_site="S3", name="Site 3", commune_id=1602, latitude=36.9, longitude=3.07)
+        db.session.add_all([s1, s2, s3])
+        db.session.flush()
+        sector = Sector(code_sector="S1_1", azimuth=30, hba=25, site_id=s1.id)
+        db.session.add_all([sector, Sector(code_sector="S3_1", azimuth=90, hba=20, site_id=s3.id)])
+        db.session.flush()
+        db.session.add_all([
+            Cell(cellname="S1_L1", technology="4G", antenna_id=antenna.id, sector_id=sector.id),
+            Cell(cellname="S1_G1", technology="2G", sector_id=sector.id),
+            Mapping(map_id="M1", cell_code="L1", antenna_tech="4G", band="L1800", sector_code="1", technology="4G"),
+        ])
+        engineer = User(username="eng", is_admin=False, is_active=True)
+        engineer.set_password("pass1234")
+        admin = User(username="admin", is_admin=True, is_active=True)
+        admin.set_password("adminpass")
+        db.session.add_all([engineer, admin])
+        db.session.flush()
+        # S1 alone covers part of commune 1601, S3 covers all of 1602.
+        engineer.assigned_sites = [s1, s3]
+        db.session.commit()
+        self.engineer_id = engineer.id
+        self.admin_id = admin.id
+
+    def _dashboard_as(self, user_id):
+        with self.app.test_request_context("/dashboard"):
+            login_user(db.session.get(User, user_id))
+            return get_dashboard_data()
+
+    def test_admin_dashboard_is_answered_from_counters_that_follow_writes(self):
+        with self.app.app_context():
+            data = self._dashboard_as(self.admin_id)
+            self.assertEqual(3, data["stats"]["total_sites"])
+            self.assertEqual(2, data["stats"]["total_cells"])
+            self.assertEqual({"2G": 1, "3G": 0, "4G": 1, "Other": 0}, {row["label"]: row["value"] for row in data["tech_distribution"]})
+            self.assertEqual([{"name": "ALGER", "count": 3, "pct": 100.0}], data["top_wilayas"])
+            self.assertEqual({"Unassigned": 2, "Nokia": 1}, {row["name"]: row["count"] for row in data["top_suppliers"]})
+            self.assertEqual(1, data["data_quality"]["sites_without_sectors"])
+            self.assertEqual(1, data["data_quality"]["sectors_without_cells"])
+            self.assertEqual(1, data["data_quality"]["cells_without_antenna"])
+            self.assertEqual(1, data["data_quality"]["mapped_cells"])
+
+            sector = Sector.query.filter_by(code_sector="S3_1").one()
+            db.session.add(Cell(cellname="S3_U1", technology="3G", sector_id=sector.id))
+            db.session.commit()
+            db.session.delete(Site.query.filter_by(code_site="S2").one())
+            db.session.commit()
+
+            data = self._dashboard_as(self.admin_id)
+            self.assertEqual(2, data["stats"]["total_sites"])
+            self.assertEqual(3, data["stats"]["total_cells"])
+            self.assertEqual(0, data["data_quality"]["sites_without_sectors"])
+            self.assertEqual(0, data["data_quality"]["sectors_without_cells"])
+            # Incremental maintenance left nothing for the reconciliation to repair.
+            with db.engine.begin() as connection:
+                self.assertEqual(0, reconcile_inventory_stats(connection))
+            self.assertTrue(InventoryStat.query.filter_by(commune_id=1602, metric="sites").one().value)
+
+    def test_bulk_statements_refresh_only_the_communes_they_touch(self):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                reconcile_inventory_stats(connection)
+            moved = Cell.query.filter_by(cellname="S1_G1").one().id
+            target = Sector.query.filter_by(code_sector="S3_1").one().id
+            with mock.patch("app.services.inventory_stats.request_deferred_reconcile") as deferred:
+                db.session.execute(update(Cell), [{"id": moved, "sector_id": target}])
+                db.session.commit()
+            deferred.assert_not_called()
+            with db.engine.begin() as connection:
+                self.assertEqual(0, reconcile_inventory_stats(connection))
+
+            # Rows behind a WHERE clause are unknown: one reconciliation runs later, not in the commit.
+            with mock.patch("app.services.inventory_stats.request_deferred_reconcile") as deferred:
+                Cell.query.filter(Cell.sector_id == target).update({"technology": "3G"})
+                db.session.commit()
+            deferred.assert_called_once_with(db.engine)
+            with db.engine.begin() as connection:
+                self.assertTrue(reconcile_inventory_stats(connection))
+
+    def test_request_commits_refresh_counters_after_the_response(self):
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                reconcile_inventory_stats(connection)
+            sector_id = Sector.query.filter_by(code_sector="S3_1").one().id
+            with self.app.test_request_context("/edit"):
+                db.session.add(Cell(cellname="S3_U1", technology="3G", sector_id=sector_id))
+                db.session.commit()
+                db.session.add(Cell(cellname="S3_U2", technology="3G", sector_id=sector_id))
+                db.session.commit()
+                stored = db.session.query(func.sum(InventoryStat.value)).filter_by(metric="cube_cells").scalar()
+                response = self.app.process_response(self.app.response_class("ok"))
+            # Nothing was refreshed while the request ran; both commits land once it is sent.
+            self.assertEqual(2, stored)
+            with mock.patch("app.services.inventory_stats.refresh_inventory_stats",
+                            wraps=inventory_stats.refresh_inventory_stats) as refresh:
+                response.close()
+            refresh.assert_called_once()
+            with db.engine.begin() as connection:
+                self.assertEqual(0, reconcile_inventory_stats(connection))
+
+    def test_scoped_dashboard_counts_partial_communes_live(self):
+        with self.app.app_context():
+            data = self._dashboard_as(self.engineer_id)
+            self.assertEqual(2, data["stats"]["total_sites"])
+            self.assertEqual(2, data["stats"]["total_sectors"])
+            self.assertEqual(2, data["stats"]["total_communes"])
+            self.assertEqual(1, data["stats"]["total_antennas"])
+            # S2 (commune 1601, out of scope) is the only site without sectors.
+            self.assertEqual(0, data["data_quality"]["sites_without_sectors"])
+            self.assertEqual(1, data["data_quality"]["sites_without_supplier"])
+
+    def test_dashboard_snapshot_is_shared_until_an_inventory_write(self):
+        with self.app.app_context():
+            first = self._dashboard_as(self.admin_id)
+            second = self._dashboard_as(self.admin_id)
+            self.assertEqual(first["generated_at"], second["generated_at"])
+            self.assertEqual(1, get_dashboard_cache(self.app).misses)
+
+            db.session.add(Mapping(map_id="M2", cell_code="G1", antenna_tech="2G", band="G900", sector_code="1", technology="2G"))
+            db.session.commit()
+            third = self._dashboard_as(self.admin_id)
+            self.assertNotEqual(first["generated_at"], third["generated_at"])
+            self.assertEqual(2, third["data_quality"]["mapped_cells"])
+
+    def test_admin_cache_hit_reads_only_the_data_versions(self):
+        statements = []
+
+        def record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            first = self._dashboard_as(self.admin_id)
+            with self.app.test_request_context("/dashboard"):
+                login_user(db.session.get(User, self.admin_id))
+                event.listen(db.engine, "before_cursor_execute", record)
+                try:
+                    second = get_dashboard_data()
+                finally:
+                    event.remove(db.engine, "before_cursor_execute", record)
+        self.assertEqual(first["generated_at"], second["generated_at"])
+        self.assertEqual(1, len(statements), statements)
+        self.assertIn("data_version", statements[0])
+
+    def test_snapshot_built_before_the_counter_refresh_is_not_kept(self):
+        with self.app.app_context():
+            self.assertEqual(2, self._dashboard_as(self.admin_id)["stats"]["total_cells"])
+            sector_id = Sector.query.filter_by(code_sector="S3_1").one().id
+            # A committed write whose counter refresh has not run yet.
+            with db.engine.begin() as connection:
+                connection.execute(Cell.__table__.insert().values(cellname="S3_U1", technology="3G", sector_id=sector_id))
+                bump_data_version(connection, INVENTORY_SCOPE)
+            self.assertEqual(2, self._dashboard_as(self.admin_id)["stats"]["total_cells"])
+
+            with db.engine.begin() as connection:
+                self.assertTrue(reconcile_inventory_stats(connection))
+            self.assertEqual(3, self._dashboard_as(self.admin_id)["stats"]["total_cells"])
+
+    def test_dashboard_slices_are_sums_of_cube_rows(self):
+        with self.app.app_context():
+            Site.query.filter_by(code_site="S3").one().status = "Planned"
+            db.session.commit()
+
+            def sliced(**filters):
+                with self.app.test_request_context("/dashboard"):
+                    login_user(db.session.get(User, self.admin_id))
+                    return get_dashboard_data(filters)
+
+            data = sliced(tech="4G")
+            self.assertEqual((1, 1, 1), (data["stats"]["total_sites"], data["stats"]["total_sectors"], data["stats"]["total_cells"]))
+            self.assertEqual(1, data["data_quality"]["mapped_cells"])
+            data = sliced(supplier="none")
+            self.assertEqual(2, data["stats"]["total_sites"])
+            self.assertEqual(1, data["data_quality"]["sites_without_sectors"])
+            data = sliced(status="Planned")
+            self.assertEqual((1, 1, 0), (data["stats"]["total_sites"], data["stats"]["total_sectors"], data["stats"]["total_cells"]))
+            data = sliced(dq="unmapped")
+            self.assertEqual(1, data["stats"]["total_cells"])
+            self.assertEqual(1, data["data_quality"]["cells_without_antenna"])
+            self.assertEqual(["On air", "Planned"], data["filters"]["statuses"])
+
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(self.admin_id)
+            session["_fresh"] = True
+        response = client.get("/dashboard?wilaya=16&tech=2G&dq=bogus")
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b"Reset filters", response.data)
+
+    def test_expired_snapshot_is_served_while_refreshed_in_background(self):
+        cache = DashboardCache(ttl_seconds=0)
+        builds = []
+
+        def compute():
+            builds.append(len(builds) + 1)
+            return {"build": len(builds)}
+
+        self.assertEqual({"build": 1}, cache.get("all", 1, compute, self.app))
+        # Expired: the old snapshot comes back immediately, a thread rebuilds it.
+        self.assertEqual({"build": 1}, cache.get("all", 1, compute, self.app))
+        deadline = time.monotonic() + 5
+        while cache.get("all", 1, compute) != {"build": 2} and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual({"build": 2}, cache.get("all", 1, compute))
+        # A newer data version is rebuilt before being served.
+        self.assertEqual({"build": 3}, cache.get("all", 2, compute))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,278 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from openpyxl import load_workbook
+
+from app import create_app, db
+from app.models import Antenna, Cell, Commune, Mapping, Region, Sector, Site, User, Wilaya
+from app.routes.import_data import resolved_sector_statement
+from app.routes.doc_data import _get_d4b_job, _run_d4b_batch_job
+from app.routes.main import _get_cell_export_job, _run_cell_export_job
+from app.services.columnar_export import (
+    _PYARROW_AVAILABLE,
+    COLUMNAR_ENTITIES,
+    _entity_statement,
+    write_columnar_inventory,
+)
+from app.services.excel_export import StreamingXlsxWriter
+
+
+class ExcelExportTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        # Export jobs and import reports write under instance/: keep them out of the working tree.
+        self.instance_dir = tempfile.mkdtemp(prefix="ransites_instance_")
+        self.app.instance_path = self.instance_dir
+        with self.app.app_context():
+            db.create_all()
+            self._seed_data()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+        shutil.rmtree(self.instance_dir, ignore_errors=True)
+
+    def _seed_data(self):
+        region = Region(name="center")
+        db.session.add(region)
+        db.session.flush()
+        wilaya = Wilaya(id=16, name="ALGER", region_id=region.id)
+        db.session.add(wilaya)
+        db.session.flush()
+        commune = Commune(id=1601, name="ALGER CENTRE", wilaya_id=wilaya.id)
+        antenna = Antenna(supplier="ACME", model="A65", frequency=2100, hbeamwidth=65, vbeamwidth=7, gain=17)
+        db.session.add_all([commune, antenna])
+        db.session.flush()
+        site = Site(code_site="C16S001", name="Site 1", commune_id=commune.id, latitude=36.7, longitude=3.05)
+        db.session.add(site)
+        db.session.flush()
+        sector = Sector(code_sector="C16S001_1", azimuth=30, hba=25, site_id=site.id)
+        db.session.add(sector)
+        db.session.flush()
+        db.session.add_all([
+            Cell(cellname="C16S001_L1", technology="4G", frequency=1800, antenna_id=antenna.id, sector_id=sector.id),
+            Cell(cellname="C16S001_G1", technology="2G", frequency=900, antenna_id=antenna.id, sector_id=sector.id),
+        ])
+        admin = User(username="admin", is_admin=True, is_active=True)
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+        self.admin_id = admin.id
+
+    def _client(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(self.admin_id)
+            sess["_fresh"] = True
+            sess["_csrf_token"] = "token"
+        return client
+
+    def test_writer_interleaves_sheets_and_spools_to_a_file(self):
+        writer = StreamingXlsxWriter()
+        writer.add_sheet("A", ["x", "y"])
+        writer.add_sheet("B", ["z"])
+        for idx in range(3):
+            writer.append_dict("A", {"x": idx, "y": idx * 2})
+            writer.append("B", [f"b{idx}"])
+        path = writer.save()
+        try:
+            wb = load_workbook(path, read_only=True)
+            self.assertEqual(["A", "B"], wb.sheetnames)
+            self.assertEqual([("x", "y"), (0, 0), (1, 2), (2, 4)], list(wb["A"].iter_rows(values_only=True)))
+            self.assertEqual(3, writer.row_counts["B"])
+            wb.close()
+        finally:
+            os.remove(path)
+
+    def test_lbs_export_streams_rows_per_technology_and_removes_temp_file(self):
+        before = set(Path(tempfile.gettempdir()).glob("export_*.xlsx"))
+        response = self._client().post(
+            "/export-lbs",
+            data={"csrf_token": "token", "cell_list": "C16S001_L1\nC16S001_G1\nUNKNOWN_1"},
+        )
+        self.assertEqual(200, response.status_code)
+        wb = load_workbook(io.BytesIO(response.get_data()), read_only=True)
+        rows_4g = list(wb["4G"].iter_rows(values_only=True))
+        rows_2g = list(wb["2G"].iter_rows(values_only=True))
+        missing = list(wb["NOT_FOUND"].iter_rows(values_only=True))
+        wb.close()
+        response.close()
+
+        self.assertEqual(["C16S001_L1"], [row[1] for row in rows_4g[1:]])
+        self.assertEqual(["C16S001_G1"], [row[2] for row in rows_2g[1:]])
+        self.assertEqual([("UNKNOWN_1", None, "CELL_MISSING")], [row[:3] for row in missing[1:]])
+        self.assertEqual(before, set(Path(tempfile.gettempdir()).glob("export_*.xlsx")))
+
+    def test_allplan_export_joins_the_staged_list_in_upload_order(self):
+        names = ["UNKNOWN_1", "C16S001_L1", "C16S001_G1", "C16S001_L1"] + [f"GHOST_{i}" for i in range(12000)]
+        response = self._client().post("/export-allplan", data={"csrf_token": "token", "cell_list": "\n".join(names)})
+        self.assertEqual(200, response.status_code)
+        wb = load_workbook(io.BytesIO(response.get_data()), read_only=True)
+        rows_4g = list(wb["4G"].iter_rows(values_only=True))
+        missing = [row for row in wb["NOT_FOUND"].iter_rows(values_only=True)][1:]
+        wb.close()
+        response.close()
+
+        self.assertEqual(["C16S001_L1"], [row[0] for row in rows_4g[1:]])
+        self.assertEqual(("UNKNOWN_1", None, "CELL_MISSING"), missing[0][:3])
+        self.assertEqual("GHOST_11999", missing[-1][0])
+        self.assertEqual(12001, sum(1 for row in missing if row[2] == "CELL_MISSING"))
+
+    def test_export_data_filters_and_searches_in_sql(self):
+        client = self._client()
+
+        def export_rows(url):
+            response = client.get(url)
+            self.assertEqual(200, response.status_code)
+            wb = load_workbook(io.BytesIO(response.get_data()), read_only=True)
+            rows = list(wb.worksheets[0].iter_rows(values_only=True))
+            wb.close()
+            response.close()
+            return rows
+
+        cells = export_rows("/export-data/cells?search=l1")
+        self.assertEqual(["C16S001_L1"], [row[1] for row in cells[1:]])
+        self.assertEqual([], export_rows("/export-data/cells?dq_filter=without_antenna")[1:])
+        self.assertEqual([], export_rows("/export-data/cells?search=%25")[1:])
+        sites = export_rows("/export-data/sites?search=alger")
+        self.assertEqual("C16S001", sites[1][1])
+        self.assertEqual([], export_rows("/export-data/sites?dq_filter=without_sectors")[1:])
+
+    def test_columnar_statements_flatten_profiles_and_respect_scope(self):
+        cell_spec = COLUMNAR_ENTITIES["cells"]()
+        names = [column["name"] for column in cell_spec]
+        with self.app.app_context():
+            for entity, spec_factory in COLUMNAR_ENTITIES.items():
+                spec = spec_factory()
+                rows = db.session.execute(_entity_statement(entity, spec, None)).all()
+                self.assertTrue(all(len(row) == len(spec) for row in rows), entity)
+            cells = db.session.execute(_entity_statement("cells", cell_spec, None)).all()
+            hidden = db.session.execute(_entity_statement("cells", cell_spec, {999})).all()
+
+        self.assertEqual({"C16S001_L1", "C16S001_G1"}, {row[names.index("cellname")] for row in cells})
+        self.assertEqual({"C16S001"}, {row[names.index("site_code")] for row in cells})
+        self.assertEqual([], hidden)
+
+    @unittest.skipUnless(_PYARROW_AVAILABLE, "pyarrow is not installed")
+    def test_columnar_inventory_round_trips_through_parquet(self):
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as out_dir:
+            with self.app.app_context():
+                counts = write_columnar_inventory(out_dir, "parquet")
+            cells = pq.read_table(os.path.join(out_dir, "cells.parquet"))
+        self.assertEqual(2, counts["cells.parquet"])
+        self.assertEqual("int64", str(cells.schema.field("ci_4g").type))
+        self.assertEqual(["C16S001_L1", "C16S001_G1"], cells.column("cellname").to_pylist())
+
+    def test_columnar_export_without_pyarrow_shows_the_install_hint(self):
+        with mock.patch("app.services.columnar_export._PYARROW_AVAILABLE", False):
+            with self.app.app_context(), self.assertRaisesRegex(RuntimeError, "pip install pyarrow"):
+                write_columnar_inventory(self.instance_dir, "parquet")
+            response = self._client().get("/export-columnar?format=parquet", follow_redirects=True)
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b"pip install pyarrow", response.data)
+        self.assertNotEqual("application/zip", response.mimetype)
+
+    def test_lbs_export_job_reports_progress_and_serves_the_artifact(self):
+        with tempfile.TemporaryDirectory() as instance_dir:
+            self.app.instance_path = instance_dir
+            _run_cell_export_job(self.app, "lbs-job", "lbs", ["C16S001_L1", "C16S001_G1", "UNKNOWN_1"])
+            job = _get_cell_export_job("lbs-job")
+            self.assertEqual("completed", job["status"])
+            self.assertEqual(3, job["processed"])
+            # 4G + 2G rows plus the missing name on NOT_FOUND.
+            self.assertEqual(3, job["rows_written"])
+
+            client = self._client()
+            status = client.get("/export-cells/status/lbs-job").get_json()
+            self.assertTrue(status["download_ready"])
+            response = client.get(status["download_url"])
+            self.assertEqual(200, response.status_code)
+            wb = load_workbook(io.BytesIO(response.get_data()), read_only=True)
+            self.assertEqual(["2G", "3G", "4G", "NOT_FOUND"], wb.sheetnames)
+            wb.close()
+            response.close()
+            self.assertEqual(404, client.get("/export-cells/status/unknown").status_code)
+            self.assertEqual(400, client.post("/export-lbs/start", data={"csrf_token": "token"}).status_code)
+
+    def test_cell_codes_are_derived_and_drive_the_sector_join(self):
+        with self.app.app_context():
+            db.session.add_all([
+                Mapping(map_id="M9", cell_code="L9", antenna_tech="4G", band="L1800", sector_code="1", technology="4G"),
+                Cell(cellname="4C16S001_L9", technology="4g ", frequency="1800"),
+            ])
+            db.session.commit()
+            cell = Cell.query.filter_by(cellname="4C16S001_L9").one()
+            self.assertEqual(("C16S001", "L9"), (cell.site_code_hint, cell.cell_code))
+
+            sector_id = Sector.query.filter_by(code_sector="C16S001_1").one().id
+            resolved = db.session.execute(resolved_sector_statement().where(Cell.sector_id.is_(None))).all()
+            self.assertEqual([(cell.id, sector_id)], [tuple(row) for row in resolved])
+
+            cell.cellname = "4C16S001_L8"
+            db.session.commit()
+            self.assertEqual("L8", cell.cell_code)
+            self.assertEqual([], db.session.execute(resolved_sector_statement().where(Cell.sector_id.is_(None))).all())
+
+    def test_d4b_batch_job_zips_one_filled_workbook_per_site(self):
+        with self.app.app_context():
+            site = Site(code_site="C16S002", name="Site 2", commune_id=1601, latitude=36.8, longitude=3.1)
+            db.session.add(site)
+            db.session.commit()
+            site_ids = [row.id for row in Site.query.order_by(Site.id)]
+        self.app.config["D4B_BATCH_WORKERS"] = 1
+        with tempfile.TemporaryDirectory() as instance_dir:
+            self.app.instance_path = instance_dir
+            stale = Path(instance_dir) / "d4b_exports" / "d4b_old.zip"
+            stale.parent.mkdir()
+            stale.write_bytes(b"")
+            os.utime(stale, (0, 0))
+            _run_d4b_batch_job(self.app, "d4b-job", site_ids)
+            job = _get_d4b_job("d4b-job")
+            self.assertEqual("completed", job["status"])
+            self.assertEqual(2, job["processed"])
+            self.assertFalse(stale.exists())
+
+            with zipfile.ZipFile(job["file_path"]) as zf:
+                self.assertEqual(["D4b_C16S001.xlsx", "D4b_C16S002.xlsx"], zf.namelist())
+                first = load_workbook(io.BytesIO(zf.read("D4b_C16S001.xlsx"))).active
+                second = load_workbook(io.BytesIO(zf.read("D4b_C16S002.xlsx"))).active
+            self.assertEqual("C16S001", first["J5"].value)
+            self.assertEqual(30, first["E31"].value)
+            self.assertEqual("A65", first["E33"].value)
+            # The shared template is refilled per site: nothing leaks from the previous one.
+            self.assertEqual("C16S002", second["J5"].value)
+            self.assertIsNone(second["E31"].value)
+
+            client = self._client()
+            self.assertEqual(400, client.post("/generate_d4b/batch/start", data={"csrf_token": "token"}).status_code)
+            status = client.get("/generate_d4b/batch/status/d4b-job").get_json()
+            self.assertTrue(status["download_ready"])
+            response = client.get(status["download_url"])
+            self.assertEqual("application/zip", response.mimetype)
+            response.close()
+
+
+    def test_failed_d4b_batch_leaves_no_partial_archive(self):
+        with self.app.app_context():
+            site_ids = [row.id for row in Site.query]
+        self.app.config["D4B_BATCH_WORKERS"] = 1
+        with mock.patch("app.routes.doc_data.render_d4b_entry", side_effect=OSError("disk full")):
+            _run_d4b_batch_job(self.app, "d4b-failed", site_ids)
+        self.assertEqual("failed", _get_d4b_job("d4b-failed")["status"])
+        self.assertEqual([], list((Path(self.instance_dir) / "d4b_exports").iterdir()))
+
+
+if __name__ == "__main__":
+    unittest.main()
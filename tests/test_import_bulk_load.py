@@ -0,0 +1,73 @@
+import os
+import unittest
+
+import pandas as pd
+
+from app import create_app, db
+from app.models import Cell, Cell4G, Commune, Mapping, Region, Sector, Site, Supplier, Wilaya
+from app.routes.import_data import import_cells, import_sectors, import_sites
+from app.services.inventory_stats import reconcile_inventory_stats
+
+
+class ImportBulkLoadTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["INVENTORY_STATS_RECONCILE_MINUTES"] = 0
+        with self.app.app_context():
+            db.create_all()
+            region = Region(name="center")
+            db.session.add(region)
+            db.session.flush()
+            db.session.add(Wilaya(id=16, name="ALGER", region_id=region.id))
+            db.session.flush()
+            db.session.add_all([
+                Commune(id=1601, name="ALGER CENTRE", wilaya_id=16),
+                Supplier(name="Nokia"),
+                Mapping(map_id="M1", cell_code="L1", antenna_tech="4G", band="L1800", sector_code="1", technology="4G"),
+            ])
+            db.session.flush()
+            db.session.add(Site(code_site="C16S001", name="Old name", commune_id=1601, latitude=36.7, longitude=3.0))
+            db.session.commit()
+            with db.engine.begin() as connection:
+                reconcile_inventory_stats(connection)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+    def test_new_rows_are_bulk_loaded_and_counted(self):
+        with self.app.app_context():
+            ok, message, _details = import_sites(pd.DataFrame([
+                {"site_code": code, "site_name": f"Site {code}", "commune_id": 1601, "supplier_name": "Nokia",
+                 "latitude": 36.7, "longitude": 3.0, "altitude": 12.5}
+                for code in ("C16S001", "C16S002")
+            ]))
+            self.assertTrue(ok, message)
+            ok, message, _details = import_sectors(pd.DataFrame([
+                {"code_sector": f"{code}_1", "code_site": code, "azimuth": 30, "hba": 25}
+                for code in ("C16S001", "C16S002")
+            ]))
+            self.assertTrue(ok, message)
+            ok, message, _details = import_cells(pd.DataFrame([
+                {"CELLNAME": f"4{code}_L1", "TECHNOLOGY": "4G", "FREQUENCY": "L1800", "PCI": 101}
+                for code in ("C16S001", "C16S002")
+            ]))
+            self.assertTrue(ok, message)
+
+            self.assertEqual(["Site C16S001", "Site C16S002"], [site.name for site in Site.query.order_by(Site.code_site)])
+            self.assertEqual(["On air", "On air"], [site.status for site in Site.query])
+            cell = Cell.query.filter_by(cellname="4C16S002_L1").one()
+            self.assertEqual(("C16S002", "L1"), (cell.site_code_hint, cell.cell_code))
+            self.assertEqual("C16S002_1", db.session.get(Sector, cell.sector_id).code_sector)
+            self.assertEqual(101, Cell4G.query.filter_by(cell_id=cell.id).one().pci)
+            # The counters followed rows the unit of work never saw.
+            with db.engine.begin() as connection:
+                self.assertEqual(0, reconcile_inventory_stats(connection))
+
+
+if __name__ == "__main__":
+    unittest.main()
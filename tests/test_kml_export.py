@@ -0,0 +1,277 @@
+import io
+import math
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+from app import create_app, db
+from app.models import Antenna, Cell, Commune, Region, Sector, Site, User, Wilaya
+from app.routes.doc_data import (
+    ADMIN_FULL_SCOPE,
+    _cached_kml_artifact,
+    _evict_kml_cache,
+    _get_kml_job,
+    _kml_cache_key,
+    _kml_export_options,
+    _placemark_cache,
+    _iter_kmz_bytes,
+    _iter_sectors_kml_chunks,
+    _iter_sites_kml_chunks,
+    _kml_partitions,
+    _run_kml_job,
+    _write_regionated_kmz,
+    _write_kml_file,
+)
+from app.services.beam_geometry import format_kml_coordinates, geodesic_beam_vertices, metric_beam_vertices
+
+
+class KmlExportTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        with self.app.app_context():
+            db.create_all()
+            self._seed_data()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+    def _seed_data(self):
+        region = Region(name="center")
+        db.session.add(region)
+        db.session.flush()
+        wilaya = Wilaya(id=16, name="ALGER", region_id=region.id)
+        db.session.add(wilaya)
+        db.session.flush()
+        commune = Commune(id=1601, name="ALGER CENTRE", wilaya_id=wilaya.id)
+        antenna = Antenna(supplier="ACME", model="A65", frequency=2100, hbeamwidth=65, vbeamwidth=7, gain=17)
+        db.session.add_all([commune, antenna])
+        db.session.flush()
+
+        for site_idx in range(1, 6):
+            site = Site(code_site=f"C16S{site_idx:03d}", name=f"Site {site_idx}", commune_id=commune.id, latitude=36.7 + site_idx * 0.01, longitude=3.05)
+            db.session.add(site)
+            db.session.flush()
+            for sector_idx, azimuth in enumerate((0, 120, 240), start=1):
+                sector = Sector(code_sector=f"{site.code_site}_{sector_idx}", azimuth=azimuth, hba=30, site_id=site.id)
+                db.session.add(sector)
+                db.session.flush()
+                db.session.add(Cell(cellname=f"{site.code_site}_L{sector_idx}", technology="4G", antenna_id=antenna.id, sector_id=sector.id))
+        db.session.commit()
+
+    def _sector_chunks(self):
+        return _iter_sectors_kml_chunks(
+            beam_length_km=0.8,
+            beam_width_deg=40.0,
+            line_color="ffff5500",
+            poly_color="66ff5500",
+            accessible_site_ids=ADMIN_FULL_SCOPE,
+        )
+
+    def test_streamed_kml_and_kmz_carry_the_same_document(self):
+        progress = []
+        with self.app.app_context():
+            site_kml = ''.join(_iter_sites_kml_chunks(
+                icon_href="http://example.test/icon.png",
+                icon_scale=1.2,
+                accessible_site_ids=ADMIN_FULL_SCOPE,
+                progress_cb=lambda done, total, msg: progress.append((done, total)),
+            ))
+            sector_kml = ''.join(self._sector_chunks())
+            streamed_kmz = b''.join(_iter_kmz_bytes(self._sector_chunks()))
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                kmz_path = Path(tmp_dir) / "sectors.kmz"
+                _write_kml_file(self._sector_chunks(), kmz_path, kmz=True)
+                with zipfile.ZipFile(kmz_path) as archive:
+                    written_kml = archive.read("doc.kml").decode("utf-8")
+
+        self.assertEqual(5, site_kml.count("<Placemark>"))
+        self.assertEqual((5, 5), progress[-1])
+        self.assertEqual(15, sector_kml.count("<Placemark>"))
+        self.assertTrue(sector_kml.rstrip().endswith("</kml>"))
+        self.assertEqual(sector_kml, written_kml)
+        with zipfile.ZipFile(io.BytesIO(streamed_kmz)) as archive:
+            self.assertEqual(["doc.kml"], archive.namelist())
+            self.assertEqual(sector_kml, archive.read("doc.kml").decode("utf-8"))
+
+    def test_vectorized_beams_match_scalar_destination_formula(self):
+        def destination(lat, lon, bearing_deg, distance_km):
+            brng, lat1, lon1, d = math.radians(bearing_deg), math.radians(lat), math.radians(lon), distance_km / 6371.0
+            lat2 = math.asin(math.sin(lat1) * math.cos(d) + math.cos(lat1) * math.sin(d) * math.cos(brng))
+            lon2 = lon1 + math.atan2(math.sin(brng) * math.sin(d) * math.cos(lat1), math.cos(d) - math.sin(lat1) * math.sin(lat2))
+            return math.degrees(lat2), math.degrees(lon2)
+
+        sites = [(36.75, 3.05, 350.0, 65.0, 0.8), (-0.5, -0.0000004, 120.0, 40.0, 2.5)]
+        lons, lats = geodesic_beam_vertices(*zip(*sites), points=20)
+        for row, (lat, lon, azimuth, width, radius) in enumerate(sites):
+            expected = [(lon, lat)]
+            expected += [destination(lat, lon, azimuth - width / 2 + width * i / 20, radius)[::-1] for i in range(21)]
+            expected.append((lon, lat))
+            np.testing.assert_allclose(np.array(expected), np.column_stack((lons[row], lats[row])), atol=1e-9)
+            text = " ".join("%.6f,%.6f,0" % pair for pair in zip(lons[row], lats[row]))
+            self.assertEqual(text, format_kml_coordinates(lons, lats)[row])
+
+        xs, ys = metric_beam_vertices([100.0], [200.0], [90.0], [60.0], [1000.0], steps=24)
+        self.assertEqual((1, 27), xs.shape)
+        self.assertAlmostEqual(100.0 + 1000.0 * math.sin(math.radians(60.0)), xs[0, 1])
+        self.assertAlmostEqual(200.0, ys[0, 13])
+
+
+    def test_kml_coordinates_match_printf_formatting(self):
+        rng = np.random.default_rng(31)
+        lons = np.concatenate([
+            rng.uniform(-180.0, 180.0, 200),
+            rng.uniform(-1e-6, 1e-6, 100),
+            [-0.0, 0.0, -0.0000004, 0.0000005, -0.0000005, 0.0000015, 179.9999996, -179.9999996],
+        ])
+        lats = np.concatenate([rng.uniform(-90.0, 90.0, 200), rng.normal(0.0, 1e-6, 100), np.linspace(-90.0, 90.0, 8)])
+        rows = np.stack((lons, lats)).T.reshape(-1, 4, 2)
+        texts = format_kml_coordinates(rows[..., 0], rows[..., 1])
+        self.assertEqual(len(rows), len(texts))
+        for row, text in zip(rows, texts):
+            self.assertEqual(" ".join("%.6f,%.6f,0" % (lon, lat) for lon, lat in row), text)
+        self.assertEqual([""], format_kml_coordinates(np.empty((1, 0)), np.empty((1, 0))))
+    def test_placemark_fragments_are_reused_until_a_row_changes(self):
+        _placemark_cache.clear()
+        with self.app.app_context():
+            first = ''.join(self._sector_chunks())
+            self.assertEqual((0, 15), (_placemark_cache.hits, _placemark_cache.misses))
+            self.assertEqual(first, ''.join(self._sector_chunks()))
+            self.assertEqual(15, _placemark_cache.hits)
+
+            sector = Sector.query.filter_by(code_sector="C16S002_1").first()
+            sector.azimuth = 45
+            db.session.commit()
+            edited = ''.join(self._sector_chunks())
+        self.assertEqual((29, 16), (_placemark_cache.hits, _placemark_cache.misses))
+        self.assertNotEqual(first, edited)
+        self.assertEqual(first.count("<Placemark>"), edited.count("<Placemark>"))
+
+    def test_regionated_kmz_links_one_document_per_partition(self):
+        with self.app.app_context():
+            commune = Commune(id=1602, name="BAB EL OUED", wilaya_id=16)
+            db.session.add(commune)
+            db.session.flush()
+            Site.query.filter_by(code_site="C16S005").first().commune_id = commune.id
+            db.session.commit()
+
+            self.app.config["KML_REGION_WORKERS"] = 1
+            options = _kml_export_options("sectors", {"beam_length_km": "1.1"})
+            flat = ''.join(_iter_sectors_kml_chunks(accessible_site_ids=ADMIN_FULL_SCOPE, **options))
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                by_wilaya = Path(tmp_dir) / "wilaya.kmz"
+                by_commune = Path(tmp_dir) / "commune.kmz"
+                _write_regionated_kmz(self.app, "sectors", options, ADMIN_FULL_SCOPE, by_wilaya)
+                _write_regionated_kmz(self.app, "sectors", options, ADMIN_FULL_SCOPE, by_commune, split_communes=True)
+                with zipfile.ZipFile(by_wilaya) as archive:
+                    wilaya_names = archive.namelist()
+                    root = archive.read("doc.kml").decode("utf-8")
+                    wilaya_doc = archive.read("wilaya_16.kml").decode("utf-8")
+                with zipfile.ZipFile(by_commune) as archive:
+                    commune_names = archive.namelist()
+                    commune_docs = [archive.read(f"commune_{cid}.kml").decode("utf-8") for cid in (1601, 1602)]
+                    commune_root = archive.read("wilaya_16.kml").decode("utf-8")
+
+        self.assertEqual(["doc.kml", "wilaya_16.kml"], wilaya_names)
+        self.assertIn("<href>wilaya_16.kml</href>", root)
+        self.assertIn("<minLodPixels>128</minLodPixels>", root)
+        self.assertEqual(flat, wilaya_doc)
+        self.assertEqual(["doc.kml", "commune_1601.kml", "commune_1602.kml", "wilaya_16.kml"], commune_names)
+        self.assertEqual(2, commune_root.count("<NetworkLink>"))
+        self.assertEqual([12, 3], [doc.count("<Placemark>") for doc in commune_docs])
+
+    def test_partition_bounds_pad_longitude_by_the_latitude(self):
+        with self.app.app_context():
+            (partition,) = _kml_partitions({}, ADMIN_FULL_SCOPE, 0.1)
+        north, south, east, west = partition["bounds"]
+        self.assertAlmostEqual(36.75 + 0.1, north)
+        self.assertAlmostEqual(36.71 - 0.1, south)
+        lon_pad = 0.1 / math.cos(math.radians(36.75))
+        self.assertAlmostEqual(3.05 + lon_pad, east)
+        self.assertAlmostEqual(3.05 - lon_pad, west)
+
+    def test_export_cache_hits_until_inventory_changes_and_evicts_lru(self):
+        params = {"site_icon": "antenna", "site_icon_scale": "1.4", "wilaya_id": "16", "format": "kmz", "admin_scope": True}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.app.instance_path = tmp_dir
+            with self.app.app_context():
+                options = _kml_export_options("sites", params)
+                params["cache_key"] = _kml_cache_key("sites", "kmz", options, ADMIN_FULL_SCOPE)
+                self.assertIsNone(_cached_kml_artifact(params["cache_key"], "kmz"))
+                self.assertNotEqual(params["cache_key"], _kml_cache_key("sites", "kmz", options, {1, 2}))
+
+                _run_kml_job(self.app, "job-1", "sites", params)
+                job = _get_kml_job("job-1")
+                self.assertEqual("completed", job["status"])
+                self.assertEqual("sites_export.kmz", job["download_name"])
+                self.assertEqual(job["file_path"], str(_cached_kml_artifact(params["cache_key"], "kmz")))
+
+                site = Site.query.filter_by(code_site="C16S001").first()
+                site.name = "Renamed"
+                db.session.commit()
+                fresh_key = _kml_cache_key("sites", "kmz", options, ADMIN_FULL_SCOPE)
+                self.assertNotEqual(params["cache_key"], fresh_key)
+
+                _run_kml_job(self.app, "job-2", "sites", dict(params, cache_key=fresh_key))
+                stale = Path(job["file_path"])
+                os.utime(stale, (time.time() - 60, time.time() - 60))
+                self.app.config["KML_CACHE_MAX_MB"] = 0
+                _evict_kml_cache(keep=Path(_get_kml_job("job-2")["file_path"]))
+                self.assertFalse(stale.exists())
+                self.assertIsNotNone(_cached_kml_artifact(fresh_key, "kmz"))
+
+
+    def _admin_client(self):
+        with self.app.app_context():
+            admin = User(username="admin", is_admin=True, is_active=True)
+            admin.set_password("adminpass")
+            db.session.add(admin)
+            db.session.commit()
+            admin_id = admin.id
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(admin_id)
+            sess["_fresh"] = True
+        return client
+
+    def test_sync_export_streams_once_then_serves_the_cached_artifact(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.app.instance_path = tmp_dir
+            cache_dir = Path(tmp_dir, "kml_exports")
+            client = self._admin_client()
+
+            # A client that goes away mid-download leaves neither an artifact nor a partial file.
+            aborted = client.get("/export_kml/sectors?format=kmz&beam_length_km=1.5", buffered=False)
+            next(aborted.response)
+            aborted.close()
+            self.assertEqual([], list(cache_dir.iterdir()))
+
+            streamed = client.get("/export_kml/sectors?format=kmz")
+            self.assertTrue(streamed.is_streamed)
+            body = streamed.get_data()
+            streamed.close()
+            (artifact,) = cache_dir.iterdir()
+            self.assertEqual(body, artifact.read_bytes())
+            with zipfile.ZipFile(io.BytesIO(body)) as archive:
+                self.assertEqual(15, archive.read("doc.kml").decode("utf-8").count("<Placemark>"))
+
+            with mock.patch("app.routes.doc_data._iter_kml_export_chunks", side_effect=AssertionError("rebuilt")):
+                cached = client.get("/export_kml/sectors?format=kmz")
+            self.assertEqual(200, cached.status_code)
+            self.assertEqual("application/vnd.google-earth.kmz", cached.mimetype)
+            self.assertEqual(body, cached.get_data())
+            cached.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app import create_app, db
+from app.models import Antenna, Cell, Commune, Region, Sector, Site, User, Wilaya
+from app.routes.map_data import CREATED_MARKER, _prune_tile_cache
+from app.services.map_tiles import build_tile, tile_bounds
+from app.services.site_index import VIEWPORT_MAX_POINTS, SiteGridIndex
+
+
+def _tile_for(lat, lon, z):
+    import math
+
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return z, x, y
+
+
+class MapTileTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.instance_dir = tempfile.TemporaryDirectory()
+        self.app.instance_path = self.instance_dir.name
+        with self.app.app_context():
+            db.create_all()
+            self._seed_data()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+        self.instance_dir.cleanup()
+
+    def _seed_data(self):
+        region = Region(name="center")
+        db.session.add(region)
+        db.session.flush()
+        wilaya = Wilaya(id=16, name="ALGER", region_id=region.id)
+        db.session.add(wilaya)
+        db.session.flush()
+        commune = Commune(id=1601, name="ALGER CENTRE", wilaya_id=wilaya.id)
+        antenna = Antenna(supplier="ACME", model="A65", frequency=2100, hbeamwidth=65, vbeamwidth=7, gain=17)
+        db.session.add_all([commune, antenna])
+        db.session.flush()
+
+        # Two sites a few metres apart (same pixel at low zoom) and one in another tile.
+        first = Site(code_site="C16A001", name="A", commune_id=commune.id, latitude=36.7500, longitude=3.0500)
+        twin = Site(code_site="C16A002", name="B", commune_id=commune.id, latitude=36.7501, longitude=3.0501)
+        other = Site(code_site="C16B001", name="C", commune_id=commune.id, latitude=35.0, longitude=1.0)
+        db.session.add_all([first, twin, other])
+        db.session.flush()
+        for idx, azimuth in enumerate((0, 120, 240), start=1):
+            sector = Sector(code_sector=f"C16A001_{idx}", azimuth=azimuth, hba=30, site_id=first.id)
+            db.session.add(sector)
+            db.session.flush()
+            db.session.add(Cell(cellname=f"C16A001_L{idx}", technology="4G", antenna_id=antenna.id, sector_id=sector.id))
+
+        engineer = User(username="eng", is_admin=False, is_active=True)
+        engineer.set_password("pass1234")
+        engineer.assigned_sites = [twin]
+        admin = User(username="admin", is_admin=True, is_active=True)
+        admin.set_password("adminpass")
+        db.session.add_all([engineer, admin])
+        db.session.commit()
+        self.first_id, self.twin_id = first.id, twin.id
+        self.admin_id, self.engineer_id = admin.id, engineer.id
+
+    def test_sites_merge_per_pixel_at_low_zoom_and_respect_scope(self):
+        with self.app.app_context():
+            low = build_tile("sites", *_tile_for(36.75, 3.05, 8), None)
+            high = build_tile("sites", *_tile_for(36.75, 3.05, 16), None)
+            scoped = build_tile("sites", *_tile_for(36.75, 3.05, 16), {self.twin_id})
+            too_far_out = build_tile("sites", *_tile_for(36.75, 3.05, 3), None)
+
+        self.assertEqual([2], [f["properties"]["count"] for f in low["features"]])
+        self.assertEqual(["C16A001", "C16A002"], [f["properties"]["code"] for f in high["features"]])
+        self.assertEqual(["C16A002"], [f["properties"]["code"] for f in scoped["features"]])
+        self.assertEqual([], too_far_out["features"])
+
+    def test_sector_beams_use_antenna_beamwidth_and_stay_near_the_tile(self):
+        z, x, y = _tile_for(36.75, 3.05, 16)
+        with self.app.app_context():
+            tile = build_tile("sectors", z, x, y, None)
+            hidden = build_tile("sectors", z, x, y, {self.twin_id})
+        west, south, east, north = tile_bounds(z, x, y)
+
+        self.assertEqual(3, len(tile["features"]))
+        self.assertEqual({65.0}, {f["properties"]["beamwidth"] for f in tile["features"]})
+        for feature in tile["features"]:
+            lons = [pt[0] for ring in feature["geometry"]["coordinates"] for pt in ring]
+            self.assertLessEqual(max(lons), east + (east - west) / 2 + 1e-9)
+            self.assertGreaterEqual(min(lons), west - (east - west) / 2 - 1e-9)
+        self.assertEqual([], hidden["features"])
+
+    def test_tile_route_caches_on_disk_per_scope_and_data_version(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(self.engineer_id)
+            sess["_fresh"] = True
+        z, x, y = _tile_for(36.75, 3.05, 16)
+
+        response = client.get(f"/tiles/sites/{z}/{x}/{y}")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["C16A002"], [f["properties"]["code"] for f in json.loads(response.data)["features"]])
+        response.close()
+        cached = list(Path(self.app.instance_path, "map_tiles").rglob("*.geojson"))
+        self.assertEqual(1, len(cached))
+        self.assertEqual(404, client.get("/tiles/roads/1/0/0").status_code)
+
+        with self.app.app_context():
+            db.session.get(Site, self.twin_id).name = "Renamed"
+            db.session.commit()
+        response = client.get(f"/tiles/sites/{z}/{x}/{y}")
+        self.assertEqual("Renamed", json.loads(response.data)["features"][0]["properties"]["name"])
+        response.close()
+        # Requests that read the previous version keep their tiles during the grace period.
+        self.assertTrue(cached[0].exists())
+
+    def test_tile_responses_are_private_to_the_user_scope(self):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(self.engineer_id)
+            sess["_fresh"] = True
+        z, x, y = _tile_for(36.75, 3.05, 16)
+
+        built = client.get(f"/tiles/sites/{z}/{x}/{y}")
+        from_disk = client.get(f"/tiles/sites/{z}/{x}/{y}")
+        for response in (built, from_disk):
+            self.assertEqual(200, response.status_code)
+            self.assertTrue(response.cache_control.private)
+            self.assertFalse(response.cache_control.public)
+            self.assertEqual(60, response.cache_control.max_age)
+            self.assertIn("Cookie", response.vary)
+            response.close()
+        self.assertEqual(built.get_etag(), from_disk.get_etag())
+        revalidated = client.get(f"/tiles/sites/{z}/{x}/{y}", headers={"If-None-Match": built.get_etag()[0]})
+        self.assertEqual(304, revalidated.status_code)
+        revalidated.close()
+
+    def test_tile_cache_prune_waits_for_the_grace_period_and_caps_the_size(self):
+        root = Path(self.app.instance_path, "map_tiles")
+        now = time.time()
+        for version, age in ((1, 7200), (2, 3600), (3, 60)):
+            tiles = root / f"v{version}" / "all" / "sites" / "16"
+            tiles.mkdir(parents=True)
+            marker = root / f"v{version}" / CREATED_MARKER
+            marker.touch()
+            os.utime(marker, (now - age, now - age))
+            for y in range(4):
+                tile = tiles / f"{y}.geojson"
+                tile.write_bytes(b"x" * 1000)
+                os.utime(tile, (now - age + y, now - age + y))
+
+        _prune_tile_cache(root, grace_seconds=600, max_bytes=1_000_000)
+        # v1 was superseded two hours ago; v2 only a minute ago, so it stays readable.
+        self.assertEqual(["v2", "v3"], sorted(path.name for path in root.iterdir()))
+
+        _prune_tile_cache(root, grace_seconds=600, max_bytes=5000)
+        remaining = sorted(path.relative_to(root).parts[0] + "/" + path.name for path in root.rglob("*.geojson"))
+        self.assertEqual(["v3/0.geojson", "v3/1.geojson", "v3/2.geojson", "v3/3.geojson"], remaining)
+
+    def test_viewport_clusters_large_views_and_lists_sites_when_zoomed_in(self):
+        ids = list(range(1, 1001))
+        lats = [36.0 + (i % 40) * 0.01 for i in ids]
+        lons = [3.0 + (i // 40) * 0.01 for i in ids]
+        index = SiteGridIndex(ids, [f"S{i}" for i in ids], [""] * len(ids), lats, lons)
+
+        wide = index.query((-10.0, 20.0, 12.0, 40.0), 6)
+        scoped = index.query((-10.0, 20.0, 12.0, 40.0), 6, {5, 6, 7})
+        close = index.query((3.0, 36.0, 3.02, 36.02), 16)
+
+        self.assertTrue(wide["clustered"])
+        self.assertEqual(1000, sum(p["count"] for p in wide["points"]))
+        self.assertLess(len(wide["points"]), 10)
+        self.assertFalse(scoped["clustered"])
+        self.assertEqual([5, 6, 7], [p["id"] for p in scoped["points"]])
+        self.assertFalse(close["clustered"])
+        self.assertTrue(all(p["count"] == 1 for p in close["points"]))
+        self.assertFalse(close["truncated"])
+
+        with mock.patch("app.services.site_index.VIEWPORT_MAX_POINTS", 10):
+            capped = index.query((3.0, 36.0, 3.3, 36.4), 16)
+        self.assertTrue(capped["truncated"])
+        self.assertEqual(1000, capped["total"])
+        self.assertEqual(10, len(capped["points"]))
+        # The kept sites are the ones nearest the centre of the viewport.
+        self.assertTrue(all(abs(p["lat"] - 36.2) <= 0.03 and abs(p["lon"] - 3.15) <= 0.03 for p in capped["points"]))
+
+        # A country-wide bbox at a street-level zoom still fits the budget: cells grow instead.
+        spread = SiteGridIndex(ids, [f"S{i}" for i in ids], [""] * len(ids),
+                               [19.0 + (i % 40) * 0.4 for i in ids], [-8.0 + (i // 40) * 0.8 for i in ids])
+        for zoom in (6, 10, 14):
+            country = spread.query((-9.0, 18.0, 12.0, 38.0), zoom)
+            self.assertTrue(country["clustered"], zoom)
+            self.assertLessEqual(len(country["points"]), VIEWPORT_MAX_POINTS, zoom)
+            self.assertEqual(1000, sum(p["count"] for p in country["points"]), zoom)
+            self.assertLess(len(json.dumps(country["points"])), 8 * 1024, zoom)
+
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess["_user_id"] = str(self.engineer_id)
+            sess["_fresh"] = True
+        payload = client.get("/sites/viewport?bbox=0,30,10,40&zoom=10").get_json()
+        self.assertEqual(["C16A002"], [p["code"] for p in payload["points"]])
+        self.assertEqual(400, client.get("/sites/viewport?bbox=oops&zoom=3").status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import unittest
+
+from app import create_app, db
+from app.models import Antenna, Cell, Commune, Mapping, Region, Sector, Site, Supplier, Wilaya
+from app.services.query_plans import HOT_QUERIES, full_table_scans, hot_query_scans
+
+
+class QueryPlanTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["INVENTORY_STATS_RECONCILE_MINUTES"] = 0
+        with self.app.app_context():
+            db.create_all()
+            self._seed_data()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+    def _seed_data(self):
+        region = Region(id=1, name="center")
+        db.session.add(region)
+        db.session.flush()
+        db.session.add(Wilaya(id=16, name="ALGER", region_id=region.id))
+        db.session.flush()
+        supplier = Supplier(name="Nokia")
+        antenna = Antenna(supplier="ACME", model="A65", frequency=2100, hbeamwidth=65, vbeamwidth=7, gain=17)
+        db.session.add_all([Commune(id=1601, name="ALGER CENTRE", wilaya_id=16), supplier, antenna])
+        db.session.flush()
+        site = Site(id=1, code_site="SITE01", name="Site 1", commune_id=1601, latitude=36.7, longitude=3.05, supplier_id=supplier.id)
+        db.session.add_all([site, Site(id=2, code_site="SITE02", name="Site 2", commune_id=1601, latitude=36.8, longitude=3.06)])
+        db.session.flush()
+        sector = Sector(code_sector="SITE01_1", azimuth=30, hba=25, site_id=site.id)
+        db.session.add(sector)
+        db.session.flush()
+        db.session.add_all([
+            Cell(cellname="4CSITE01_L1", technology="4G", antenna_id=antenna.id, sector_id=sector.id),
+            Cell(cellname="2CSITE01_G1", technology="2G", sector_id=sector.id),
+            Cell(cellname="ORPHAN_U1", technology="3G"),
+            Mapping(map_id="M1", cell_code="L1", antenna_tech="4G", band="L1800", sector_code="1", technology="4G"),
+        ])
+        db.session.commit()
+
+    def test_hot_queries_do_not_scan_tables(self):
+        with self.app.app_context():
+            table_names = set(db.metadata.tables)
+            for name in HOT_QUERIES:
+                with self.subTest(hot_query=name):
+                    offending = hot_query_scans(name, db.engine, table_names)
+                    self.assertEqual([], [(scans, plan, statement) for statement, plan, scans in offending])
+
+    def test_scan_detection_reads_sqlite_plan_lines(self):
+        plan = [
+            "SCAN cell USING INDEX sqlite_autoindex_cell_1",
+            "SEARCH sector AS sector_1 USING INTEGER PRIMARY KEY (rowid=?)",
+            "SCAN latest_mapping",
+            "SCAN antenna",
+        ]
+        self.assertEqual({"cell", "antenna"}, full_table_scans(plan, {"cell", "sector", "antenna"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,223 @@
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from app import create_app, db
+from app.models import Antenna, Cell, Cell3G, Commune, Region, Road, Sector, Site, Wilaya
+from app.routes.road_analysis import (
+    _get_road_job,
+    _iter_geojson_features,
+    _kml_to_geometry,
+    _run_road_analysis_job,
+    _upsert_roads_from_features,
+)
+from app.services.road_analysis_service import (
+    analyze_road_for_sites_and_sectors,
+    analyze_roads_batch,
+    build_inventory_snapshot,
+    simplify_line_coords,
+)
+
+
+class RoadAnalysisTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        with self.app.app_context():
+            db.create_all()
+            self._seed_data()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+    def _seed_data(self):
+        region = Region(name="center")
+        db.session.add(region)
+        db.session.flush()
+        wilaya = Wilaya(id=16, name="ALGER", region_id=region.id)
+        db.session.add(wilaya)
+        db.session.flush()
+        commune = Commune(id=1601, name="ALGER CENTRE", wilaya_id=wilaya.id)
+        antenna = Antenna(supplier="ACME", model="A65", frequency=2100, hbeamwidth=65, vbeamwidth=7, gain=17)
+        db.session.add_all([commune, antenna])
+        db.session.flush()
+
+        # Road runs east along latitude 36.70; two sites next to it, one far away.
+        near_north = Site(code_site="C16N001", name="North", commune_id=commune.id, latitude=36.705, longitude=3.05)
+        near_south = Site(code_site="C16S001", name="South", commune_id=commune.id, latitude=36.696, longitude=3.08)
+        far = Site(code_site="C16F001", name="Far", commune_id=commune.id, latitude=37.5, longitude=3.05)
+        db.session.add_all([near_north, near_south, far])
+        db.session.flush()
+
+        for site, azimuths in ((near_north, (0, 180)), (near_south, (0, 200)), (far, (90,))):
+            for idx, azimuth in enumerate(azimuths, start=1):
+                sector = Sector(code_sector=f"{site.code_site}_{idx}", azimuth=azimuth, hba=30, site_id=site.id)
+                db.session.add(sector)
+                db.session.flush()
+                cell = Cell(cellname=f"{site.code_site}_U{idx}", technology="3G", antenna_id=antenna.id, sector_id=sector.id)
+                db.session.add(cell)
+                db.session.flush()
+                db.session.add(Cell3G(cell_id=cell.id, dlarfcn="10612"))
+
+        geometry = {"type": "LineString", "coordinates": [[3.0, 36.70], [3.1, 36.70], [3.2, 36.70]]}
+        self.road_geojson = json.dumps(geometry)
+        road = Road(code="RN11", name="RN11", geometry_geojson=self.road_geojson)
+        db.session.add(road)
+        db.session.commit()
+        self.road_id = road.id
+
+    def test_single_road_finds_nearby_sites_and_facing_sectors(self):
+        with self.app.app_context():
+            road = db.session.get(Road, self.road_id)
+            result = analyze_road_for_sites_and_sectors(road, None)
+
+        self.assertEqual(["C16N001", "C16S001"], [row["site_code"] for row in result.site_rows])
+        facing = {row["sector_code"] for row in result.sector_rows if row["facing_road"]}
+        self.assertEqual({"C16N001_2", "C16S001_1"}, facing)
+        north_row = next(row for row in result.sector_rows if row["sector_code"] == "C16N001_2")
+        self.assertEqual(65.0, north_row["beamwidth_deg"])
+        self.assertEqual("10612", north_row["dlarfcn_list"])
+
+    def test_batch_matches_single_road_and_respects_scope(self):
+        with self.app.app_context():
+            road = db.session.get(Road, self.road_id)
+            single = analyze_road_for_sites_and_sectors(road, None)
+            roads = [{"id": road.id, "name": road.name, "geometry_geojson": road.geometry_geojson}]
+            batch = analyze_roads_batch(roads, build_inventory_snapshot(None), max_workers=1)
+
+            south_id = Site.query.filter_by(code_site="C16S001").first().id
+            scoped = analyze_roads_batch(roads, build_inventory_snapshot({south_id}), max_workers=1)
+
+        result, error = batch[self.road_id]
+        self.assertIsNone(error)
+        self.assertEqual(single.site_rows, result.site_rows)
+        self.assertEqual(single.sector_rows, result.sector_rows)
+        self.assertEqual(["C16S001"], [row["site_code"] for row in scoped[self.road_id][0].site_rows])
+
+    def test_streaming_geojson_parser_handles_chunk_boundaries(self):
+        features = [
+            {"type": "Feature", "properties": {"name": f"Road {{{idx}}}"}, "geometry": {"type": "LineString", "coordinates": [[idx, 1.5], [idx + 1, 2.25]]}}
+            for idx in range(20)
+        ]
+        payload = {"type": "FeatureCollection", "crs": {"name": "features"}, "features": features, "total": 20}
+        raw = json.dumps(payload).encode("utf-8")
+        for chunk_size in (1, 5, 4096):
+            self.assertEqual(features, list(_iter_geojson_features(io.BytesIO(raw), chunk_size=chunk_size)))
+        with self.assertRaises(ValueError):
+            list(_iter_geojson_features(io.BytesIO(b'{"type": "FeatureCollection"}')))
+
+    def test_kml_upload_accepts_utf8_and_latin1_documents(self):
+        template = (
+            '<kml xmlns="http://www.opengis.net/kml/2.2"><Placemark><name>Route de Médéa</name>'
+            "<LineString><coordinates>3.0,36.7 3.1,36.75</coordinates></LineString></Placemark></kml>"
+        )
+        for encoding in ("utf-8-sig", "latin-1"):
+            feature = _kml_to_geometry(io.BytesIO(template.encode(encoding)), "RN1")
+            self.assertEqual({"type": "LineString", "coordinates": [[3.0, 36.7], [3.1, 36.75]]}, feature["geometry"], encoding)
+        with self.assertRaises(ValueError):
+            _kml_to_geometry(io.BytesIO(b"<kml><Placemark>"), "RN1")
+
+    def test_import_simplifies_lines_and_reports_vertices(self):
+        # ~1 m wobble around a straight line: a 10 m tolerance keeps only the ends.
+        coords = [[3.0 + (i * 0.001), 36.7 + (0.00001 if i % 2 else 0.0)] for i in range(101)]
+        self.assertEqual([coords[0], coords[-1]], simplify_line_coords(coords, 10.0))
+        self.assertEqual(coords, simplify_line_coords(coords, 0.0))
+
+        feature = {"type": "Feature", "properties": {"name": "RN5", "code": "RN5"}, "geometry": {"type": "LineString", "coordinates": coords}}
+        with self.app.app_context():
+            added, updated, vertex_stats = _upsert_roads_from_features([feature], simplify_tolerance_m=10.0)
+            stored = json.loads(Road.query.filter_by(code="RN5").first().geometry_geojson)
+        self.assertEqual((1, 0), (added, updated))
+        self.assertEqual({"before": 101, "after": 2}, vertex_stats)
+        self.assertEqual(2, len(stored["coordinates"]))
+
+
+    def _road_feature(self, name, code=None, lon=3.0):
+        props = {"name": name}
+        if code:
+            props["code"] = code
+        return {"type": "Feature", "properties": props,
+                "geometry": {"type": "LineString", "coordinates": [[lon, 36.7], [lon + 0.1, 36.7]]}}
+
+    def test_upsert_matches_code_first_then_lowest_id_with_the_name(self):
+        with self.app.app_context():
+            named = [Road(name="Rocade", geometry_geojson=self.road_geojson) for _ in range(2)]
+            db.session.add_all(named)
+            db.session.commit()
+            first_named, second_named = sorted(road.id for road in named)
+
+            by_name = _upsert_roads_from_features([self._road_feature("Rocade", lon=5.0)])
+            # Its code wins over the name it shares with the two "Rocade" roads.
+            by_code = _upsert_roads_from_features([self._road_feature("Rocade", code="RN11", lon=4.0)])
+            roads = {road.id: road for road in Road.query}
+
+        self.assertEqual([(0, 1), (0, 1)], [result[:2] for result in (by_name, by_code)])
+        self.assertEqual(3, len(roads))
+        self.assertEqual(("RN11", "Rocade"), (roads[self.road_id].code, roads[self.road_id].name))
+        self.assertEqual(4.0, json.loads(roads[self.road_id].geometry_geojson)["coordinates"][0][0])
+        self.assertEqual(5.0, json.loads(roads[first_named].geometry_geojson)["coordinates"][0][0])
+        self.assertEqual(self.road_geojson, roads[second_named].geometry_geojson)
+
+    def test_upsert_mixes_updates_and_inserts_across_chunks_and_reports_progress(self):
+        features = [self._road_feature("RN11", code="RN11", lon=4.0)]
+        features += [self._road_feature(f"Road {idx}", code=f"W{idx}", lon=3.0 + idx * 0.01) for idx in range(4)]
+        features.append(self._road_feature("Road 0", code="W0", lon=6.0))
+        progress = []
+        with self.app.app_context(), mock.patch("app.routes.road_analysis.ROAD_UPSERT_CHUNK_SIZE", 2):
+            added, updated, _stats = _upsert_roads_from_features(
+                features, progress_cb=lambda done, total, message: progress.append((done, total, message)),
+            )
+            roads = {road.code: road for road in Road.query}
+
+        # Features are grouped by code first, so W0's second line joins the first.
+        self.assertEqual((4, 1), (added, updated))
+        self.assertEqual({"RN11", "W0", "W1", "W2", "W3"}, set(roads))
+        self.assertEqual("MultiLineString", json.loads(roads["W0"].geometry_geojson)["type"])
+        self.assertEqual(4.0, json.loads(roads["RN11"].geometry_geojson)["coordinates"][0][0])
+        self.assertEqual([(1, 5), (3, 5), (5, 5)], [(done, total) for done, total, _message in progress])
+        self.assertEqual("Saving roads 5/5", progress[-1][2])
+
+    def test_import_roads_command_prints_progress(self):
+        payload = {"type": "FeatureCollection", "features": [self._road_feature("RN5", code="RN5")]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "roads.geojson")
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump(payload, handle)
+            result = self.app.test_cli_runner().invoke(args=["import-roads", path])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("Saving roads 1/1", result.output)
+        self.assertIn("Road import completed: 1 added, 0 updated.", result.output)
+        with self.app.app_context():
+            self.assertEqual(1, Road.query.filter_by(code="RN5").count())
+
+
+    def test_road_jobs_prune_outputs_past_the_retention(self):
+        params = {"max_sites": 10, "site_distance_m": 500.0, "beam_width_deg": 65.0, "beam_length_m": 1000.0}
+        with tempfile.TemporaryDirectory() as instance_dir:
+            self.app.instance_path = instance_dir
+            out_dir = Path(instance_dir, "road_analysis_exports")
+            out_dir.mkdir()
+            stale = [out_dir / "road_result_old.json", out_dir / "road_batch_old.xlsx"]
+            for path in stale:
+                path.write_text("{}", encoding="utf-8")
+                os.utime(path, (time.time() - 2 * 86400, time.time() - 2 * 86400))
+            recent = out_dir / "road_batch_recent.zip"
+            recent.write_bytes(b"")
+
+            _run_road_analysis_job(self.app, "road-job", self.road_id, None, params)
+
+            self.assertEqual("completed", _get_road_job("road-job")["status"])
+            self.assertEqual(["road_batch_recent.zip", "road_result_road-job.json"], sorted(p.name for p in out_dir.iterdir()))
+
+
+if __name__ == "__main__":
+    unittest.main()
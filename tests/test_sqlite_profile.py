@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import exc, text
+
+from app import create_app, db
+from app.models import Region, User
+from app.services.read_session import get_read_engine, read_session
+
+
+class SqliteProfileTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp(prefix="ransites_sqlite_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(self.tmp_dir, 'radio.db')}"
+        os.environ["SQLITE_CACHE_SIZE_KB"] = "32768"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["INVENTORY_STATS_RECONCILE_MINUTES"] = 0
+        with self.app.app_context():
+            db.create_all()
+            admin = User(username="admin", is_admin=True, is_active=True)
+            admin.set_password("adminpass")
+            db.session.add_all([admin, Region(name="center")])
+            db.session.commit()
+            self.admin_id = admin.id
+
+    def tearDown(self):
+        os.environ.pop("SQLITE_CACHE_SIZE_KB", None)
+        with self.app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+            get_read_engine().dispose()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _pragmas(self, connection):
+        return {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "cache_size", "mmap_size", "temp_store", "foreign_keys", "query_only")
+        }
+
+    def test_write_and_read_pools_apply_the_profile(self):
+        with self.app.app_context():
+            with db.engine.connect() as connection:
+                self.assertEqual(
+                    {"journal_mode": "wal", "cache_size": -32768, "mmap_size": 256 * 1024 * 1024,
+                     "temp_store": 2, "foreign_keys": 0, "query_only": 0},
+                    self._pragmas(connection),
+                )
+            with get_read_engine().connect() as connection:
+                self.assertEqual(1, self._pragmas(connection)["query_only"])
+                with self.assertRaises(exc.OperationalError):
+                    connection.execute(text("INSERT INTO region (name) VALUES ('east')"))
+
+    def test_read_session_sees_committed_writes(self):
+        with self.app.app_context():
+            db.session.add(Region(name="east"))
+            db.session.commit()
+            with read_session() as session:
+                self.assertIsNot(db.session, session)
+                self.assertEqual(["center", "east"], sorted(region.name for region in session.query(Region)))
+
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(self.admin_id)
+            session["_fresh"] = True
+        response = client.get("/cells/data?draw=1")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(0, response.get_json()["recordsTotal"])
+
+    def test_in_memory_database_reads_through_the_primary_session(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        app = create_app()
+        with app.app_context():
+            self.assertIsNone(get_read_engine())
+            with read_session() as session:
+                self.assertIs(db.session, session)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+import unittest
+
+from app import create_app, db
+from app.models import Region, Road
+from app.routes.road_analysis import _upsert_roads_from_features
+from app.services.write_coordinator import (
+    BATCH,
+    CommitSlice,
+    WriteCoordinator,
+    bulk_writer,
+    get_write_coordinator,
+)
+
+
+class WriteCoordinatorTests(unittest.TestCase):
+    def _start_waiter(self, coordinator, priority, order):
+        def run():
+            coordinator.acquire(priority, timeout=5)
+            order.append(priority)
+            coordinator.release()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_interactive_writer_gets_the_slot_before_a_waiting_batch(self):
+        coordinator = WriteCoordinator(wait_timeout=5)
+        order = []
+        self.assertTrue(coordinator.acquire(BATCH))
+        batch = self._start_waiter(coordinator, BATCH, order)
+        time.sleep(0.05)
+        interactive = self._start_waiter(coordinator, "interactive", order)
+        time.sleep(0.05)
+        coordinator.release()
+        batch.join(5)
+        interactive.join(5)
+        self.assertEqual(["interactive", BATCH], order)
+
+    def test_acquire_times_out_while_another_thread_writes(self):
+        coordinator = WriteCoordinator(wait_timeout=5)
+        self.assertTrue(coordinator.acquire())
+        self.assertTrue(coordinator.acquire())  # re-entrant for the owner
+        results = []
+        thread = threading.Thread(target=lambda: results.append(coordinator.acquire(timeout=0.05)))
+        thread.start()
+        thread.join(5)
+        self.assertEqual([False], results)
+        coordinator.release()
+        coordinator.release()
+        self.assertTrue(coordinator.acquire(timeout=0))
+
+    def test_bulk_jobs_run_one_at_a_time_in_arrival_order(self):
+        coordinator = WriteCoordinator()
+        events = []
+        queued = []
+        first_started = threading.Event()
+        finish_first = threading.Event()
+
+        def first():
+            with coordinator.bulk_job("first"):
+                events.append("first")
+                first_started.set()
+                finish_first.wait(5)
+
+        def second():
+            with coordinator.bulk_job("second", on_queued=queued.append):
+                events.append("second")
+
+        threads = [threading.Thread(target=first)]
+        threads[0].start()
+        first_started.wait(5)
+        threads.append(threading.Thread(target=second))
+        threads[1].start()
+        time.sleep(0.05)
+        self.assertEqual(["first", "second"], coordinator.queued_jobs())
+        self.assertEqual(["first"], events)
+        finish_first.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(["first", "second"], events)
+        self.assertEqual([1], queued)
+        self.assertEqual([], coordinator.queued_jobs())
+
+    def test_bulk_job_with_timeout_gives_up_and_leaves_the_queue(self):
+        coordinator = WriteCoordinator()
+        release = threading.Event()
+        started = threading.Event()
+
+        def hold():
+            with coordinator.bulk_job("fpall"):
+                started.set()
+                release.wait(5)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        started.wait(5)
+        try:
+            with self.assertRaisesRegex(TimeoutError, "fpall"):
+                with coordinator.bulk_job("late", timeout=0.05):
+                    pass
+            self.assertEqual(["fpall"], coordinator.queued_jobs())
+        finally:
+            release.set()
+            holder.join(5)
+        self.assertEqual([], coordinator.queued_jobs())
+
+    def test_commit_slice_is_due_by_rows_or_elapsed_time(self):
+        by_rows = CommitSlice(max_seconds=60, max_rows=3)
+        self.assertFalse(by_rows.due)
+        self.assertFalse(by_rows.add(2))
+        self.assertTrue(by_rows.add())
+        by_rows.reset()
+        self.assertFalse(by_rows.due)
+
+        by_time = CommitSlice(max_seconds=0.01)
+        self.assertFalse(by_time.add())
+        time.sleep(0.02)
+        self.assertTrue(by_time.due)
+
+
+class SessionWriteSlotTests(unittest.TestCase):
+    def setUp(self):
+        os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+        self.app = create_app()
+        self.app.config["TESTING"] = True
+        self.app.config["INVENTORY_STATS_RECONCILE_MINUTES"] = 0
+        with self.app.app_context():
+            db.create_all()
+        self.coordinator = get_write_coordinator(self.app)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+    def _slot_owner(self):
+        return self.coordinator._owner
+
+    def test_session_holds_the_slot_from_first_write_to_commit(self):
+        self.assertIsNotNone(self.coordinator)
+        with self.app.app_context():
+            db.session.query(Region).count()
+            self.assertIsNone(self._slot_owner())
+
+            db.session.add(Region(name="center"))
+            with db.session.begin_nested():
+                db.session.add(Region(name="east"))
+            # Leaving the savepoint keeps the outer transaction, and the slot, open.
+            self.assertEqual(threading.get_ident(), self._slot_owner())
+
+            db.session.commit()
+            self.assertIsNone(self._slot_owner())
+
+            db.session.query(Region).filter_by(name="east").delete()
+            self.assertEqual(threading.get_ident(), self._slot_owner())
+            db.session.rollback()
+            self.assertIsNone(self._slot_owner())
+
+    def test_bulk_writer_marks_the_session_as_batch(self):
+        with self.app.app_context():
+            with bulk_writer("regions"):
+                self.assertEqual(BATCH, db.session.info.get("write_role"))
+                self.assertEqual(["regions"], self.coordinator.queued_jobs())
+                db.session.add(Region(name="center"))
+                db.session.commit()
+            self.assertNotIn("write_role", db.session.info)
+            self.assertEqual([], self.coordinator.queued_jobs())
+
+    def test_web_road_import_does_not_wait_for_queued_bulk_jobs(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def hold():
+            with self.coordinator.bulk_job("fpall"):
+                started.set()
+                release.wait(10)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        started.wait(5)
+        try:
+            feature = {
+                "type": "Feature",
+                "properties": {"name": "RN1"},
+                "geometry": {"type": "LineString", "coordinates": [[3.0, 36.7], [3.1, 36.7]]},
+            }
+            with self.app.app_context():
+                begun = time.monotonic()
+                added, _updated, _stats = _upsert_roads_from_features([feature])
+                self.assertLess(time.monotonic() - begun, 2)
+                self.assertEqual(1, added)
+                self.assertEqual(["RN1"], [road.name for road in Road.query])
+        finally:
+            release.set()
+            holder.join(5)
+
+    def test_coordinator_can_be_disabled(self):
+        os.environ["WRITE_COORDINATOR"] = "off"
+        try:
+            app = create_app()
+        finally:
+            os.environ.pop("WRITE_COORDINATOR", None)
+        self.assertIsNone(get_write_coordinator(app))
+
+
+if __name__ == "__main__":
+    unittest.main()